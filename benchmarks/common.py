@@ -0,0 +1,232 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+"""
+Helpers shared by the benchmarks.  Each benchmark runs a HeyU hub in a
+subprocess, listening on a Unix domain socket, and talks to it over
+plain sockets, so that the client side costs the same whatever the
+hub is doing.
+"""
+
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+from tendril import framers
+
+from heyu import protocol
+
+
+def encode(msg):
+    """
+    Encode a message for the wire.
+
+    :param msg: The ``heyu.protocol.Message`` object.
+
+    :returns: The message, framed for the wire.
+    """
+
+    framer = framers.COBSFramer(True)
+    return framer.streamify(framers.FrameState(), msg.to_frame())
+
+
+def decode(data):
+    """
+    Decode the complete messages in data read from the wire.
+
+    :param data: The data read from the wire.
+
+    :returns: A tuple of a list of the ``heyu.protocol.Message``
+              objects and the data left over.
+    """
+
+    framer = framers.COBSFramer(True)
+    state = framers.FrameState()
+    msgs = [protocol.Message.from_frame(frame)
+            for frame in framer.frameify(state, data)]
+    return msgs, state.recv_buf
+
+
+def rss(pid):
+    """
+    Retrieve the resident set size of a process.
+
+    :param pid: The process ID.
+
+    :returns: The resident set size, in bytes.
+    """
+
+    with open('/proc/%d/status' % pid) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+
+    raise RuntimeError('Could not determine RSS of process %d' % pid)
+
+
+def stat(stats_path, name):
+    """
+    Retrieve the value of one of the hub's metrics.
+
+    :param stats_path: The path of the hub's statistics socket.
+    :param name: The name of the metric.
+
+    :returns: The value of the metric, or ``None`` if the hub is not
+              yet serving its statistics.
+    """
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(stats_path)
+        data = b''
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    except socket.error:
+        return None
+    finally:
+        sock.close()
+
+    for line in data.decode('utf-8').splitlines():
+        key, _sep, value = line.partition(' ')
+        if key == name:
+            return float(value)
+
+    return None
+
+
+def wait_for(stats_path, name, value, timeout, proc=None):
+    """
+    Wait for one of the hub's metrics to reach a value.
+
+    :param stats_path: The path of the hub's statistics socket.
+    :param name: The name of the metric.
+    :param value: The desired value.
+    :param timeout: The number of seconds to wait.
+    :param proc: The ``subprocess.Popen`` object for the hub.  If
+                 given, waiting stops early if the hub exits.
+    """
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError('Hub exited with status %d' % proc.returncode)
+        if stat(stats_path, name) == value:
+            return
+        time.sleep(0.1)
+
+    raise RuntimeError('Timed out waiting for %s to reach %s' %
+                       (name, value))
+
+
+def raise_fd_limit(needed):
+    """
+    Raise the soft limit on file descriptors.  Subprocesses started
+    afterwards inherit the limit.
+
+    :param needed: The number of descriptors needed.
+    """
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft >= needed:
+        return
+
+    if hard != resource.RLIM_INFINITY and hard < needed:
+        raise RuntimeError('Need %d file descriptors, but the hard limit '
+                           'is %d' % (needed, hard))
+
+    resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+
+
+def start_hub(workdir, *args):
+    """
+    Start a hub in a subprocess.  The hub listens on a Unix domain
+    socket and serves its statistics in the working directory; it
+    also listens on a TCP port, which the benchmarks don't use.
+
+    :param workdir: The working directory for the sockets.
+    :param args: Additional command line arguments for the hub.
+
+    :returns: A tuple of the ``subprocess.Popen`` object for the hub,
+              the path of its Unix domain socket, and the path of its
+              statistics socket.  The hub is ready when this returns.
+    """
+
+    sock_path = os.path.join(workdir, 'hub.sock')
+    stats_path = os.path.join(workdir, 'stats.sock')
+
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+
+    with open(os.devnull, 'w') as devnull:
+        proc = subprocess.Popen([
+            sys.executable, '-c',
+            'from heyu import hub; hub.start_hub.console()',
+            '--foreground', '--insecure', '--unix-socket', sock_path,
+            '--stats-socket', stats_path, '127.0.0.1:%d' % port,
+        ] + list(args), stdout=devnull, stderr=devnull)
+
+    try:
+        wait_for(stats_path, 'subscribers', 0, 30, proc)
+    except Exception:
+        stop(proc)
+        raise
+
+    return proc, sock_path, stats_path
+
+
+def stop(proc, timeout=10.0):
+    """
+    Stop a process, killing it if it doesn't exit promptly.
+
+    :param proc: The ``subprocess.Popen`` object for the process.
+    :param timeout: The number of seconds to wait for it to exit.
+    """
+
+    if proc.poll() is not None:
+        return
+
+    proc.terminate()
+    deadline = time.time() + timeout
+    while proc.poll() is None:
+        if time.time() >= deadline:
+            proc.kill()
+            break
+        time.sleep(0.1)
+    proc.wait()
+
+
+def connect(sock_path, msg):
+    """
+    Connect to the hub and send it a message.
+
+    :param sock_path: The path of the hub's Unix domain socket.
+    :param msg: The ``heyu.protocol.Message`` object to send.
+
+    :returns: The connected socket.
+    """
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(sock_path)
+    sock.sendall(encode(msg))
+    return sock
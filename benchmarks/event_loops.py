@@ -0,0 +1,183 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+"""
+Compare the event loops a HeyU hub can run on.
+
+For each event loop, as given to the hub's "--loop" option, a hub is
+started in a subprocess and two workloads are run against it:
+
+* fanout: a number of subscribers are connected, a batch of
+  notifications is submitted, and the time until every subscriber
+  has received every notification is measured.
+
+* churn: connections are repeatedly opened, used to submit a single
+  notification, and closed, and the rate at which this can be done is
+  measured.
+
+Event loops that can't be used with the installed gevent are
+reported and skipped.
+"""
+
+from __future__ import print_function
+
+import argparse
+import select
+import shutil
+import tempfile
+import time
+
+from heyu import protocol
+
+import common
+
+
+# The event loops compared by default; the empty string is gevent's
+# default loop
+LOOPS = ['', 'libev:epoll', 'libev:poll', 'libev:select', 'libev-cffi',
+         'libuv']
+
+
+def fanout(sock_path, stats_path, subscribers, notifications):
+    """
+    Run the fanout workload.
+
+    :param sock_path: The path of the hub's Unix domain socket.
+    :param stats_path: The path of the hub's statistics socket.
+    :param subscribers: The number of subscribers to connect.
+    :param notifications: The number of notifications to submit.
+
+    :returns: The number of seconds taken to deliver all the
+              notifications to all the subscribers.
+    """
+
+    clients = [common.connect(sock_path, protocol.Message('subscribe'))
+               for _i in range(subscribers)]
+    try:
+        common.wait_for(stats_path, 'subscribers', subscribers, 60)
+
+        # Each subscriber must receive the "subscribed" reply and
+        # every notification
+        poller = select.poll()
+        pending = {}
+        for sock in clients:
+            poller.register(sock, select.POLLIN)
+            pending[sock.fileno()] = [notifications + 1, b'', sock]
+
+        # The hub closes a submitter's connection once it has
+        # accepted the notification, so each needs its own
+        start = time.time()
+        submitters = [common.connect(sock_path, protocol.Message(
+            'notify', app_name='bench', summary='summary', body='body'))
+            for _i in range(notifications)]
+        try:
+            while pending:
+                for fd, _event in poller.poll(1000):
+                    state = pending[fd]
+                    data = state[2].recv(65536)
+                    if not data:
+                        raise RuntimeError('Hub closed a subscriber')
+                    msgs, state[1] = common.decode(state[1] + data)
+                    state[0] -= len(msgs)
+                    if state[0] <= 0:
+                        poller.unregister(fd)
+                        del pending[fd]
+
+            return time.time() - start
+        finally:
+            for sock in submitters:
+                sock.close()
+    finally:
+        for sock in clients:
+            sock.close()
+        common.wait_for(stats_path, 'subscribers', 0, 60)
+
+
+def churn(sock_path, connections):
+    """
+    Run the connection churn workload.
+
+    :param sock_path: The path of the hub's Unix domain socket.
+    :param connections: The number of connections to make.
+
+    :returns: The number of connections handled per second.
+    """
+
+    start = time.time()
+    for _i in range(connections):
+        sock = common.connect(sock_path, protocol.Message(
+            'notify', app_name='bench', summary='summary', body='body'))
+        try:
+            # Wait for the hub to accept the notification
+            data = b''
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    raise RuntimeError('Hub closed the connection')
+                msgs, data = common.decode(data + chunk)
+                if msgs:
+                    break
+        finally:
+            sock.close()
+
+    return connections / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n\n')[0])
+    parser.add_argument('loops', nargs='*', default=LOOPS,
+                        help='The event loops to compare, as given to the '
+                        'hub\'s "--loop" option.  Defaults to all of them.')
+    parser.add_argument('--subscribers', type=int, default=1000,
+                        help='The number of subscribers for the fanout '
+                        'workload.  Defaults to 1000.')
+    parser.add_argument('--notifications', type=int, default=100,
+                        help='The number of notifications for the fanout '
+                        'workload.  Defaults to 100.')
+    parser.add_argument('--connections', type=int, default=2000,
+                        help='The number of connections for the churn '
+                        'workload.  Defaults to 2000.')
+    args = parser.parse_args()
+
+    common.raise_fd_limit(args.subscribers + 256)
+
+    print('%-16s %12s %14s' % ('loop', 'fanout (s)', 'churn (conn/s)'))
+    for loop in args.loops:
+        workdir = tempfile.mkdtemp()
+        try:
+            hub_args = ['--loop', loop] if loop else []
+            try:
+                hub, sock_path, stats_path = common.start_hub(workdir,
+                                                              *hub_args)
+            except RuntimeError:
+                print('%-16s %12s' % (loop or 'default', 'unavailable'))
+                continue
+
+            try:
+                elapsed = fanout(sock_path, stats_path, args.subscribers,
+                                 args.notifications)
+                rate = churn(sock_path, args.connections)
+            finally:
+                common.stop(hub)
+
+            print('%-16s %12.3f %14.1f' % (loop or 'default', elapsed, rate))
+        finally:
+            shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+"""
+Measure the resident memory a HeyU hub uses per idle subscriber.
+
+A hub is started in a subprocess, listening on a Unix domain socket,
+and the requested numbers of subscribers are connected to it.  Each
+subscriber sends a single "subscribe" message, requesting a heartbeat
+and an acknowledgement session like the stock notifiers do, and then
+stays quiet.  Once the hub reports that all the subscribers are
+connected, its resident set size is compared to its size with no
+subscribers.
+
+Each connection needs a file descriptor in both the hub and this
+process, so the descriptor limit must allow for the largest count;
+this script raises its soft limit as far as the hard limit allows,
+and the hub inherits it.
+"""
+
+from __future__ import print_function
+
+import argparse
+import shutil
+import tempfile
+import time
+import uuid
+
+from heyu import protocol
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split(
+        '\n\n')[0])
+    parser.add_argument('counts', nargs='*', type=int,
+                        default=[10000, 100000],
+                        help='The numbers of idle subscribers to measure '
+                        'at.  Defaults to 10000 and 100000.')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='Seconds to let the hub settle before '
+                        'measuring.  Defaults to 2.')
+    parser.add_argument('--timeout', type=float, default=300.0,
+                        help='Seconds to wait for the subscribers to '
+                        'connect.  Defaults to 300.')
+    args = parser.parse_args()
+    counts = sorted(args.counts)
+
+    common.raise_fd_limit(max(counts) + 256)
+
+    workdir = tempfile.mkdtemp()
+    hub, sock_path, stats_path = common.start_hub(workdir)
+
+    clients = []
+    try:
+        time.sleep(args.settle)
+        baseline = common.rss(hub.pid)
+        print('baseline: %.1f MiB' % (baseline / 1048576.0))
+
+        for count in counts:
+            # Subscribe like the stock notifiers do
+            while len(clients) < count:
+                clients.append(common.connect(sock_path, protocol.Message(
+                    'subscribe', heartbeat=30.0, session=str(uuid.uuid4()))))
+
+            common.wait_for(stats_path, 'subscribers', count, args.timeout)
+            time.sleep(args.settle)
+            used = common.rss(hub.pid) - baseline
+            print('%d subscribers: %.1f MiB, %d bytes per subscriber' %
+                  (count, used / 1048576.0, used // count))
+    finally:
+        common.stop(hub)
+        for sock in clients:
+            sock.close()
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -104,7 +104,8 @@ def backoff(max_sleep, threshold, recover):
                     'factor and used to reduce the time before the next '
                     'connection attempt.')
 def gtk_notifier(hub, cert_conf=None, secure=True,
-                 max_sleep=300, threshold=30, recover=5):
+                 max_sleep=300, threshold=30, recover=5, lag_threshold=None,
+                 ring=None, loop=None, snapshot=False):
     """
     GTK notification driver.  This uses the PyGTK package "pynotify"
     to generate desktop notifications from the notifications received
@@ -128,10 +129,21 @@ def gtk_notifier(hub, cert_conf=None, secure=True,
                     factor, truncated to integer, and subtracted from
                     the last sleep time, when the operation is
                     successful.
+    :param lag_threshold: If given, callbacks that block the event
+                          loop for longer than this many seconds are
+                          logged to standard error.  Optional.
+    :param ring: The path of the hub's shared memory ring, to read
+                 notifications from.  Optional.
+    :param loop: The event loop for gevent to use.  Optional.
+    :param snapshot: If ``True``, the current notifications are
+                     requested from the hub on startup.
     """
 
     # Set up the server
-    server = notifications.NotificationServer(hub, cert_conf, secure)
+    server = notifications.NotificationServer(hub, cert_conf, secure,
+                                              lag_threshold=lag_threshold,
+                                              ring=ring, loop=loop,
+                                              snapshot=snapshot)
 
     # Initialize pynotify
     pynotify.init(server.app_name)
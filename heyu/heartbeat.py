@@ -0,0 +1,110 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+import gevent
+
+from heyu import protocol
+
+
+class Heartbeat(object):
+    """
+    Detects a dead peer on a persistent connection.  Every interval,
+    a "ping" message may be sent to the peer; if nothing at all has
+    been received from the peer for ``misses`` intervals, the peer is
+    presumed dead and the client's ``expired()`` method is called.
+    Peers answer "ping" with "pong", so an idle but live peer is
+    never presumed dead.
+    """
+
+    # Every subscriber may have a heartbeat, so keep them small
+    __slots__ = ('_client', 'interval', 'misses', '_ping', '_last',
+                 '_timer')
+
+    def __init__(self, client, interval, misses=3, ping=True):
+        """
+        Initialize a ``Heartbeat`` object.
+
+        :param client: The client to watch.  This must have
+                       ``send_frame()`` and ``expired()`` methods.
+        :param interval: The heartbeat interval, in seconds.
+        :param misses: The number of intervals that may pass without
+                       anything being received from the peer before
+                       it is presumed dead.  Defaults to 3.
+        :param ping: If ``True``, a "ping" message is sent to the
+                     peer every interval.  If ``False``, the peer is
+                     expected to send its own.  Defaults to ``True``.
+        """
+
+        self._client = client
+        self.interval = interval
+        self.misses = misses
+        self._ping = ping
+
+        # The time something was last received from the peer
+        self._last = time.time()
+
+        # The timer for the next check
+        self._timer = None
+
+    def start(self):
+        """
+        Start the heartbeat.
+        """
+
+        self._last = time.time()
+        if self._timer is None:
+            self._timer = gevent.spawn_later(self.interval, self._beat)
+
+    def stop(self):
+        """
+        Stop the heartbeat.
+        """
+
+        if self._timer is not None:
+            self._timer.kill()
+            self._timer = None
+
+    def received(self):
+        """
+        Note that something was received from the peer.
+        """
+
+        self._last = time.time()
+
+    def _beat(self):
+        """
+        Check on the peer, once per interval.  Each check schedules
+        the next, rather than sleeping in a loop, so that an idle
+        connection doesn't hold a suspended greenlet between checks.
+        """
+
+        # Has the peer gone quiet for too long?
+        if time.time() - self._last >= self.interval * self.misses:
+            self._timer = None
+            self._client.expired()
+            return
+
+        if self._ping:
+            try:
+                self._client.send_frame(protocol.Message('ping').to_frame())
+            except Exception:
+                # Ignore failures; the peer will go quiet
+                pass
+
+        # Schedule the next check, unless we were stopped meanwhile
+        if self._timer is not None:
+            self._timer = gevent.spawn_later(self.interval, self._beat)
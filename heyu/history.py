@@ -0,0 +1,138 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import time
+
+from heyu import protocol
+from heyu import ulid
+
+
+class History(object):
+    """
+    A bounded ring buffer of recently submitted notifications.  The
+    notifications are kept as their already-encoded frames, so that
+    they may be replayed to a reconnecting subscriber without having
+    to be re-encoded.  Once the buffer is full, the oldest
+    notification is discarded to make room for the newest.
+    Notifications that have expired are retained, but never replayed.
+    """
+
+    def __init__(self, size):
+        """
+        Initialize a ``History`` object.
+
+        :param size: The maximum number of notifications to retain.
+        """
+
+        # The entries are tuples of the notification ID, the time the
+        # notification was recorded, the encoded frame, and the time
+        # the notification expires
+        self._entries = collections.deque(maxlen=size)
+
+    def __len__(self):
+        """
+        Retrieve the number of notifications currently retained.
+
+        :returns: The number of retained notifications.
+        """
+
+        return len(self._entries)
+
+    @property
+    def last(self):
+        """
+        Retrieve the ID of the most recently recorded notification, or
+        ``None`` if no notifications are retained.
+        """
+
+        if not self._entries:
+            return None
+
+        return self._entries[-1][0]
+
+    def append(self, msg_id, frame, timestamp=None, expires=None):
+        """
+        Record a notification.
+
+        :param msg_id: The ID of the notification.
+        :param frame: The encoded frame for the notification.
+        :param timestamp: The time at which the notification was
+                          received, as a UNIX timestamp.  If not
+                          given, the current time is used.
+        :param expires: The time at which the notification expires,
+                        as a UNIX timestamp.  Optional.
+        """
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        self._entries.append((msg_id, timestamp, frame, expires))
+
+    def since(self, msg_id=None, timestamp=None):
+        """
+        Retrieve the frames of notifications recorded after a given
+        notification or a given time.  If ``msg_id`` is given, the
+        frames following the most recent notification with that ID
+        are returned.  If that notification is no longer retained and
+        its ID records when it was generated, the frames of
+        notifications recorded after that time are returned;
+        otherwise, all retained frames are returned, since it is
+        impossible to tell which were missed.  Otherwise, if
+        ``timestamp`` is given, the frames of notifications recorded
+        after that time are returned.  If neither is given, nothing is
+        returned.  The frames of expired notifications are omitted.
+
+        :param msg_id: The ID of the last notification seen.
+                       Optional.
+        :param timestamp: The time of the last notification seen, as a
+                          UNIX timestamp.  Optional.
+
+        :returns: A list of frames, in the order in which they were
+                  recorded.
+        """
+
+        now = time.time()
+
+        if msg_id is not None:
+            # Walk backwards to find the most recent occurrence
+            frames = []
+            for entry_id, _ts, frame, expires in reversed(self._entries):
+                if entry_id == msg_id:
+                    break
+                if not protocol.expired(expires, now):
+                    frames.append(frame)
+            else:
+                # Not retained; IDs generated by a hub or submitter
+                # record when they were generated, which is still
+                # meaningful if the ID came from another hub
+                generated = ulid.timestamp(msg_id)
+                if generated is not None:
+                    return self.since(timestamp=generated)
+            frames.reverse()
+            return frames
+        elif timestamp is not None:
+            # Walk backwards until we find an older notification
+            frames = []
+            for _entry_id, entry_ts, frame, expires in reversed(
+                    self._entries):
+                if entry_ts <= timestamp:
+                    break
+                if not protocol.expired(expires, now):
+                    frames.append(frame)
+            frames.reverse()
+            return frames
+
+        return []
@@ -13,16 +13,35 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import os
 import signal
 import socket
-import uuid
+import time
 
 import cli_tools
 import gevent
 import tendril
 
+from heyu import heartbeat
+from heyu import history
+from heyu import journal
+from heyu import looplag
+from heyu import loops
+from heyu import metrics
+from heyu import outbox
 from heyu import protocol
+from heyu import ratelimit
+from heyu import receipts
+from heyu import relay
+from heyu import shmring
+from heyu import snapshot
+from heyu import timingwheel
+from heyu import udp
+from heyu import ulid
+from heyu import unix
 from heyu import util
+from heyu import writer
 
 
 class HubServer(object):
@@ -32,26 +51,243 @@ class HubServer(object):
     on to them.
     """
 
-    def __init__(self, endpoints):
+    # The number of notification IDs to remember for deduplicating
+    # relayed notifications
+    dedup_size = 10000
+
+    # The granularity, in seconds, with which notifications held for
+    # later delivery are released
+    schedule_resolution = 1.0
+
+    # How often to check whether output has drained, when stopping or
+    # when holding output for a subscriber that has fallen behind
+    drain_interval = 0.05
+
+    # The number of heartbeat intervals a subscriber may miss before
+    # it is evicted
+    heartbeat_misses = 3
+
+    # The number of disconnected subscriber sessions to retain
+    # unacknowledged notifications for
+    max_sessions = 1000
+
+    def __init__(self, endpoints, history_size=0, journal=None, coalesce=0,
+                 limiter=None, stats_socket=None, name=None, relays=None,
+                 standby=None, failover=5.0, unix_socket=None,
+                 unix_uids=None, udp_endpoint=None, udp_key=None,
+                 drain_timeout=5.0, endpoints_file=None, heartbeat_min=5.0,
+                 lag_threshold=None, ring_path=None,
+                 ring_size=4 * 1024 * 1024, write_delay=0,
+                 write_budget=65536, snapshot_size=0):
         """
         Initialize a ``HubServer`` object.
 
         :param endpoints: A list of tuples of addresses and ports to
                           listen on.
+        :param history_size: The number of recent notifications to
+                             retain for replay to reconnecting
+                             subscribers.  If 0, no history is kept.
+        :param journal: An instance of ``heyu.journal.Journal``, used
+                        to durably record accepted notifications.
+                        Optional.
+        :param coalesce: The coalescing window, in seconds.  Within
+                         the window, only the newest version of each
+                         notification is delivered to a subscriber.
+                         If 0, notifications are delivered
+                         immediately.
+        :param limiter: An instance of ``heyu.ratelimit.RateLimiter``,
+                        used to limit the rate of submissions.
+                        Optional.
+        :param stats_socket: The path of a Unix domain socket on which
+                             to serve the metrics as text.  Optional.
+        :param name: The name of the hub, used to detect relay loops.
+                     Every hub in a federation must have a distinct
+                     name.  Defaults to the fully qualified domain
+                     name of the host.
+        :param relays: A list of tuples of the hostnames and ports of
+                       upstream hubs to relay notifications from.
+                       Optional.
+        :param standby: A tuple of the hostname and port of a primary
+                        hub.  If given, this hub is a standby for that
+                        hub: it follows the notifications accepted by
+                        the primary, and only begins accepting
+                        connections once the primary has been
+                        unreachable for ``failover`` seconds.
+                        Optional.
+        :param failover: The number of seconds the primary hub may be
+                         unreachable before a standby hub takes over.
+                         Defaults to 5 seconds.
+        :param unix_socket: The path of a Unix domain socket on which
+                            to accept connections from local clients.
+                            Connections on this socket are not
+                            encrypted, and are authenticated by the
+                            credentials of the connecting process
+                            rather than by certificate.  Optional.
+        :param unix_uids: A set of the user IDs allowed to connect to
+                          the Unix domain socket.  If ``None``, only
+                          the user running the hub may connect.
+        :param udp_endpoint: A tuple of the address and port on which
+                             to accept notifications in single
+                             datagrams.  Optional.
+        :param udp_key: The shared key used to authenticate the
+                        datagrams.  Required if ``udp_endpoint`` is
+                        given.
+        :param drain_timeout: The maximum number of seconds ``stop()``
+                              waits for output to subscribers to be
+                              written before closing their
+                              connections.  If 0, connections are
+                              closed immediately.  Defaults to 5
+                              seconds.
+        :param endpoints_file: The path of a file listing additional
+                               endpoints to listen on.  The file is
+                               re-read by ``reload()``.  Optional.
+        :param heartbeat_min: The shortest heartbeat interval, in
+                              seconds, that subscribers may request.
+                              Defaults to 5 seconds.
+        :param lag_threshold: If given, the event loop is monitored,
+                              and callbacks that block it for longer
+                              than this many seconds are logged.  The
+                              loop lag is included in the metrics.
+                              Optional.
+        :param ring_path: The path of a shared memory file to write
+                          notifications into.  Subscribers on the
+                          same host may read notifications from the
+                          ring instead of receiving their own copies
+                          over their connections.  Optional.
+        :param ring_size: The capacity of the ring, in bytes.
+                          Defaults to 4 MiB.
+        :param write_delay: The longest time, in seconds, output to a
+                            subscriber may be held so that it can be
+                            written together with the output that
+                            follows it.  If 0, the default, output is
+                            written as soon as possible.
+        :param write_budget: The number of bytes of held output at
+                             which it is written without waiting for
+                             the delay to expire.  Defaults to 64
+                             KiB.
+        :param snapshot_size: The number of distinct notifications
+                              whose latest version is retained, to
+                              bring new subscribers up to date.  If
+                              0, no snapshot is kept.
         """
 
+        # The name of the local host, resolved once rather than for
+        # every local connection
+        self.fqdn = socket.getfqdn()
+
+        # The name of the hub
+        self.name = name or self.fqdn
+
         # A dictionary to keep track of the subscribers
         self._subscribers = {}
 
+        # The receipts of disconnected subscriber sessions, by session
+        # ID, oldest first; these continue to record notifications
+        # until the subscriber reconnects
+        self._sessions = collections.OrderedDict()
+
+        # The subscribers holding each session, by session ID
+        self._attached = {}
+
+        # The history of recent notifications, for replay
+        self._history = None
+        if history_size:
+            self._history = history.History(history_size)
+
+        # The latest version of each live notification, for bringing
+        # new subscribers up to date
+        self._snapshot = None
+        if snapshot_size:
+            self._snapshot = snapshot.Snapshot(snapshot_size)
+
+        # The durable log of accepted notifications
+        self._journal = journal
+
+        # The coalescing window
+        self._coalesce = coalesce
+
+        # The submission rate limiter
+        self._limiter = limiter
+
+        # How long to wait for output to drain when stopping
+        self._drain_timeout = drain_timeout
+
+        # The shortest heartbeat interval subscribers may request
+        self._heartbeat_min = heartbeat_min
+
+        # Set up the metrics
+        self.metrics = self._init_metrics()
+        self._stats_server = None
+        if stats_socket:
+            self._stats_server = metrics.StatsServer(self.metrics,
+                                                     stats_socket)
+
+        # Set up the event loop monitor
+        self._monitor = None
+        if lag_threshold:
+            self._monitor = looplag.LoopMonitor(lag_threshold, self.metrics)
+
+        # Set up the shared memory ring for local subscribers
+        self._ring = None
+        if ring_path:
+            self._ring = shmring.RingWriter(ring_path, ring_size)
+
+        # How output to the subscribers is batched
+        self._write_delay = write_delay
+        self._write_budget = write_budget
+
+        # The upstream hubs to relay from, and the relay links
+        self._relay_hubs = relays or []
+        self._relays = []
+
+        # The primary hub to follow, if we're a standby
+        self._standby = standby
+        self._failover = failover
+        self._follower = None
+
+        # The content of the most recent notifications, by ID, for
+        # deduplicating relayed notifications
+        self._seen = collections.OrderedDict()
+
+        # Notifications accepted but not yet delivered to the
+        # subscribers, and the greenlet delivering them
+        self._dispatch = collections.deque()
+        self._dispatcher = None
+
+        # The ring readers owed a wakeup once the notifications being
+        # delivered have all been written to the ring
+        self._wakeups = []
+
+        # Notifications held until the time they should be delivered,
+        # and the greenlet releasing them
+        self._scheduled = timingwheel.TimingWheel(time.time(),
+                                                  self.schedule_resolution)
+        self._scheduler = None
+
         # A dictionary to keep track of the listeners
         self._listeners = {}
 
-        # Keep track of whether we're running
+        # Keep track of whether we're running, and whether we're
+        # accepting connections
         self._running = False
+        self._active = False
+
+        # The endpoints to listen on; those read from the endpoints
+        # file may change when the configuration is reloaded
+        self._endpoints = list(endpoints)
+        self._endpoints_file = endpoints_file
 
         # Set up the tendril managers
-        for endpoint in endpoints:
+        for endpoint in self._read_endpoints():
             self._listeners[endpoint] = tendril.get_manager('tcp', endpoint)
+        if unix_socket:
+            self._listeners[unix_socket] = unix.UnixTendrilManager(
+                unix_socket, unix_uids)
+
+        # Set up the datagram listener
+        self._udp = None
+        if udp_endpoint:
+            self._udp = udp.UDPListener(self, udp_endpoint, udp_key)
 
         # Set up behavior on signals
         gevent.signal(signal.SIGINT, self.stop)
@@ -62,6 +298,100 @@ class HubServer(object):
         except Exception:  # pragma: no cover
             # Ignore errors; SIGUSR1 isn't everywhere
             pass
+        try:  # pragma: no cover
+            # Reload the configuration
+            gevent.signal(signal.SIGHUP, self.reload)
+        except Exception:  # pragma: no cover
+            # Ignore errors; SIGHUP isn't everywhere
+            pass
+
+    def _init_metrics(self):
+        """
+        Set up the metrics registry for the hub.
+
+        :returns: An instance of ``heyu.metrics.Registry``.
+        """
+
+        registry = metrics.Registry()
+
+        # Traffic counters
+        registry.counter('notifications_submitted')
+        registry.counter('notifications_expired')
+        registry.counter('notifications_scheduled')
+        registry.counter('submit_errors')
+        registry.counter('decode_errors')
+        registry.counter('bytes_in')
+        registry.counter('bytes_out')
+        registry.counter('relay_loops')
+        registry.counter('relay_duplicates')
+        registry.counter('udp_datagrams')
+        registry.counter('udp_rejected')
+        registry.counter('reloads')
+        registry.counter('reload_errors')
+        registry.counter('heartbeat_evictions')
+        registry.counter('notifications_acked')
+        registry.counter('notifications_redelivered')
+        registry.counter('receipts_dropped')
+        registry.counter('sessions_dropped')
+        registry.counter('ring_oversize')
+        registry.counter('write_batches')
+
+        # Latency histograms
+        registry.histogram('notify_seconds')
+        registry.histogram('fanout_seconds')
+
+        # Gauges are only computed when the metrics are inspected
+        registry.gauge('subscribers', lambda: len(self._subscribers))
+        registry.gauge('sessions', lambda: len(self._sessions))
+        registry.gauge('ring_head', lambda: self.ring_head or 0)
+        registry.gauge('queue_depth', self._queue_depth)
+        registry.gauge('dispatch_queue', lambda: len(self._dispatch))
+        registry.gauge('scheduled', lambda: len(self._scheduled))
+        registry.gauge('history_entries',
+                       lambda: len(self._history) if self._history else 0)
+        registry.gauge('snapshot_entries',
+                       lambda: len(self._snapshot) if self._snapshot else 0)
+        if self._limiter is not None:
+            registry.gauge('ratelimit_rejected',
+                           lambda: self._limiter.rejected)
+            registry.gauge('ratelimit_deferred',
+                           lambda: self._limiter.deferred)
+            registry.gauge('ratelimit_buckets', lambda: len(self._limiter))
+
+        return registry
+
+    def _read_endpoints(self):
+        """
+        Determine the endpoints to listen on.
+
+        :returns: A list of the endpoints given to the constructor,
+                  followed by any listed in the endpoints file.
+        """
+
+        endpoints = list(self._endpoints)
+        if self._endpoints_file:
+            endpoints.extend(ep for ep in
+                             util.read_endpoints(self._endpoints_file)
+                             if ep not in endpoints)
+
+        return endpoints
+
+    def _queue_depth(self):
+        """
+        Compute the total amount of output queued for the subscribers.
+
+        :returns: The number of bytes not yet written to the
+                  subscribers' connections, plus the number of
+                  notifications held in their outboxes.
+        """
+
+        depth = 0
+        for client in self._subscribers.values():
+            depth += client.pending
+            if client.outbox is not None:
+                depth += len(client.outbox)
+
+        return depth
 
     def _acceptor(self, tend):
         """
@@ -76,6 +406,43 @@ class HubServer(object):
 
         return HubApplication(tend, self)
 
+    def _recover(self):
+        """
+        Recover the notifications recorded in the journal, so that they
+        are available for replay, then open the journal for appending.
+        Notifications that were still held for later delivery are
+        submitted again, so that they are delivered when due.
+        """
+
+        # Notifications held for later delivery are journaled when
+        # accepted, then again when released; track the ones that
+        # were never released, by frame
+        pending = collections.OrderedDict()
+
+        for timestamp, frame in self._journal.recover():
+            msg = protocol.Message.from_frame(frame)
+
+            # Was this notification held for later delivery?
+            if msg.deliver_at is not None and msg.deliver_at > timestamp:
+                pending[frame] = msg
+                continue
+            pending.pop(frame, None)
+
+            # Feed the notification into the history and the snapshot
+            if self._history is not None:
+                self._history.append(msg.id, frame, timestamp, msg.expires)
+            if self._snapshot is not None:
+                self._snapshot.update(msg.id, frame, msg.expires)
+
+        self._journal.open()
+
+        # Hold the pending notifications again; this journals them in
+        # the new segment, so they survive the old one being
+        # discarded.  Those that came due while the hub was down are
+        # released right away, and those that expired are dropped.
+        for msg in pending.values():
+            self.submit(msg)
+
     def start(self, cert_conf=None, secure=True):
         """
         Start the server.  This ensures that the hub can receive
@@ -91,36 +458,224 @@ class HubServer(object):
         if self._running:
             raise ValueError('server is already running')
 
-        # Get the wrapper
-        wrapper = util.cert_wrapper(cert_conf, 'hub', server_side=True,
-                                    secure=secure)
+        # Get the wrappers
+        self._wrapper = util.cert_wrapper(cert_conf, 'hub', server_side=True,
+                                          secure=secure)
+        self._client_wrapper = None
+        if self._relay_hubs or self._standby:
+            self._client_wrapper = util.cert_wrapper(cert_conf, 'hub',
+                                                     secure=secure)
 
-        # Walk through all managers and start them
-        for manager in self._listeners.values():
-            manager.start(self._acceptor, wrapper)
+        # Recover from the journal before accepting connections
+        if self._journal is not None:
+            self._recover()
+
+        # Start serving the metrics
+        if self._stats_server is not None:
+            self._stats_server.start()
+
+        # Start monitoring the event loop
+        if self._monitor is not None:
+            self._monitor.start()
+
+        # Create the shared memory ring
+        if self._ring is not None:
+            self._ring.open()
 
         self._running = True
 
+        # A standby follows the primary until it has to take over
+        if self._standby:
+            self._follower = relay.Standby(self, self._standby,
+                                           self._client_wrapper,
+                                           self._failover)
+            if self._history is not None:
+                self._follower.last_id = self._history.last
+            self._follower.start()
+        else:
+            self.promote()
+
+    def promote(self):
+        """
+        Begin accepting connections on the declared endpoints and
+        relaying from the upstream hubs.  This is called by ``start()``,
+        or, for a standby hub, once the primary hub has failed.
+        """
+
+        # Do nothing if we're already active
+        if self._active:
+            return
+
+        self._follower = None
+
+        # Walk through all managers and start them; local connections
+        # are authenticated by credentials, not certificates
+        for manager in self._listeners.values():
+            if manager.proto == 'unix':
+                manager.start(self._acceptor, None)
+            else:
+                manager.start(self._acceptor, self._wrapper)
+        if self._udp is not None:
+            self._udp.start()
+
+        # Connect to the upstream hubs
+        self._relays = [relay.Relay(self, hub, self._client_wrapper)
+                        for hub in self._relay_hubs]
+        for link in self._relays:
+            link.start()
+
+        self._active = True
+
+    def _stop_listener(self, manager):
+        """
+        Stop a listener and close its listening socket.  Unlike
+        ``shutdown()``, this leaves the connections it accepted open.
+
+        :param manager: The tendril manager.
+        """
+
+        # Tendril only closes the listening socket when the listening
+        # thread exits
+        if manager._listen_thread is not None:
+            manager._listen_thread.kill()
+            manager._listen_thread = None
+        manager.stop()
+
+    def reload(self, *args):
+        """
+        Reload the configuration.  The certificates are re-read, and
+        listeners are added or removed to match the endpoints file.
+        Connections accepted from then on use the new configuration;
+        established connections, including those accepted by removed
+        listeners, are left alone.  If the configuration cannot be
+        loaded, it is left unchanged.  Extra arguments are ignored, so
+        that this method may be used as a signal handler.
+        """
+
+        # Do nothing if we're not running
+        if not self._running:
+            return
+
+        try:
+            util.reload_wrappers()
+            endpoints = self._read_endpoints()
+        except Exception:
+            self.metrics['reload_errors'].inc()
+            return
+
+        self.metrics['reloads'].inc()
+
+        for endpoint, manager in list(self._listeners.items()):
+            if manager.proto != 'tcp':
+                continue
+
+            if endpoint not in endpoints:
+                # The endpoint has been removed
+                del self._listeners[endpoint]
+                if self._active:
+                    self._stop_listener(manager)
+            elif self._active and self._wrapper is not None:
+                # The listening socket is bound to the old
+                # certificates, so restart the listener
+                self._stop_listener(manager)
+                manager.start(self._acceptor, self._wrapper)
+
+        # Set up listeners for new endpoints
+        for endpoint in endpoints:
+            if endpoint in self._listeners:
+                continue
+
+            manager = tendril.get_manager('tcp', endpoint)
+            self._listeners[endpoint] = manager
+            if self._active:
+                manager.start(self._acceptor, self._wrapper)
+
     def stop(self, *args):
         """
         Stop the server.  This stops the listening threads and disconnects
-        all the clients.  Extra arguments are ignored, so that this
-        method may be used as a signal handler.
+        all the clients.  Output still pending for the subscribers is
+        flushed, and the connections are only closed once it has been
+        written or the drain timeout has expired.  Extra arguments are
+        ignored, so that this method may be used as a signal handler.
         """
 
         # Do nothing if we're not running
         if not self._running:
             return
 
+        # Stop following the primary hub
+        if self._follower is not None:
+            self._follower.stop()
+            self._follower = None
+
         # Walk through all managers and stop them
-        for manager in self._listeners.values():
-            manager.stop()
+        if self._active:
+            for manager in self._listeners.values():
+                manager.stop()
+
+        # Stop accepting datagrams
+        if self._udp is not None:
+            self._udp.stop()
+
+        # Disconnect from the upstream hubs
+        for link in self._relays:
+            link.stop()
+        self._relays = []
+
+        # Deliver the notifications that are still queued; those held
+        # for later delivery are only kept if there's a journal, from
+        # which they're recovered when the hub is next started
+        self._scheduled.clear()
+        self._dispatch_queued()
 
         # Now walk through all the subscribers and disconnect them
-        for client, _version in self._subscribers.values():
-            client.disconnect()
+        clients = list(self._subscribers.values())
+        if self._drain_timeout:
+            for client in clients:
+                client.disconnect(drain=True)
+            self._drain(clients)
+        else:
+            for client in clients:
+                client.disconnect()
+
+        # Close the journal
+        if self._journal is not None:
+            self._journal.close()
+
+        # Stop serving the metrics
+        if self._stats_server is not None:
+            self._stats_server.stop()
+
+        # Stop monitoring the event loop
+        if self._monitor is not None:
+            self._monitor.stop()
+
+        # Remove the shared memory ring
+        if self._ring is not None:
+            self._ring.close()
 
         self._running = False
+        self._active = False
+
+    def _drain(self, clients):
+        """
+        Wait for the output to a set of clients to be written, up to
+        the drain timeout, then close their connections.
+
+        :param clients: A list of the clients.
+        """
+
+        deadline = time.time() + self._drain_timeout
+        while (any(client.pending for client in clients) and
+               time.time() < deadline):
+            gevent.sleep(self.drain_interval)
+
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                # The connection may already be gone
+                pass
 
     def shutdown(self, *args):
         """
@@ -134,17 +689,66 @@ class HubServer(object):
         if not self._running:
             return
 
+        # Stop following the primary hub
+        if self._follower is not None:
+            self._follower.stop()
+            self._follower = None
+
         # Walk through all managers and shut them down
-        for manager in self._listeners.values():
-            manager.shutdown()
+        if self._active:
+            for manager in self._listeners.values():
+                manager.shutdown()
+
+        # Stop accepting datagrams
+        if self._udp is not None:
+            self._udp.stop()
+
+        # Disconnect from the upstream hubs
+        for link in self._relays:
+            link.stop()
+        self._relays = []
 
         # All subscriber connections were closed by shutdown, so clear
-        # the the subscribers list
+        # the the subscribers list; there's nobody left to deliver the
+        # queued notifications to
         self._subscribers = {}
+        self._dispatch.clear()
+        self._scheduled.clear()
+
+        # Close the journal
+        if self._journal is not None:
+            self._journal.close()
+
+        # Stop serving the metrics
+        if self._stats_server is not None:
+            self._stats_server.stop()
+
+        # Stop monitoring the event loop
+        if self._monitor is not None:
+            self._monitor.stop()
+
+        # Remove the shared memory ring
+        if self._ring is not None:
+            self._ring.close()
 
         self._running = False
+        self._active = False
+
+    @property
+    def ring_head(self):
+        """
+        Retrieve the position in the shared memory ring at which the
+        next notification will be written, or ``None`` if there is no
+        ring.
+        """
+
+        if self._ring is None:
+            return None
 
-    def subscribe(self, client, version):
+        return self._ring.head
+
+    def subscribe(self, client, version, interval=None, session=None,
+                  ring=None):
         """
         Subscribe a client to notifications.
 
@@ -153,38 +757,483 @@ class HubServer(object):
         :param version: The protocol version to use when communicating
                         with the client.  Currently, the only
                         recognized version is 0.
+        :param interval: The heartbeat interval requested by the
+                         client, in seconds.  If given, the client is
+                         pinged at that interval, or at the minimum
+                         interval if that is longer, and is evicted if
+                         it stops answering.  Optional.
+        :param session: The session ID chosen by the client.  If
+                        given, the client is expected to acknowledge
+                        the notifications it receives, and those it
+                        does not are redelivered if it reconnects with
+                        the same session ID.  Optional.
+        :param ring: The path of the shared memory ring the client
+                     wishes to read notifications from.  If it names
+                     the hub's ring and the client is on the same
+                     host, notifications are written to the ring
+                     rather than sent to the client, and the client is
+                     only sent a "wakeup" message to tell it to read
+                     the ring.  Optional.
+
+        :returns: The negotiated heartbeat interval, or ``None`` if
+                  no heartbeat was requested.
         """
 
+        # Deliver the notifications accepted before the client
+        # subscribed, so that it only receives those accepted after;
+        # any it missed are replayed from the history
+        self._dispatch_queued()
+
+        # Use the shared memory ring if possible; notifications read
+        # from the ring aren't acknowledged
+        if (ring is not None and self._ring is not None and
+                ring == self._ring.path and client.local):
+            client.ring = True
+            session = None
+
+        # Set up tracking of unacknowledged notifications, resuming
+        # the session if the client is reconnecting
+        if session is not None:
+            # A client may reconnect before its old connection has
+            # been reaped; the old connection gives up the session,
+            # and its unacknowledged notifications, to the new one
+            old = self._attached.get(session)
+            if old is not None:
+                self.unsubscribe(old)
+                try:
+                    old.close()
+                except Exception:
+                    # The connection may already be gone
+                    pass
+
+            tracker = self._sessions.pop(session, None)
+            if tracker is not None and tracker.version == version:
+                tracker.resumed = True
+            else:
+                tracker = receipts.Receipts(session, version, client.relay)
+            client.receipts = tracker
+            self._attached[session] = client
+
+        # Set up queuing of the client's output, so that urgent
+        # notifications may overtake others when the client is
+        # behind, and coalescing, if enabled
+        if self._coalesce:
+            client.outbox = outbox.Outbox(client, self._coalesce,
+                                          receipts=client.receipts)
+        else:
+            client.outbox = outbox.Outbox(client, self.drain_interval,
+                                          False, client.receipts)
+
+        # Set up batching of the client's writes
+        if self._write_delay:
+            client.writer = writer.Writer(client.write_frames,
+                                          self._write_delay,
+                                          self._write_budget)
+
+        # Set up the heartbeat
+        if interval:
+            interval = max(interval, self._heartbeat_min)
+            client.heartbeat = heartbeat.Heartbeat(client, interval,
+                                                   self.heartbeat_misses)
+            client.heartbeat.start()
+        else:
+            interval = None
+
         # Add the client to the dictionary of subscribers
-        self._subscribers[id(client)] = (client, version)
+        client.version = version
+        self._subscribers[id(client)] = client
+
+        return interval
+
+    def redeliver(self, client):
+        """
+        Redeliver the notifications a reconnecting client did not
+        acknowledge before it was disconnected, including those
+        submitted while it was disconnected.
+
+        :param client: An instance of ``HubApplication`` representing
+                       the client to redeliver notifications to.
+
+        :returns: ``True`` if the client resumed a session, in which
+                  case there is no need to replay notifications to
+                  it, ``False`` otherwise.
+        """
+
+        if client.receipts is None or not client.receipts.resumed:
+            return False
+
+        # The frames are recorded again as they're sent, since they
+        # must be acknowledged again; frames for notifications that
+        # have expired are not returned
+        for key, frame, expires in client.receipts.take():
+            self.metrics['notifications_redelivered'].inc()
+            client.outbox.push(key, frame, expires=expires)
+
+        return True
 
-    def unsubscribe(self, client):
+    def replay(self, client, since_id=None, since=None):
+        """
+        Replay recent notifications to a client.  The cached frames
+        are written directly to the client, without being re-encoded.
+        Notifications that have expired are not replayed.
+
+        :param client: An instance of ``HubApplication`` representing
+                       the client to replay notifications to.
+        :param since_id: The ID of the last notification the client
+                         saw.  Optional.
+        :param since: The time of the last notification the client
+                      saw, as a UNIX timestamp.  Optional.
+        """
+
+        # Do nothing if we're not keeping a history
+        if self._history is None:
+            return
+
+        frames = self._history.since(since_id, since)
+        for frame in frames:
+            client.send_frame(frame)
+
+        # The client counts these when acknowledging notifications
+        if client.receipts is not None:
+            client.receipts.skip(len(frames))
+
+    def send_snapshot(self, client):
+        """
+        Bring a new client up to date by sending it the latest version
+        of each live notification.  As with ``replay()``, the cached
+        frames are written directly to the client; they are written
+        back to back, so they go out together.
+
+        :param client: An instance of ``HubApplication`` representing
+                       the client to send the snapshot to.
+        """
+
+        # Do nothing if we're not keeping a snapshot
+        if self._snapshot is None:
+            return
+
+        frames = self._snapshot.frames()
+        for frame in frames:
+            client.send_frame(frame)
+
+        # The client counts these when acknowledging notifications
+        if client.receipts is not None:
+            client.receipts.skip(len(frames))
+
+    def unsubscribe(self, client, retain=True):
         """
         Unsubscribe a client from notifications.
 
         :param client: An instance of ``HubApplication`` representing
                        the client to unsubscribe.
+        :param retain: If ``True``, the default, and the client
+                       acknowledges notifications, its unacknowledged
+                       notifications are retained for redelivery if
+                       it reconnects.  If ``False``, they are
+                       discarded; this is appropriate when the client
+                       disconnects cleanly.
         """
 
         # Remove the client from the dictionary of subscribers
         self._subscribers.pop(id(client), None)
 
+        # Retain the session, including any output not yet sent, but
+        # only if no other subscriber has taken it over
+        if client.receipts is not None:
+            session = client.receipts.session
+            if self._attached.get(session) is client:
+                del self._attached[session]
+                if retain:
+                    if client.outbox is not None:
+                        for key, frame, expires in client.outbox.take():
+                            client.receipts.sent(key, frame, expires)
+                    self._sessions.pop(session, None)
+                    self._sessions[session] = client.receipts
+                    if len(self._sessions) > self.max_sessions:
+                        self._sessions.popitem(last=False)
+                        self.metrics['sessions_dropped'].inc()
+            client.receipts = None
+
+        # Discard any coalesced output
+        if client.outbox is not None:
+            client.outbox.cancel()
+            client.outbox = None
+
+        # Write out any batched output; it has already been sent as
+        # far as everything else is concerned
+        if client.writer is not None:
+            client.writer.flush()
+            client.writer = None
+
+        # Stop the heartbeat
+        if client.heartbeat is not None:
+            client.heartbeat.stop()
+            client.heartbeat = None
+
+    def throttle(self, hostname, app_name):
+        """
+        Apply the rate limit to a submission.  If the submission must
+        be deferred, this sleeps until it may proceed.  Raises
+        ``heyu.ratelimit.RateLimitExceeded`` if the submission is
+        over the limit and may not be deferred.
+
+        :param hostname: The origin hostname of the submission.
+        :param app_name: The application name of the submission.
+        """
+
+        # Do nothing if there's no limit
+        if self._limiter is None:
+            return
+
+        wait = self._limiter.check(hostname, app_name)
+        if wait:
+            gevent.sleep(wait)
+
     def submit(self, msg):
         """
-        Submit a notification to all current subscribers.
+        Submit a notification to all current subscribers.  The
+        notification is recorded in the journal, if any, and the
+        history, then queued for delivery; it is delivered to the
+        subscribers asynchronously, so that the submitter need not
+        wait for it to be delivered to every subscriber.  A
+        notification that has already expired is dropped, and one that
+        is to be delivered later is held until then, then submitted
+        again.
 
         :param msg: The ``heyu.protocol.Message`` object containing
                     the notification to forward.
         """
 
-        # Forward the message to all subscribers
-        for client, version in self._subscribers.values():
+        # Don't bother with notifications that are already stale
+        timestamp = time.time()
+        if protocol.expired(msg.expires, timestamp):
+            self.metrics['notifications_expired'].inc()
+            return
+
+        # Record the message in the journal; this returns once the
+        # configured durability level has been reached.  Note that
+        # the frame is in the current protocol version.  A
+        # notification that isn't due yet is recorded both now and
+        # when it's released, so that recovery can tell whether it
+        # was still being held.
+        if self._journal is not None:
+            self._journal.append(msg.to_frame(), timestamp)
+
+        # Hold notifications that aren't due yet
+        if msg.deliver_at is not None and msg.deliver_at > timestamp:
+            self._schedule(msg)
+            return
+
+        # Record the message in the history
+        if self._history is not None:
+            self._history.append(msg.id, msg.to_frame(), timestamp,
+                                 msg.expires)
+
+        # Record it as the latest version of the notification
+        if self._snapshot is not None:
+            self._snapshot.update(msg.id, msg.to_frame(), msg.expires)
+
+        # Remember its content, for deduplicating relayed copies
+        self._seen.pop(msg.id, None)
+        self._seen[msg.id] = _content(msg)
+        if len(self._seen) > self.dedup_size:
+            self._seen.popitem(last=False)
+
+        # Queue the message for delivery
+        self._dispatch.append(msg)
+        if self._dispatcher is None:
+            self._dispatcher = gevent.spawn(self._dispatch_run)
+
+        self.metrics['notifications_submitted'].inc()
+
+    def _schedule(self, msg):
+        """
+        Hold a notification until the time it should be delivered.
+
+        :param msg: The ``heyu.protocol.Message`` object containing
+                    the notification.
+        """
+
+        self._scheduled.add(msg.deliver_at, msg, time.time())
+        if self._scheduler is None:
+            self._scheduler = gevent.spawn(self._schedule_run)
+
+        self.metrics['notifications_scheduled'].inc()
+
+    def _schedule_run(self):
+        """
+        The body of the scheduler greenlet.  Submits the held
+        notifications as they become due, until none are left; the
+        next notification to be held starts a new scheduler.
+        """
+
+        try:
+            resolution = self._scheduled.resolution
+            while self._scheduled:
+                # Wake at the start of the next tick
+                gevent.sleep(resolution - time.time() % resolution)
+
+                for msg in self._scheduled.advance(time.time()):
+                    try:
+                        self.submit(msg)
+                    except Exception:
+                        # The submitter is long gone, so there's
+                        # nobody to tell
+                        self.metrics['submit_errors'].inc()
+        finally:
+            self._scheduler = None
+
+    def _dispatch_run(self):
+        """
+        The body of the dispatcher greenlet.  Delivers the queued
+        notifications, then exits; the next submission starts a new
+        dispatcher.
+        """
+
+        try:
+            self._dispatch_queued()
+        finally:
+            self._dispatcher = None
+
+    def _dispatch_queued(self):
+        """
+        Deliver the queued notifications to the subscribers, in the
+        order in which they were submitted.  Delivery doesn't yield
+        to other greenlets, so this may also be called directly to
+        deliver the queued notifications immediately.
+        """
+
+        while self._dispatch:
+            self._fanout(self._dispatch.popleft())
+
+        self._wake()
+
+    def _fanout(self, msg):
+        """
+        Deliver a notification to all current subscribers, and record
+        it for disconnected subscriber sessions.
+
+        :param msg: The ``heyu.protocol.Message`` object containing
+                    the notification to forward.
+        """
+
+        # Write the message to the shared memory ring; if it doesn't
+        # fit, it must be sent to the ring's readers directly
+        in_ring = False
+        if self._ring is not None:
+            if self._ring.write(msg.to_frame()):
+                in_ring = True
+            else:
+                self.metrics['ring_oversize'].inc()
+
+        # Forward the message to all subscribers, except for relays
+        # that have already seen it
+        path = msg.path or []
+        start = time.time()
+        for tracker in self._sessions.values():
+            if tracker.relay is not None and tracker.relay in path:
+                continue
+
+            # Hold it for the disconnected subscriber
+            if tracker.sent(msg.id, msg.to_frame(tracker.version),
+                            msg.expires):
+                self.metrics['receipts_dropped'].inc()
+        for client in self._subscribers.values():
+            if client.relay is not None and client.relay in path:
+                continue
+
+            try:
+                if client.ring and in_ring:
+                    # Only one wakeup need be pending at a time; it's
+                    # sent by _wake(), at the most urgent level of the
+                    # notifications it covers
+                    if client.wakeup is None:
+                        client.wakeup = msg.urgency
+                        self._wakeups.append(client)
+                    elif msg.urgency > client.wakeup:
+                        client.wakeup = msg.urgency
+                elif client.outbox is not None:
+                    client.outbox.push(msg.id, msg.to_frame(client.version),
+                                       msg.urgency, msg.expires)
+                else:
+                    client.send_frame(msg.to_frame(client.version))
+            except Exception:
+                # Ignore failures
+                pass
+
+        self.metrics['fanout_seconds'].observe(time.time() - start)
+
+    def _wake(self):
+        """
+        Send a single wakeup to each ring reader with notifications
+        waiting in the ring, however many were written for it.
+        """
+
+        if not self._wakeups:
+            return
+
+        wakeup = protocol.Message('wakeup').to_frame()
+        wakeups, self._wakeups = self._wakeups, []
+        for client in wakeups:
+            urgency, client.wakeup = client.wakeup, None
+
+            # The client may have been unsubscribed since
+            if client.outbox is None:
+                continue
+
             try:
-                client.send_frame(msg.to_frame(version))
+                client.outbox.push(None, wakeup, urgency)
             except Exception:
                 # Ignore failures
                 pass
 
+    def relay(self, msg):
+        """
+        Submit a notification received from an upstream hub.  The
+        notification is dropped if it has already passed through this
+        hub, or if an identical notification with the same ID was
+        recently submitted, i.e., one received from another upstream
+        hub.
+
+        :param msg: The ``heyu.protocol.Message`` object containing
+                    the notification.
+        """
+
+        # Break relay loops
+        path = msg.path or []
+        if self.name in path:
+            self.metrics['relay_loops'].inc()
+            return
+
+        # Drop duplicates arriving from different upstream hubs
+        if self._seen.get(msg.id) == _content(msg):
+            self.metrics['relay_duplicates'].inc()
+            return
+
+        # Record ourself in the path and submit it
+        notif = protocol.Message('notify', id=msg.id, app_name=msg.app_name,
+                                 summary=msg.summary, body=msg.body,
+                                 urgency=msg.urgency, category=msg.category,
+                                 path=path + [self.name],
+                                 expires=msg.expires)
+        self.submit(notif)
+
+
+def _content(msg):
+    """
+    Compute the content of a notification, for the purpose of
+    recognizing duplicates.  This excludes the relay path, which
+    differs between copies of a notification relayed by different
+    hubs.
+
+    :param msg: The ``heyu.protocol.Message`` object containing the
+                notification.
+
+    :returns: A tuple describing the notification content.
+    """
+
+    return (msg.app_name, msg.summary, msg.body, msg.urgency, msg.category)
+
 
 class HubApplication(tendril.Application):
     """
@@ -193,6 +1242,13 @@ class HubApplication(tendril.Application):
     Each instance of this class represents a single HeyU client.
     """
 
+    # A hub may have a great many idle subscribers, so keep the
+    # per-connection state small.  (The attributes of the base class
+    # still live in an instance dictionary.)
+    __slots__ = ('server', 'persist', 'outbox', 'writer', 'relay',
+                 'heartbeat', 'receipts', 'local', 'ring', 'wakeup',
+                 'version', 'hostname')
+
     def __init__(self, parent, server):
         """
         Initialize a HeyU client application.
@@ -213,13 +1269,43 @@ class HubApplication(tendril.Application):
         # Are we a persistent connection?
         self.persist = False
 
+        # Coalesced output, if enabled by the server
+        self.outbox = None
+
+        # Batched writes, if enabled by the server
+        self.writer = None
+
+        # The protocol version, once subscribed
+        self.version = None
+
+        # The name of the downstream hub, if this client is a relay
+        self.relay = None
+
+        # The heartbeat, if requested by the client
+        self.heartbeat = None
+
+        # The unacknowledged notifications, if the client acknowledges
+        # the notifications it receives
+        self.receipts = None
+
+        # Whether the client is on the same host, whether it reads
+        # notifications from the shared memory ring, and, if a wakeup
+        # is owed, the urgency to send it at
+        self.local = False
+        self.ring = False
+        self.wakeup = None
+
         # Set up the desired framer
         parent.framers = tendril.COBSFramer(True)
 
         # Determine the hostname of the client
         try:
-            if parent.remote_addr[0] in ('127.0.0.1', '::1'):
-                self.hostname = socket.getfqdn()
+            if getattr(parent, 'proto', None) == 'unix':
+                self.hostname = server.fqdn
+                self.local = True
+            elif parent.remote_addr[0] in ('127.0.0.1', '::1'):
+                self.hostname = server.fqdn
+                self.local = True
             else:
                 self.hostname, _port = socket.getnameinfo(parent.remote_addr,
                                                           0)
@@ -227,6 +1313,74 @@ class HubApplication(tendril.Application):
             # Just use the bare address
             self.hostname = parent.remote_addr[0]
 
+        # Many connections come from the same few hosts, so share the
+        # hostname strings
+        self.hostname = util.intern(self.hostname)
+
+        # Output is batched by the writer, if at all, so don't let
+        # Nagle's algorithm hold it back any further
+        if getattr(parent, 'proto', None) == 'tcp':
+            try:
+                parent.sock.setsockopt(socket.IPPROTO_TCP,
+                                       socket.TCP_NODELAY, 1)
+            except Exception:
+                pass
+
+    @property
+    def backlog(self):
+        """
+        Retrieve the number of bytes of output that have been handed
+        to the connection but not yet written.  Frames held by the
+        writer are not counted; they go out within the write delay
+        anyway, so they don't mean the client is falling behind.
+        """
+
+        # Tendril doesn't expose the size of its send buffer, so we
+        # have to peek at it
+        return len(getattr(self.parent, '_sendbuf', ''))
+
+    @property
+    def pending(self):
+        """
+        Retrieve the number of bytes of output that have not yet been
+        written to the connection, including frames held by the
+        writer.
+        """
+
+        pending = self.backlog
+        if self.writer is not None:
+            pending += len(self.writer)
+
+        return pending
+
+    def send_frame(self, frame):
+        """
+        Send a frame across the connection.  If writes are being
+        batched, the frame may be held briefly.
+
+        :param frame: The frame to send.
+        """
+
+        self.server.metrics['bytes_out'].inc(len(frame))
+        if self.writer is not None:
+            self.writer.write(frame)
+        else:
+            super(HubApplication, self).send_frame(frame)
+
+    def write_frames(self, frames):
+        """
+        Write a batch of frames to the connection.  Tendril appends
+        each frame to its send buffer, and its send thread only runs
+        once they have all been appended, so the whole batch is
+        handed to the operating system in a single write.
+
+        :param frames: A list of frames.
+        """
+
+        self.server.metrics['write_batches'].inc()
+        for frame in frames:
+            super(HubApplication, self).send_frame(frame)
+
     def recv_frame(self, frame):
         """
         Called when a frame is received.  Dispatches the appropriate
@@ -235,6 +1389,12 @@ class HubApplication(tendril.Application):
         :param frame: The received frame.
         """
 
+        self.server.metrics['bytes_in'].inc(len(frame))
+
+        # Anything received shows the client is alive
+        if self.heartbeat is not None:
+            self.heartbeat.received()
+
         # Parse the frame and dispatch to the appropriate handler
         try:
             msg = protocol.Message.from_frame(frame)
@@ -242,6 +1402,15 @@ class HubApplication(tendril.Application):
                 self.notify(msg)
             elif msg.msg_type == 'subscribe':
                 self.subscribe(msg)
+            elif msg.msg_type == 'stats':
+                self.stats()
+            elif msg.msg_type == 'ack':
+                self.ack(msg)
+            elif msg.msg_type == 'ping':
+                self.send_frame(protocol.Message('pong').to_frame())
+            elif msg.msg_type == 'pong':
+                # Already noted by the heartbeat
+                pass
             elif msg.msg_type == 'goodbye':
                 self.disconnect()
             else:
@@ -253,6 +1422,8 @@ class HubApplication(tendril.Application):
                 # Close the connection
                 self.close()
         except ValueError as e:
+            self.server.metrics['decode_errors'].inc()
+
             reason = 'Failed to decode message: %s' % e
             reply = protocol.Message('error', reason=reason)
             self.send_frame(reply.to_frame())
@@ -269,21 +1440,34 @@ class HubApplication(tendril.Application):
                     the message.
         """
 
+        start = time.time()
+
         # First, determine the message ID
-        id = msg.id or str(uuid.uuid4())
+        id = msg.id or ulid.generate()
 
         # Augment the app_name with the origin host name
         app_name = '[%s]%s' % (self.hostname, msg.app_name)
 
+        # Resolve relative times against our own clock
+        deliver_at = protocol.delivery(msg.deliver_at, msg.delay, start)
+
         # Generate a notification message
         notif = protocol.Message('notify', id=id, app_name=app_name,
                                  summary=msg.summary, body=msg.body,
-                                 urgency=msg.urgency, category=msg.category)
-
-        # Submit it to the subscribers
+                                 urgency=msg.urgency, category=msg.category,
+                                 path=[self.server.name],
+                                 expires=protocol.expiry(
+                                     msg.expires, msg.ttl,
+                                     deliver_at, start),
+                                 deliver_at=deliver_at)
+
+        # Submit it to the subscribers, subject to the rate limit
         try:
+            self.server.throttle(self.hostname, msg.app_name)
             self.server.submit(notif)
         except Exception as e:
+            self.server.metrics['submit_errors'].inc()
+
             # Notify of the error
             reason = 'Failed to submit notification: %s' % e
             reply = protocol.Message('error', reason=reason)
@@ -296,6 +1480,8 @@ class HubApplication(tendril.Application):
         if not self.persist:
             self.close()
 
+        self.server.metrics['notify_seconds'].observe(time.time() - start)
+
     def subscribe(self, msg):
         """
         A subscription request was received; subscribe the client to
@@ -305,16 +1491,24 @@ class HubApplication(tendril.Application):
                     the message.
         """
 
+        # Remember if the client is a downstream hub
+        self.relay = msg.relay
+
         # Subscribe the client to notifications
         try:
-            self.server.subscribe(self, msg.version)
+            interval = self.server.subscribe(self, msg.version,
+                                             msg.heartbeat, msg.session,
+                                             msg.ring)
         except Exception as e:
             # Notify of the error
             reason = 'Failed to subscribe: %s' % e
             reply = protocol.Message('error', reason=reason)
         else:
             # It's been accepted; send the appropriate response
-            reply = protocol.Message('subscribed')
+            reply = protocol.Message(
+                'subscribed', heartbeat=interval,
+                session=None if self.ring else msg.session,
+                ring=self.server.ring_head if self.ring else None)
 
             # Transform ourself into a persistent client
             self.persist = True
@@ -323,14 +1517,81 @@ class HubApplication(tendril.Application):
         self.send_frame(reply.to_frame())
         if not self.persist:
             self.close()
+            return
+
+        # Redeliver any notifications the client didn't acknowledge;
+        # a resumed session covers everything the client missed
+        if self.server.redeliver(self):
+            return
 
-    def disconnect(self):
+        # Bring a new client up to date, or replay any notifications
+        # a returning client missed
+        if msg.snapshot:
+            self.server.send_snapshot(self)
+        elif msg.since_id is not None or msg.since is not None:
+            self.server.replay(self, msg.since_id, msg.since)
+
+    def ack(self, msg):
         """
-        Causes the client to be disconnected from the server.
+        An acknowledgment was received; forget the acknowledged
+        notifications.
+
+        :param msg: The ``heyu.protocol.Message`` object describing
+                    the message.
         """
 
-        # Clean up client subscriptions, if any
+        # Ignore acknowledgments if we're not tracking receipts
+        if self.receipts is None:
+            return
+
+        self.server.metrics['notifications_acked'].inc(
+            self.receipts.ack(msg.seq))
+
+    def expired(self):
+        """
+        Called by the heartbeat when the client has stopped answering.
+        Evicts the client.
+        """
+
+        self.server.metrics['heartbeat_evictions'].inc()
+
+        # Clean up client subscriptions and drop the connection; the
+        # client isn't listening, so there's no point saying goodbye
         self.server.unsubscribe(self)
+        self.close()
+
+    def stats(self):
+        """
+        A statistics request was received; reply with a snapshot of the
+        hub metrics.
+        """
+
+        reply = protocol.Message('statistics',
+                                 data=self.server.metrics.snapshot())
+
+        # Send the reply and close the connection if necessary
+        self.send_frame(reply.to_frame())
+        if not self.persist:
+            self.close()
+
+    def disconnect(self, drain=False):
+        """
+        Causes the client to be disconnected from the server.
+
+        :param drain: If ``True``, any coalesced output is sent before
+                      the "goodbye" message, and the connection is
+                      left open so that the output can be written; the
+                      caller is responsible for closing it.  Defaults
+                      to ``False``.
+        """
+
+        # Flush coalesced output, which unsubscribing would discard
+        if drain and self.outbox is not None:
+            self.outbox.drain()
+
+        # Clean up client subscriptions, if any; a client that says
+        # goodbye won't be back for its unacknowledged notifications
+        self.server.unsubscribe(self, False)
 
         # Send a "goodbye" message
         try:
@@ -338,7 +1599,8 @@ class HubApplication(tendril.Application):
         except Exception:
             pass
 
-        self.close()
+        if not drain:
+            self.close()
 
     def closed(self, error):
         """
@@ -381,11 +1643,227 @@ class HubApplication(tendril.Application):
                     action='store_false',
                     help='Specifies that SSL should not be used to connect '
                     'to the hub.')
+@cli_tools.argument('--history',
+                    dest='history_size',
+                    default=1000,
+                    type=int,
+                    help='Specifies the number of recent notifications the '
+                    'hub should retain for replay to reconnecting '
+                    'notifiers.  A value of 0 disables the history.  '
+                    'Defaults to %(default)s.')
+@cli_tools.argument('--snapshot',
+                    dest='snapshot_size',
+                    default=1000,
+                    type=int,
+                    help='Specifies the number of distinct notifications '
+                    'whose latest version the hub should retain, to bring '
+                    'new notifiers up to date.  A value of 0 disables the '
+                    'snapshot.  Defaults to %(default)s.')
+@cli_tools.argument('--journal', '-j',
+                    dest='journal_dir',
+                    default=None,
+                    help='Specifies a directory in which the hub should '
+                    'keep a durable log of accepted notifications.  The '
+                    'log is used to recover the notification history when '
+                    'the hub is restarted.  By default, no log is kept.')
+@cli_tools.argument('--journal-sync',
+                    default=journal.SYNC_ALWAYS,
+                    type=journal.parse_sync,
+                    help='Specifies when the log should be synced to disk: '
+                    '"always" syncs after every notification, "none" leaves '
+                    'syncing to the operating system, and an integer syncs '
+                    'every that many milliseconds.  Notifications are not '
+                    'accepted until they have been synced.  Defaults to '
+                    '"%(default)s".')
+@cli_tools.argument('--journal-segment-size',
+                    default=16777216,
+                    type=int,
+                    help='Specifies the size, in bytes, at which a new log '
+                    'segment is started.  Defaults to %(default)s.')
+@cli_tools.argument('--journal-max-bytes',
+                    default=None,
+                    type=int,
+                    help='Specifies the maximum total size, in bytes, of the '
+                    'log.  The oldest segments are discarded to stay under '
+                    'this size.')
+@cli_tools.argument('--journal-max-age',
+                    default=None,
+                    type=int,
+                    help='Specifies the maximum age, in seconds, of a log '
+                    'segment.  Older segments are discarded.')
+@cli_tools.argument('--coalesce',
+                    default=0,
+                    type=float,
+                    help='Specifies a coalescing window, in seconds.  '
+                    'Within the window, only the newest version of each '
+                    'notification is delivered to each notifier.  By '
+                    'default, notifications are delivered immediately.')
+@cli_tools.argument('--rate-limit', '-r',
+                    default=None,
+                    type=ratelimit.parse_rate,
+                    help='Specifies a limit on the rate of submissions from '
+                    'each origin host, as the number of notifications per '
+                    'second, optionally followed by a slash and the number '
+                    'of notifications that may be submitted in a burst, '
+                    'i.e., "2/10".  By default, submissions are not '
+                    'limited.')
+@cli_tools.argument('--rate-limit-by-app',
+                    default=False,
+                    action='store_true',
+                    help='Specifies that the rate limit should be applied '
+                    'to each application on each origin host separately.')
+@cli_tools.argument('--rate-limit-defer',
+                    default=0,
+                    type=float,
+                    help='Specifies the maximum number of seconds an '
+                    'over-limit submission may be deferred.  Submissions '
+                    'that would have to wait longer are rejected with an '
+                    'error.  By default, over-limit submissions are always '
+                    'rejected.')
+@cli_tools.argument('--stats-socket', '-S',
+                    default=None,
+                    help='Specifies the path of a Unix domain socket on '
+                    'which the hub should serve its metrics as text.')
+@cli_tools.argument('--name', '-n',
+                    dest='hub_name',
+                    default=None,
+                    help='Specifies the name of the hub, used to prevent '
+                    'relay loops between federated hubs.  Each hub must '
+                    'have a distinct name.  Defaults to the fully qualified '
+                    'domain name of the host.')
+@cli_tools.argument('--relay', '-R',
+                    dest='relays',
+                    action='append',
+                    default=[],
+                    type=util.parse_hub,
+                    help='Specifies an upstream hub, as "hostname" or '
+                    '"hostname:port", whose notifications should be '
+                    'relayed to this hub\'s notifiers.  May be given more '
+                    'than once.')
+@cli_tools.argument('--standby', '-s',
+                    default=None,
+                    type=util.parse_hub,
+                    help='Specifies a primary hub, as "hostname" or '
+                    '"hostname:port", for which this hub should act as a '
+                    'standby.  The standby follows the notifications '
+                    'accepted by the primary, and takes over if the primary '
+                    'becomes unreachable.')
+@cli_tools.argument('--failover',
+                    default=5.0,
+                    type=float,
+                    help='Specifies the number of seconds the primary hub '
+                    'may be unreachable before a standby hub takes over.  '
+                    'Defaults to %(default)s.')
+@cli_tools.argument('--unix-socket', '-u',
+                    default=None,
+                    help='Specifies the path of a Unix domain socket on '
+                    'which the hub should accept connections from local '
+                    'clients.  These connections are not encrypted, and are '
+                    'authenticated by the user ID of the connecting process '
+                    'rather than by certificate.')
+@cli_tools.argument('--unix-allow',
+                    dest='unix_allow',
+                    action='append',
+                    default=None,
+                    type=unix.parse_user,
+                    help='Specifies a user name or user ID allowed to '
+                    'connect to the Unix domain socket.  May be given more '
+                    'than once.  By default, only the user running the hub '
+                    'may connect.')
+@cli_tools.argument('--drain-timeout',
+                    default=5.0,
+                    type=float,
+                    help='Specifies the maximum number of seconds the hub '
+                    'should wait, when stopping, for pending output to '
+                    'notifiers to be written.  If 0, connections are closed '
+                    'immediately.  Defaults to %(default)s.')
+@cli_tools.argument('--endpoints-file', '-E',
+                    default=None,
+                    help='Specifies the path of a file listing endpoints to '
+                    'listen on, one per line, as "address" or '
+                    '"address:port".  The file is re-read when the hub '
+                    'receives SIGHUP, and listeners are added or removed to '
+                    'match; the certificates are also re-read.')
+@cli_tools.argument('--udp-endpoint',
+                    default=None,
+                    help='Specifies an endpoint, as "address" or '
+                    '"address:port", on which the hub should accept '
+                    'notifications in single UDP datagrams.  No reply is '
+                    'sent, and lost datagrams are not retried.  Requires '
+                    '--udp-key-file.')
+@cli_tools.argument('--udp-key-file',
+                    default=None,
+                    help='Specifies the path of a file containing the '
+                    'shared key used to authenticate UDP datagrams.')
+@cli_tools.argument('--heartbeat-min',
+                    default=5.0,
+                    type=float,
+                    help='Specifies the shortest heartbeat interval, in '
+                    'seconds, that notifiers may request.  Notifiers that '
+                    'miss %d heartbeats in a row are disconnected.  '
+                    'Defaults to %%(default)s.' % HubServer.heartbeat_misses)
+@cli_tools.argument('--lag-threshold',
+                    default=None,
+                    type=float,
+                    help='Specifies that the event loop should be monitored, '
+                    'and that any callback blocking it for longer than this '
+                    'many seconds should be logged with its stack.  The '
+                    'loop lag is also included in the statistics.')
+@cli_tools.argument('--lag-log',
+                    default=None,
+                    help='Specifies the path of a file to which slow '
+                    'callbacks should be logged.  By default, they are '
+                    'logged to standard error.')
+@cli_tools.argument('--ring',
+                    dest='ring_path',
+                    default=None,
+                    help='Specifies the path of a shared memory file, '
+                    'typically under "/dev/shm", into which the hub should '
+                    'write each notification once.  Notifiers on the same '
+                    'host that ask for the ring read notifications from it '
+                    'instead of receiving their own copies.  Note that any '
+                    'local user can read the ring.')
+@cli_tools.argument('--ring-size',
+                    default=4 * 1024 * 1024,
+                    type=int,
+                    help='Specifies the capacity of the shared memory ring, '
+                    'in bytes.  Defaults to %(default)s.')
+@cli_tools.argument('--write-delay',
+                    default=0,
+                    type=float,
+                    help='Specifies the longest time, in seconds, output to '
+                    'a notifier may be held so that it can be written '
+                    'together with the output that follows it.  By '
+                    'default, output is written as soon as possible.')
+@cli_tools.argument('--write-budget',
+                    default=65536,
+                    type=int,
+                    help='Specifies the number of bytes of held output at '
+                    'which it is written without waiting for the write '
+                    'delay to expire.  Defaults to %(default)s.')
+@cli_tools.argument('--loop',
+                    default=None,
+                    help='Specifies the event loop gevent should use, as '
+                    '"loop" or "loop:backend".  The loop is one of "libev", '
+                    '"libev-cffi", or "libuv"; the backend, for the libev '
+                    'loops, is a polling mechanism such as "epoll" or '
+                    '"poll".  Defaults to the value of the HEYU_LOOP '
+                    'environment variable, or to gevent\'s default.')
 @cli_tools.argument('--debug', '-d',
                     default=False,
                     action='store_true',
                     help='Enables debugging.')
-def start_hub(endpoints, cert_conf=None, secure=True):
+def start_hub(endpoints, cert_conf=None, secure=True, history_size=1000,
+              journal_dir=None, journal_sync=journal.SYNC_ALWAYS,
+              journal_segment_size=16777216, journal_max_bytes=None,
+              journal_max_age=None, coalesce=0, rate_limit=None,
+              rate_limit_by_app=False, rate_limit_defer=0,
+              stats_socket=None, hub_name=None, relays=None, standby=None,
+              failover=5.0, unix_socket=None, unix_allow=None,
+              udp_endpoint=None, udp_key_file=None, drain_timeout=5.0,
+              endpoints_file=None, heartbeat_min=5.0, lag_threshold=None,
+              lag_log=None, ring_path=None, ring_size=4 * 1024 * 1024,
+              write_delay=0, write_budget=65536, snapshot_size=1000):
     """
     Starts the HeyU hub.  Note that certificate configuration is
     specified in "~/.heyu.cert" by default.
@@ -397,10 +1875,110 @@ def start_hub(endpoints, cert_conf=None, secure=True):
                       Optional.
     :param secure: If ``False``, SSL will not be used.  Defaults to
                    ``True``.
+    :param history_size: The number of recent notifications to retain
+                         for replay to reconnecting notifiers.
+    :param journal_dir: The directory in which to keep the durable
+                        log of accepted notifications.  Optional.
+    :param journal_sync: The fsync policy for the log; see
+                         ``heyu.journal.parse_sync()``.
+    :param journal_segment_size: The size, in bytes, at which a new
+                                 log segment is started.
+    :param journal_max_bytes: The maximum total size, in bytes, of the
+                              log.  Optional.
+    :param journal_max_age: The maximum age, in seconds, of a log
+                            segment.  Optional.
+    :param coalesce: The coalescing window, in seconds.  If 0,
+                     notifications are delivered immediately.
+    :param rate_limit: A tuple of the rate, in notifications per
+                       second, and the burst size of the submission
+                       rate limit.  Optional.
+    :param rate_limit_by_app: If ``True``, the rate limit is applied
+                              per application as well as per origin
+                              host.
+    :param rate_limit_defer: The maximum number of seconds an
+                             over-limit submission may be deferred.
+    :param stats_socket: The path of a Unix domain socket on which to
+                         serve the metrics as text.  Optional.
+    :param hub_name: The name of the hub, used to prevent relay
+                     loops.  Optional.
+    :param relays: A list of tuples of the hostnames and ports of
+                   upstream hubs to relay notifications from.
+                   Optional.
+    :param standby: A tuple of the hostname and port of a primary hub
+                    for which this hub should act as a standby.
+                    Optional.
+    :param failover: The number of seconds the primary hub may be
+                     unreachable before a standby hub takes over.
+    :param unix_socket: The path of a Unix domain socket on which to
+                        accept connections from local clients.
+                        Optional.
+    :param unix_allow: A list of the user IDs allowed to connect to
+                       the Unix domain socket.  If not given, only the
+                       user running the hub may connect.
+    :param udp_endpoint: A tuple of the address and port on which to
+                         accept notifications in single datagrams.
+                         Optional.
+    :param udp_key_file: The path of a file containing the shared key
+                         used to authenticate the datagrams.  Required
+                         if ``udp_endpoint`` is given.
+    :param drain_timeout: The maximum number of seconds to wait, when
+                          stopping, for pending output to notifiers to
+                          be written.
+    :param endpoints_file: The path of a file listing additional
+                           endpoints to listen on.  Optional.
+    :param heartbeat_min: The shortest heartbeat interval, in seconds,
+                          that notifiers may request.
+    :param lag_threshold: If given, the event loop is monitored, and
+                          callbacks that block it for longer than this
+                          many seconds are logged.  Optional.
+    :param lag_log: The path of a file to which slow callbacks are
+                    logged.  Defaults to standard error.
+    :param ring_path: The path of a shared memory file to write
+                      notifications into, for local notifiers.
+                      Optional.
+    :param ring_size: The capacity of the shared memory ring, in
+                      bytes.
+    :param write_delay: The longest time, in seconds, output to a
+                        notifier may be held so that it can be written
+                        together with the output that follows it.  If
+                        0, output is written as soon as possible.
+    :param write_budget: The number of bytes of held output at which
+                         it is written without waiting for the write
+                         delay to expire.
+    :param snapshot_size: The number of distinct notifications whose
+                          latest version is retained, to bring new
+                          notifiers up to date.
     """
 
+    # Set up the journal
+    jrnl = None
+    if journal_dir:
+        jrnl = journal.Journal(journal_dir, journal_sync,
+                               journal_segment_size, journal_max_bytes,
+                               journal_max_age)
+
+    # Set up the rate limiter
+    limiter = None
+    if rate_limit:
+        limiter = ratelimit.RateLimiter(rate_limit[0], rate_limit[1],
+                                        rate_limit_by_app, rate_limit_defer)
+
+    # Read the datagram key
+    udp_key = None
+    if udp_endpoint:
+        udp_key = udp.read_key(udp_key_file)
+
+    # Set up logging of slow callbacks
+    if lag_threshold:
+        looplag.configure_log(lag_log)
+
     # Initialize the server
-    server = HubServer(endpoints)
+    server = HubServer(endpoints, history_size, jrnl, coalesce, limiter,
+                       stats_socket, hub_name, relays, standby, failover,
+                       unix_socket, set(unix_allow) if unix_allow else None,
+                       udp_endpoint, udp_key, drain_timeout, endpoints_file,
+                       heartbeat_min, lag_threshold, ring_path, ring_size,
+                       write_delay, write_budget, snapshot_size)
 
     # Start it
     server.start(cert_conf, secure)
@@ -419,16 +1997,42 @@ def _normalize_args(args):
                   normalization.
     """
 
+    # Select the event loop before anything creates it
+    loops.select(args.loop)
+
     # If no endpoints have been set up, set up the defaults
-    if not args.endpoints:
+    if not args.endpoints and not args.endpoints_file:
         args.endpoints = [('', util.HEYU_PORT)]
         if socket.has_ipv6:
             args.endpoints.append(('::', util.HEYU_PORT))
-    else:
+    elif args.endpoints:
         # Resolve the endpoints
         args.endpoints = [util.parse_hub(endpoint)
                           for endpoint in args.endpoints]
 
+    # The datagram endpoint needs a key
+    if args.udp_endpoint:
+        if not args.udp_key_file:
+            raise udp.UDPException('--udp-endpoint requires --udp-key-file')
+        args.udp_endpoint = util.parse_hub(args.udp_endpoint)
+
+    # The journal directory, the sockets, and the key file must
+    # survive the change of directory
+    if args.journal_dir:
+        args.journal_dir = os.path.abspath(args.journal_dir)
+    if args.stats_socket:
+        args.stats_socket = os.path.abspath(args.stats_socket)
+    if args.unix_socket:
+        args.unix_socket = os.path.abspath(args.unix_socket)
+    if args.udp_key_file:
+        args.udp_key_file = os.path.abspath(args.udp_key_file)
+    if args.endpoints_file:
+        args.endpoints_file = os.path.abspath(args.endpoints_file)
+    if args.lag_log:
+        args.lag_log = os.path.abspath(args.lag_log)
+    if args.ring_path:
+        args.ring_path = os.path.abspath(args.ring_path)
+
     # Go into the background if requested, and not in debug mode
     if args.daemon and not args.debug:
         util.daemonize(pidfile=args.pid_file)
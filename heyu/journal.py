@@ -0,0 +1,370 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import re
+import struct
+import time
+import zlib
+
+import gevent
+import gevent.event
+import gevent.lock
+
+
+# The fsync policies
+SYNC_ALWAYS = 'always'
+SYNC_NONE = 'none'
+
+# Each record in a segment is a header, consisting of the length of
+# the frame, a CRC-32 of the frame, and the time at which the frame
+# was recorded, followed by the frame itself
+_header = struct.Struct('>IId')
+
+# Segment files are named after their sequence number
+_segment_fmt = '%016d.seg'
+_segment_re = re.compile(r'^(?P<seq>\d{16})\.seg$')
+
+
+class JournalException(Exception):
+    """
+    Exception raised if there's an error with the journal
+    configuration.
+    """
+
+    pass
+
+
+def parse_sync(value):
+    """
+    Parse an fsync policy specification.
+
+    :param value: The fsync policy.  May be "always", to sync after
+                  every record; "none", to leave syncing to the
+                  operating system; or an integer number of
+                  milliseconds, to sync at that interval.
+
+    :returns: One of ``SYNC_ALWAYS`` or ``SYNC_NONE``, or the sync
+              interval as a floating point number of seconds.
+    """
+
+    value = value.strip().lower()
+    if value in (SYNC_ALWAYS, SYNC_NONE):
+        return value
+
+    try:
+        interval = int(value)
+    except ValueError:
+        raise JournalException("Could not understand fsync policy '%s'" %
+                               value)
+
+    if interval <= 0:
+        raise JournalException("The fsync interval must be positive")
+
+    return interval / 1000.0
+
+
+class Journal(object):
+    """
+    A durable, append-only, segmented log of accepted notifications.
+    Notifications are appended to the current segment as their
+    encoded frames; once a segment grows too large, a new one is
+    started, and old segments are discarded based on the total size
+    of the journal or on their age.  On startup, the journal may be
+    read back to recover the notifications.
+    """
+
+    def __init__(self, directory, sync=SYNC_ALWAYS, segment_size=16777216,
+                 max_bytes=None, max_age=None):
+        """
+        Initialize a ``Journal`` object.
+
+        :param directory: The directory in which to keep the journal
+                          segments.  It will be created if it does not
+                          exist.
+        :param sync: The fsync policy.  May be ``SYNC_ALWAYS``,
+                     ``SYNC_NONE``, or a sync interval in seconds.
+                     Defaults to ``SYNC_ALWAYS``.
+        :param segment_size: The size, in bytes, beyond which a new
+                             segment is started.  Defaults to 16 MiB.
+        :param max_bytes: The maximum total size, in bytes, of the
+                          journal.  Old segments are discarded to stay
+                          under this size.  Optional.
+        :param max_age: The maximum age, in seconds, of a segment.
+                        Segments last written longer ago than this
+                        are discarded.  Optional.
+        """
+
+        self._directory = directory
+        self._sync = sync
+        self._segment_size = segment_size
+        self._max_bytes = max_bytes
+        self._max_age = max_age
+
+        # The current segment, its sequence number, and its size
+        self._fd = None
+        self._seq = 0
+        self._size = 0
+
+        # Support for syncing; appenders wait on the event, which is
+        # set once the data has been synced.  The syncs themselves run
+        # in the hub's thread pool, so the lock keeps the segment from
+        # being closed out from under a sync in progress
+        self._dirty = False
+        self._synced = gevent.event.Event()
+        self._syncer = None
+        self._lock = gevent.lock.Semaphore()
+
+    def _segments(self):
+        """
+        Retrieve the existing segments.
+
+        :returns: A sorted list of tuples of the sequence number and
+                  the path of each segment.
+        """
+
+        segments = []
+        for fname in os.listdir(self._directory):
+            match = _segment_re.match(fname)
+            if match:
+                segments.append((int(match.group('seq')),
+                                 os.path.join(self._directory, fname)))
+
+        return sorted(segments)
+
+    def _read_segment(self, path):
+        """
+        Read the records from a segment.  Reading stops at the first
+        torn or corrupt record, which can only result from a crash
+        while the record was being written.
+
+        :param path: The path to the segment.
+
+        :returns: A list of tuples of the timestamp and the frame of
+                  each record.
+        """
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        records = []
+        offset = 0
+        while offset + _header.size <= len(data):
+            length, crc, timestamp = _header.unpack_from(data, offset)
+            start = offset + _header.size
+            frame = data[start:start + length]
+            if (len(frame) < length or
+                    zlib.crc32(frame) & 0xffffffff != crc):
+                break
+            records.append((timestamp, frame))
+            offset = start + length
+
+        return records
+
+    def recover(self):
+        """
+        Read back the notifications stored in the journal.  This must
+        be called before ``open()``.
+
+        :returns: A list of tuples of the timestamp and the frame of
+                  each notification, oldest first.
+        """
+
+        # Make sure the journal directory exists
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+
+        records = []
+        for seq, path in self._segments():
+            records.extend(self._read_segment(path))
+            self._seq = seq
+
+        return records
+
+    def open(self):
+        """
+        Open the journal for appending.  A new segment is always
+        started, so that new records are never appended after a torn
+        record.
+        """
+
+        # Make sure the journal directory exists
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+
+        # Start with a fresh segment
+        self._roll()
+
+        # Start the syncer if needed
+        if self._sync not in (SYNC_ALWAYS, SYNC_NONE):
+            self._syncer = gevent.spawn(self._sync_loop)
+
+    def close(self):
+        """
+        Close the journal.  Any outstanding data is synced first.
+        """
+
+        with self._lock:
+            # Stop the syncer
+            if self._syncer is not None:
+                self._syncer.kill()
+                self._syncer = None
+
+            if self._fd is not None:
+                if self._sync != SYNC_NONE:
+                    self._fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
+
+        # Release anyone waiting for a sync
+        self._dirty = False
+        self._synced.set()
+
+    def _roll(self):
+        """
+        Start a new segment, then discard old segments as dictated by
+        the retention policy.  Once the journal is open, this must be
+        called with the lock held.
+        """
+
+        # Open the next segment; records are appended to it from now
+        # on
+        old_fd = self._fd
+        self._seq += 1
+        path = os.path.join(self._directory, _segment_fmt % self._seq)
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                           0o600)
+        self._size = 0
+
+        # Close out the previous segment
+        if old_fd is not None:
+            if self._sync != SYNC_NONE:
+                self._fsync(old_fd)
+            os.close(old_fd)
+
+        # Apply the retention policy
+        self._retain()
+
+    def _retain(self):
+        """
+        Discard old segments.  The current segment is never discarded.
+        """
+
+        # Collect the sizes and modification times of the segments
+        segments = []
+        for seq, path in self._segments():
+            if seq == self._seq:
+                continue
+            stat = os.stat(path)
+            segments.append((path, stat.st_size, stat.st_mtime))
+
+        total = sum(size for _path, size, _mtime in segments)
+        horizon = time.time() - self._max_age if self._max_age else None
+        for path, size, mtime in segments:
+            if ((self._max_bytes is None or total <= self._max_bytes) and
+                    (horizon is None or mtime >= horizon)):
+                break
+
+            os.unlink(path)
+            total -= size
+
+    def _fsync(self, fd):
+        """
+        Sync a segment.  The sync is performed in the hub's thread
+        pool, so that only the greenlets waiting for it are blocked,
+        rather than the whole event loop.
+
+        :param fd: The file descriptor of the segment.
+        """
+
+        gevent.get_hub().threadpool.apply(os.fsync, (fd,))
+
+    def _flush(self):
+        """
+        Sync the records written so far, waking up any appenders
+        waiting for them to become durable.
+        """
+
+        with self._lock:
+            # Records written while the sync is in progress must wait
+            # for the next one
+            self._dirty = False
+            synced = self._synced
+            self._synced = gevent.event.Event()
+
+            self._fsync(self._fd)
+
+        synced.set()
+
+    def _sync_loop(self):
+        """
+        Sync the journal at the configured interval.
+        """
+
+        while True:
+            gevent.sleep(self._sync)
+
+            if self._dirty:
+                self._flush()
+
+    def _sync_pending(self):
+        """
+        Sync the journal until there are no more records waiting to
+        become durable.  Appenders arriving while a sync is in
+        progress are synced together by the next one.
+        """
+
+        try:
+            while self._dirty:
+                self._flush()
+        finally:
+            self._syncer = None
+
+    def append(self, frame, timestamp=None):
+        """
+        Append a notification to the journal.  Returns once the record
+        has reached the configured durability level.
+
+        :param frame: The encoded frame for the notification.
+        :param timestamp: The time at which the notification was
+                          received, as a UNIX timestamp.  If not
+                          given, the current time is used.
+        """
+
+        if self._fd is None:
+            raise JournalException('journal is not open')
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        # Build and write the record
+        record = _header.pack(len(frame), zlib.crc32(frame) & 0xffffffff,
+                              timestamp) + frame
+        os.write(self._fd, record)
+        self._size += len(record)
+
+        # Make the record durable
+        if self._sync != SYNC_NONE:
+            self._dirty = True
+            if self._sync == SYNC_ALWAYS and self._syncer is None:
+                self._syncer = gevent.spawn(self._sync_pending)
+            self._synced.wait()
+
+        # Start a new segment if this one is full
+        if self._size >= self._segment_size:
+            with self._lock:
+                # Another appender may have beaten us to it
+                if self._size >= self._segment_size:
+                    self._roll()
@@ -0,0 +1,182 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+
+import gevent
+
+from heyu import metrics
+
+
+LOG = logging.getLogger(__name__)
+
+
+def configure_log(path=None):
+    """
+    Arrange for the reports of the event loop monitor to be logged.
+
+    :param path: The path of a file to append the reports to.  If not
+                 given, the reports are written to standard error.
+    """
+
+    if path:
+        handler = logging.FileHandler(path)
+    else:
+        handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(
+        '%(asctime)s %(levelname)s %(message)s'))
+
+    LOG.addHandler(handler)
+    LOG.setLevel(logging.INFO)
+
+
+class LoopMonitor(object):
+    """
+    Monitors the gevent event loop.  A greenlet repeatedly sleeps for
+    a short interval and records how much later than requested it
+    was woken, which is the time other callbacks kept the loop busy.
+    A separate thread watches that greenlet; if it is not woken
+    within the threshold, whatever is blocking the loop is still
+    running, so the thread captures its stack and logs it.
+    """
+
+    # The number of slow callback reports to retain
+    max_reports = 10
+
+    def __init__(self, threshold, registry=None, interval=None):
+        """
+        Initialize a ``LoopMonitor`` object.
+
+        :param threshold: The number of seconds a callback may run
+                          before it is reported as slow.
+        :param registry: An instance of ``heyu.metrics.Registry`` in
+                         which to register the monitor's metrics.
+                         If not given, a new registry is created.
+        :param interval: How often to sample the lag, in seconds.
+                         Defaults to half the threshold.
+        """
+
+        self.threshold = threshold
+        self.interval = interval or threshold / 2.0
+
+        # Set up the metrics
+        if registry is None:
+            registry = metrics.Registry()
+        self.metrics = registry
+        self._lag = self.metrics.histogram('loop_lag_seconds')
+        self._slow = self.metrics.counter('slow_callbacks')
+
+        # The most recent slow callback reports, as tuples of the
+        # time the loop was blocked for and the formatted stack
+        self.reports = collections.deque(maxlen=self.max_reports)
+
+        # The time the sampling greenlet last went to sleep, and the
+        # last such time for which a report was made
+        self._tick = None
+        self._reported = None
+
+        # The sampling greenlet and the watching thread
+        self._sampler = None
+        self._watcher = None
+        self._ident = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """
+        Start monitoring the event loop.  Must be called from the
+        thread running the event loop.
+        """
+
+        if self._sampler is not None:
+            return
+
+        self._tick = time.time()
+        self._ident = threading.current_thread().ident
+        self._stopped.clear()
+        self._sampler = gevent.spawn(self._sample)
+        self._watcher = threading.Thread(target=self._watch,
+                                         name='heyu-looplag')
+        self._watcher.daemon = True
+        self._watcher.start()
+
+    def stop(self):
+        """
+        Stop monitoring the event loop.
+        """
+
+        if self._sampler is None:
+            return
+
+        self._stopped.set()
+        self._sampler.kill()
+        self._sampler = None
+        self._watcher = None
+
+    def _sample(self):
+        """
+        Sample the event loop lag.
+        """
+
+        while True:
+            self._tick = time.time()
+            gevent.sleep(self.interval)
+            lag = time.time() - self._tick - self.interval
+            self._lag.observe(max(lag, 0.0))
+
+    def _watch(self):
+        """
+        Watch for callbacks blocking the event loop.  Runs in a
+        separate thread.
+        """
+
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def check(self, now=None):
+        """
+        Check whether the event loop is blocked, and report the
+        callback blocking it if so.  Each blocking callback is
+        reported once.
+
+        :param now: The current time.  Defaults to the result of
+                    ``time.time()``.
+
+        :returns: ``True`` if a slow callback was reported.
+        """
+
+        if now is None:
+            now = time.time()
+
+        tick = self._tick
+        blocked = now - tick - self.interval
+        if blocked <= self.threshold or tick == self._reported:
+            return False
+        self._reported = tick
+
+        # Capture the stack of whatever is running in the loop
+        frame = sys._current_frames().get(self._ident)
+        stack = ''.join(traceback.format_stack(frame)) if frame else ''
+
+        self._slow.inc()
+        self.reports.append((blocked, stack))
+        LOG.warning('Event loop blocked for %.3f seconds:\n%s',
+                    blocked, stack)
+
+        return True
@@ -0,0 +1,135 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import gevent
+import gevent.hub
+
+
+# The environment variable consulted if no event loop is specified
+LOOP_ENV = 'HEYU_LOOP'
+
+# The event loop implementations, mapped to the names gevent's
+# configuration knows them by
+_loops = {
+    'libev': 'libev-cext',
+    'libev-cffi': 'libev-cffi',
+    'libuv': 'libuv-cffi',
+}
+
+
+class LoopException(Exception):
+    """
+    Exception raised if the requested event loop cannot be used.
+    """
+
+    pass
+
+
+def parse(spec):
+    """
+    Parse an event loop specification.
+
+    :param spec: The event loop specification, as "loop",
+                 "loop:backend", or ":backend".  The loop is one of
+                 "libev", "libev-cffi", or "libuv"; the backend is
+                 the polling mechanism for the libev loops to use,
+                 such as "epoll", "poll", or "select".
+
+    :returns: A tuple of the loop and the backend.  Either may be
+              ``None`` if not specified.
+    """
+
+    loop, _sep, backend = spec.strip().partition(':')
+    loop = loop or None
+    backend = backend or None
+
+    if loop is not None and loop not in _loops:
+        raise LoopException("Unknown event loop '%s'; choose from %s" %
+                            (loop, ', '.join(sorted(_loops))))
+    if backend is not None and loop == 'libuv':
+        raise LoopException("The libuv event loop does not take a backend")
+
+    return loop, backend
+
+
+def _hub_exists():
+    """
+    Determine whether the gevent hub, and thus the event loop, has
+    already been created.
+
+    :returns: ``True`` if the hub exists, ``False`` otherwise.
+    """
+
+    get_hub = getattr(gevent.hub, '_get_hub', None)
+    if get_hub is not None:
+        return get_hub() is not None
+
+    # Older versions of gevent keep it in a thread local
+    return getattr(gevent.hub._threadlocal, 'hub', None) is not None
+
+
+def select(spec=None):
+    """
+    Select the event loop for gevent to use.  This must be called
+    before anything uses gevent, since the loop is created with the
+    gevent hub.
+
+    :param spec: The event loop specification; see ``parse()``.  If
+                 not given, the value of the "HEYU_LOOP" environment
+                 variable is used.  If that isn't set either, gevent's
+                 own default is left alone.
+
+    :returns: A tuple of the selected loop and backend, or ``None``
+              if gevent's default was left alone.
+    """
+
+    if spec is None:
+        spec = os.environ.get(LOOP_ENV)
+    if not spec:
+        return None
+
+    loop, backend = parse(spec)
+
+    if _hub_exists():
+        raise LoopException('The event loop has already been created')
+
+    config = getattr(gevent, 'config', None)
+    if config is None:
+        # Before gevent 1.3, only the libev loop is available, but
+        # its backend may still be chosen
+        if loop not in (None, 'libev'):
+            raise LoopException("gevent %s only supports the libev event "
+                                "loop" % gevent.__version__)
+        if backend is not None:
+            from gevent import core
+            if backend not in core.supported_backends():
+                raise LoopException("Unsupported event loop backend '%s'" %
+                                    backend)
+            gevent.hub.Hub.backend = backend
+    else:
+        try:
+            if loop is not None:
+                config.loop = _loops[loop]
+            if backend is not None:
+                config.libev_backend = backend
+
+            # Make sure the loop can actually be loaded
+            config.loop
+        except Exception as e:
+            raise LoopException("Cannot use event loop '%s': %s" % (spec, e))
+
+    return loop, backend
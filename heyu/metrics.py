@@ -0,0 +1,342 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bisect
+import collections
+import os
+
+import gevent.server
+from gevent import socket
+
+
+# Default histogram bucket boundaries, suitable for latencies
+# measured in seconds
+LATENCY_BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                  0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter(object):
+    """
+    A monotonically increasing counter.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        """
+        Initialize a ``Counter`` object.
+        """
+
+        self.value = 0
+
+    def inc(self, amount=1):
+        """
+        Increment the counter.
+
+        :param amount: The amount to increment the counter by.
+                       Defaults to 1.
+        """
+
+        self.value += amount
+
+    def collect(self):
+        """
+        Retrieve the value of the counter.
+
+        :returns: The value of the counter.
+        """
+
+        return self.value
+
+
+class Gauge(object):
+    """
+    A gauge.  The value of the gauge is computed by calling a function
+    only when the gauge is collected, so that gauges cost nothing
+    until they are inspected.
+    """
+
+    __slots__ = ('_func',)
+
+    def __init__(self, func):
+        """
+        Initialize a ``Gauge`` object.
+
+        :param func: A callable taking no arguments and returning the
+                     current value of the gauge.
+        """
+
+        self._func = func
+
+    def collect(self):
+        """
+        Retrieve the value of the gauge.
+
+        :returns: The value of the gauge.
+        """
+
+        return self._func()
+
+
+class Histogram(object):
+    """
+    A histogram with fixed bucket boundaries.  Observations are
+    counted in the first bucket whose upper bound is greater than or
+    equal to the observed value; values greater than the last bound
+    are counted in an overflow bucket.
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        """
+        Initialize a ``Histogram`` object.
+
+        :param bounds: A sorted sequence of the upper bounds of the
+                       buckets.  Defaults to ``LATENCY_BOUNDS``.
+        """
+
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Record an observation.
+
+        :param value: The observed value.
+        """
+
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def collect(self):
+        """
+        Retrieve the state of the histogram.
+
+        :returns: A dictionary with the keys "count", giving the
+                  number of observations; "sum", giving the sum of the
+                  observed values; and "buckets", giving a list of
+                  pairs of the upper bound of each bucket and the
+                  cumulative number of observations less than or
+                  equal to that bound.  The upper bound of the
+                  overflow bucket is ``None``.
+        """
+
+        buckets = []
+        total = 0
+        for bound, count in zip(self.bounds + (None,), self.counts):
+            total += count
+            buckets.append([bound, total])
+
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': buckets,
+        }
+
+
+class Registry(object):
+    """
+    A registry of named metrics.  Metrics are cheap to update, so that
+    collection may be left enabled in production; the cost of
+    formatting them is only paid when they are inspected.
+    """
+
+    def __init__(self):
+        """
+        Initialize a ``Registry`` object.
+        """
+
+        self._metrics = collections.OrderedDict()
+
+    def __getitem__(self, name):
+        """
+        Retrieve a metric.
+
+        :param name: The name of the metric.
+
+        :returns: The metric.
+        """
+
+        return self._metrics[name]
+
+    def __contains__(self, name):
+        """
+        Determine whether a metric has been registered.
+
+        :param name: The name of the metric.
+
+        :returns: ``True`` if the metric exists.
+        """
+
+        return name in self._metrics
+
+    def _register(self, name, metric):
+        """
+        Register a metric.
+
+        :param name: The name of the metric.
+        :param metric: The metric.
+
+        :returns: The metric.
+        """
+
+        if name in self._metrics:
+            raise ValueError("metric '%s' is already registered" % name)
+
+        self._metrics[name] = metric
+        return metric
+
+    def counter(self, name):
+        """
+        Register a counter.
+
+        :param name: The name of the counter.
+
+        :returns: The ``Counter``.
+        """
+
+        return self._register(name, Counter())
+
+    def gauge(self, name, func):
+        """
+        Register a gauge.
+
+        :param name: The name of the gauge.
+        :param func: A callable taking no arguments and returning the
+                     current value of the gauge.
+
+        :returns: The ``Gauge``.
+        """
+
+        return self._register(name, Gauge(func))
+
+    def histogram(self, name, bounds=LATENCY_BOUNDS):
+        """
+        Register a histogram.
+
+        :param name: The name of the histogram.
+        :param bounds: A sorted sequence of the upper bounds of the
+                       buckets.  Defaults to ``LATENCY_BOUNDS``.
+
+        :returns: The ``Histogram``.
+        """
+
+        return self._register(name, Histogram(bounds))
+
+    def snapshot(self):
+        """
+        Collect the values of all the metrics.
+
+        :returns: A dictionary mapping the name of each metric to its
+                  value.
+        """
+
+        return dict((name, metric.collect())
+                    for name, metric in self._metrics.items())
+
+    def render(self):
+        """
+        Render the values of all the metrics as text.  Each line
+        contains the name of a metric and its value, separated by a
+        space; histograms are rendered as a line for the count, the
+        sum, and each bucket.
+
+        :returns: The rendered text.
+        """
+
+        lines = []
+        for name, metric in self._metrics.items():
+            value = metric.collect()
+            if isinstance(metric, Histogram):
+                lines.append('%s_count %d' % (name, value['count']))
+                lines.append('%s_sum %r' % (name, value['sum']))
+                for bound, count in value['buckets']:
+                    lines.append('%s_bucket{le="%s"} %d' %
+                                 (name, '+Inf' if bound is None else
+                                  repr(bound), count))
+            else:
+                lines.append('%s %r' % (name, value))
+
+        return '\n'.join(lines) + '\n'
+
+
+class StatsServer(object):
+    """
+    Serves the rendered metrics over a local Unix domain socket.  Each
+    connection receives the current values of the metrics as text,
+    after which the connection is closed.
+    """
+
+    def __init__(self, registry, path):
+        """
+        Initialize a ``StatsServer`` object.
+
+        :param registry: The ``Registry`` of metrics to serve.
+        :param path: The path of the Unix domain socket.
+        """
+
+        self._registry = registry
+        self._path = path
+        self._server = None
+
+    def _handle(self, sock, addr):
+        """
+        Handle a connection.
+
+        :param sock: The connected socket.
+        :param addr: The address of the peer.  Ignored.
+        """
+
+        try:
+            sock.sendall(self._registry.render().encode('utf-8'))
+        finally:
+            sock.close()
+
+    def start(self):
+        """
+        Start serving the metrics.  Any stale socket left at the path
+        is replaced.
+        """
+
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self._path)
+        os.chmod(self._path, 0o600)
+        listener.listen(16)
+
+        self._server = gevent.server.StreamServer(listener, self._handle)
+        self._server.start()
+
+    def stop(self):
+        """
+        Stop serving the metrics and remove the socket.
+        """
+
+        if self._server is None:
+            return
+
+        self._server.stop()
+        self._server = None
+
+        try:
+            os.unlink(self._path)
+        except OSError:
+            pass
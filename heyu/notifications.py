@@ -27,7 +27,11 @@ import gevent
 import gevent.event
 import tendril
 
+from heyu import heartbeat
+from heyu import looplag
+from heyu import loops
 from heyu import protocol
+from heyu import shmring
 from heyu import util
 
 
@@ -45,7 +49,8 @@ class NotificationServer(object):
     """
 
     def __init__(self, hub, cert_conf=None, secure=True, app_name=None,
-                 app_id=None):
+                 app_id=None, heartbeat=30.0, lag_threshold=None,
+                 ring=None, loop=None, snapshot=False):
         """
         Initialize a ``NotificationServer`` object.
 
@@ -61,8 +66,33 @@ class NotificationServer(object):
         :param app_id: A UUID for notifications generated internal to
                        the notifier.  If not specified, a random UUID
                        will be generated.
+        :param heartbeat: The heartbeat interval to request from the
+                          hub, in seconds.  If the hub stops sending
+                          heartbeats, the connection is presumed dead
+                          and closed.  If ``None``, no heartbeat is
+                          requested.  Defaults to 30 seconds.
+        :param lag_threshold: If given, the event loop is monitored,
+                              and callbacks that block it for longer
+                              than this many seconds are logged to
+                              standard error.  Optional.
+        :param ring: The path of the hub's shared memory ring.  If
+                     given, and the hub is on the same host, the
+                     notifications are read from the ring rather than
+                     received over the connection.  The ring is opened
+                     for each connection, since the hub creates a new
+                     one whenever it starts; if it can't be opened,
+                     notifications are received over the connection.
+                     Optional.
+        :param loop: The event loop for gevent to use, as described
+                     for ``heyu.loops.parse()``.  Optional.
+        :param snapshot: If ``True``, the hub is asked to send the
+                         latest version of each live notification when
+                         first subscribing.  Defaults to ``False``.
         """
 
+        # Select the event loop before anything creates it
+        loops.select(loop)
+
         # Handle the arguments
         self._hub = hub
         self._manager = tendril.get_manager('tcp', util.outgoing_endpoint(hub))
@@ -77,6 +107,28 @@ class NotificationServer(object):
         self._notifications = []
         self._notify_event = gevent.event.Event()
 
+        # Track the ID of the last notification received from the hub,
+        # so that missed notifications can be replayed on reconnect
+        self._last_id = None
+
+        # The heartbeat interval to request
+        self._heartbeat = heartbeat
+
+        # Whether to ask for the current notifications when first
+        # subscribing
+        self._snapshot = snapshot
+
+        # The path of the shared memory ring to read notifications
+        # from, and the reader for the current connection
+        self._ring_path = ring
+        self._ring = None
+
+        # Set up the event loop monitor
+        self._monitor = None
+        if lag_threshold:
+            looplag.configure_log()
+            self._monitor = looplag.LoopMonitor(lag_threshold)
+
         # Set up behavior on signals
         gevent.signal(signal.SIGINT, self.stop)
         gevent.signal(signal.SIGTERM, self.stop)
@@ -170,6 +222,10 @@ class NotificationServer(object):
         # return from connect() until the acceptor has returned.
         self._hub_app = True
 
+        # Start monitoring the event loop
+        if self._monitor is not None:
+            self._monitor.start()
+
         # Start the manager and connect to the hub
         self._manager.start()
         self._manager.connect(self._hub, self._acceptor, self._wrapper)
@@ -188,6 +244,10 @@ class NotificationServer(object):
         # Stop the manager
         self._manager.stop()
 
+        # Stop monitoring the event loop
+        if self._monitor is not None:
+            self._monitor.stop()
+
         # Disconnect the client if we can
         if self._hub_app is not True:
             self._hub_app.disconnect()
@@ -217,6 +277,10 @@ class NotificationServer(object):
         # Shut down the manager
         self._manager.shutdown()
 
+        # Stop monitoring the event loop
+        if self._monitor is not None:
+            self._monitor.stop()
+
         # The client was closed by the shutdown, so clear _hub_app
         self._hub_app = None
 
@@ -229,10 +293,19 @@ class NotificationServer(object):
     def notify(self, msg):
         """
         Queue up a new notification to be produced by the iterator.
+        Notifications that have expired are dropped.
 
         :param msg: A dictionary describing the notification.
         """
 
+        # Remember the last notification from the hub
+        if msg.id != self._app_id:
+            self._last_id = msg.id
+
+        # Don't display stale notifications
+        if protocol.expired(msg.expires):
+            return
+
         # Append the notification and set the event
         self._notifications.append(msg)
         self._notify_event.set()
@@ -253,6 +326,70 @@ class NotificationServer(object):
 
         return self._app_id
 
+    @property
+    def last_id(self):
+        """
+        Retrieve the ID of the last notification received from the hub.
+        """
+
+        return self._last_id
+
+    @property
+    def heartbeat(self):
+        """
+        Retrieve the heartbeat interval to request from the hub.
+        """
+
+        return self._heartbeat
+
+    @property
+    def snapshot(self):
+        """
+        Retrieve whether to ask the hub for the current notifications
+        when first subscribing.
+        """
+
+        return self._snapshot
+
+    @property
+    def ring(self):
+        """
+        Retrieve the ``heyu.shmring.RingReader`` for the hub's shared
+        memory ring, or ``None`` if not using the ring.
+        """
+
+        return self._ring
+
+    def open_ring(self):
+        """
+        Open the hub's shared memory ring for a new connection,
+        replacing the reader from any earlier connection.
+
+        :returns: The ``heyu.shmring.RingReader``, or ``None`` if not
+                  using the ring or if it could not be opened.
+        """
+
+        self.close_ring()
+
+        if self._ring_path:
+            try:
+                self._ring = shmring.RingReader(self._ring_path)
+            except shmring.RingException:
+                # The hub may not have created it yet; use the
+                # connection instead
+                pass
+
+        return self._ring
+
+    def close_ring(self):
+        """
+        Close the reader for the hub's shared memory ring, if open.
+        """
+
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
 
 class NotificationApplication(tendril.Application):
     """
@@ -260,6 +397,17 @@ class NotificationApplication(tendril.Application):
     notifications from the HeyU server.
     """
 
+    # The number of heartbeats that may be missed before the hub is
+    # presumed dead
+    heartbeat_misses = 3
+
+    # Received notifications are acknowledged in batches: an
+    # acknowledgment is sent once this many notifications have been
+    # received, or this many seconds after the first unacknowledged
+    # one was received
+    ack_batch = 100
+    ack_delay = 0.1
+
     def __init__(self, parent, server, app_name, app_id):
         """
         Initialize a HeyU notification application.
@@ -287,11 +435,36 @@ class NotificationApplication(tendril.Application):
         self.app_name = app_name
         self.app_id = app_id
 
+        # The watchdog on the hub's heartbeat, once negotiated
+        self.heartbeat = None
+
+        # Whether the hub expects acknowledgments, the number of
+        # notifications received on the connection, and the state of
+        # the pending acknowledgment
+        self.acks = False
+        self._received_count = 0
+        self._ack_count = 0
+        self._ack_timer = None
+
         # Set up the desired framer
         parent.framers = tendril.COBSFramer(True)
 
-        # We need to subscribe to receive notifications
-        subscribe = protocol.Message('subscribe')
+        # We need to subscribe to receive notifications; ask the hub
+        # to replay anything we missed while disconnected, or, if
+        # desired, to bring us up to date the first time.  The app ID
+        # identifies our session, so that a hub which tracks
+        # acknowledgments can redeliver anything we didn't receive.
+        kwargs = {'session': app_id}
+        if server.last_id is not None:
+            kwargs['since_id'] = server.last_id
+        elif server.snapshot:
+            kwargs['snapshot'] = True
+        if server.heartbeat:
+            kwargs['heartbeat'] = server.heartbeat
+        ring = server.open_ring()
+        if ring is not None:
+            kwargs['ring'] = ring.path
+        subscribe = protocol.Message('subscribe', **kwargs)
         self.send_frame(subscribe.to_frame())
 
     def recv_frame(self, frame):
@@ -302,13 +475,49 @@ class NotificationApplication(tendril.Application):
         :param frame: The received frame.
         """
 
+        # Anything received shows the hub is alive
+        if self.heartbeat is not None:
+            self.heartbeat.received()
+
         # Parse the frame and dispatch to the appropriate handler
         try:
             msg = protocol.Message.from_frame(frame)
             if msg.msg_type == 'notify':
                 # Dispatch directly to the server
                 self.server.notify(msg)
+
+                # Acknowledge it, if the hub wants us to
+                if self.acks:
+                    self._received()
+            elif msg.msg_type == 'wakeup':
+                # New notifications are waiting in the ring
+                self._read_ring()
+            elif msg.msg_type == 'ping':
+                # Answer the hub's heartbeat
+                self.send_frame(protocol.Message('pong').to_frame())
+            elif msg.msg_type == 'pong':
+                # Already noted by the heartbeat
+                pass
             elif msg.msg_type == 'subscribed':
+                # Watch for the hub's heartbeat, if it agreed to send
+                # one; hubs that don't support heartbeats won't
+                if msg.heartbeat and self.heartbeat is None:
+                    self.heartbeat = heartbeat.Heartbeat(
+                        self, msg.heartbeat, self.heartbeat_misses, False)
+                    self.heartbeat.start()
+
+                # Acknowledge notifications if the hub is tracking our
+                # session; hubs that don't support this won't be
+                self.acks = msg.session is not None
+
+                # If the hub agreed to let us read from its ring, it
+                # tells us where to start reading; otherwise, the
+                # notifications come over the connection
+                if msg.ring is None:
+                    self.server.close_ring()
+                elif self.server.ring is not None:
+                    self.server.ring.position = msg.ring
+
                 # Generate a notification to let the notifier know
                 self.notify('Connection Established', 'The connection to the '
                             'HeyU hub has been established.', CONNECTED)
@@ -351,11 +560,31 @@ class NotificationApplication(tendril.Application):
             # communication error notification
             self.server.stop()
 
+    def expired(self):
+        """
+        Called by the heartbeat when the hub has stopped sending
+        heartbeats.  Closes the connection rather than waiting for
+        the operating system to notice that the hub is gone.
+        """
+
+        self.heartbeat = None
+        self._cancel_ack()
+
+        # Drop the connection and let the notifier know
+        self.close()
+        self.closed(None)
+
     def disconnect(self):
         """
         Disconnect from the server.
         """
 
+        self._stop_heartbeat()
+
+        # Acknowledge what we've received, so the hub doesn't hold on
+        # to it
+        self.send_ack()
+
         # Send a "goodbye" message
         try:
             self.send_frame(protocol.Message('goodbye').to_frame())
@@ -371,6 +600,9 @@ class NotificationApplication(tendril.Application):
         ensures that the server is stopped.
         """
 
+        self._stop_heartbeat()
+        self._cancel_ack()
+
         # Generate an informational notification
         self.notify('Connection Closed', 'The connection to the HeyU hub '
                     'has been closed.', DISCONNECTED)
@@ -378,6 +610,90 @@ class NotificationApplication(tendril.Application):
         # Stop the server
         self.server.stop()
 
+    def _stop_heartbeat(self):
+        """
+        Stop watching for the hub's heartbeat.
+        """
+
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+            self.heartbeat = None
+
+    def _read_ring(self):
+        """
+        Read the notifications waiting in the hub's shared memory
+        ring, and pass them on to the notifier.
+        """
+
+        ring = self.server.ring
+        if ring is None:
+            return
+
+        overruns = ring.overruns
+        for frame in ring.read():
+            try:
+                msg = protocol.Message.from_frame(frame)
+            except ValueError:
+                # Skip anything garbled
+                continue
+
+            if msg.msg_type == 'notify':
+                self.server.notify(msg)
+
+        # Let the notifier know if we fell too far behind
+        if ring.overruns != overruns:
+            self.notify('Notifications Lost', 'Notifications were lost '
+                        'because the notifier fell behind the HeyU hub.',
+                        ERROR)
+
+    def _received(self):
+        """
+        Note the receipt of a notification from the hub, and arrange
+        for it to be acknowledged.
+        """
+
+        # Acknowledgments are cumulative, naming the number of
+        # notifications received on the connection
+        self._received_count += 1
+        self._ack_count += 1
+
+        if self._ack_count >= self.ack_batch:
+            self.send_ack()
+        elif self._ack_timer is None:
+            self._ack_timer = gevent.spawn_later(self.ack_delay,
+                                                 self.send_ack)
+
+    def send_ack(self):
+        """
+        Acknowledge all the notifications received from the hub so
+        far.
+        """
+
+        pending = self._ack_count
+        self._cancel_ack()
+
+        if not pending:
+            return
+
+        try:
+            self.send_frame(protocol.Message(
+                'ack', seq=self._received_count).to_frame())
+        except Exception:
+            # The hub will redeliver anything not acknowledged
+            pass
+
+    def _cancel_ack(self):
+        """
+        Forget the pending acknowledgment, if any.
+        """
+
+        # Note that this may be called by the timer itself
+        if (self._ack_timer is not None and
+                self._ack_timer is not gevent.getcurrent()):
+            self._ack_timer.kill()
+        self._ack_timer = None
+        self._ack_count = 0
+
     def notify(self, summary, body, category):
         """
         Directly generates a notification to pass on to the notifier.
@@ -396,7 +712,8 @@ class NotificationApplication(tendril.Application):
 
 
 @cli_tools.console
-def stdout_notifier(hub, cert_conf=None, secure=True):
+def stdout_notifier(hub, cert_conf=None, secure=True, lag_threshold=None,
+                    ring=None, loop=None, snapshot=False):
     """
     Standard output notification driver.  This emits notifications to
     standard output.  Does not attempt to maintain a connection to the
@@ -408,13 +725,23 @@ def stdout_notifier(hub, cert_conf=None, secure=True):
                       Optional.
     :param secure: If ``False``, SSL will not be used.  Defaults to
                    ``True``.
+    :param lag_threshold: If given, callbacks that block the event
+                          loop for longer than this many seconds are
+                          logged to standard error.  Optional.
+    :param ring: The path of the hub's shared memory ring, to read
+                 notifications from.  Optional.
+    :param loop: The event loop for gevent to use.  Optional.
+    :param snapshot: If ``True``, the current notifications are
+                     requested from the hub on startup.
     """
 
     # Keep track of the number of notifications seen
     count = 0
 
     # Set up the server
-    server = NotificationServer(hub, cert_conf, secure)
+    server = NotificationServer(hub, cert_conf, secure,
+                                lag_threshold=lag_threshold, ring=ring,
+                                loop=loop, snapshot=snapshot)
 
     # Consume notifications
     for msg in server:
@@ -438,7 +765,8 @@ def stdout_notifier(hub, cert_conf=None, secure=True):
 
 @cli_tools.argument('filename',
                     help='The file to write notifications to.')
-def file_notifier(filename, hub, cert_conf=None, secure=True):
+def file_notifier(filename, hub, cert_conf=None, secure=True,
+                  lag_threshold=None, ring=None, loop=None, snapshot=False):
     """
     File notification driver.  This appends notifications to a named
     file.  Does not attempt to maintain a connection to the HeyU hub.
@@ -453,12 +781,22 @@ def file_notifier(filename, hub, cert_conf=None, secure=True):
                       Optional.
     :param secure: If ``False``, SSL will not be used.  Defaults to
                    ``True``.
+    :param lag_threshold: If given, callbacks that block the event
+                          loop for longer than this many seconds are
+                          logged to standard error.  Optional.
+    :param ring: The path of the hub's shared memory ring, to read
+                 notifications from.  Optional.
+    :param loop: The event loop for gevent to use.  Optional.
+    :param snapshot: If ``True``, the current notifications are
+                     requested from the hub on startup.
     """
 
     # Open the file...
     with open(filename, 'a') as output:
         # Set up the server
-        server = NotificationServer(hub, cert_conf, secure)
+        server = NotificationServer(hub, cert_conf, secure,
+                                    lag_threshold=lag_threshold, ring=ring,
+                                    loop=loop, snapshot=snapshot)
 
         # Consume notifications
         for msg in server:
@@ -504,7 +842,9 @@ def _validate_subs(text):
                     'values from the notification.  It is recommended to '
                     'precede the script value with "--" to prevent argument '
                     'interpretation.')
-def script_notifier(script, hub, cert_conf=None, secure=True):
+def script_notifier(script, hub, cert_conf=None, secure=True,
+                    lag_threshold=None, ring=None, loop=None,
+                    snapshot=False):
     """
     Script notification driver.  This invokes a given executable for
     each notification, with notification values indicated by
@@ -520,10 +860,20 @@ def script_notifier(script, hub, cert_conf=None, secure=True):
                       Optional.
     :param secure: If ``False``, SSL will not be used.  Defaults to
                    ``True``.
+    :param lag_threshold: If given, callbacks that block the event
+                          loop for longer than this many seconds are
+                          logged to standard error.  Optional.
+    :param ring: The path of the hub's shared memory ring, to read
+                 notifications from.  Optional.
+    :param loop: The event loop for gevent to use.  Optional.
+    :param snapshot: If ``True``, the current notifications are
+                     requested from the hub on startup.
     """
 
     # Set up the server
-    server = NotificationServer(hub, cert_conf, secure)
+    server = NotificationServer(hub, cert_conf, secure,
+                                lag_threshold=lag_threshold, ring=ring,
+                                loop=loop, snapshot=snapshot)
 
     # Consume notifications
     for msg in server:
@@ -38,6 +38,34 @@ from heyu import util
                     action='store_false',
                     help='Specifies that SSL should not be used to connect '
                     'to the hub.')
+@cli_tools.argument('--lag-threshold',
+                    default=None,
+                    type=float,
+                    help='Specifies that the event loop should be monitored, '
+                    'and that any callback blocking it for longer than this '
+                    'many seconds should be logged to standard error with '
+                    'its stack.')
+@cli_tools.argument('--ring',
+                    default=None,
+                    help='Specifies the path of the shared memory ring of a '
+                    'hub on the same host.  Notifications are read from the '
+                    'ring rather than received over the connection, if the '
+                    'hub agrees.')
+@cli_tools.argument('--snapshot', '-s',
+                    default=False,
+                    action='store_true',
+                    help='Specifies that the hub should send the latest '
+                    'version of each notification that is still live on '
+                    'startup, rather than only those submitted after the '
+                    'notifier starts.')
+@cli_tools.argument('--loop',
+                    default=None,
+                    help='Specifies the event loop gevent should use, as '
+                    '"loop" or "loop:backend".  The loop is one of "libev", '
+                    '"libev-cffi", or "libuv"; the backend, for the libev '
+                    'loops, is a polling mechanism such as "epoll" or '
+                    '"poll".  Defaults to the value of the HEYU_LOOP '
+                    'environment variable, or to gevent\'s default.')
 @cli_tools.argument('--debug', '-d',
                     default=False,
                     action='store_true',
@@ -0,0 +1,273 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import time
+
+import gevent
+
+from heyu import protocol
+
+
+class Outbox(object):
+    """
+    Pending notification output for a single subscriber.  Frames are
+    queued by urgency, and more urgent frames are sent ahead of less
+    urgent ones; all the frames for a given notification ID are kept
+    in one queue, at the highest urgency seen for that ID, so that
+    they are always sent in order.
+
+    If coalescing, frames are held for a short window before being
+    sent; if another version of a notification with the same ID
+    arrives within the window, it replaces the pending version, so
+    that only the newest state of each notification is delivered.
+    If the subscriber is still behind on earlier output when the
+    window expires, the window is extended, so that a slow subscriber
+    also receives only the newest state.
+
+    If not coalescing, frames are sent immediately unless the
+    subscriber is behind on earlier output, in which case they are
+    queued until it catches up.
+
+    Frames for notifications that expire while pending are discarded
+    rather than sent.
+
+    If given a ``heyu.receipts.Receipts`` object, each frame is
+    recorded in it as it is sent, so that frames the client does not
+    acknowledge may be redelivered.
+    """
+
+    # Every subscriber has an outbox, and most are empty most of the
+    # time, so keep them small
+    __slots__ = ('_client', '_window', '_coalesce', '_receipts', '_queues',
+                 '_urgency', '_expires', '_count', '_timer')
+
+    def __init__(self, client, window, coalesce=True, receipts=None):
+        """
+        Initialize an ``Outbox`` object.
+
+        :param client: The client to send the frames to.  This must
+                       have a ``send_frame()`` method and a
+                       ``backlog`` attribute giving the amount of
+                       output not yet written to the connection.
+        :param window: The coalescing window, in seconds.  If not
+                       coalescing, this is how often to check whether
+                       the client has caught up.
+        :param coalesce: If ``True``, the default, only the newest
+                         pending frame for each notification ID is
+                         sent.
+        :param receipts: A ``heyu.receipts.Receipts`` object to record
+                         the sent frames in.  Optional.
+        """
+
+        self._client = client
+        self._window = window
+        self._coalesce = coalesce
+        self._receipts = receipts
+
+        # The pending frames, as a dictionary mapping urgency to an
+        # ordered dictionary mapping notification ID to a list of
+        # frames, the urgency of the queue holding each notification
+        # ID, and the time each notification ID expires, if it does.
+        # These are only allocated while frames are pending.
+        self._queues = None
+        self._urgency = None
+        self._expires = None
+
+        # The number of pending frames
+        self._count = 0
+
+        # The timer for the next flush
+        self._timer = None
+
+    def __len__(self):
+        """
+        Retrieve the number of pending frames.
+
+        :returns: The number of pending frames.
+        """
+
+        return self._count
+
+    def push(self, key, frame, urgency=protocol.URGENCY_LOW, expires=None):
+        """
+        Add a frame to the outbox.
+
+        :param key: The ID of the notification.  If coalescing, a
+                    pending frame with the same ID is replaced.
+        :param frame: The encoded frame.
+        :param urgency: The urgency of the notification.  Defaults to
+                        ``URGENCY_LOW``.
+        :param expires: The time at which the notification expires,
+                        as a UNIX timestamp.  This applies to all the
+                        pending frames for the notification ID.
+                        Optional.
+        """
+
+        # If the client has caught up and nothing is queued ahead of
+        # the frame, there's no reason to hold it
+        if (not self._coalesce and not self._count and
+                not self._client.backlog):
+            self._deliver(key, frame, expires)
+            return
+
+        if self._queues is None:
+            self._queues = {}
+            self._urgency = {}
+            self._expires = {}
+
+        # The newest version of the notification determines when it
+        # expires
+        if expires is None:
+            self._expires.pop(key, None)
+        else:
+            self._expires[key] = expires
+
+        current = self._urgency.get(key)
+        if current is None:
+            # New notification ID
+            self._queues.setdefault(urgency, collections.OrderedDict())
+            self._queues[urgency][key] = [frame]
+            self._urgency[key] = urgency
+            self._count += 1
+        else:
+            # Move the ID's frames to the more urgent queue, so the
+            # new frame can't overtake them
+            if urgency > current:
+                frames = self._queues[current].pop(key)
+                self._queues.setdefault(urgency, collections.OrderedDict())
+                self._queues[urgency][key] = frames
+                self._urgency[key] = urgency
+                current = urgency
+
+            frames = self._queues[current][key]
+            if self._coalesce:
+                # Note that replacing a frame keeps its position
+                frames[:] = [frame]
+            else:
+                frames.append(frame)
+                self._count += 1
+
+        # Make sure a flush is scheduled
+        if self._timer is None:
+            self._timer = gevent.spawn_later(self._window, self.flush)
+
+    def flush(self):
+        """
+        Send the pending frames to the client.  If the client is still
+        behind on earlier output, the flush is deferred for another
+        window.
+        """
+
+        self._timer = None
+
+        if not self._count:
+            return
+
+        # If the client hasn't caught up, keep waiting
+        if self._client.backlog:
+            self._timer = gevent.spawn_later(self._window, self.flush)
+            return
+
+        self._send()
+
+    def drain(self):
+        """
+        Send the pending frames to the client immediately, whether or
+        not it has caught up on earlier output, and cancel any
+        scheduled flush.  Used when the client is about to be
+        disconnected.
+        """
+
+        if self._timer is not None:
+            self._timer.kill()
+            self._timer = None
+
+        self._send()
+
+    def take(self):
+        """
+        Retrieve and discard the pending frames.  The frames of
+        expired notifications are discarded without being returned.
+
+        :returns: A list of tuples of the notification ID, the frame,
+                  and the time the notification expires, most urgent
+                  first.
+        """
+
+        queues = self._queues or {}
+        expiry = self._expires or {}
+        self._clear()
+
+        now = time.time()
+        pending = []
+        for urgency in sorted(queues, reverse=True):
+            for key, frames in queues[urgency].items():
+                expires = expiry.get(key)
+                if protocol.expired(expires, now):
+                    continue
+                pending.extend((key, frame, expires) for frame in frames)
+
+        return pending
+
+    def _send(self):
+        """
+        Send the pending frames to the client, most urgent first.
+        """
+
+        for key, frame, expires in self.take():
+            try:
+                self._deliver(key, frame, expires)
+            except Exception:
+                # Ignore failures
+                pass
+
+    def _deliver(self, key, frame, expires=None):
+        """
+        Send a frame to the client, recording it if the client's
+        receipts are being tracked.  The frame is recorded even if
+        sending it fails, so that it will be redelivered.
+
+        :param key: The ID of the notification.
+        :param frame: The encoded frame.
+        :param expires: The time at which the notification expires,
+                        as a UNIX timestamp.  Optional.
+        """
+
+        if self._receipts is not None:
+            self._receipts.sent(key, frame, expires)
+
+        self._client.send_frame(frame)
+
+    def _clear(self):
+        """
+        Discard the pending frames.
+        """
+
+        self._queues = None
+        self._urgency = None
+        self._expires = None
+        self._count = 0
+
+    def cancel(self):
+        """
+        Discard the pending frames and cancel any scheduled flush.
+        """
+
+        if self._timer is not None:
+            self._timer.kill()
+            self._timer = None
+
+        self._clear()
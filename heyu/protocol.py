@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
+
 import msgpack
 
 
@@ -50,14 +52,45 @@ _versions = {
                 'urgency': URGENCY_LOW,
                 'category': None,
                 'id': None,
+                'path': None,
+                'expires': None,
+                'ttl': None,
+                'deliver_at': None,
+                'delay': None,
             },
         },
         'accepted': {
             'required': set(['id']),
         },
-        'subscribe': {},
-        'subscribed': {},
+        'subscribe': {
+            'defaults': {
+                'since_id': None,
+                'since': None,
+                'relay': None,
+                'heartbeat': None,
+                'session': None,
+                'ring': None,
+                'snapshot': None,
+            },
+        },
+        'subscribed': {
+            'defaults': {
+                'heartbeat': None,
+                'session': None,
+                'ring': None,
+            },
+        },
+        'wakeup': {},
+        'ack': {
+            'required': set(['seq']),
+        },
+        'ping': {},
+        'pong': {},
         'goodbye': {},
+        'stats': {},
+        'statistics': {
+            'required': set(['data']),
+        },
         'error': {
             'required': set(['reason']),
         },
@@ -65,6 +98,92 @@ _versions = {
 }
 
 
+def expired(expires, now=None):
+    """
+    Determine whether a notification has expired.
+
+    :param expires: The time at which the notification expires, as a
+                    UNIX timestamp, or ``None`` if it never expires.
+    :param now: The current time.  Defaults to the result of
+                ``time.time()``.
+
+    :returns: ``True`` if the notification has expired, ``False``
+              otherwise.
+    """
+
+    if expires is None:
+        return False
+
+    if now is None:
+        now = time.time()
+
+    return expires <= now
+
+
+def delivery(deliver_at, delay, now=None):
+    """
+    Determine the time at which a received notification should be
+    delivered.  Submitters asking for a delay send it as is, rather
+    than as a delivery time, so that it does not depend on the
+    submitter's clock agreeing with the hub's.
+
+    :param deliver_at: The time at which the notification should be
+                       delivered, as a UNIX timestamp, or ``None``.
+                       Used if ``delay`` is ``None``.
+    :param delay: The number of seconds to hold the notification
+                  before delivering it, or ``None``.
+    :param now: The current time.  Defaults to the result of
+                ``time.time()``.
+
+    :returns: The time at which the notification should be delivered,
+              as a UNIX timestamp, or ``None`` to deliver it
+              immediately.
+    """
+
+    if delay is None:
+        return deliver_at
+
+    if now is None:
+        now = time.time()
+
+    return now + delay
+
+
+def expiry(expires, ttl, deliver_at=None, now=None):
+    """
+    Determine the time at which a received notification expires.
+    Submitters send a time to live rather than an expiry time, so
+    that the lifetime of a notification does not depend on the
+    submitter's clock agreeing with the hub's.
+
+    :param expires: The time at which the notification expires, as a
+                    UNIX timestamp, or ``None``.  Used if ``ttl`` is
+                    ``None``.
+    :param ttl: The number of seconds after which the notification
+                expires, counted from when it is delivered, or
+                ``None``.
+    :param deliver_at: The time at which the notification should be
+                       delivered, as a UNIX timestamp, or ``None`` to
+                       deliver it immediately.
+    :param now: The current time.  Defaults to the result of
+                ``time.time()``.
+
+    :returns: The time at which the notification expires, as a UNIX
+              timestamp, or ``None`` if it never expires.
+    """
+
+    if ttl is None:
+        return expires
+
+    if now is None:
+        now = time.time()
+
+    # The lifetime starts when the notification is delivered
+    if deliver_at is not None and deliver_at > now:
+        return deliver_at + ttl
+    return now + ttl
+
+
 class Message(object):
     """
     Represent a protocol message.  The ``msg_type`` property
@@ -0,0 +1,251 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import re
+import time
+
+
+# Regular expression for parsing a rate limit specification
+RATE_RE = re.compile(r'^(?P<rate>\d+(?:\.\d*)?)(?:/(?P<burst>\d+))?$')
+
+
+class RateLimitException(Exception):
+    """
+    Exception raised if there's an error parsing the rate limit
+    specification.
+    """
+
+    pass
+
+
+class RateLimitExceeded(Exception):
+    """
+    Exception raised if a submission exceeds the rate limit.
+    """
+
+    pass
+
+
+def parse_rate(value):
+    """
+    Parse a rate limit specification.
+
+    :param value: The rate limit specification.  This is the number
+                  of notifications per second, optionally followed by
+                  a slash ('/') and the size of the burst allowed,
+                  i.e., "2/10".  If the burst is not given, it
+                  defaults to the rate, but is never less than 1.
+
+    :returns: A tuple of the rate, as a float, and the burst, as an
+              integer.
+    """
+
+    match = RATE_RE.match(value.strip())
+    if not match:
+        raise RateLimitException("Could not understand rate limit '%s'" %
+                                 value)
+
+    rate = float(match.group('rate'))
+    if rate <= 0:
+        raise RateLimitException("The rate limit must be positive")
+
+    burst = match.group('burst')
+    if burst is None:
+        burst = max(int(rate), 1)
+    else:
+        burst = int(burst)
+        if burst < 1:
+            raise RateLimitException("The burst size must be at least 1")
+
+    return rate, burst
+
+
+class TokenBucket(object):
+    """
+    A token bucket.  The bucket holds up to ``burst`` tokens and is
+    refilled at ``rate`` tokens per second; each submission consumes
+    one token.
+    """
+
+    def __init__(self, rate, burst, now):
+        """
+        Initialize a ``TokenBucket`` object.  The bucket starts out
+        full.
+
+        :param rate: The rate at which tokens are added, in tokens
+                     per second.
+        :param burst: The capacity of the bucket.
+        :param now: The current time.
+        """
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = now
+
+    def _refill(self, now):
+        """
+        Add the tokens accumulated since the last update.
+
+        :param now: The current time.
+        """
+
+        if now > self.stamp:
+            self.tokens = min(self.tokens + (now - self.stamp) * self.rate,
+                              self.burst)
+            self.stamp = now
+
+    def full(self, now):
+        """
+        Determine whether the bucket is full.  A full bucket is
+        indistinguishable from a new one.
+
+        :param now: The current time.
+
+        :returns: ``True`` if the bucket is full.
+        """
+
+        self._refill(now)
+        return self.tokens >= self.burst
+
+    def consume(self, now, max_wait=0):
+        """
+        Consume a token.  If no token is available, a token may be
+        borrowed against the future, provided it will become
+        available within ``max_wait`` seconds; the caller must then
+        wait that long before proceeding.
+
+        :param now: The current time.
+        :param max_wait: The maximum number of seconds the caller is
+                         willing to wait for a token.  Defaults to 0.
+
+        :returns: The number of seconds the caller must wait, or
+                  ``None`` if no token could be obtained; in that
+                  case, no token is consumed.
+        """
+
+        self._refill(now)
+
+        # How long until a token is available?
+        wait = 0.0
+        if self.tokens < 1:
+            wait = (1 - self.tokens) / self.rate
+            if wait > max_wait:
+                return None
+
+        self.tokens -= 1
+        return wait
+
+
+class RateLimiter(object):
+    """
+    Applies token bucket rate limits to submissions.  Limits are
+    keyed by origin hostname and, optionally, by application name.
+    Over-limit submissions are either rejected or deferred until a
+    token becomes available.
+    """
+
+    # Idle buckets are pruned once there are more than this many
+    prune_threshold = 10000
+
+    def __init__(self, rate, burst, by_app=False, defer=0):
+        """
+        Initialize a ``RateLimiter`` object.
+
+        :param rate: The sustained rate, in notifications per second.
+        :param burst: The number of notifications that may be
+                      submitted at once.
+        :param by_app: If ``True``, limits are keyed by application
+                       name as well as origin hostname.  Defaults to
+                       ``False``.
+        :param defer: The maximum number of seconds an over-limit
+                      submission may be deferred before it is
+                      rejected.  Defaults to 0, meaning that
+                      over-limit submissions are always rejected.
+        """
+
+        self.rate = rate
+        self.burst = burst
+        self.by_app = by_app
+        self.defer = defer
+
+        # The token buckets, least recently used first
+        self._buckets = collections.OrderedDict()
+
+        # Counters of limited submissions
+        self.rejected = 0
+        self.deferred = 0
+
+    def __len__(self):
+        """
+        Retrieve the number of token buckets being tracked.
+
+        :returns: The number of token buckets.
+        """
+
+        return len(self._buckets)
+
+    def _prune(self, now):
+        """
+        Discard the token buckets that have refilled completely.  The
+        least recently used buckets are the ones that have had longest
+        to refill, so pruning stops at the first bucket that isn't
+        full; this keeps the cost of pruning proportional to the
+        number of buckets discarded.
+
+        :param now: The current time.
+        """
+
+        while self._buckets:
+            key = next(iter(self._buckets))
+            if not self._buckets[key].full(now):
+                break
+            del self._buckets[key]
+
+    def check(self, hostname, app_name=None):
+        """
+        Check a submission against the rate limit.
+
+        :param hostname: The origin hostname of the submission.
+        :param app_name: The application name of the submission.
+
+        :returns: The number of seconds the submission must be
+                  deferred; 0 if it may proceed immediately.
+        """
+
+        now = time.time()
+        key = (hostname, app_name) if self.by_app else hostname
+
+        # Get the bucket, pruning idle ones if we're tracking too
+        # many; either way, it becomes the most recently used
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            if len(self._buckets) >= self.prune_threshold:
+                self._prune(now)
+            bucket = TokenBucket(self.rate, self.burst, now)
+        self._buckets[key] = bucket
+
+        wait = bucket.consume(now, self.defer)
+        if wait is None:
+            self.rejected += 1
+            if self.by_app:
+                raise RateLimitExceeded('rate limit exceeded for %s on %s' %
+                                        (app_name, hostname))
+            raise RateLimitExceeded('rate limit exceeded for %s' % hostname)
+        elif wait:
+            self.deferred += 1
+
+        return wait
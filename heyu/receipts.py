@@ -0,0 +1,170 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import time
+
+from heyu import protocol
+
+
+class Receipts(object):
+    """
+    The notifications sent to a subscriber session which have not yet
+    been acknowledged.  Frames are recorded in the order in which
+    they were sent, and numbered in sequence from 1 on each
+    connection.  Since a connection delivers frames in order, a
+    subscriber acknowledges everything it has received by counting
+    the notifications it has received on the connection and sending
+    the count; these cumulative acknowledgments are cheap for both
+    sides, and unlike notification IDs, which repeat when a
+    notification is updated, they are never ambiguous.  The
+    unacknowledged frames are redelivered if the subscriber
+    reconnects, unless their notifications have expired by then.
+    """
+
+    __slots__ = ('session', 'version', 'relay', 'resumed', '_seq',
+                 '_pending')
+
+    # Bound on the number of unacknowledged frames to retain; beyond
+    # this, the oldest are forgotten
+    max_pending = 10000
+
+    def __init__(self, session, version, relay=None):
+        """
+        Initialize a ``Receipts`` object.
+
+        :param session: The session ID chosen by the subscriber.  A
+                        subscriber reconnecting with the same session
+                        ID receives the unacknowledged frames.
+        :param version: The protocol version of the recorded frames.
+        :param relay: The name of the downstream hub, if the
+                      subscriber is a relay.  Optional.
+        """
+
+        self.session = session
+        self.version = version
+        self.relay = relay
+
+        # Set when the session is resumed by a reconnecting subscriber
+        self.resumed = False
+
+        # The sequence number of the last frame sent on the current
+        # connection
+        self._seq = 0
+
+        # The unacknowledged frames, as tuples of the sequence number,
+        # the notification ID, the frame, and the time the
+        # notification expires.  A subscriber that keeps up has
+        # nothing unacknowledged most of the time, so this is only
+        # allocated while needed.
+        self._pending = None
+
+    def __len__(self):
+        """
+        Retrieve the number of unacknowledged frames.
+
+        :returns: The number of unacknowledged frames.
+        """
+
+        return len(self._pending) if self._pending else 0
+
+    def sent(self, key, frame, expires=None):
+        """
+        Record a frame sent to the subscriber.
+
+        :param key: The ID of the notification.
+        :param frame: The encoded frame.
+        :param expires: The time at which the notification expires,
+                        as a UNIX timestamp.  Optional.
+
+        :returns: ``True`` if the oldest unacknowledged frame had to
+                  be forgotten to make room for the frame, ``False``
+                  otherwise.
+        """
+
+        if self._pending is None:
+            self._pending = collections.deque()
+
+        self._seq += 1
+        self._pending.append((self._seq, key, frame, expires))
+
+        if len(self._pending) <= self.max_pending:
+            return False
+
+        self._forget()
+        return True
+
+    def skip(self, count):
+        """
+        Account for frames sent to the subscriber without being
+        recorded, such as replayed notifications, so that the
+        sequence numbers of the recorded frames match the
+        subscriber's count.
+
+        :param count: The number of frames sent.
+        """
+
+        self._seq += count
+
+    def ack(self, seq):
+        """
+        Acknowledge the receipt of a frame, and of every frame sent
+        before it.
+
+        :param seq: The sequence number of the last frame received;
+                    that is, the number of notifications the
+                    subscriber has received on the connection.
+
+        :returns: The number of frames acknowledged.
+        """
+
+        # Frames already acknowledged or forgotten are simply absent
+        count = 0
+        while self._pending and self._pending[0][0] <= seq:
+            self._forget()
+            count += 1
+
+        return count
+
+    def take(self):
+        """
+        Retrieve and discard the unacknowledged frames, for
+        redelivery on a new connection; frames sent on that
+        connection are numbered from 1 again.  The frames of expired
+        notifications are discarded without being returned.
+
+        :returns: A list of tuples of the notification ID, the frame,
+                  and the time the notification expires, in the order
+                  in which they were sent.
+        """
+
+        now = time.time()
+        pending = [(key, frame, expires)
+                   for _seq, key, frame, expires in self._pending or []
+                   if not protocol.expired(expires, now)]
+        self._pending = None
+        self._seq = 0
+        return pending
+
+    def _forget(self):
+        """
+        Discard the oldest unacknowledged frame.
+        """
+
+        self._pending.popleft()
+
+        # Release the buffer once everything is acknowledged
+        if not self._pending:
+            self._pending = None
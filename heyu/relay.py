@@ -0,0 +1,428 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import gevent
+import tendril
+
+from heyu import heartbeat
+from heyu import protocol
+from heyu import util
+
+
+class Relay(object):
+    """
+    A relay link to an upstream hub.  The link maintains a single
+    persistent subscription to the upstream hub and re-publishes the
+    notifications it receives through the local hub.  If the
+    connection is lost, it is re-established, and the upstream hub is
+    asked to replay anything that was missed.  The upstream hub is
+    asked for a heartbeat, so that a hub which has gone silent is
+    noticed without waiting for the connection to close.
+    """
+
+    # Bounds on the delay before reconnecting, in seconds
+    min_delay = 1.0
+    max_delay = 60.0
+
+    # The heartbeat interval to request from the upstream hub, in
+    # seconds
+    heartbeat = 30.0
+
+    def __init__(self, server, hub, wrapper=None):
+        """
+        Initialize a ``Relay`` object.
+
+        :param server: The local ``heyu.hub.HubServer`` instance, to
+                       which received notifications are submitted.
+        :param hub: The address of the upstream hub, as a tuple of
+                    hostname and port.
+        :param wrapper: A wrapper callable, suitable for use with
+                        Tendril, to set up TLS on the connection.
+                        Optional.
+        """
+
+        self._server = server
+        self._hub = hub
+        self._wrapper = wrapper
+        self._manager = tendril.get_manager('tcp', util.outgoing_endpoint(hub))
+
+        # The current connection and the pending reconnect
+        self._app = None
+        self._timer = None
+        self._running = False
+
+        # The current reconnect delay
+        self._delay = self.min_delay
+
+        # The ID of the last notification received, for replay
+        self.last_id = None
+
+        # The time from which to replay notifications on the first
+        # connection, if no notification has been received yet
+        self.since = None
+
+    def _acceptor(self, tend):
+        """
+        Called when a connection is established.  Acceptable for use as an
+        acceptor.
+
+        :param tend: The ``tendril.Tendril`` object representing the
+                     connection.
+
+        :returns: An instance of ``RelayApplication``.
+        """
+
+        self._app = RelayApplication(tend, self, self._server.name)
+        return self._app
+
+    def _connect(self):
+        """
+        Connect to the upstream hub.  If the connection cannot be
+        established, another attempt is scheduled.
+        """
+
+        self._timer = None
+
+        try:
+            self._manager.connect(self._hub, self._acceptor, self._wrapper)
+        except Exception:
+            self._app = None
+            self._reconnect()
+
+    def _reconnect(self):
+        """
+        Schedule an attempt to reconnect to the upstream hub.  The delay
+        between attempts doubles with each failure, up to
+        ``max_delay``.
+        """
+
+        if not self._running or self._timer is not None:
+            return
+
+        self._timer = gevent.spawn_later(self._delay, self._connect)
+        self._delay = min(self._delay * 2, self.max_delay)
+
+    def start(self):
+        """
+        Start the relay.  This starts up the manager and connects to
+        the upstream hub.
+        """
+
+        # Don't allow redundant start
+        if self._running:
+            raise ValueError('relay is already running')
+
+        self._running = True
+
+        # The manager may be shared with other links
+        if not self._manager.running:
+            self._manager.start()
+
+        self._connect()
+
+    def stop(self):
+        """
+        Stop the relay.  This disconnects from the upstream hub.
+        """
+
+        # Do nothing if we're not running
+        if not self._running:
+            return
+
+        self._running = False
+
+        # Cancel any pending reconnect
+        if self._timer is not None:
+            self._timer.kill()
+            self._timer = None
+
+        # Disconnect from the upstream hub
+        if self._app is not None:
+            self._app.disconnect()
+            self._app = None
+
+    def subscribed(self):
+        """
+        Called when the subscription to the upstream hub has been
+        accepted.  Resets the reconnect delay.
+        """
+
+        self._delay = self.min_delay
+
+    def notify(self, msg):
+        """
+        Called when a notification is received from the upstream hub.
+
+        :param msg: The ``heyu.protocol.Message`` object containing
+                    the notification.
+        """
+
+        self.last_id = msg.id
+        self._server.relay(msg)
+
+    def closed(self):
+        """
+        Called when the connection to the upstream hub has been lost.
+        Schedules a reconnect.
+        """
+
+        self._app = None
+        self._reconnect()
+
+
+class Standby(Relay):
+    """
+    A replication link from a standby hub to the primary hub.  The
+    standby follows the stream of notifications accepted by the
+    primary, starting with everything in the primary's history, so
+    that it can serve replay to notifiers after a failover.  If the
+    primary cannot be reached for ``failover`` seconds, the link is
+    stopped and the standby hub is promoted; the clock starts when
+    the connection is lost or the primary stops sending heartbeats.
+    """
+
+    # Reconnect quickly, so that a brief outage doesn't trigger a
+    # failover
+    min_delay = 0.5
+    max_delay = 1.0
+
+    # Ask for heartbeats as often as hubs allow by default, so that a
+    # hung primary is noticed quickly
+    heartbeat = 5.0
+
+    def __init__(self, server, hub, wrapper=None, failover=5.0):
+        """
+        Initialize a ``Standby`` object.
+
+        :param server: The standby ``heyu.hub.HubServer`` instance.
+        :param hub: The address of the primary hub, as a tuple of
+                    hostname and port.
+        :param wrapper: A wrapper callable, suitable for use with
+                        Tendril, to set up TLS on the connection.
+                        Optional.
+        :param failover: The number of seconds the primary may be
+                         unreachable before the standby is promoted.
+                         Defaults to 5 seconds.
+        """
+
+        super(Standby, self).__init__(server, hub, wrapper)
+
+        self._failover = failover
+        self._failover_timer = None
+
+        # Start with everything the primary has
+        self.since = 0
+
+    def _arm(self):
+        """
+        Schedule the promotion of the standby hub, if it isn't already
+        scheduled.
+        """
+
+        if self._running and self._failover_timer is None:
+            self._failover_timer = gevent.spawn_later(self._failover,
+                                                      self._promote)
+
+    def _disarm(self):
+        """
+        Cancel any scheduled promotion of the standby hub.
+        """
+
+        if self._failover_timer is not None:
+            self._failover_timer.kill()
+            self._failover_timer = None
+
+    def _promote(self):
+        """
+        The primary hub has been unreachable for too long; stop
+        following it and promote the standby hub.
+        """
+
+        self._failover_timer = None
+        self.stop()
+        self._server.promote()
+
+    def start(self):
+        """
+        Start following the primary hub.  If the primary hub cannot be
+        reached in time, the standby hub is promoted.
+        """
+
+        super(Standby, self).start()
+        self._arm()
+
+    def stop(self):
+        """
+        Stop following the primary hub.
+        """
+
+        self._disarm()
+        super(Standby, self).stop()
+
+    def subscribed(self):
+        """
+        Called when the subscription to the primary hub has been
+        accepted.  Cancels any scheduled promotion.
+        """
+
+        super(Standby, self).subscribed()
+        self._disarm()
+
+    def closed(self):
+        """
+        Called when the connection to the primary hub has been lost.
+        Schedules a reconnect and the promotion of the standby hub.
+        """
+
+        super(Standby, self).closed()
+        self._arm()
+
+
+class RelayApplication(tendril.Application):
+    """
+    The application for a relay link, which subscribes to
+    notifications from an upstream hub.
+    """
+
+    # The number of heartbeats that may be missed before the upstream
+    # hub is presumed dead
+    heartbeat_misses = 3
+
+    def __init__(self, parent, relay, name):
+        """
+        Initialize a relay application.
+
+        :param parent: The parent of the ``RelayApplication``.  This
+                       will be an instance of ``tendril.Tendril``.
+        :param relay: The ``Relay`` instance managing the link.
+        :param name: The name of the local hub.  This is sent to the
+                     upstream hub, so that it need not send back
+                     notifications that originated here.
+        """
+
+        # Initialize the application
+        super(RelayApplication, self).__init__(parent)
+
+        # Save the relay link
+        self.relay = relay
+
+        # The watchdog on the upstream hub's heartbeat, once
+        # negotiated
+        self.heartbeat = None
+
+        # Set up the desired framer
+        parent.framers = tendril.COBSFramer(True)
+
+        # Subscribe, asking the hub to replay anything we missed while
+        # disconnected
+        kwargs = {'relay': name}
+        if relay.last_id is not None:
+            kwargs['since_id'] = relay.last_id
+        elif relay.since is not None:
+            kwargs['since'] = relay.since
+        if relay.heartbeat:
+            kwargs['heartbeat'] = relay.heartbeat
+        subscribe = protocol.Message('subscribe', **kwargs)
+        self.send_frame(subscribe.to_frame())
+
+    def recv_frame(self, frame):
+        """
+        Called when a frame is received.  Dispatches the appropriate
+        method based on the received message.
+
+        :param frame: The received frame.
+        """
+
+        # Anything received shows the upstream hub is alive
+        if self.heartbeat is not None:
+            self.heartbeat.received()
+
+        # Parse the frame and dispatch to the appropriate handler
+        try:
+            msg = protocol.Message.from_frame(frame)
+        except ValueError:
+            # Drop the connection; it will be re-established
+            self._stop_heartbeat()
+            self.close()
+            self.relay.closed()
+            return
+
+        if msg.msg_type == 'notify':
+            self.relay.notify(msg)
+        elif msg.msg_type == 'ping':
+            # Answer the upstream hub's heartbeat
+            self.send_frame(protocol.Message('pong').to_frame())
+        elif msg.msg_type == 'subscribed':
+            # Watch for the upstream hub's heartbeat, if it agreed to
+            # send one; hubs that don't support heartbeats won't
+            if msg.heartbeat and self.heartbeat is None:
+                self.heartbeat = heartbeat.Heartbeat(
+                    self, msg.heartbeat, self.heartbeat_misses, False)
+                self.heartbeat.start()
+
+            self.relay.subscribed()
+        elif msg.msg_type in ('goodbye', 'error'):
+            # The upstream hub is going away or refused us; drop the
+            # connection, and it will be re-established
+            self._stop_heartbeat()
+            self.close()
+            self.relay.closed()
+
+        # Other message types are ignored
+
+    def expired(self):
+        """
+        Called by the heartbeat when the upstream hub has stopped
+        sending heartbeats.  Drops the connection rather than waiting
+        for the operating system to notice that the hub is gone; the
+        relay link treats this like any other lost connection.
+        """
+
+        self.heartbeat = None
+        self.close()
+        self.relay.closed()
+
+    def disconnect(self):
+        """
+        Disconnect from the upstream hub.
+        """
+
+        self._stop_heartbeat()
+
+        # Send a "goodbye" message
+        try:
+            self.send_frame(protocol.Message('goodbye').to_frame())
+        except Exception:
+            pass
+
+        self.close()
+
+    def closed(self, error):
+        """
+        Called to notify the application that the connection has been
+        closed.  Not called if the ``close()`` method is called.
+        """
+
+        self._stop_heartbeat()
+        self.relay.closed()
+
+    def _stop_heartbeat(self):
+        """
+        Stop watching for the upstream hub's heartbeat.
+        """
+
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+            self.heartbeat = None
@@ -0,0 +1,304 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mmap
+import os
+import struct
+
+
+# The ring file begins with a header giving a magic string, the
+# capacity of the data area, the position at which the next record
+# will be written, and the position up to which the writer may be
+# writing.  Positions count bytes written since the ring was created,
+# and so never decrease; the offset of a position in the data area is
+# the position modulo the capacity.  The writer advances the reserved
+# position before writing a record and the head after, so that a
+# reader can tell whether a record it copied was being overwritten.
+MAGIC = b'HeyURing'
+_header = struct.Struct('=8sQQQ')
+_head = struct.Struct('=Q')
+_HEAD_OFFSET = 16
+_RESERVE_OFFSET = 24
+
+# Each record is a length followed by an encoded frame.  Records are
+# never split across the end of the data area; if a record doesn't
+# fit, a wrap marker is written and the record starts over at the
+# beginning of the data area.
+_length = struct.Struct('=I')
+WRAP = 0xffffffff
+
+
+class RingException(Exception):
+    """
+    Exception raised if a ring file cannot be opened.
+    """
+
+    pass
+
+
+class RingWriter(object):
+    """
+    Writes encoded frames into a ring buffer in a shared memory file,
+    from which any number of local processes may read them.  Only one
+    process may write to a ring.  Readers that fall more than a ring's
+    worth of data behind lose the overwritten frames.
+    """
+
+    def __init__(self, path, size=4 * 1024 * 1024, mode=0o644):
+        """
+        Initialize a ``RingWriter`` object.  The ring file is not
+        created until ``open()`` is called.
+
+        :param path: The path of the ring file.  This should be on a
+                     memory-backed filesystem, such as "/dev/shm".
+        :param size: The capacity of the ring, in bytes.  Defaults to
+                     4 MiB.
+        :param mode: The permissions to give the ring file.  Note
+                     that anyone who can read the file can read the
+                     notifications.  Defaults to 0644.
+        """
+
+        self.path = path
+        self.size = size
+        self.mode = mode
+
+        self._mmap = None
+        self._head = 0
+
+    @property
+    def head(self):
+        """
+        Retrieve the position at which the next frame will be written.
+        """
+
+        return self._head
+
+    def open(self):
+        """
+        Create the ring file, replacing any stale one, and map it.
+        """
+
+        if self._mmap is not None:
+            return
+
+        # Replace any stale ring; readers that still have it mapped
+        # will simply stop seeing new frames
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL,
+                     self.mode)
+        try:
+            os.fchmod(fd, self.mode)
+            os.ftruncate(fd, _header.size + self.size)
+            self._mmap = mmap.mmap(fd, _header.size + self.size)
+        finally:
+            os.close(fd)
+
+        self._head = 0
+        self._mmap[:_header.size] = _header.pack(MAGIC, self.size, 0, 0)
+
+    def close(self):
+        """
+        Unmap and remove the ring file.
+        """
+
+        if self._mmap is None:
+            return
+
+        self._mmap.close()
+        self._mmap = None
+
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def write(self, frame):
+        """
+        Write a frame to the ring.
+
+        :param frame: The encoded frame.
+
+        :returns: ``True`` if the frame was written, ``False`` if the
+                  ring isn't open or the frame is too large to fit in
+                  it.
+        """
+
+        size = _length.size + len(frame)
+        if self._mmap is None or size > self.size:
+            return False
+
+        # Wrap around if the record won't fit at the end
+        head = self._head
+        offset = head % self.size
+        wrap = offset + size > self.size
+        if wrap:
+            head += self.size - offset
+
+        # Reserve the space, write the record, then publish it by
+        # advancing the head
+        self._set(_RESERVE_OFFSET, head + size)
+        if wrap:
+            if self.size - offset >= _length.size:
+                self._write(offset, _length.pack(WRAP))
+            offset = 0
+        self._write(offset, _length.pack(len(frame)) + frame)
+        self._head = head + size
+        self._set(_HEAD_OFFSET, self._head)
+
+        return True
+
+    def _set(self, field, position):
+        """
+        Set a position in the header.
+
+        :param field: The offset of the field in the header.
+        :param position: The position.
+        """
+
+        self._mmap[field:field + _head.size] = _head.pack(position)
+
+    def _write(self, offset, data):
+        """
+        Write data to the data area.
+
+        :param offset: The offset in the data area.
+        :param data: The data to write.
+        """
+
+        start = _header.size + offset
+        self._mmap[start:start + len(data)] = data
+
+
+class RingReader(object):
+    """
+    Reads encoded frames from a ring buffer in a shared memory file,
+    written by a ``RingWriter``.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize a ``RingReader`` object.  Reading begins with the
+        next frame written.
+
+        :param path: The path of the ring file.
+        """
+
+        self.path = path
+
+        try:
+            with open(path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError) as e:
+            raise RingException("Could not open ring '%s': %s" % (path, e))
+
+        if len(self._mmap) < _header.size:
+            raise RingException("Ring '%s' is truncated" % path)
+        magic, self.size = _header.unpack_from(self._mmap)[:2]
+        if magic != MAGIC or len(self._mmap) < _header.size + self.size:
+            raise RingException("File '%s' is not a ring" % path)
+
+        # The position of the next frame to read
+        self.position = self.head
+
+        # The number of times the writer has overtaken the reader
+        self.overruns = 0
+
+    @property
+    def head(self):
+        """
+        Retrieve the position at which the next frame will be written.
+        """
+
+        return _head.unpack_from(self._mmap, _HEAD_OFFSET)[0]
+
+    @property
+    def reserved(self):
+        """
+        Retrieve the position up to which the writer may be writing.
+        """
+
+        return _head.unpack_from(self._mmap, _RESERVE_OFFSET)[0]
+
+    def close(self):
+        """
+        Unmap the ring file.
+        """
+
+        self._mmap.close()
+
+    def read(self):
+        """
+        Read the frames written since the last read.  If the writer
+        has overtaken the reader, the overwritten frames are lost and
+        ``overruns`` is incremented.
+
+        :returns: A list of the encoded frames, in the order in which
+                  they were written.
+        """
+
+        head = self.head
+        if head - self.position > self.size:
+            self._overrun(head)
+            return []
+
+        # Copy the records out; the positions are needed to check
+        # that they weren't overwritten while being copied
+        records = []
+        position = self.position
+        while position < head:
+            offset = position % self.size
+            if self.size - offset < _length.size:
+                position += self.size - offset
+                continue
+
+            start = _header.size + offset
+            length = _length.unpack_from(self._mmap, start)[0]
+            if length == WRAP:
+                position += self.size - offset
+                continue
+            elif offset + _length.size + length > self.size:
+                # Garbage; the record must have been overwritten
+                self._overrun(self.head)
+                return []
+
+            start += _length.size
+            records.append((position, self._mmap[start:start + length]))
+            position += _length.size + length
+        self.position = position
+
+        # A record is intact if the writer hasn't since reserved
+        # space a full ring beyond its start; the reserved position is
+        # checked only after the copy, since the writer may have begun
+        # overwriting the record while it was being copied
+        limit = self.reserved - self.size
+        frames = [frame for start, frame in records if start >= limit]
+        if len(frames) < len(records):
+            self.overruns += 1
+
+        return frames
+
+    def _overrun(self, head):
+        """
+        Handle the writer overtaking the reader.  Since records can't
+        be found in the middle of the ring, reading resumes at the
+        head.
+
+        :param head: The current head of the ring.
+        """
+
+        self.overruns += 1
+        self.position = head
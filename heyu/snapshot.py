@@ -0,0 +1,91 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import collections
+import time
+
+from heyu import protocol
+
+
+class Snapshot(object):
+    """
+    The current state of each live notification.  Where the history
+    records every version of every notification, the snapshot keeps
+    only the latest version of each notification ID, so that a new
+    subscriber may be brought up to date without being sent each of
+    the intermediate versions.  Once full, the notification updated
+    least recently is forgotten to make room; expired notifications
+    are forgotten when they're found.
+    """
+
+    def __init__(self, size):
+        """
+        Initialize a ``Snapshot`` object.
+
+        :param size: The maximum number of notifications to retain.
+        """
+
+        self.size = size
+
+        # The entries map the notification ID to a tuple of the
+        # encoded frame and the time the notification expires, least
+        # recently updated first
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        """
+        Retrieve the number of notifications currently retained.
+
+        :returns: The number of retained notifications.
+        """
+
+        return len(self._entries)
+
+    def update(self, msg_id, frame, expires=None):
+        """
+        Record the latest version of a notification.
+
+        :param msg_id: The ID of the notification.
+        :param frame: The encoded frame for the notification.
+        :param expires: The time at which the notification expires,
+                        as a UNIX timestamp.  Optional.
+        """
+
+        # Move it to the end, as the most recently updated
+        self._entries.pop(msg_id, None)
+        self._entries[msg_id] = (frame, expires)
+
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def frames(self):
+        """
+        Retrieve the frames of the latest version of each live
+        notification.
+
+        :returns: A list of frames, least recently updated first.
+        """
+
+        now = time.time()
+
+        frames = []
+        for msg_id, (frame, expires) in list(self._entries.items()):
+            if protocol.expired(expires, now):
+                del self._entries[msg_id]
+            else:
+                frames.append(frame)
+
+        return frames
@@ -17,12 +17,18 @@ from __future__ import print_function
 
 import os
 import sys
+import time
 
 import cli_tools
 import gevent
+from gevent import socket
 import tendril
 
+from heyu import loops
 from heyu import protocol
+from heyu import udp
+from heyu import ulid
+from heyu import unix
 from heyu import util
 
 
@@ -34,6 +40,86 @@ class SubmitterException(Exception):
     pass
 
 
+def parse_time(value, now=None):
+    """
+    Parse a time of day.
+
+    :param value: The time of day, as "HH:MM" or "HH:MM:SS", in local
+                  time.
+    :param now: The current time.  Defaults to the result of
+                ``time.time()``.
+
+    :returns: The next occurrence of the time of day, as a UNIX
+              timestamp.
+    """
+
+    try:
+        fields = [int(field) for field in value.split(':')]
+    except ValueError:
+        fields = []
+    if (len(fields) not in (2, 3) or not 0 <= fields[0] < 24 or
+            not all(0 <= field < 60 for field in fields[1:])):
+        raise SubmitterException("Invalid time of day '%s'" % value)
+    hour, minute, second = (fields + [0])[:3]
+
+    if now is None:
+        now = time.time()
+
+    # Today, if the time hasn't passed yet; otherwise, tomorrow.
+    # Note that mktime() normalizes the day of the month.
+    today = time.localtime(now)
+    for day in (today.tm_mday, today.tm_mday + 1):
+        when = time.mktime((today.tm_year, today.tm_mon, day,
+                            hour, minute, second, 0, 0, -1))
+        if when > now:
+            break
+
+    return when
+
+
+def _notify(app_name, summary, body, urgency=None, category=None, id=None,
+            ttl=None, deliver_at=None, delay=None):
+    """
+    Construct a "notify" message.
+
+    :param app_name: The name of the application the notification is
+                     for.
+    :param summary: A summary of the notification.
+    :param body: The body of the notification.
+    :param urgency: The urgency level for the notification.  Optional.
+    :param category: A category for the notification.  Optional.
+    :param id: The ID of a notification to replace.  Optional.
+    :param ttl: The number of seconds after which the notification
+                expires, counted from when it is delivered.
+                Optional.
+    :param deliver_at: The time at which the notification should be
+                       delivered, as a UNIX timestamp.  Optional.
+    :param delay: The number of seconds the hub should hold the
+                  notification before delivering it.  Optional.
+
+    :returns: The ``heyu.protocol.Message`` object.
+    """
+
+    kwargs = {
+        'app_name': app_name,
+        'summary': summary,
+        'body': body,
+    }
+    if urgency is not None:
+        kwargs['urgency'] = urgency
+    if category is not None:
+        kwargs['category'] = category
+    if id is not None:
+        kwargs['id'] = id
+    if deliver_at is not None:
+        kwargs['deliver_at'] = deliver_at
+    if delay is not None:
+        kwargs['delay'] = delay
+    if ttl is not None:
+        kwargs['ttl'] = ttl
+    return protocol.Message('notify', **kwargs)
+
+
 class SubmitterApplication(tendril.Application):
     """
     The application for the submitter, a HeyU client.  The submitter
@@ -43,7 +129,8 @@ class SubmitterApplication(tendril.Application):
     """
 
     def __init__(self, parent, app_name, summary, body,
-                 urgency=None, category=None, id=None):
+                 urgency=None, category=None, id=None, ttl=None,
+                 deliver_at=None, delay=None):
         """
         Initialize a submitter application.  This submits the notification
         to the hub.
@@ -59,6 +146,14 @@ class SubmitterApplication(tendril.Application):
                         Optional.
         :param category: A category for the notification.  Optional.
         :param id: The ID of a notification to replace.  Optional.
+        :param ttl: The number of seconds after which the notification
+                    expires, counted from when it is delivered.
+                    Optional.
+        :param deliver_at: The time at which the notification should
+                           be delivered, as a UNIX timestamp.
+                           Optional.
+        :param delay: The number of seconds the hub should hold the
+                      notification before delivering it.  Optional.
         """
 
         # Initialize the application
@@ -67,21 +162,9 @@ class SubmitterApplication(tendril.Application):
         # Set up the desired framer
         parent.framers = tendril.COBSFramer(True)
 
-        # Create the notify message
-        kwargs = {
-            'app_name': app_name,
-            'summary': summary,
-            'body': body,
-        }
-        if urgency is not None:
-            kwargs['urgency'] = urgency
-        if category is not None:
-            kwargs['category'] = category
-        if id is not None:
-            kwargs['id'] = id
-        msg = protocol.Message('notify', **kwargs)
-
-        # Send it
+        # Create the notify message and send it
+        msg = _notify(app_name, summary, body, urgency, category, id, ttl,
+                      deliver_at, delay)
         self.send_frame(msg.to_frame())
 
     def recv_frame(self, frame):
@@ -134,6 +217,24 @@ class SubmitterApplication(tendril.Application):
 @cli_tools.argument('--id', '-I',
                     default=None,
                     help='Specifies the ID of a notification to replace.')
+@cli_tools.argument('--ttl', '-t',
+                    default=None,
+                    type=float,
+                    help='Specifies the number of seconds after which the '
+                    'notification expires, counted from when it is '
+                    'delivered.  Expired notifications are discarded '
+                    'rather than delivered.')
+@cli_tools.argument('--delay', '-D',
+                    default=None,
+                    type=float,
+                    help='Specifies the number of seconds the hub should '
+                    'hold the notification before delivering it.')
+@cli_tools.argument('--at', '-A',
+                    default=None,
+                    help='Specifies the time of day, as "HH:MM" or '
+                    '"HH:MM:SS" in local time, at which the hub should '
+                    'deliver the notification.  If the time has already '
+                    'passed today, it is delivered at that time tomorrow.')
 @cli_tools.argument('--cert-conf', '-C',
                     default=None,
                     help='Specifies an alternate path to the certificate '
@@ -144,13 +245,36 @@ class SubmitterApplication(tendril.Application):
                     action='store_false',
                     help='Specifies that SSL should not be used to connect '
                     'to the hub.')
+@cli_tools.argument('--socket', '-U',
+                    dest='unix_socket',
+                    default=None,
+                    help='Specifies the path of the Unix domain socket of a '
+                    'local HeyU hub.  If given, the notification is '
+                    'submitted through the socket, and "--host" and the '
+                    'certificate configuration are ignored.')
+@cli_tools.argument('--udp-key-file', '-K',
+                    default=None,
+                    help='Specifies the path of a file containing the key '
+                    'shared with the hub.  If given, the notification is '
+                    'sent to the hub in a single UDP datagram, and no reply '
+                    'is awaited.')
+@cli_tools.argument('--loop',
+                    default=None,
+                    help='Specifies the event loop gevent should use, as '
+                    '"loop" or "loop:backend".  The loop is one of "libev", '
+                    '"libev-cffi", or "libuv"; the backend, for the libev '
+                    'loops, is a polling mechanism such as "epoll" or '
+                    '"poll".  Defaults to the value of the HEYU_LOOP '
+                    'environment variable, or to gevent\'s default.')
 @cli_tools.argument('--debug', '-d',
                     default=False,
                     action='store_true',
                     help='Enables debugging.')
 def send_notification(hub, app_name, summary, body,
                       urgency=None, category=None, id=None,
-                      cert_conf=None, secure=True):
+                      cert_conf=None, secure=True, unix_socket=None,
+                      udp_key_file=None, ttl=None, deliver_at=None,
+                      delay=None):
     """
     Sends a notification via the configured HeyU hub.  The hub address
     is read from the "~/.heyu.hub" file, which should contain either
@@ -173,18 +297,57 @@ def send_notification(hub, app_name, summary, body,
                       Optional.
     :param secure: If ``False``, SSL will not be used.  Defaults to
                    ``True``.
+    :param unix_socket: The path of the Unix domain socket of a local
+                        hub.  If given, the notification is submitted
+                        through the socket, without SSL.  Optional.
+    :param udp_key_file: The path of a file containing the key shared
+                         with the hub.  If given, the notification is
+                         sent in a single UDP datagram, and its ID is
+                         printed without waiting for a reply.
+                         Optional.
+    :param ttl: The number of seconds after which the notification
+                expires, counted from when it is delivered.
+                Optional.
+    :param deliver_at: The time at which the hub should deliver the
+                       notification, as a UNIX timestamp.  Optional.
+    :param delay: The number of seconds the hub should hold the
+                  notification before delivering it.  Optional.
     """
 
-    # Look up the manager
-    manager = tendril.get_manager('tcp', util.outgoing_endpoint(hub))
-    manager.start()
+    if udp_key_file:
+        # The hub doesn't reply, so pick the ID ourselves
+        id = id or ulid.generate()
+        msg = _notify(app_name, summary, body, urgency, category, id, ttl,
+                      deliver_at, delay)
+        datagram = udp.seal(udp.read_key(udp_key_file), msg.to_frame())
+
+        sock = socket.socket(tendril.addr_info(hub), socket.SOCK_DGRAM)
+        try:
+            sock.sendto(datagram, hub)
+        finally:
+            sock.close()
+
+        print(id)
+        return
 
-    # Connect to the hub
     app = tendril.TendrilPartial(SubmitterApplication,
                                  app_name, summary, body,
-                                 urgency, category, id)
-    wrapper = util.cert_wrapper(cert_conf, 'submitter', secure=secure)
-    manager.connect(hub, app, wrapper)
+                                 urgency, category, id, ttl, deliver_at,
+                                 delay)
+
+    if unix_socket:
+        # Local hubs authenticate us by our credentials
+        manager = unix.UnixTendrilManager()
+        manager.start()
+        manager.connect(unix_socket, app)
+    else:
+        # Look up the manager
+        manager = tendril.get_manager('tcp', util.outgoing_endpoint(hub))
+        manager.start()
+
+        # Connect to the hub
+        wrapper = util.cert_wrapper(cert_conf, 'submitter', secure=secure)
+        manager.connect(hub, app, wrapper)
 
     # Wait for the submitter to exit
     gevent.wait()
@@ -200,6 +363,9 @@ def _normalize_args(args):
                  normalization.
     """
 
+    # Select the event loop before anything creates it
+    loops.select(args.loop)
+
     # Next, we need the application name
     if not args.app_name:
         args.app_name = os.path.basename(sys.argv[0])
@@ -211,3 +377,12 @@ def _normalize_args(args):
             raise SubmitterException("Unknown urgency level '%s'" %
                                      args.urgency)
         args.urgency = urgency
+
+    # Finally, work out when the notification should be delivered; a
+    # delay is sent as is, for the hub to count from when it receives
+    # the notification
+    if args.delay is not None and args.at:
+        raise SubmitterException('Specify at most one of --delay and --at')
+    args.deliver_at = None
+    if args.at:
+        args.deliver_at = parse_time(args.at)
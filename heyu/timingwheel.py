@@ -0,0 +1,172 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import math
+
+
+class TimingWheel(object):
+    """
+    A hierarchical timing wheel, holding items until a given time.
+    Time is divided into ticks of ``resolution`` seconds.  The lowest
+    level wheel has a slot for each of the next ``slots`` ticks; each
+    slot of the next level up covers an entire rotation of the level
+    below it, and so on.  An item is placed directly in the slot
+    covering its tick, and when a lower level completes a rotation,
+    the items in the next slot of the level above are spread out over
+    the lower levels.  Adding an item and retrieving it when it is due
+    are thus constant time, regardless of the number of items held.
+    """
+
+    def __init__(self, now, resolution=1.0, slots=64, levels=4):
+        """
+        Initialize a ``TimingWheel`` object.
+
+        :param now: The current time, as a UNIX timestamp.
+        :param resolution: The length of a tick, in seconds.  Items
+                           are never released early, but may be
+                           released up to a tick late.
+        :param slots: The number of slots in each level.
+        :param levels: The number of levels.  Items due beyond the
+                       range of the top level are held in its last
+                       slot and placed again once it is reached.
+        """
+
+        self.resolution = resolution
+        self._slots = slots
+
+        # The number of ticks covered by a slot at each level
+        self._spans = [slots ** level for level in range(levels)]
+
+        # The last tick processed
+        self._tick = int(now // resolution)
+
+        # The slots hold lists of tuples of the tick at which the item
+        # is due and the item
+        self._wheels = [[[] for _i in range(slots)] for _j in range(levels)]
+        self._count = 0
+
+    def __len__(self):
+        """
+        Retrieve the number of items being held.
+
+        :returns: The number of items.
+        """
+
+        return self._count
+
+    def _place(self, tick, item):
+        """
+        Place an item in the slot covering its tick.
+
+        :param tick: The tick at which the item is due.  Must not be
+                     earlier than the last tick processed.
+        :param item: The item.
+        """
+
+        # Find the lowest level whose rotation covers the tick
+        delta = tick - self._tick
+        slot_tick = tick
+        for level, span in enumerate(self._spans):
+            if delta < span * self._slots:
+                break
+        else:
+            # Beyond the range of the wheel; hold it in the farthest
+            # slot, to be placed again when that slot is reached
+            slot_tick = self._tick + span * self._slots - 1
+
+        slot = (slot_tick // span) % self._slots
+        self._wheels[level][slot].append((tick, item))
+
+    def add(self, when, item, now=None):
+        """
+        Add an item to the wheel.
+
+        :param when: The time at which the item is due, as a UNIX
+                     timestamp.  If the time has already passed, the
+                     item is due at the next tick.
+        :param item: The item.
+        :param now: The current time, as a UNIX timestamp.  If given
+                    and the wheel is empty, the wheel is first moved
+                    up to this time, so that the next advance doesn't
+                    have to step through the ticks it sat idle for.
+        """
+
+        if now is not None and not self._count:
+            self._tick = max(self._tick, int(now // self.resolution))
+
+        tick = max(int(math.ceil(when / self.resolution)), self._tick + 1)
+        self._place(tick, item)
+        self._count += 1
+
+    def advance(self, now):
+        """
+        Advance the wheel to the current time, releasing the items
+        that have become due.
+
+        :param now: The current time, as a UNIX timestamp.
+
+        :returns: A list of the items that have become due, in the
+                  order in which they became due.
+        """
+
+        due = []
+        target = int(now // self.resolution)
+
+        while self._tick < target:
+            # Nothing to release; skip straight to the target
+            if not self._count:
+                self._tick = target
+                break
+
+            self._tick += 1
+
+            # Spread out the next slot of each level whose lower level
+            # just completed a rotation
+            for level in range(1, len(self._spans)):
+                span = self._spans[level]
+                if self._tick % span:
+                    break
+
+                slot = (self._tick // span) % self._slots
+                entries = self._wheels[level][slot]
+                self._wheels[level][slot] = []
+                for tick, item in entries:
+                    self._place(tick, item)
+
+            # Release the items in the current slot; with a single
+            # level, it may also hold items beyond the wheel's range
+            slot = self._tick % self._slots
+            entries = self._wheels[0][slot]
+            if entries:
+                self._wheels[0][slot] = []
+                for tick, item in entries:
+                    if tick > self._tick:
+                        self._place(tick, item)
+                    else:
+                        due.append(item)
+                        self._count -= 1
+
+        return due
+
+    def clear(self):
+        """
+        Discard all the items being held.
+        """
+
+        for wheel in self._wheels:
+            for slot in range(self._slots):
+                wheel[slot] = []
+        self._count = 0
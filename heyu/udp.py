@@ -0,0 +1,304 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import hashlib
+import hmac
+import os
+import socket
+import struct
+import time
+
+import gevent.server
+
+from heyu import protocol
+from heyu import ulid
+
+
+# A sealed datagram consists of an HMAC-SHA256 digest, followed by a
+# header of the time the datagram was sealed and a random nonce,
+# followed by the encoded "notify" message.  The digest covers the
+# header and the message.
+DIGEST_SIZE = hashlib.sha256().digest_size
+_header = struct.Struct('!dQ')
+
+
+class UDPException(Exception):
+    """
+    Exception raised if a datagram cannot be authenticated, or if
+    there's an error reading the key.
+    """
+
+    pass
+
+
+def read_key(path):
+    """
+    Read a shared key from a file.
+
+    :param path: The path of the file containing the key.  Trailing
+                 whitespace is ignored.
+
+    :returns: The key.
+    """
+
+    try:
+        with open(path, 'rb') as f:
+            key = f.read().rstrip()
+    except IOError as e:
+        raise UDPException("Could not read key file '%s': %s" % (path, e))
+
+    if not key:
+        raise UDPException("Key file '%s' is empty" % path)
+
+    return key
+
+
+def _digest(key, data):
+    """
+    Compute the digest of a datagram.
+
+    :param key: The shared key.
+    :param data: The header and message of the datagram.
+
+    :returns: The digest.
+    """
+
+    return hmac.new(key, data, hashlib.sha256).digest()
+
+
+def seal(key, payload, now=None, nonce=None):
+    """
+    Seal a message for transmission as a datagram.
+
+    :param key: The shared key.
+    :param payload: The encoded message.
+    :param now: The current time.  Defaults to the result of
+                ``time.time()``.
+    :param nonce: A 64-bit nonce.  Defaults to a random value.
+
+    :returns: The datagram.
+    """
+
+    if now is None:
+        now = time.time()
+    if nonce is None:
+        nonce = struct.unpack('!Q', os.urandom(8))[0]
+
+    data = _header.pack(now, nonce) + payload
+    return _digest(key, data) + data
+
+
+class ReplayCache(object):
+    """
+    Detects replayed datagrams.  Datagrams sealed more than ``window``
+    seconds from the current time are rejected outright, and the
+    nonces of the datagrams accepted within the window are
+    remembered, so that a datagram cannot be accepted twice.
+    """
+
+    # Bound on the number of nonces to remember; once reached, new
+    # datagrams are rejected until old nonces leave the window
+    max_nonces = 100000
+
+    def __init__(self, window):
+        """
+        Initialize a ``ReplayCache`` object.
+
+        :param window: The number of seconds a datagram remains
+                       acceptable.
+        """
+
+        self.window = window
+
+        # The nonces accepted within the window, in order of arrival,
+        # mapped to the time the datagram was sealed
+        self._nonces = collections.OrderedDict()
+
+    def __len__(self):
+        """
+        Retrieve the number of nonces being remembered.
+
+        :returns: The number of nonces.
+        """
+
+        return len(self._nonces)
+
+    def check(self, timestamp, nonce, now):
+        """
+        Check a datagram for replay.  If the datagram is acceptable,
+        its nonce is remembered.
+
+        :param timestamp: The time the datagram was sealed.
+        :param nonce: The nonce of the datagram.
+        :param now: The current time.
+
+        :returns: ``True`` if the datagram is acceptable, ``False``
+                  if it is stale, has already been seen, or cannot be
+                  remembered.
+        """
+
+        # Forget nonces that have left the window; their datagrams
+        # would now be rejected as stale anyway
+        horizon = now - self.window
+        while self._nonces:
+            oldest = next(iter(self._nonces))
+            if self._nonces[oldest] >= horizon:
+                break
+            del self._nonces[oldest]
+
+        if abs(now - timestamp) > self.window or nonce in self._nonces:
+            return False
+
+        # Forgetting a nonce still within the window would allow its
+        # datagram to be replayed, so refuse new datagrams instead
+        if len(self._nonces) >= self.max_nonces:
+            return False
+
+        self._nonces[nonce] = timestamp
+        return True
+
+
+class UDPListener(object):
+    """
+    Accepts sealed "notify" messages in single datagrams, for
+    high-rate sources that can tolerate loss.  Datagrams are
+    authenticated by an HMAC with a shared key, replays are dropped,
+    and no reply is sent.  Accepted notifications are submitted to the
+    hub like any other.
+    """
+
+    def __init__(self, server, endpoint, key, window=30.0):
+        """
+        Initialize a ``UDPListener`` object.
+
+        :param server: The ``heyu.hub.HubServer`` instance to submit
+                       notifications to.
+        :param endpoint: The address to listen on, as a tuple of
+                         address and port.
+        :param key: The shared key used to authenticate datagrams.
+        :param window: The number of seconds a datagram remains
+                       acceptable after it is sealed.  Defaults to 30
+                       seconds.
+        """
+
+        self._server = server
+        self._endpoint = endpoint
+        self._key = key
+        self._replay = ReplayCache(window)
+        self._listener = None
+
+        # The name to use for local senders; resolved once at start
+        self._fqdn = None
+
+    def unseal(self, datagram, now=None):
+        """
+        Authenticate a datagram and check it for replay.
+
+        :param datagram: The received datagram.
+        :param now: The current time.  Defaults to the result of
+                    ``time.time()``.
+
+        :returns: The encoded message.
+        """
+
+        if now is None:
+            now = time.time()
+
+        if len(datagram) < DIGEST_SIZE + _header.size:
+            raise UDPException('datagram too short')
+
+        digest = datagram[:DIGEST_SIZE]
+        data = datagram[DIGEST_SIZE:]
+        if not hmac.compare_digest(digest, _digest(self._key, data)):
+            raise UDPException('bad digest')
+
+        timestamp, nonce = _header.unpack_from(data)
+        if not self._replay.check(timestamp, nonce, now):
+            raise UDPException('stale or replayed datagram')
+
+        return data[_header.size:]
+
+    def _handle(self, datagram, addr):
+        """
+        Handle a received datagram.
+
+        :param datagram: The received datagram.
+        :param addr: The address of the sender.
+        """
+
+        server = self._server
+        server.metrics['udp_datagrams'].inc()
+        server.metrics['bytes_in'].inc(len(datagram))
+
+        try:
+            msg = protocol.Message.from_frame(self.unseal(datagram))
+            if msg.msg_type != 'notify':
+                raise UDPException('unexpected message type')
+        except Exception:
+            server.metrics['udp_rejected'].inc()
+            return
+
+        start = time.time()
+
+        # Resolving every sender would be too expensive at the rates
+        # this endpoint is intended for, so use the bare address
+        hostname = addr[0]
+        if hostname in ('127.0.0.1', '::1'):
+            hostname = self._fqdn
+
+        # Resolve relative times against our own clock
+        deliver_at = protocol.delivery(msg.deliver_at, msg.delay, start)
+
+        notif = protocol.Message('notify', id=msg.id or ulid.generate(),
+                                 app_name='[%s]%s' % (hostname, msg.app_name),
+                                 summary=msg.summary, body=msg.body,
+                                 urgency=msg.urgency, category=msg.category,
+                                 path=[server.name],
+                                 expires=protocol.expiry(
+                                     msg.expires, msg.ttl,
+                                     deliver_at, start),
+                                 deliver_at=deliver_at)
+
+        # Submit it, subject to the rate limit; there's nobody to tell
+        # about failures
+        try:
+            server.throttle(hostname, msg.app_name)
+            server.submit(notif)
+        except Exception:
+            server.metrics['submit_errors'].inc()
+
+        server.metrics['notify_seconds'].observe(time.time() - start)
+
+    def start(self):
+        """
+        Start listening for datagrams.
+        """
+
+        self._fqdn = socket.getfqdn()
+        self._listener = gevent.server.DatagramServer(self._endpoint,
+                                                      self._handle)
+        self._listener.start()
+
+    def stop(self):
+        """
+        Stop listening for datagrams.
+        """
+
+        if self._listener is None:
+            return
+
+        self._listener.stop()
+        self._listener = None
@@ -0,0 +1,178 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import binascii
+import os
+import struct
+import time
+
+
+# The Crockford base32 alphabet; it omits I, L, O, and U to avoid
+# confusion, and sorts in the same order as the values it encodes
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_values = dict((c, i) for i, c in enumerate(ALPHABET))
+
+# An ID is 128 bits: a 48-bit timestamp in milliseconds, followed by
+# 80 bits of randomness.  The text form is 26 base32 characters, and
+# the binary form is 16 bytes, both of which sort in time order.
+TEXT_SIZE = 26
+BINARY_SIZE = 16
+_RANDOM_BITS = 80
+_RANDOM_MAX = (1 << _RANDOM_BITS) - 1
+_TIME_MAX = (1 << 48) - 1
+_halves = struct.Struct('!QQ')
+
+
+def encode(value):
+    """
+    Encode a 128-bit ID in its text form.
+
+    :param value: The ID, as an integer.
+
+    :returns: The text form of the ID.
+    """
+
+    chars = []
+    for _i in range(TEXT_SIZE):
+        chars.append(ALPHABET[value & 0x1f])
+        value >>= 5
+
+    return ''.join(reversed(chars))
+
+
+def decode(text):
+    """
+    Decode the text form of an ID.  Lowercase characters are
+    accepted.
+
+    :param text: The text form of the ID.
+
+    :returns: The ID, as an integer.
+    """
+
+    if len(text) != TEXT_SIZE:
+        raise ValueError('ID must be %d characters' % TEXT_SIZE)
+
+    value = 0
+    for char in text.upper():
+        try:
+            value = (value << 5) | _values[char]
+        except KeyError:
+            raise ValueError('invalid character %r in ID' % char)
+
+    # The text form has two more bits than the ID
+    if value >> 128:
+        raise ValueError('ID out of range')
+
+    return value
+
+
+def pack(text):
+    """
+    Convert the text form of an ID to its binary form.
+
+    :param text: The text form of the ID.
+
+    :returns: The binary form of the ID.
+    """
+
+    value = decode(text)
+    return _halves.pack(value >> 64, value & 0xffffffffffffffff)
+
+
+def unpack(data):
+    """
+    Convert the binary form of an ID to its text form.
+
+    :param data: The binary form of the ID.
+
+    :returns: The text form of the ID.
+    """
+
+    if len(data) != BINARY_SIZE:
+        raise ValueError('ID must be %d bytes' % BINARY_SIZE)
+
+    high, low = _halves.unpack(data)
+    return encode((high << 64) | low)
+
+
+def timestamp(text):
+    """
+    Determine when an ID was generated.
+
+    :param text: The text form of the ID.
+
+    :returns: The time the ID was generated, as a UNIX timestamp, or
+              ``None`` if ``text`` is not a valid ID.
+    """
+
+    try:
+        value = decode(text)
+    except (TypeError, ValueError):
+        return None
+
+    return (value >> _RANDOM_BITS) / 1000.0
+
+
+class Generator(object):
+    """
+    Generates IDs which sort in the order they were generated.  Each
+    ID consists of the time in milliseconds and a random component;
+    IDs generated within the same millisecond, or while the clock is
+    running backwards, increment the random component of the previous
+    ID instead of drawing a new one, so that they still sort in
+    order.
+    """
+
+    def __init__(self):
+        """
+        Initialize a ``Generator`` object.
+        """
+
+        self._last_time = -1
+        self._last_random = 0
+
+    def __call__(self, now=None):
+        """
+        Generate an ID.
+
+        :param now: The current time, as a UNIX timestamp.  Defaults
+                    to the result of ``time.time()``.
+
+        :returns: The text form of the ID.
+        """
+
+        if now is None:
+            now = time.time()
+        ms = min(int(now * 1000), _TIME_MAX)
+
+        if ms > self._last_time:
+            rand = int(binascii.hexlify(os.urandom(_RANDOM_BITS // 8)), 16)
+        else:
+            ms = self._last_time
+            rand = self._last_random + 1
+            if rand > _RANDOM_MAX:
+                # Borrow the next millisecond
+                ms += 1
+                rand = 0
+
+        self._last_time = ms
+        self._last_random = rand
+
+        return encode((ms << _RANDOM_BITS) | rand)
+
+
+# The generator for IDs assigned by this process
+generate = Generator()
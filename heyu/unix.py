@@ -0,0 +1,311 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import os
+import pwd
+import stat
+import struct
+
+import gevent
+from gevent import socket
+from tendril import application
+from tendril import tcp
+from tendril import utils
+
+
+# The socket option for retrieving the credentials of the peer; not
+# all versions of Python define it, so fall back to the Linux value
+SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)
+
+# The credentials are returned as a "struct ucred": the process ID,
+# user ID, and group ID of the peer
+_ucred = struct.Struct('3i')
+
+
+class UnixException(Exception):
+    """
+    Exception raised if there's an error parsing a user specification,
+    or if the path of the socket is taken by something other than a
+    socket.
+    """
+
+    pass
+
+
+def parse_user(value):
+    """
+    Parse a user specification.
+
+    :param value: The user specification.  May be a user name or a
+                  numeric user ID.
+
+    :returns: The numeric user ID.
+    """
+
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+
+    try:
+        return pwd.getpwnam(value).pw_uid
+    except KeyError:
+        raise UnixException("Unknown user '%s'" % value)
+
+
+def remove_stale(path):
+    """
+    Remove a socket left behind by a previous listener.  Anything else
+    at the path is left alone, so that a mistyped path cannot destroy
+    an unrelated file.
+
+    :param path: The path of the Unix domain socket.
+    """
+
+    try:
+        mode = os.lstat(path).st_mode
+    except OSError as exc:
+        if exc.errno == errno.ENOENT:
+            return
+        raise
+
+    if not stat.S_ISSOCK(mode):
+        raise UnixException("'%s' exists and is not a socket" % path)
+
+    os.unlink(path)
+
+
+def peer_credentials(sock):
+    """
+    Retrieve the credentials of the process at the other end of a
+    Unix domain socket.
+
+    :param sock: The connected socket.
+
+    :returns: A tuple of the process ID, user ID, and group ID of the
+              peer.
+    """
+
+    return _ucred.unpack(sock.getsockopt(socket.SOL_SOCKET, SO_PEERCRED,
+                                         _ucred.size))
+
+
+class UnixTendril(tcp.TCPTendril):
+    """
+    Manages state associated with a single Unix domain socket
+    connection.  In addition to the attributes available on the
+    ``tendril.TCPTendril`` class, this class includes the attribute
+    ``credentials``, which is a tuple of the process ID, user ID, and
+    group ID of the peer, if known.
+    """
+
+    proto = 'unix'
+
+    def __init__(self, manager, sock, remote_addr=None, credentials=None):
+        """
+        Initialize a ``UnixTendril``.
+
+        :param manager: The ``UnixTendrilManager`` responsible for the
+                        Tendril.
+        :param sock: The socket for the underlying connection.
+        :param remote_addr: The address of the remote end of the
+                            connection.  Unix domain socket clients
+                            are usually unnamed, so this should be
+                            something unique to the connection.
+        :param credentials: A tuple of the process ID, user ID, and
+                            group ID of the peer.  Optional.
+        """
+
+        super(UnixTendril, self).__init__(manager, sock, remote_addr)
+
+        self.credentials = credentials
+
+
+class UnixTendrilManager(tcp.TCPTendrilManager):
+    """
+    Manages connections through a Unix domain socket.  Connections are
+    authenticated by the credentials of the connecting process, rather
+    than by certificates; if a set of user IDs is given, connections
+    from processes running as any other user are refused.
+    """
+
+    proto = 'unix'
+
+    def __init__(self, path=None, uids=None, mode=None):
+        """
+        Initialize a ``UnixTendrilManager``.
+
+        :param path: The path of the Unix domain socket to listen on.
+                     Not needed for managers that only initiate
+                     connections.
+        :param uids: A set of the user IDs allowed to connect.  If
+                     ``None``, only the user running the listener
+                     may connect, unless ``mode`` says otherwise.
+        :param mode: The permissions to give the socket.  If ``uids``
+                     is given, defaults to 0666, so that the listed
+                     users may connect; otherwise, defaults to 0600,
+                     so that only the user running the listener may.
+        """
+
+        super(UnixTendrilManager, self).__init__(path)
+
+        self.uids = uids
+        if mode is None:
+            mode = 0o600 if uids is None else 0o666
+        self.mode = mode
+
+    def start(self, acceptor=None, wrapper=None):
+        """
+        Starts the ``UnixTendrilManager``.  If it will be accepting
+        connections, any socket left behind by a previous listener is
+        removed first; if something other than a socket is in the way,
+        a ``UnixException`` is raised and the manager is not started.
+
+        :param acceptor: If given, specifies a callable that will be
+                         called with each newly received
+                         ``UnixTendril``.  If not given, no new
+                         connections will be accepted.
+        :param wrapper: A callable taking, as its first argument, a
+                        socket.socket object.  The callable must
+                        return a valid proxy for the socket.socket
+                        object.
+        """
+
+        if acceptor and self.endpoint:
+            remove_stale(self.endpoint)
+
+        super(UnixTendrilManager, self).start(acceptor, wrapper)
+
+    def connect(self, target, acceptor, wrapper=None):
+        """
+        Initiate a connection to a Unix domain socket.  Once the
+        connection is completed, a ``UnixTendril`` object will be
+        created and passed to the given acceptor.
+
+        :param target: The path of the Unix domain socket.
+        :param acceptor: A callable which will initialize the state of
+                         the new ``UnixTendril`` object.
+        :param wrapper: A callable taking, as its first argument, a
+                        socket.socket object.  The callable must
+                        return a valid proxy for the socket.socket
+                        object, which will subsequently be used to
+                        communicate on the connection.
+        """
+
+        # The common sanity-checks insist that the target be in the
+        # same address family as the endpoint, which doesn't work for
+        # managers that only initiate connections
+        if not self.running:
+            raise ValueError("TendrilManager not running")
+
+        # Set up the socket
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        with utils.SocketCloser(sock, ignore=[application.RejectConnection]):
+            # Connect to our target
+            sock.connect(target)
+
+            # Call any wrappers
+            if wrapper:
+                sock = wrapper(sock)
+
+            # Now, construct a Tendril
+            tend = UnixTendril(self, sock, target)
+
+            # Finally, set up the application
+            tend.application = acceptor(tend)
+
+            # OK, let's track the tendril
+            self._track_tendril(tend)
+
+            # Start the tendril
+            tend._start()
+
+            return tend
+
+        # The acceptor raised a RejectConnection exception, apparently
+        sock.close()
+        return None
+
+    def listener(self, acceptor, wrapper):
+        """
+        Listens for new connections to the manager's Unix domain
+        socket.  Once a new connection is received and its
+        credentials checked, a ``UnixTendril`` object is generated for
+        it and it is passed to the acceptor, which must initialize the
+        state of the connection.
+
+        :param acceptor: If given, specifies a callable that will be
+                         called with each newly received
+                         ``UnixTendril``.  If not given, no new
+                         connections will be accepted.
+        :param wrapper: A callable taking, as its first argument, a
+                        socket.socket object.  The callable must
+                        return a valid proxy for the socket.socket
+                        object.
+        """
+
+        # If we have no acceptor, there's nothing for us to do here
+        if not acceptor:
+            # Not listening on anything
+            self.local_addr = None
+
+            # Just sleep in a loop
+            while True:
+                gevent.sleep(600)
+
+        # OK, set up the socket
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        with utils.SocketCloser(sock):
+            sock.bind(self.endpoint)
+            os.chmod(self.endpoint, self.mode)
+            self.local_addr = self.endpoint
+
+            # Call any wrappers
+            if wrapper:
+                sock = wrapper(sock)
+
+            # Initiate listening
+            sock.listen(self.backlog)
+
+        # OK, now go into an accept loop with an error threshold of 10
+        closer = utils.SocketCloser(sock, 10,
+                                    ignore=[application.RejectConnection])
+        while True:
+            with closer:
+                cli, _addr = sock.accept()
+
+                # Authenticate the peer
+                with utils.SocketCloser(cli):
+                    creds = peer_credentials(cli)
+                    if self.uids is not None and creds[1] not in self.uids:
+                        raise application.RejectConnection()
+
+                    # Clients are unnamed, so distinguish the
+                    # connection by the peer credentials and the
+                    # descriptor
+                    tend = UnixTendril(self, cli, creds + (cli.fileno(),),
+                                       creds)
+
+                    # Set up the application
+                    tend.application = acceptor(tend)
+
+                    # Make sure we track the new tendril, but only if
+                    # the acceptor doesn't throw any exceptions
+                    self._track_tendril(tend)
+
+                    # Start the tendril
+                    tend._start()
@@ -20,9 +20,11 @@ import ConfigParser
 import os
 import re
 import socket
-import ssl
 import sys
 
+from gevent import ssl
+import tendril
+
 # Import the correct asyncio library
 try:
     import asyncio
@@ -37,6 +39,13 @@ else:
     SSLContext = asyncio.SSLContext
 
 
+# Select the correct intern() function to use
+if hasattr(sys, 'intern'):
+    intern = sys.intern
+else:
+    intern = intern
+
+
 # Default port for the HeyU hub
 HEYU_PORT = 4859
 
@@ -110,29 +119,51 @@ def default_hub():
         return ('127.0.0.1', HEYU_PORT)
 
 
-# def outgoing_endpoint(target):
-#     """
-#     The ``tendril.get_manager()`` function must be called with the
-#     appropriate originating endpoint for the target address
-#     family--that is, if the hub is on an IPv4 address,
-#     ``tendril.get_manager()`` must be called with an endpoint of
-#     ``('', 0)``, and if it is an IPv6 address, the endpoint must be
-#     ``('::', 0)``.  This helper function selects the correct
-#     originating endpoint given the target address.
+def read_endpoints(path):
+    """
+    Read a list of endpoints from a file.
+
+    :param path: The path of the file.  Each line of the file
+                 contains an endpoint, as "address" or "address:port";
+                 blank lines and lines beginning with '#' are ignored.
+
+    :returns: A list of tuples of the address and integer port number.
+    """
 
-#     :param target: The target of the connection.
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except IOError as e:
+        raise HubException("Could not read endpoints file '%s': %s" %
+                           (path, e))
 
-#     :returns: One of ``('', 0)`` or ``('::', 0)``, depending on the
-#               address family of ``target``.
-#     """
+    return [parse_hub(line.strip()) for line in lines
+            if line.strip() and not line.strip().startswith('#')]
 
-#     # Need the address family of the target
-#     fam = tendril.addr_info(target)
 
-#     # Select the correct endpoint
-#     if fam == socket.AF_INET6:
-#         return ('::', 0)
-#     return ('', 0)
+def outgoing_endpoint(target):
+    """
+    The ``tendril.get_manager()`` function must be called with the
+    appropriate originating endpoint for the target address
+    family--that is, if the hub is on an IPv4 address,
+    ``tendril.get_manager()`` must be called with an endpoint of
+    ``('', 0)``, and if it is an IPv6 address, the endpoint must be
+    ``('::', 0)``.  This helper function selects the correct
+    originating endpoint given the target address.
+
+    :param target: The target of the connection.
+
+    :returns: One of ``('', 0)`` or ``('::', 0)``, depending on the
+              address family of ``target``.
+    """
+
+    # Need the address family of the target
+    fam = tendril.addr_info(target)
+
+    # Select the correct endpoint
+    if fam == socket.AF_INET6:
+        return ('::', 0)
+    return ('', 0)
 
 
 # Regular expression for parsing a certificate configuration
@@ -150,84 +181,195 @@ class CertException(Exception):
     pass
 
 
-# def cert_wrapper(cert_conf, profile, server_side=False, secure=True):
-#     """
-#     Compute and return a ``tendril.TendrilPartial`` object which will
-#     set up TLS on the HeyU port.
-
-#     :param cert_conf: The path to the certificate profile
-#                       configuration file.  If ``None``, "~/.heyu.cert"
-#                       is used.  The path is tilde-expanded.  Note that
-#                       the path may included an alternate profile name,
-#                       enclosed in braces ('[]') and appended to the
-#                       end of the path; this will override the value of
-#                       ``profile``.
-#     :param profile: The name of the default profile to use.
-#     :param server_side: If ``True``, TLS will be set up for the server
-#                         side of the connection, rather than the client
-#                         side.  Defaults to ``False``.
-#     :param secure: If ``True``, TLS will be set up, and an error
-#                    raised if the certificate configuration file cannot
-#                    be found.  If ``False``, TLS will not be set up.
-
-#     :returns: A wrapper callable, suitable for use with Tendril, that
-#               will set up TLS authentication and encryption for the
-#               HeyU connection.
-#     """
-
-#     # Set up no wrappers if we're set up insecure
-#     if not secure:
-#         return None
-
-#     # We need to find the certificate configuration file...
-#     if cert_conf is None:
-#         cert_conf = '~/.heyu.cert'
-#     else:
-#         # Parse the configuration specification
-#         match = CERTCONF_RE.match(cert_conf)
-#         if not match:
-#             raise CertException("Could not understand certificate "
-#                                 "configuration path '%s'" % cert_conf)
-
-#         # Set the stripped path
-#         cert_conf = match.group('conf_path')
-
-#         # Was the profile overridden?
-#         override = match.group('profile')
-#         if override:
-#             profile = override
-
-#     # Look up and read the certificate configuration
-#     cert_path = os.path.expanduser(cert_conf)
-#     cp = ConfigParser.SafeConfigParser()
-#     if not cp.read(cert_path):
-#         raise CertException("Could not read certificate configuration "
-#                             "file '%s'" % cert_path)
-
-#     # Suck in the profile
-#     try:
-#         conf = dict(cp.items(profile))
-#     except ConfigParser.NoSectionError:
-#         raise CertException("No such profile [%s] in configuration file '%s'" %
-#                             (profile, cert_path))
-#     except Exception as exc:
-#         raise CertException("Could not load profile [%s] from '%s': %s" %
-#                             (profile, cert_path, exc))
-
-#     # All we need now is the three essential configuration settings
-#     missing = [key for key in ('cafile', 'certfile', 'keyfile')
-#                if key not in conf]
-#     if missing:
-#         raise CertException("Missing configuration for the following "
-#                             "values in the [%s] profile of '%s': %s" %
-#                             (profile, cert_path, ', '.join(sorted(missing))))
-
-#     return tendril.TendrilPartial(
-#         ssl.wrap_socket,
-#         keyfile=conf['keyfile'], certfile=conf['certfile'],
-#         ca_certs=conf['cafile'],
-#         server_side=server_side, cert_reqs=ssl.CERT_REQUIRED,
-#         ssl_version=ssl.PROTOCOL_TLSv1)
+class TLSWrapper(object):
+    """
+    A wrapper callable, suitable for use with Tendril, that sets up
+    TLS on a socket using a shared ``SSLContext``.  Sharing the
+    context means the certificates are only loaded once, and allows
+    the server side to resume sessions.  On the client side, the
+    session negotiated with each peer is cached and offered on the
+    next connection to that peer, so that the full handshake can be
+    skipped; this requires a Python with ``ssl.SSLSession``, and is
+    skipped otherwise.
+    """
+
+    def __init__(self, context, server_side=False):
+        """
+        Initialize a ``TLSWrapper`` object.
+
+        :param context: The ``SSLContext`` to use.
+        :param server_side: If ``True``, TLS will be set up for the
+                            server side of the connection, rather
+                            than the client side.  Defaults to
+                            ``False``.
+        """
+
+        self.context = context
+        self.server_side = server_side
+
+        # The client-side session cache, keyed by peer address
+        self._sessions = {}
+
+    def __call__(self, sock):
+        """
+        Set up TLS on a socket.
+
+        :param sock: The socket to wrap.
+
+        :returns: The wrapped socket.
+        """
+
+        if self.server_side:
+            return self.context.wrap_socket(sock, server_side=True)
+
+        # Without session support, all we can do is a full handshake
+        if not hasattr(ssl, 'SSLSession'):
+            return self.context.wrap_socket(sock)
+
+        # Offer the session we last negotiated with the peer
+        peer = sock.getpeername()
+        wrapped = self.context.wrap_socket(
+            sock, session=self._sessions.get(peer))
+        self._sessions[peer] = wrapped.session
+
+        return wrapped
+
+    def replace(self, context):
+        """
+        Replace the ``SSLContext`` used for new connections.  Cached
+        sessions belong to the old context, so they are discarded.
+
+        :param context: The new ``SSLContext``.
+        """
+
+        self.context = context
+        self._sessions.clear()
+
+
+# A cache of the wrappers, keyed by the certificate configuration
+# path, the profile, and the side of the connection
+_wrappers = {}
+
+
+def cert_wrapper(cert_conf, profile, server_side=False, secure=True):
+    """
+    Compute and return a ``TLSWrapper`` object which will set up TLS
+    on the HeyU port.  The certificate configuration is only read
+    once for each profile; subsequent calls return the same wrapper,
+    sharing its ``SSLContext``.
+
+    :param cert_conf: The path to the certificate profile
+                      configuration file.  If ``None``, "~/.heyu.cert"
+                      is used.  The path is tilde-expanded.  Note that
+                      the path may included an alternate profile name,
+                      enclosed in braces ('[]') and appended to the
+                      end of the path; this will override the value of
+                      ``profile``.
+    :param profile: The name of the default profile to use.
+    :param server_side: If ``True``, TLS will be set up for the server
+                        side of the connection, rather than the client
+                        side.  Defaults to ``False``.
+    :param secure: If ``True``, TLS will be set up, and an error
+                   raised if the certificate configuration file cannot
+                   be found.  If ``False``, TLS will not be set up.
+
+    :returns: A wrapper callable, suitable for use with Tendril, that
+              will set up TLS authentication and encryption for the
+              HeyU connection.
+    """
+
+    # Set up no wrappers if we're set up insecure
+    if not secure:
+        return None
+
+    # We need to find the certificate configuration file...
+    if cert_conf is None:
+        cert_conf = '~/.heyu.cert'
+    else:
+        # Parse the configuration specification
+        match = CERTCONF_RE.match(cert_conf)
+        if not match:
+            raise CertException("Could not understand certificate "
+                                "configuration path '%s'" % cert_conf)
+
+        # Set the stripped path
+        cert_conf = match.group('conf_path')
+
+        # Was the profile overridden?
+        override = match.group('profile')
+        if override:
+            profile = override
+
+    # Have we already built the wrapper?
+    cert_path = os.path.expanduser(cert_conf)
+    cache_key = (cert_path, profile, server_side)
+    if cache_key in _wrappers:
+        return _wrappers[cache_key]
+
+    _wrappers[cache_key] = TLSWrapper(_load_context(cert_path, profile),
+                                      server_side)
+    return _wrappers[cache_key]
+
+
+def _load_context(cert_path, profile):
+    """
+    Read a certificate profile and build an ``SSLContext`` from it.
+
+    :param cert_path: The path to the certificate profile
+                      configuration file.
+    :param profile: The name of the profile to use.
+
+    :returns: The ``SSLContext``.
+    """
+
+    # Look up and read the certificate configuration
+    cp = ConfigParser.SafeConfigParser()
+    if not cp.read(cert_path):
+        raise CertException("Could not read certificate configuration "
+                            "file '%s'" % cert_path)
+
+    # Suck in the profile
+    try:
+        conf = dict(cp.items(profile))
+    except ConfigParser.NoSectionError:
+        raise CertException("No such profile [%s] in configuration file "
+                            "'%s'" % (profile, cert_path))
+    except Exception as exc:
+        raise CertException("Could not load profile [%s] from '%s': %s" %
+                            (profile, cert_path, exc))
+
+    # All we need now is the three essential configuration settings
+    missing = [key for key in ('cafile', 'certfile', 'keyfile')
+               if key not in conf]
+    if missing:
+        raise CertException("Missing configuration for the following "
+                            "values in the [%s] profile of '%s': %s" %
+                            (profile, cert_path, ', '.join(sorted(missing))))
+
+    # Build the context
+    context = SSLContext(ssl.PROTOCOL_TLSv1)
+    context.verify_mode = ssl.CERT_REQUIRED
+    context.load_cert_chain(conf['certfile'], conf['keyfile'])
+    context.load_verify_locations(conf['cafile'])
+
+    return context
+
+
+def reload_wrappers():
+    """
+    Re-read the certificate configuration for all the wrappers
+    returned by ``cert_wrapper()``, and replace their contexts.  New
+    connections will use the new certificates; established
+    connections are unaffected.  If any profile cannot be loaded, an
+    exception is raised and no wrapper is changed.
+    """
+
+    # Load all the new contexts before touching any wrapper
+    contexts = dict((cache_key, _load_context(cache_key[0], cache_key[1]))
+                    for cache_key in _wrappers)
+
+    for cache_key, context in contexts.items():
+        _wrappers[cache_key].replace(context)
 
 
 def daemonize(workdir='/', pidfile=None):
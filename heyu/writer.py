@@ -0,0 +1,115 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import gevent
+
+
+class Writer(object):
+    """
+    Batches the frames written to a subscriber's connection.  During
+    a burst, each notification would otherwise be written to the
+    connection by its own system call; instead, frames are collected
+    for a short delay, or until a byte budget is reached, and then
+    handed over together, so that they go out in a single write.  A
+    frame written while nothing is pending waits at most the delay.
+    """
+
+    # Every subscriber may have a writer, so keep them small
+    __slots__ = ('_write', 'delay', 'budget', '_frames', '_size', '_timer')
+
+    def __init__(self, write, delay, budget):
+        """
+        Initialize a ``Writer`` object.
+
+        :param write: A callable which will be called with a list of
+                      frames to write them to the connection.  It must
+                      not yield to other greenlets between frames.
+        :param delay: The longest time, in seconds, a frame may be
+                      held.
+        :param budget: The number of bytes of pending frames at which
+                       the frames are written without waiting for the
+                       delay to expire.
+        """
+
+        self._write = write
+        self.delay = delay
+        self.budget = budget
+
+        # The pending frames, only allocated while frames are pending,
+        # and their total size
+        self._frames = None
+        self._size = 0
+
+        # The timer for the next flush
+        self._timer = None
+
+    def __len__(self):
+        """
+        Retrieve the number of bytes of pending frames.
+
+        :returns: The number of bytes.
+        """
+
+        return self._size
+
+    def write(self, frame):
+        """
+        Write a frame.  The frame is held until the delay expires or
+        the byte budget is reached.
+
+        :param frame: The encoded frame.
+        """
+
+        if self._frames is None:
+            self._frames = []
+        self._frames.append(frame)
+        self._size += len(frame)
+
+        if self._size >= self.budget:
+            self.flush()
+        elif self._timer is None:
+            self._timer = gevent.spawn_later(self.delay, self._expired)
+
+    def flush(self):
+        """
+        Write the pending frames immediately.
+        """
+
+        if self._timer is not None:
+            self._timer.kill()
+            self._timer = None
+
+        self._send()
+
+    def _expired(self):
+        """
+        Called when the delay expires.  Writes the pending frames.
+        """
+
+        self._timer = None
+        self._send()
+
+    def _send(self):
+        """
+        Hand the pending frames over to be written.
+        """
+
+        frames = self._frames
+        self._frames = None
+        self._size = 0
+
+        if frames:
+            self._write(frames)
@@ -96,7 +96,9 @@ class GtkNotifierTest(unittest.TestCase):
         gtk.gtk_notifier('hub')
 
         mock_backoff.assert_called_once_with(300, 30, 5)
-        mock_NotificationServer.assert_called_once_with('hub', None, True)
+        mock_NotificationServer.assert_called_once_with(
+            'hub', None, True, lag_threshold=None, ring=None,
+            loop=None, snapshot=False)
         mock_init.assert_called_once_with('app_name')
         mock_Notification.assert_has_calls([
             mock.call('Starting', 'app_name is starting up'),
@@ -134,7 +136,9 @@ class GtkNotifierTest(unittest.TestCase):
         gtk.gtk_notifier('hub')
 
         mock_backoff.assert_called_once_with(300, 30, 5)
-        mock_NotificationServer.assert_called_once_with('hub', None, True)
+        mock_NotificationServer.assert_called_once_with(
+            'hub', None, True, lag_threshold=None, ring=None,
+            loop=None, snapshot=False)
         mock_init.assert_called_once_with('app_name')
         mock_Notification.assert_has_calls([
             mock.call('Starting', 'app_name is starting up'),
@@ -176,7 +180,9 @@ class GtkNotifierTest(unittest.TestCase):
         gtk.gtk_notifier('hub')
 
         mock_backoff.assert_called_once_with(300, 30, 5)
-        mock_NotificationServer.assert_called_once_with('hub', None, True)
+        mock_NotificationServer.assert_called_once_with(
+            'hub', None, True, lag_threshold=None, ring=None,
+            loop=None, snapshot=False)
         mock_init.assert_called_once_with('app_name')
         mock_Notification.assert_has_calls([
             mock.call('Starting', 'app_name is starting up'),
@@ -0,0 +1,174 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import mock
+
+from heyu import heartbeat
+
+
+class HeartbeatTest(unittest.TestCase):
+    @mock.patch('time.time', return_value=1000.0)
+    def test_init(self, mock_time):
+        result = heartbeat.Heartbeat('client', 10.0)
+
+        self.assertEqual('client', result._client)
+        self.assertEqual(10.0, result.interval)
+        self.assertEqual(3, result.misses)
+        self.assertEqual(True, result._ping)
+        self.assertEqual(1000.0, result._last)
+        self.assertEqual(None, result._timer)
+
+    @mock.patch('time.time', return_value=1000.0)
+    def test_init_alt(self, mock_time):
+        result = heartbeat.Heartbeat('client', 10.0, 5, False)
+
+        self.assertEqual(5, result.misses)
+        self.assertEqual(False, result._ping)
+
+    @mock.patch('time.time', side_effect=[1000.0, 1010.0])
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_start(self, mock_spawn_later, mock_time):
+        hb = heartbeat.Heartbeat('client', 10.0)
+
+        hb.start()
+
+        self.assertEqual(1010.0, hb._last)
+        self.assertEqual('timer', hb._timer)
+        mock_spawn_later.assert_called_once_with(10.0, hb._beat)
+
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_start_running(self, mock_spawn_later, mock_time):
+        hb = heartbeat.Heartbeat('client', 10.0)
+        hb._timer = 'running'
+
+        hb.start()
+
+        self.assertEqual('running', hb._timer)
+        self.assertFalse(mock_spawn_later.called)
+
+    def test_stop(self):
+        hb = heartbeat.Heartbeat('client', 10.0)
+        timer = mock.Mock()
+        hb._timer = timer
+
+        hb.stop()
+
+        timer.kill.assert_called_once_with()
+        self.assertEqual(None, hb._timer)
+
+    def test_stop_stopped(self):
+        hb = heartbeat.Heartbeat('client', 10.0)
+
+        hb.stop()
+
+        self.assertEqual(None, hb._timer)
+
+    @mock.patch('time.time', side_effect=[1000.0, 1020.0])
+    def test_received(self, mock_time):
+        hb = heartbeat.Heartbeat('client', 10.0)
+
+        hb.received()
+
+        self.assertEqual(1020.0, hb._last)
+
+    def test_slots(self):
+        hb = heartbeat.Heartbeat('client', 10.0)
+
+        self.assertFalse(hasattr(hb, '__dict__'))
+
+    @mock.patch('time.time', side_effect=[1000.0, 1010.0])
+    @mock.patch('gevent.spawn_later', return_value='next timer')
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    def test_beat_ping(self, mock_Message, mock_spawn_later, mock_time):
+        client = mock.Mock()
+        hb = heartbeat.Heartbeat(client, 10.0)
+        hb._timer = 'timer'
+
+        hb._beat()
+
+        mock_Message.assert_called_once_with('ping')
+        client.send_frame.assert_called_once_with('frame')
+        self.assertFalse(client.expired.called)
+        mock_spawn_later.assert_called_once_with(10.0, hb._beat)
+        self.assertEqual('next timer', hb._timer)
+
+    @mock.patch('time.time', side_effect=[1000.0, 1010.0])
+    @mock.patch('gevent.spawn_later', return_value='next timer')
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    def test_beat_ping_failure(self, mock_Message, mock_spawn_later,
+                               mock_time):
+        client = mock.Mock(**{'send_frame.side_effect': Exception('closed')})
+        hb = heartbeat.Heartbeat(client, 10.0)
+        hb._timer = 'timer'
+
+        hb._beat()
+
+        client.send_frame.assert_called_once_with('frame')
+        self.assertEqual('next timer', hb._timer)
+
+    @mock.patch('time.time', side_effect=[1000.0, 1010.0])
+    @mock.patch('gevent.spawn_later', return_value='next timer')
+    @mock.patch('heyu.protocol.Message')
+    def test_beat_no_ping(self, mock_Message, mock_spawn_later, mock_time):
+        client = mock.Mock()
+        hb = heartbeat.Heartbeat(client, 10.0, ping=False)
+        hb._timer = 'timer'
+
+        hb._beat()
+
+        self.assertFalse(mock_Message.called)
+        self.assertFalse(client.send_frame.called)
+        self.assertFalse(client.expired.called)
+        self.assertEqual('next timer', hb._timer)
+
+    @mock.patch('time.time', side_effect=[1000.0, 1010.0])
+    @mock.patch('gevent.spawn_later', return_value='next timer')
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    def test_beat_stopped(self, mock_Message, mock_spawn_later, mock_time):
+        client = mock.Mock()
+        hb = heartbeat.Heartbeat(client, 10.0)
+        hb._timer = 'timer'
+
+        def send_frame(frame):
+            hb._timer = None
+        client.send_frame.side_effect = send_frame
+
+        hb._beat()
+
+        self.assertFalse(mock_spawn_later.called)
+        self.assertEqual(None, hb._timer)
+
+    @mock.patch('time.time', side_effect=[1000.0, 1030.0])
+    @mock.patch('gevent.spawn_later')
+    def test_beat_expired(self, mock_spawn_later, mock_time):
+        client = mock.Mock()
+        hb = heartbeat.Heartbeat(client, 10.0)
+        hb._timer = 'timer'
+
+        hb._beat()
+
+        client.expired.assert_called_once_with()
+        self.assertFalse(client.send_frame.called)
+        self.assertFalse(mock_spawn_later.called)
+        self.assertEqual(None, hb._timer)
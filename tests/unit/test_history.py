@@ -0,0 +1,144 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import mock
+
+from heyu import history
+from heyu import ulid
+
+
+class HistoryTest(unittest.TestCase):
+    def _make_history(self, size=5, count=4):
+        result = history.History(size)
+        for i in range(count):
+            result.append('id%d' % i, 'frame%d' % i, 100 + i)
+        return result
+
+    def test_init(self):
+        result = history.History(5)
+
+        self.assertEqual(0, len(result))
+        self.assertEqual(5, result._entries.maxlen)
+
+    @mock.patch('time.time', return_value=1234.0)
+    def test_append_default_time(self, mock_time):
+        result = history.History(5)
+
+        result.append('id', 'frame')
+
+        self.assertEqual(1, len(result))
+        self.assertEqual([('id', 1234.0, 'frame', None)],
+                         list(result._entries))
+
+    def test_append_bounded(self):
+        result = self._make_history(3, 5)
+
+        self.assertEqual(3, len(result))
+        self.assertEqual([
+            ('id2', 102, 'frame2', None),
+            ('id3', 103, 'frame3', None),
+            ('id4', 104, 'frame4', None),
+        ], list(result._entries))
+
+    def test_append_expires(self):
+        result = history.History(5)
+
+        result.append('id', 'frame', 100, 160)
+
+        self.assertEqual([('id', 100, 'frame', 160)], list(result._entries))
+
+    def test_last(self):
+        result = self._make_history(5, 3)
+
+        self.assertEqual('id2', result.last)
+
+    def test_last_empty(self):
+        result = history.History(5)
+
+        self.assertEqual(None, result.last)
+
+    def test_since_nothing(self):
+        result = self._make_history()
+
+        self.assertEqual([], result.since())
+
+    def test_since_id(self):
+        result = self._make_history()
+
+        self.assertEqual(['frame2', 'frame3'], result.since('id1'))
+
+    def test_since_id_latest(self):
+        result = self._make_history()
+
+        self.assertEqual([], result.since('id3'))
+
+    def test_since_id_repeated(self):
+        result = self._make_history()
+        result.append('id1', 'frame1b', 200)
+        result.append('id5', 'frame5', 201)
+
+        self.assertEqual(['frame5'], result.since('id1'))
+
+    def test_since_id_unknown(self):
+        result = self._make_history()
+
+        self.assertEqual(['frame0', 'frame1', 'frame2', 'frame3'],
+                         result.since('unknown'))
+
+    def test_since_id_unknown_generated(self):
+        result = self._make_history()
+
+        self.assertEqual(['frame2', 'frame3'],
+                         result.since(ulid.encode((101000 << 80) | 5)))
+
+    def test_since_time(self):
+        result = self._make_history()
+
+        self.assertEqual(['frame2', 'frame3'], result.since(timestamp=101))
+
+    def test_since_time_future(self):
+        result = self._make_history()
+
+        self.assertEqual([], result.since(timestamp=1000))
+
+    def test_since_id_preferred(self):
+        result = self._make_history()
+
+        self.assertEqual(['frame3'], result.since('id2', 100))
+
+    @mock.patch('time.time', return_value=150.0)
+    def test_since_id_expired(self, mock_time):
+        result = self._make_history()
+        result.append('id4', 'frame4', 104, 150.0)
+        result.append('id5', 'frame5', 105, 151.0)
+
+        self.assertEqual(['frame3', 'frame5'], result.since('id2'))
+
+    @mock.patch('time.time', return_value=150.0)
+    def test_since_id_expired_boundary(self, mock_time):
+        result = self._make_history()
+        result.append('id4', 'frame4', 104, 150.0)
+        result.append('id5', 'frame5', 105)
+
+        self.assertEqual(['frame5'], result.since('id4'))
+
+    @mock.patch('time.time', return_value=150.0)
+    def test_since_time_expired(self, mock_time):
+        result = self._make_history()
+        result.append('id4', 'frame4', 104, 149.0)
+
+        self.assertEqual(['frame2', 'frame3'], result.since(timestamp=101))
@@ -13,13 +13,22 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import signal
+import socket
 import unittest
 
+import gevent
 import mock
 
 from heyu import hub
+from heyu import outbox
+from heyu import ratelimit
+from heyu import receipts
+from heyu import timingwheel
+from heyu import udp
 from heyu import util
+from heyu import writer
 
 
 class TestException(Exception):
@@ -34,6 +43,8 @@ class HubServerTest(unittest.TestCase):
         ]
         if hasattr(signal, 'SIGUSR1'):
             signals.append(mock.call(signal.SIGUSR1, hub_server.shutdown))
+        if hasattr(signal, 'SIGHUP'):
+            signals.append(mock.call(signal.SIGHUP, hub_server.reload))
         mock_signal.assert_has_calls(signals)
         self.assertEqual(len(signals), mock_signal.call_count)
 
@@ -43,8 +54,18 @@ class HubServerTest(unittest.TestCase):
         result = hub.HubServer([])
 
         self.assertEqual({}, result._subscribers)
+        self.assertEqual({}, result._sessions)
+        self.assertEqual({}, result._attached)
+        self.assertEqual(None, result._history)
+        self.assertEqual(None, result._journal)
+        self.assertEqual(0, result._coalesce)
+        self.assertEqual(0, result._write_delay)
+        self.assertEqual(65536, result._write_budget)
+        self.assertEqual(None, result._limiter)
         self.assertEqual({}, result._listeners)
         self.assertEqual(False, result._running)
+        self.assertEqual(0, len(result._scheduled))
+        self.assertEqual(1.0, result._scheduled.resolution)
         self.assertFalse(mock_get_manager.called)
         self._signal_test(result, mock_signal)
 
@@ -67,6 +88,177 @@ class HubServerTest(unittest.TestCase):
         ], any_order=True)
         self._signal_test(result, mock_signal)
 
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    @mock.patch.object(util, 'read_endpoints', return_value=['ep2', 'ep3'])
+    def test_init_endpoints_file(self, mock_read_endpoints, mock_signal,
+                                 mock_get_manager):
+        result = hub.HubServer(['ep1', 'ep2'], endpoints_file='/endpoints')
+
+        self.assertEqual({
+            'ep1': 'ep1',
+            'ep2': 'ep2',
+            'ep3': 'ep3',
+        }, result._listeners)
+        self.assertEqual(['ep1', 'ep2'], result._endpoints)
+        mock_read_endpoints.assert_called_once_with('/endpoints')
+
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    @mock.patch('heyu.history.History', return_value='history')
+    def test_init_history(self, mock_History, mock_signal, mock_get_manager):
+        result = hub.HubServer([], 10)
+
+        self.assertEqual('history', result._history)
+        self.assertEqual(None, result._snapshot)
+        mock_History.assert_called_once_with(10)
+        self._signal_test(result, mock_signal)
+
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    @mock.patch('heyu.snapshot.Snapshot', return_value='snapshot')
+    def test_init_snapshot(self, mock_Snapshot, mock_signal,
+                           mock_get_manager):
+        result = hub.HubServer([], snapshot_size=10)
+
+        self.assertEqual('snapshot', result._snapshot)
+        mock_Snapshot.assert_called_once_with(10)
+        self._signal_test(result, mock_signal)
+
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    @mock.patch('socket.getfqdn', return_value='fqdn')
+    def test_init_default_name(self, mock_getfqdn, mock_signal,
+                               mock_get_manager):
+        result = hub.HubServer([])
+
+        self.assertEqual('fqdn', result.name)
+        self.assertEqual('fqdn', result.fqdn)
+        mock_getfqdn.assert_called_once_with()
+        self.assertEqual([], result._relay_hubs)
+        self.assertEqual([], result._relays)
+        self.assertEqual({}, result._seen)
+
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    @mock.patch('socket.getfqdn', return_value='fqdn')
+    def test_init_relays(self, mock_getfqdn, mock_signal, mock_get_manager):
+        result = hub.HubServer([], name='hub1', relays=['up1', 'up2'])
+
+        self.assertEqual('hub1', result.name)
+        self.assertEqual('fqdn', result.fqdn)
+        self.assertEqual(['up1', 'up2'], result._relay_hubs)
+        self.assertEqual([], result._relays)
+        mock_getfqdn.assert_called_once_with()
+
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    @mock.patch('heyu.metrics.StatsServer', return_value='stats')
+    def test_init_stats_socket(self, mock_StatsServer, mock_signal,
+                               mock_get_manager):
+        result = hub.HubServer([], stats_socket='/stats')
+
+        self.assertEqual('stats', result._stats_server)
+        mock_StatsServer.assert_called_once_with(result.metrics, '/stats')
+
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    @mock.patch('heyu.unix.UnixTendrilManager', return_value='unix')
+    def test_init_unix_socket(self, mock_UnixTendrilManager, mock_signal,
+                              mock_get_manager):
+        result = hub.HubServer(['ep1'], unix_socket='/sock',
+                               unix_uids=set([1000]))
+
+        self.assertEqual({
+            'ep1': 'ep1',
+            '/sock': 'unix',
+        }, result._listeners)
+        mock_UnixTendrilManager.assert_called_once_with('/sock',
+                                                        set([1000]))
+
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    @mock.patch('heyu.udp.UDPListener', return_value='udp')
+    def test_init_udp(self, mock_UDPListener, mock_signal, mock_get_manager):
+        result = hub.HubServer([], udp_endpoint=('', 5000), udp_key='key')
+
+        self.assertEqual('udp', result._udp)
+        mock_UDPListener.assert_called_once_with(result, ('', 5000), 'key')
+
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    @mock.patch('heyu.looplag.LoopMonitor', return_value='monitor')
+    def test_init_lag_threshold(self, mock_LoopMonitor, mock_signal,
+                                mock_get_manager):
+        result = hub.HubServer([])
+        self.assertEqual(None, result._monitor)
+        self.assertFalse(mock_LoopMonitor.called)
+
+        result = hub.HubServer([], lag_threshold=0.25)
+        self.assertEqual('monitor', result._monitor)
+        mock_LoopMonitor.assert_called_once_with(0.25, result.metrics)
+
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    @mock.patch('heyu.shmring.RingWriter')
+    def test_init_ring(self, mock_RingWriter, mock_signal, mock_get_manager):
+        result = hub.HubServer([])
+        self.assertEqual(None, result._ring)
+        self.assertEqual(None, result.ring_head)
+        self.assertEqual(0, result.metrics.snapshot()['ring_head'])
+
+        mock_RingWriter.return_value.head = 42
+        result = hub.HubServer([], ring_path='/ring', ring_size=65536)
+        self.assertEqual(mock_RingWriter.return_value, result._ring)
+        self.assertEqual(42, result.ring_head)
+        self.assertEqual(42, result.metrics.snapshot()['ring_head'])
+        mock_RingWriter.assert_called_once_with('/ring', 65536)
+
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    def test_init_heartbeat_min(self, mock_signal, mock_get_manager):
+        result = hub.HubServer([])
+        self.assertEqual(5.0, result._heartbeat_min)
+
+        result = hub.HubServer([], heartbeat_min=1.5)
+        self.assertEqual(1.5, result._heartbeat_min)
+
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    def test_init_metrics(self, mock_signal, mock_get_manager):
+        result = hub.HubServer([], 10)
+        result._subscribers = {
+            'c1': mock.Mock(pending=5, outbox=None, version=0),
+            'c2': mock.Mock(pending=0, outbox=[1, 2], version=0),
+        }
+        result._history.append('id', 'frame')
+        result._snapshot = mock.MagicMock(**{'__len__.return_value': 3})
+
+        snapshot = result.metrics.snapshot()
+
+        self.assertEqual(None, result._stats_server)
+        self.assertEqual(0, snapshot['notifications_submitted'])
+        self.assertEqual(2, snapshot['subscribers'])
+        self.assertEqual(7, snapshot['queue_depth'])
+        self.assertEqual(1, snapshot['history_entries'])
+        self.assertEqual(3, snapshot['snapshot_entries'])
+        self.assertEqual(0, snapshot['notify_seconds']['count'])
+        self.assertFalse('ratelimit_rejected' in snapshot)
+
+    @mock.patch('tendril.get_manager', side_effect=lambda a, b: b)
+    @mock.patch('gevent.signal')
+    def test_init_metrics_limiter(self, mock_signal, mock_get_manager):
+        limiter = mock.MagicMock(rejected=3, deferred=2)
+        limiter.__len__.return_value = 4
+        result = hub.HubServer([], limiter=limiter)
+
+        snapshot = result.metrics.snapshot()
+
+        self.assertEqual(0, snapshot['history_entries'])
+        self.assertEqual(3, snapshot['ratelimit_rejected'])
+        self.assertEqual(2, snapshot['ratelimit_deferred'])
+        self.assertEqual(4, snapshot['ratelimit_buckets'])
+
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
     @mock.patch.object(hub, 'HubApplication', return_value='app')
     def test_acceptor(self, mock_HubApplication, mock_init):
@@ -101,231 +293,2357 @@ class HubServerTest(unittest.TestCase):
             'c': mock.Mock(),
         }
         server._running = False
+        server._active = False
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._relay_hubs = []
+        server._standby = None
 
         server.start()
 
         self.assertEqual(True, server._running)
+        self.assertEqual(True, server._active)
         mock_cert_wrapper.assert_called_once_with(
             None, 'hub', server_side=True, secure=True)
         for manager in server._listeners.values():
             manager.start.assert_called_once_with(server._acceptor, 'wrapper')
 
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch.object(util, 'cert_wrapper', return_value='wrapper')
+    def test_start_monitor(self, mock_cert_wrapper, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._running = False
+        server._active = False
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = mock.Mock()
+        server._ring = None
+        server._relay_hubs = []
+        server._standby = None
+
+        server.start()
+
+        server._monitor.start.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch.object(util, 'cert_wrapper', return_value='wrapper')
+    def test_start_ring(self, mock_cert_wrapper, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._running = False
+        server._active = False
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = mock.Mock()
+        server._relay_hubs = []
+        server._standby = None
+
+        server.start()
+
+        server._ring.open.assert_called_once_with()
+
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
     @mock.patch.object(util, 'cert_wrapper', return_value='wrapper')
     def test_start_nolisteners(self, mock_cert_wrapper, mock_init):
         server = hub.HubServer()
         server._listeners = {}
         server._running = False
+        server._active = False
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._relay_hubs = []
+        server._standby = None
 
         server.start()
 
         self.assertEqual(True, server._running)
+        self.assertEqual(True, server._active)
         mock_cert_wrapper.assert_called_once_with(
             None, 'hub', server_side=True, secure=True)
         for manager in server._listeners.values():
             manager.start.assert_called_once_with(server._acceptor, 'wrapper')
 
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
-    def test_stop_notrunning(self, mock_init):
+    @mock.patch.object(util, 'cert_wrapper', return_value='wrapper')
+    @mock.patch('heyu.relay.Standby')
+    def test_start_standby(self, mock_Standby, mock_cert_wrapper, mock_init):
         server = hub.HubServer()
         server._listeners = {
             'a': mock.Mock(),
-            'b': mock.Mock(),
-            'c': mock.Mock(),
-        }
-        server._subscribers = {
-            'a': (mock.Mock(), 0),
-            'b': (mock.Mock(), 1),
-            'c': (mock.Mock(), 2),
         }
         server._running = False
+        server._active = False
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._history = mock.Mock(last='last-id')
+        server._relay_hubs = []
+        server._standby = 'primary'
+        server._failover = 2.5
+
+        server.start('cert_conf', False)
 
-        server.stop()
-
-        for manager in server._listeners.values():
-            self.assertFalse(manager.stop.called)
-        for client, _version in server._subscribers.values():
-            self.assertFalse(client.disconnect.called)
+        self.assertEqual(True, server._running)
+        self.assertEqual(False, server._active)
+        mock_cert_wrapper.assert_has_calls([
+            mock.call('cert_conf', 'hub', server_side=True, secure=False),
+            mock.call('cert_conf', 'hub', secure=False),
+        ])
+        mock_Standby.assert_called_once_with(server, 'primary', 'wrapper',
+                                             2.5)
+        self.assertEqual(mock_Standby.return_value, server._follower)
+        self.assertEqual('last-id', server._follower.last_id)
+        mock_Standby.return_value.start.assert_called_once_with()
+        self.assertFalse(server._listeners['a'].start.called)
 
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
-    def test_stop_basic(self, mock_init):
+    @mock.patch('heyu.relay.Relay')
+    def test_promote(self, mock_Relay, mock_init):
         server = hub.HubServer()
         server._listeners = {
             'a': mock.Mock(),
             'b': mock.Mock(),
-            'c': mock.Mock(),
         }
-        server._subscribers = {
-            'a': (mock.Mock(), 0),
-            'b': (mock.Mock(), 1),
-            'c': (mock.Mock(), 2),
+        server._active = False
+        server._follower = 'follower'
+        server._wrapper = 'wrapper'
+        server._client_wrapper = 'client_wrapper'
+        server._relay_hubs = ['up1', 'up2']
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+
+        server.promote()
+
+        self.assertEqual(True, server._active)
+        self.assertEqual(None, server._follower)
+        for manager in server._listeners.values():
+            manager.start.assert_called_once_with(server._acceptor, 'wrapper')
+        mock_Relay.assert_has_calls([
+            mock.call(server, 'up1', 'client_wrapper'),
+            mock.call(server, 'up2', 'client_wrapper'),
+        ], any_order=True)
+        self.assertEqual([mock_Relay.return_value] * 2, server._relays)
+        self.assertEqual(2, mock_Relay.return_value.start.call_count)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch('heyu.relay.Relay')
+    def test_promote_unix(self, mock_Relay, mock_init):
+        server = hub.HubServer()
+        server._listeners = {
+            'a': mock.Mock(proto='tcp'),
+            '/sock': mock.Mock(proto='unix'),
         }
-        server._running = True
+        server._active = False
+        server._wrapper = 'wrapper'
+        server._client_wrapper = None
+        server._relay_hubs = []
+        server._udp = None
+        server._monitor = None
+        server._ring = None
 
-        server.stop()
+        server.promote()
 
-        self.assertEqual(False, server._running)
-        for manager in server._listeners.values():
-            manager.stop.assert_called_once_with()
-        for client, _version in server._subscribers.values():
-            client.disconnect.assert_called_once_with()
+        server._listeners['a'].start.assert_called_once_with(
+            server._acceptor, 'wrapper')
+        server._listeners['/sock'].start.assert_called_once_with(
+            server._acceptor, None)
 
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
-    def test_stop_empty(self, mock_init):
+    @mock.patch('heyu.relay.Relay')
+    def test_promote_udp(self, mock_Relay, mock_init):
         server = hub.HubServer()
         server._listeners = {}
+        server._active = False
+        server._wrapper = 'wrapper'
+        server._client_wrapper = None
+        server._relay_hubs = []
+        server._udp = mock.Mock()
+        server._monitor = None
+        server._ring = None
+
+        server.promote()
+
+        server._udp.start.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch('heyu.relay.Relay')
+    def test_promote_active(self, mock_Relay, mock_init):
+        server = hub.HubServer()
+        server._listeners = {
+            'a': mock.Mock(),
+        }
+        server._active = True
+
+        server.promote()
+
+        self.assertFalse(server._listeners['a'].start.called)
+        self.assertFalse(mock_Relay.called)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_stop_standby(self, mock_init):
+        follower = mock.Mock()
+        server = hub.HubServer()
+        server._listeners = {
+            'a': mock.Mock(),
+        }
         server._subscribers = {}
         server._running = True
+        server._active = False
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._drain_timeout = 0
+        server._relays = []
+        server._follower = follower
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
 
         server.stop()
 
-        self.assertEqual(False, server._running)
+        self.assertEqual(None, server._follower)
+        follower.stop.assert_called_once_with()
+        self.assertFalse(server._listeners['a'].stop.called)
 
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
-    def test_shutdown_notrunning(self, mock_init):
-        subscribers = {
-            'a': (mock.Mock(), 0),
-            'b': (mock.Mock(), 1),
-            'c': (mock.Mock(), 2),
-        }
+    def test_shutdown_standby(self, mock_init):
+        follower = mock.Mock()
         server = hub.HubServer()
         server._listeners = {
             'a': mock.Mock(),
-            'b': mock.Mock(),
-            'c': mock.Mock(),
         }
-        server._subscribers = subscribers
-        server._running = False
+        server._subscribers = {}
+        server._running = True
+        server._active = False
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._relays = []
+        server._follower = follower
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
 
         server.shutdown()
 
-        for manager in server._listeners.values():
-            self.assertFalse(manager.shutdown.called)
-        self.assertEqual(subscribers, server._subscribers)
+        self.assertEqual(None, server._follower)
+        follower.stop.assert_called_once_with()
+        self.assertFalse(server._listeners['a'].shutdown.called)
 
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
-    def test_shutdown_basic(self, mock_init):
-        subscribers = {
-            'a': (mock.Mock(), 0),
-            'b': (mock.Mock(), 1),
-            'c': (mock.Mock(), 2),
-        }
+    @mock.patch('heyu.protocol.Message.from_frame',
+                side_effect=lambda x: mock.Mock(id='id-%s' % x,
+                                                expires='exp-%s' % x,
+                                                deliver_at=None))
+    def test_recover(self, mock_from_frame, mock_init):
         server = hub.HubServer()
-        server._listeners = {
-            'a': mock.Mock(),
-            'b': mock.Mock(),
-            'c': mock.Mock(),
+        server._history = mock.Mock()
+        server._snapshot = None
+        server._journal = mock.Mock(**{
+            'recover.return_value': [(1.0, 'frame1'), (2.0, 'frame2')],
+        })
+
+        server._recover()
+
+        server._history.append.assert_has_calls([
+            mock.call('id-frame1', 'frame1', 1.0, 'exp-frame1'),
+            mock.call('id-frame2', 'frame2', 2.0, 'exp-frame2'),
+        ])
+        self.assertEqual(2, server._history.append.call_count)
+        server._journal.open.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch('heyu.protocol.Message.from_frame',
+                side_effect=lambda x: mock.Mock(id='id-%s' % x,
+                                                expires='exp-%s' % x,
+                                                deliver_at=None))
+    def test_recover_snapshot(self, mock_from_frame, mock_init):
+        server = hub.HubServer()
+        server._history = None
+        server._snapshot = mock.Mock()
+        server._journal = mock.Mock(**{
+            'recover.return_value': [(1.0, 'frame1'), (2.0, 'frame2')],
+        })
+
+        server._recover()
+
+        server._snapshot.update.assert_has_calls([
+            mock.call('id-frame1', 'frame1', 'exp-frame1'),
+            mock.call('id-frame2', 'frame2', 'exp-frame2'),
+        ])
+        self.assertEqual(2, server._snapshot.update.call_count)
+        server._journal.open.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, 'submit')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch('heyu.protocol.Message.from_frame',
+                side_effect=lambda x: mock.Mock(id='id-%s' % x,
+                                                expires=None,
+                                                deliver_at=None))
+    def test_recover_nohistory(self, mock_from_frame, mock_init,
+                               mock_submit):
+        server = hub.HubServer()
+        server._history = None
+        server._snapshot = None
+        server._journal = mock.Mock(**{
+            'recover.return_value': [(1.0, 'frame1'), (2.0, 'frame2')],
+        })
+
+        server._recover()
+
+        server._journal.open.assert_called_once_with()
+        self.assertFalse(mock_submit.called)
+
+    @mock.patch.object(hub.HubServer, 'submit')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_recover_scheduled(self, mock_init, mock_submit):
+        msgs = {
+            'frame1': mock.Mock(id='id1', expires=None, deliver_at=5.0),
+            'frame2': mock.Mock(id='id2', expires=None, deliver_at=6.0),
+            'frame3': mock.Mock(id='id3', expires=None, deliver_at=None),
         }
-        server._subscribers = subscribers
+        server = hub.HubServer()
+        server._history = mock.Mock()
+        server._snapshot = None
+        server._journal = mock.Mock(**{
+            'recover.return_value': [
+                (1.0, 'frame1'),
+                (2.0, 'frame2'),
+                (3.0, 'frame3'),
+                (5.0, 'frame1'),
+            ],
+        })
+
+        with mock.patch('heyu.protocol.Message.from_frame',
+                        side_effect=lambda x: msgs[x]):
+            server._recover()
+
+        # Only the delivered notifications go into the history
+        server._history.append.assert_has_calls([
+            mock.call('id3', 'frame3', 3.0, None),
+            mock.call('id1', 'frame1', 5.0, None),
+        ])
+        self.assertEqual(2, server._history.append.call_count)
+
+        # The one still held is submitted again once the journal is
+        # open
+        server._journal.open.assert_called_once_with()
+        mock_submit.assert_called_once_with(msgs['frame2'])
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_stop_journal(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
+        server._running = True
+        server._journal = mock.Mock()
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._drain_timeout = 0
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.stop()
+
+        server._journal.close.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_stop_udp(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = mock.Mock()
+        server._monitor = None
+        server._ring = None
+        server._drain_timeout = 0
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.stop()
+
+        server._udp.stop.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_stop_stats_server(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
+        server._running = True
+        server._journal = None
+        server._stats_server = mock.Mock()
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._drain_timeout = 0
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.stop()
+
+        server._stats_server.stop.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_stop_monitor(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = mock.Mock()
+        server._ring = None
+        server._drain_timeout = 0
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.stop()
+
+        server._monitor.stop.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_stop_ring(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = mock.Mock()
+        server._drain_timeout = 0
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.stop()
+
+        server._ring.close.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_shutdown_monitor(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
         server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = mock.Mock()
+        server._ring = None
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
 
         server.shutdown()
 
-        self.assertEqual(False, server._running)
-        for manager in server._listeners.values():
-            manager.shutdown.assert_called_once_with()
-        self.assertEqual({}, server._subscribers)
+        server._monitor.stop.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_shutdown_ring(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = mock.Mock()
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.shutdown()
+
+        server._ring.close.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_shutdown_udp(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = mock.Mock()
+        server._monitor = None
+        server._ring = None
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.shutdown()
+
+        server._udp.stop.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_shutdown_stats_server(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
+        server._running = True
+        server._journal = None
+        server._stats_server = mock.Mock()
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.shutdown()
+
+        server._stats_server.stop.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_shutdown_journal(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
+        server._running = True
+        server._journal = mock.Mock()
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.shutdown()
+
+        server._journal.close.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_stop_relays(self, mock_init):
+        relays = [mock.Mock(), mock.Mock()]
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._drain_timeout = 0
+        server._relays = relays[:]
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.stop()
+
+        self.assertEqual([], server._relays)
+        for link in relays:
+            link.stop.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_shutdown_relays(self, mock_init):
+        relays = [mock.Mock(), mock.Mock()]
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._relays = relays[:]
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.shutdown()
+
+        self.assertEqual([], server._relays)
+        for link in relays:
+            link.stop.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_stop_notrunning(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {
+            'a': mock.Mock(),
+            'b': mock.Mock(),
+            'c': mock.Mock(),
+        }
+        server._subscribers = {
+            'a': mock.Mock(version=0),
+            'b': mock.Mock(version=1),
+            'c': mock.Mock(version=2),
+        }
+        server._running = False
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._drain_timeout = 0
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.stop()
+
+        for manager in server._listeners.values():
+            self.assertFalse(manager.stop.called)
+        for client in server._subscribers.values():
+            self.assertFalse(client.disconnect.called)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_stop_listener(self, mock_init):
+        thread = mock.Mock()
+        manager = mock.Mock(_listen_thread=thread)
+        server = hub.HubServer()
+
+        server._stop_listener(manager)
+
+        thread.kill.assert_called_once_with()
+        self.assertEqual(None, manager._listen_thread)
+        manager.stop.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_stop_listener_no_thread(self, mock_init):
+        manager = mock.Mock(_listen_thread=None)
+        server = hub.HubServer()
+
+        server._stop_listener(manager)
+
+        manager.stop.assert_called_once_with()
+
+    def _reload_server(self, active=True, wrapper='wrapper'):
+        with mock.patch.object(hub.HubServer, '__init__', return_value=None):
+            server = hub.HubServer()
+        server._running = True
+        server._active = active
+        server._wrapper = wrapper
+        server._listeners = {
+            'ep1': mock.Mock(proto='tcp'),
+            'ep2': mock.Mock(proto='tcp'),
+            '/sock': mock.Mock(proto='unix'),
+        }
+        server.metrics = collections.defaultdict(mock.Mock)
+        return server
+
+    @mock.patch.object(util, 'reload_wrappers')
+    @mock.patch.object(hub.HubServer, '_read_endpoints')
+    def test_reload_not_running(self, mock_read_endpoints,
+                                mock_reload_wrappers):
+        server = self._reload_server()
+        server._running = False
+
+        server.reload()
+
+        self.assertFalse(mock_reload_wrappers.called)
+        self.assertFalse(mock_read_endpoints.called)
+
+    @mock.patch.object(util, 'reload_wrappers',
+                       side_effect=util.CertException('bad'))
+    @mock.patch.object(hub.HubServer, '_read_endpoints')
+    @mock.patch.object(hub.HubServer, '_stop_listener')
+    @mock.patch('tendril.get_manager')
+    def test_reload_error(self, mock_get_manager, mock_stop_listener,
+                          mock_read_endpoints, mock_reload_wrappers):
+        server = self._reload_server()
+        listeners = server._listeners.copy()
+
+        server.reload()
+
+        self.assertEqual(listeners, server._listeners)
+        self.assertFalse(mock_stop_listener.called)
+        self.assertFalse(mock_get_manager.called)
+        server.metrics['reload_errors'].inc.assert_called_once_with()
+        self.assertFalse(server.metrics['reloads'].inc.called)
+
+    @mock.patch.object(util, 'reload_wrappers')
+    @mock.patch.object(hub.HubServer, '_read_endpoints',
+                       return_value=['ep2', 'ep3'])
+    @mock.patch.object(hub.HubServer, '_stop_listener')
+    @mock.patch('tendril.get_manager')
+    def test_reload(self, mock_get_manager, mock_stop_listener,
+                    mock_read_endpoints, mock_reload_wrappers):
+        server = self._reload_server()
+        ep1 = server._listeners['ep1']
+        ep2 = server._listeners['ep2']
+        sock = server._listeners['/sock']
+
+        server.reload()
+
+        mock_reload_wrappers.assert_called_once_with()
+        self.assertEqual({
+            'ep2': ep2,
+            'ep3': mock_get_manager.return_value,
+            '/sock': sock,
+        }, server._listeners)
+        mock_stop_listener.assert_has_calls([
+            mock.call(ep1),
+            mock.call(ep2),
+        ], any_order=True)
+        self.assertEqual(2, mock_stop_listener.call_count)
+        self.assertFalse(ep1.start.called)
+        ep2.start.assert_called_once_with(server._acceptor, 'wrapper')
+        self.assertFalse(sock.start.called)
+        mock_get_manager.assert_called_once_with('tcp', 'ep3')
+        mock_get_manager.return_value.start.assert_called_once_with(
+            server._acceptor, 'wrapper')
+        server.metrics['reloads'].inc.assert_called_once_with()
+
+    @mock.patch.object(util, 'reload_wrappers')
+    @mock.patch.object(hub.HubServer, '_read_endpoints',
+                       return_value=['ep2', 'ep3'])
+    @mock.patch.object(hub.HubServer, '_stop_listener')
+    @mock.patch('tendril.get_manager')
+    def test_reload_insecure(self, mock_get_manager, mock_stop_listener,
+                             mock_read_endpoints, mock_reload_wrappers):
+        server = self._reload_server(wrapper=None)
+        ep1 = server._listeners['ep1']
+        ep2 = server._listeners['ep2']
+
+        server.reload()
+
+        mock_stop_listener.assert_called_once_with(ep1)
+        self.assertFalse(ep2.start.called)
+        mock_get_manager.return_value.start.assert_called_once_with(
+            server._acceptor, None)
+
+    @mock.patch.object(util, 'reload_wrappers')
+    @mock.patch.object(hub.HubServer, '_read_endpoints',
+                       return_value=['ep2', 'ep3'])
+    @mock.patch.object(hub.HubServer, '_stop_listener')
+    @mock.patch('tendril.get_manager')
+    def test_reload_inactive(self, mock_get_manager, mock_stop_listener,
+                             mock_read_endpoints, mock_reload_wrappers):
+        server = self._reload_server(active=False)
+
+        server.reload()
+
+        self.assertEqual(set(['ep2', 'ep3', '/sock']),
+                         set(server._listeners))
+        self.assertFalse(mock_stop_listener.called)
+        self.assertFalse(mock_get_manager.return_value.start.called)
+
+    @mock.patch.object(util, 'read_endpoints', return_value=['ep2', 'ep3'])
+    def test_read_endpoints(self, mock_read_endpoints):
+        with mock.patch.object(hub.HubServer, '__init__', return_value=None):
+            server = hub.HubServer()
+        server._endpoints = ['ep1', 'ep2']
+        server._endpoints_file = '/endpoints'
+
+        self.assertEqual(['ep1', 'ep2', 'ep3'], server._read_endpoints())
+        mock_read_endpoints.assert_called_once_with('/endpoints')
+
+    @mock.patch.object(util, 'read_endpoints')
+    def test_read_endpoints_no_file(self, mock_read_endpoints):
+        with mock.patch.object(hub.HubServer, '__init__', return_value=None):
+            server = hub.HubServer()
+        server._endpoints = ['ep1', 'ep2']
+        server._endpoints_file = None
+
+        self.assertEqual(['ep1', 'ep2'], server._read_endpoints())
+        self.assertFalse(mock_read_endpoints.called)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_stop_basic(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {
+            'a': mock.Mock(),
+            'b': mock.Mock(),
+            'c': mock.Mock(),
+        }
+        server._subscribers = {
+            'a': mock.Mock(version=0),
+            'b': mock.Mock(version=1),
+            'c': mock.Mock(version=2),
+        }
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._drain_timeout = 0
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.stop()
+
+        self.assertEqual(False, server._running)
+        for manager in server._listeners.values():
+            manager.stop.assert_called_once_with()
+        for client in server._subscribers.values():
+            client.disconnect.assert_called_once_with()
+        server._scheduled.clear.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch.object(hub.HubServer, '_fanout')
+    def test_stop_dispatch(self, mock_fanout, mock_init):
+        client = mock.Mock(version=0)
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {'a': client}
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._drain_timeout = 0
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque(['msg'])
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+        mock_fanout.side_effect = lambda msg: self.assertFalse(
+            client.disconnect.called)
+
+        server.stop()
+
+        mock_fanout.assert_called_once_with('msg')
+        self.assertEqual([], list(server._dispatch))
+        client.disconnect.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch.object(hub.HubServer, '_drain')
+    def test_stop_drain(self, mock_drain, mock_init):
+        clients = [mock.Mock(), mock.Mock()]
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {
+            'a': clients[0],
+            'b': clients[1],
+        }
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._drain_timeout = 5.0
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.stop()
+
+        for client in clients:
+            client.disconnect.assert_called_once_with(drain=True)
+        self.assertEqual(1, mock_drain.call_count)
+        self.assertEqual(sorted(clients), sorted(mock_drain.call_args[0][0]))
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch('time.time', side_effect=[100.0, 100.0, 100.1])
+    @mock.patch('gevent.sleep')
+    def test_drain(self, mock_sleep, mock_time, mock_init):
+        clients = [
+            mock.Mock(pending=0),
+            mock.Mock(pending=10),
+            mock.Mock(pending=0, **{'close.side_effect': TestException()}),
+        ]
+
+        def sleep(interval):
+            clients[1].pending = 0
+        mock_sleep.side_effect = sleep
+
+        server = hub.HubServer()
+        server._drain_timeout = 5.0
+
+        server._drain(clients)
+
+        mock_sleep.assert_called_once_with(server.drain_interval)
+        for client in clients:
+            client.close.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch('time.time', side_effect=[100.0, 104.0, 105.5])
+    @mock.patch('gevent.sleep')
+    def test_drain_deadline(self, mock_sleep, mock_time, mock_init):
+        client = mock.Mock(pending=10)
+        server = hub.HubServer()
+        server._drain_timeout = 5.0
+
+        server._drain([client])
+
+        mock_sleep.assert_called_once_with(server.drain_interval)
+        client.close.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_stop_empty(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {}
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._drain_timeout = 0
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.stop()
+
+        self.assertEqual(False, server._running)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_shutdown_notrunning(self, mock_init):
+        subscribers = {
+            'a': mock.Mock(version=0),
+            'b': mock.Mock(version=1),
+            'c': mock.Mock(version=2),
+        }
+        server = hub.HubServer()
+        server._listeners = {
+            'a': mock.Mock(),
+            'b': mock.Mock(),
+            'c': mock.Mock(),
+        }
+        server._subscribers = subscribers
+        server._running = False
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.shutdown()
+
+        for manager in server._listeners.values():
+            self.assertFalse(manager.shutdown.called)
+        self.assertEqual(subscribers, server._subscribers)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_shutdown_basic(self, mock_init):
+        subscribers = {
+            'a': mock.Mock(version=0),
+            'b': mock.Mock(version=1),
+            'c': mock.Mock(version=2),
+        }
+        server = hub.HubServer()
+        server._listeners = {
+            'a': mock.Mock(),
+            'b': mock.Mock(),
+            'c': mock.Mock(),
+        }
+        server._subscribers = subscribers
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server._dispatch.append('msg')
+
+        server.shutdown()
+
+        self.assertEqual(False, server._running)
+        for manager in server._listeners.values():
+            manager.shutdown.assert_called_once_with()
+        self.assertEqual({}, server._subscribers)
+        self.assertEqual([], list(server._dispatch))
+        server._scheduled.clear.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_shutdown_empty(self, mock_init):
+        server = hub.HubServer()
+        server._listeners = {}
+        server._subscribers = {
+            'a': mock.Mock(version=0),
+            'b': mock.Mock(version=1),
+            'c': mock.Mock(version=2),
+        }
+        server._running = True
+        server._journal = None
+        server._stats_server = None
+        server._udp = None
+        server._monitor = None
+        server._ring = None
+        server._relays = []
+        server._follower = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._scheduled = mock.Mock()
+        server._active = True
+
+        server.shutdown()
+
+        self.assertEqual(False, server._running)
+        self.assertEqual({}, server._subscribers)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch('heyu.outbox.Outbox', return_value='outbox')
+    def test_subscribe(self, mock_Outbox, mock_init):
+        client = mock.Mock(outbox=None, receipts=None)
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._coalesce = 0
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0
+
+        result = server.subscribe(client, 1)
+
+        self.assertEqual(None, result)
+        self.assertEqual({
+            id(client): client,
+        }, server._subscribers)
+        self.assertEqual(1, client.version)
+        self.assertEqual('outbox', client.outbox)
+        mock_Outbox.assert_called_once_with(client, 0.05, False, None)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch.object(hub.HubServer, '_fanout')
+    @mock.patch('heyu.outbox.Outbox', return_value='outbox')
+    def test_subscribe_dispatch(self, mock_Outbox, mock_fanout, mock_init):
+        client = mock.Mock(outbox=None, receipts=None)
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._coalesce = 0
+        server._dispatch = collections.deque(['msg'])
+        server._wakeups = []
+        server._write_delay = 0
+        mock_fanout.side_effect = lambda msg: self.assertEqual(
+            {}, server._subscribers)
+
+        server.subscribe(client, 1)
+
+        mock_fanout.assert_called_once_with('msg')
+        self.assertEqual([], list(server._dispatch))
+        self.assertEqual({
+            id(client): client,
+        }, server._subscribers)
+
+    @mock.patch('heyu.writer.Writer', return_value='writer')
+    @mock.patch('heyu.outbox.Outbox', return_value='outbox')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_subscribe_writer(self, mock_init, mock_Outbox, mock_Writer):
+        client = mock.Mock(outbox=None, receipts=None, writer=None)
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._coalesce = 0
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0.002
+        server._write_budget = 16384
+
+        server.subscribe(client, 1)
+
+        self.assertEqual('writer', client.writer)
+        mock_Writer.assert_called_once_with(client.write_frames, 0.002,
+                                            16384)
+
+    @mock.patch('heyu.outbox.Outbox', return_value='outbox')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_subscribe_coalesce(self, mock_init, mock_Outbox):
+        client = mock.Mock(outbox=None, receipts=None)
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._coalesce = 0.5
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0
+
+        server.subscribe(client, 1)
+
+        self.assertEqual({
+            id(client): client,
+        }, server._subscribers)
+        self.assertEqual(1, client.version)
+        self.assertEqual('outbox', client.outbox)
+        mock_Outbox.assert_called_once_with(client, 0.5, receipts=None)
+
+    @mock.patch('heyu.heartbeat.Heartbeat')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_subscribe_heartbeat(self, mock_init, mock_Heartbeat):
+        client = mock.Mock(outbox=None, heartbeat=None)
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._coalesce = 0
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0
+        server._heartbeat_min = 5.0
+
+        result = server.subscribe(client, 1, 10.0)
+
+        self.assertEqual(10.0, result)
+        self.assertEqual({
+            id(client): client,
+        }, server._subscribers)
+        self.assertEqual(1, client.version)
+        self.assertEqual(mock_Heartbeat.return_value, client.heartbeat)
+        mock_Heartbeat.assert_called_once_with(client, 10.0, 3)
+        mock_Heartbeat.return_value.start.assert_called_once_with()
+
+    @mock.patch('heyu.heartbeat.Heartbeat')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_subscribe_heartbeat_min(self, mock_init, mock_Heartbeat):
+        client = mock.Mock(outbox=None, heartbeat=None)
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._coalesce = 0
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0
+        server._heartbeat_min = 5.0
+
+        result = server.subscribe(client, 1, 0.1)
+
+        self.assertEqual(5.0, result)
+        mock_Heartbeat.assert_called_once_with(client, 5.0, 3)
+
+    @mock.patch('heyu.heartbeat.Heartbeat')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_subscribe_no_heartbeat(self, mock_init, mock_Heartbeat):
+        client = mock.Mock(outbox=None, heartbeat=None)
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._coalesce = 0
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0
+        server._heartbeat_min = 5.0
+
+        result = server.subscribe(client, 1)
+
+        self.assertEqual(None, result)
+        self.assertEqual(None, client.heartbeat)
+        self.assertFalse(mock_Heartbeat.called)
+
+    @mock.patch('heyu.outbox.Outbox', return_value='outbox')
+    @mock.patch('heyu.receipts.Receipts')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_subscribe_session(self, mock_init, mock_Receipts, mock_Outbox):
+        client = mock.Mock(outbox=None, receipts=None, relay='hub2')
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._sessions = collections.OrderedDict()
+        server._attached = {}
+        server._coalesce = 0
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0
+
+        server.subscribe(client, 0, session='sess')
+
+        mock_Receipts.assert_called_once_with('sess', 0, 'hub2')
+        self.assertEqual(mock_Receipts.return_value, client.receipts)
+        self.assertEqual({'sess': client}, server._attached)
+        mock_Outbox.assert_called_once_with(client, 0.05, False,
+                                            mock_Receipts.return_value)
+
+    @mock.patch('heyu.outbox.Outbox', return_value='outbox')
+    @mock.patch('heyu.receipts.Receipts')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_subscribe_session_resume(self, mock_init, mock_Receipts,
+                                      mock_Outbox):
+        client = mock.Mock(outbox=None, receipts=None)
+        tracker = mock.Mock(version=0, resumed=False)
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._sessions = collections.OrderedDict([
+            ('other', 'other tracker'),
+            ('sess', tracker),
+        ])
+        server._attached = {}
+        server._coalesce = 0.5
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0
+
+        server.subscribe(client, 0, session='sess')
+
+        self.assertFalse(mock_Receipts.called)
+        self.assertEqual(tracker, client.receipts)
+        self.assertEqual(True, tracker.resumed)
+        self.assertEqual(collections.OrderedDict([
+            ('other', 'other tracker'),
+        ]), server._sessions)
+        mock_Outbox.assert_called_once_with(client, 0.5, receipts=tracker)
+
+    @mock.patch('heyu.outbox.Outbox', return_value='outbox')
+    @mock.patch('heyu.receipts.Receipts')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_subscribe_session_version(self, mock_init, mock_Receipts,
+                                       mock_Outbox):
+        client = mock.Mock(outbox=None, receipts=None, relay=None)
+        tracker = mock.Mock(version=1, resumed=False)
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._sessions = collections.OrderedDict([('sess', tracker)])
+        server._attached = {}
+        server._coalesce = 0
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0
+
+        server.subscribe(client, 0, session='sess')
+
+        mock_Receipts.assert_called_once_with('sess', 0, None)
+        self.assertEqual(mock_Receipts.return_value, client.receipts)
+        self.assertEqual(False, tracker.resumed)
+        self.assertEqual({}, server._sessions)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_subscribe_session_takeover(self, mock_init):
+        tracker = receipts.Receipts('sess', 0)
+        tracker.sent('id1', 'frame1')
+        old = mock.Mock(heartbeat=None, outbox=None, writer=None,
+                        receipts=tracker)
+        client = mock.Mock(outbox=None, receipts=None, relay=None)
+        server = hub.HubServer()
+        server.max_sessions = 10
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._subscribers = {id(old): old}
+        server._sessions = collections.OrderedDict()
+        server._attached = {'sess': old}
+        server._coalesce = 0
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0
+
+        server.subscribe(client, 0, session='sess')
+
+        self.assertEqual(tracker, client.receipts)
+        self.assertEqual(True, tracker.resumed)
+        self.assertEqual(None, old.receipts)
+        old.close.assert_called_once_with()
+        self.assertEqual({id(client): client}, server._subscribers)
+        self.assertEqual({'sess': client}, server._attached)
+        self.assertEqual({}, server._sessions)
+
+        # Reaping the old connection leaves the session alone
+        server.unsubscribe(old)
+
+        self.assertEqual({'sess': client}, server._attached)
+        self.assertEqual({}, server._sessions)
+        self.assertEqual([('id1', 'frame1', None)], tracker.take())
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_subscribe_session_takeover_close_fails(self, mock_init):
+        old = mock.Mock(heartbeat=None, outbox=None, writer=None,
+                        receipts=receipts.Receipts('sess', 0), **{
+                            'close.side_effect': TestException('closed'),
+                        })
+        client = mock.Mock(outbox=None, receipts=None, relay=None)
+        server = hub.HubServer()
+        server.max_sessions = 10
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._subscribers = {id(old): old}
+        server._sessions = collections.OrderedDict()
+        server._attached = {'sess': old}
+        server._coalesce = 0
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0
+
+        server.subscribe(client, 0, session='sess')
+
+        self.assertEqual({'sess': client}, server._attached)
+
+    @mock.patch('heyu.outbox.Outbox', return_value='outbox')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_subscribe_ring(self, mock_init, mock_Outbox):
+        client = mock.Mock(outbox=None, receipts=None, local=True,
+                           ring=False)
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._sessions = collections.OrderedDict()
+        server._coalesce = 0
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0
+        server._ring = mock.Mock(path='/ring')
+
+        server.subscribe(client, 0, session='sess', ring='/ring')
+
+        self.assertEqual(True, client.ring)
+        self.assertEqual(None, client.receipts)
+        mock_Outbox.assert_called_once_with(client, 0.05, False, None)
+
+    @mock.patch('heyu.outbox.Outbox', return_value='outbox')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_subscribe_ring_refused(self, mock_init, mock_Outbox):
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._coalesce = 0
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._write_delay = 0
+
+        # The hub has no ring
+        client = mock.Mock(outbox=None, receipts=None, local=True,
+                           ring=False)
+        server._ring = None
+        server.subscribe(client, 0, ring='/ring')
+        self.assertEqual(False, client.ring)
+
+        # The client asked for a different ring
+        server._ring = mock.Mock(path='/ring')
+        server.subscribe(client, 0, ring='/other')
+        self.assertEqual(False, client.ring)
+
+        # The client isn't local
+        client.local = False
+        server.subscribe(client, 0, ring='/ring')
+        self.assertEqual(False, client.ring)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_redeliver_untracked(self, mock_init):
+        client = mock.Mock(receipts=None)
+        server = hub.HubServer()
+
+        self.assertEqual(False, server.redeliver(client))
+        self.assertFalse(client.outbox.push.called)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_redeliver_new_session(self, mock_init):
+        client = mock.Mock(**{'receipts.resumed': False})
+        server = hub.HubServer()
+
+        self.assertEqual(False, server.redeliver(client))
+        self.assertFalse(client.receipts.take.called)
+        self.assertFalse(client.outbox.push.called)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_redeliver(self, mock_init):
+        client = mock.Mock(**{
+            'receipts.resumed': True,
+            'receipts.take.return_value': [('id1', 'frame1', None),
+                                           ('id2', 'frame2', 2000.0)],
+        })
+        server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+
+        self.assertEqual(True, server.redeliver(client))
+        client.receipts.take.assert_called_once_with()
+        self.assertEqual([
+            mock.call('id1', 'frame1', expires=None),
+            mock.call('id2', 'frame2', expires=2000.0),
+        ], client.outbox.push.call_args_list)
+        self.assertEqual(
+            2, server.metrics['notifications_redelivered'].inc.call_count)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_unsubscribe_unsubscribed(self, mock_init):
+        client1 = mock.Mock()
+        client2 = mock.Mock(receipts=None)
+        server = hub.HubServer()
+        server._subscribers = {
+            id(client1): client1,
+        }
+
+        server.unsubscribe(client2)
+
+        self.assertEqual({
+            id(client1): client1,
+        }, server._subscribers)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_unsubscribe_subscribed(self, mock_init):
+        client1 = mock.Mock()
+        client2 = mock.Mock(outbox=None, receipts=None)
+        server = hub.HubServer()
+        server._subscribers = {
+            id(client1): client1,
+            id(client2): client2,
+        }
+
+        server.unsubscribe(client2)
+
+        self.assertEqual({
+            id(client1): client1,
+        }, server._subscribers)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_unsubscribe_outbox(self, mock_init):
+        client = mock.Mock(receipts=None)
+        client_outbox = client.outbox
+        server = hub.HubServer()
+        server._subscribers = {
+            id(client): client,
+        }
+
+        server.unsubscribe(client)
+
+        self.assertEqual({}, server._subscribers)
+        client_outbox.cancel.assert_called_once_with()
+        self.assertEqual(None, client.outbox)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_unsubscribe_writer(self, mock_init):
+        client = mock.Mock(outbox=None, receipts=None)
+        client_writer = client.writer
+        server = hub.HubServer()
+        server._subscribers = {
+            id(client): client,
+        }
+
+        server.unsubscribe(client)
+
+        client_writer.flush.assert_called_once_with()
+        self.assertEqual(None, client.writer)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_unsubscribe_heartbeat(self, mock_init):
+        client = mock.Mock(outbox=None, receipts=None)
+        client_heartbeat = client.heartbeat
+        server = hub.HubServer()
+        server._subscribers = {
+            id(client): client,
+        }
+
+        server.unsubscribe(client)
+
+        self.assertEqual({}, server._subscribers)
+        client_heartbeat.stop.assert_called_once_with()
+        self.assertEqual(None, client.heartbeat)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_unsubscribe_retain(self, mock_init):
+        tracker = mock.Mock(session='sess')
+        client = mock.Mock(heartbeat=None, receipts=tracker, **{
+            'outbox.take.return_value': [('id1', 'frame1', 2000.0)],
+        })
+        client_outbox = client.outbox
+        server = hub.HubServer()
+        server.max_sessions = 2
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._subscribers = {
+            id(client): client,
+        }
+        server._sessions = collections.OrderedDict([
+            ('sess', 'stale'),
+            ('other', 'other tracker'),
+        ])
+        server._attached = {'sess': client}
+
+        server.unsubscribe(client)
+
+        tracker.sent.assert_called_once_with('id1', 'frame1', 2000.0)
+        self.assertEqual([
+            ('other', 'other tracker'),
+            ('sess', tracker),
+        ], list(server._sessions.items()))
+        self.assertFalse(server.metrics['sessions_dropped'].inc.called)
+        self.assertEqual({}, server._attached)
+        self.assertEqual(None, client.receipts)
+        client_outbox.cancel.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_unsubscribe_taken_over(self, mock_init):
+        tracker = mock.Mock(session='sess')
+        client = mock.Mock(heartbeat=None, receipts=tracker)
+        client_outbox = client.outbox
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._sessions = collections.OrderedDict()
+        server._attached = {'sess': 'other client'}
+
+        server.unsubscribe(client)
+
+        self.assertFalse(client_outbox.take.called)
+        self.assertEqual({}, server._sessions)
+        self.assertEqual({'sess': 'other client'}, server._attached)
+        self.assertEqual(None, client.receipts)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_unsubscribe_retain_overflow(self, mock_init):
+        tracker = mock.Mock(session='sess')
+        client = mock.Mock(heartbeat=None, outbox=None, receipts=tracker)
+        server = hub.HubServer()
+        server.max_sessions = 1
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._subscribers = {}
+        server._sessions = collections.OrderedDict([
+            ('other', 'other tracker'),
+        ])
+        server._attached = {'sess': client}
+
+        server.unsubscribe(client)
+
+        self.assertEqual([('sess', tracker)], list(server._sessions.items()))
+        server.metrics['sessions_dropped'].inc.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_unsubscribe_discard(self, mock_init):
+        tracker = mock.Mock(session='sess')
+        client = mock.Mock(heartbeat=None, receipts=tracker)
+        client_outbox = client.outbox
+        server = hub.HubServer()
+        server._subscribers = {}
+        server._sessions = collections.OrderedDict()
+        server._attached = {'sess': client}
+
+        server.unsubscribe(client, False)
+
+        self.assertFalse(client_outbox.take.called)
+        self.assertFalse(tracker.sent.called)
+        self.assertEqual({}, server._sessions)
+        self.assertEqual({}, server._attached)
+        self.assertEqual(None, client.receipts)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_replay_nohistory(self, mock_init):
+        client = mock.Mock()
+        server = hub.HubServer()
+        server._history = None
+
+        server.replay(client, 'some-id')
+
+        self.assertFalse(client.send_frame.called)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_send_snapshot_disabled(self, mock_init):
+        client = mock.Mock()
+        server = hub.HubServer()
+        server._snapshot = None
+
+        server.send_snapshot(client)
+
+        self.assertFalse(client.send_frame.called)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_send_snapshot(self, mock_init):
+        client = mock.Mock()
+        server = hub.HubServer()
+        server._snapshot = mock.Mock(**{
+            'frames.return_value': ['frame1', 'frame2'],
+        })
+
+        server.send_snapshot(client)
+
+        client.send_frame.assert_has_calls([
+            mock.call('frame1'),
+            mock.call('frame2'),
+        ])
+        self.assertEqual(2, client.send_frame.call_count)
+        client.receipts.skip.assert_called_once_with(2)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_replay(self, mock_init):
+        client = mock.Mock()
+        server = hub.HubServer()
+        server._history = mock.Mock(**{
+            'since.return_value': ['frame1', 'frame2'],
+        })
+
+        server.replay(client, 'some-id', 1234)
+
+        server._history.since.assert_called_once_with('some-id', 1234)
+        client.send_frame.assert_has_calls([
+            mock.call('frame1'),
+            mock.call('frame2'),
+        ])
+        self.assertEqual(2, client.send_frame.call_count)
+        client.receipts.skip.assert_called_once_with(2)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_replay_untracked(self, mock_init):
+        client = mock.Mock(receipts=None)
+        server = hub.HubServer()
+        server._history = mock.Mock(**{
+            'since.return_value': ['frame1', 'frame2'],
+        })
+
+        server.replay(client, 'some-id')
+
+        self.assertEqual(2, client.send_frame.call_count)
+
+    @mock.patch('gevent.sleep')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_throttle_unlimited(self, mock_init, mock_sleep):
+        server = hub.HubServer()
+        server._limiter = None
+
+        server.throttle('host', 'app')
+
+        self.assertFalse(mock_sleep.called)
+
+    @mock.patch('gevent.sleep')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_throttle_allowed(self, mock_init, mock_sleep):
+        server = hub.HubServer()
+        server._limiter = mock.Mock(**{'check.return_value': 0})
+
+        server.throttle('host', 'app')
+
+        server._limiter.check.assert_called_once_with('host', 'app')
+        self.assertFalse(mock_sleep.called)
+
+    @mock.patch('gevent.sleep')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_throttle_deferred(self, mock_init, mock_sleep):
+        server = hub.HubServer()
+        server._limiter = mock.Mock(**{'check.return_value': 0.5})
+
+        server.throttle('host', 'app')
+
+        server._limiter.check.assert_called_once_with('host', 'app')
+        mock_sleep.assert_called_once_with(0.5)
+
+    @mock.patch('gevent.sleep')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_throttle_rejected(self, mock_init, mock_sleep):
+        server = hub.HubServer()
+        server._limiter = mock.Mock(**{
+            'check.side_effect': ratelimit.RateLimitExceeded('limited'),
+        })
+
+        self.assertRaises(ratelimit.RateLimitExceeded, server.throttle,
+                          'host', 'app')
+        self.assertFalse(mock_sleep.called)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_submit_empty(self, mock_init):
+        msg = mock.Mock(expires=None, deliver_at=None, **{
+            'to_frame.side_effect': lambda x: 'version %d' % x,
+        })
+        server = hub.HubServer()
+        server.metrics = mock.MagicMock()
+        server._seen = collections.OrderedDict()
+        server._subscribers = {}
+        server._history = None
+        server._snapshot = None
+        server._journal = None
+        server._sessions = {}
+        server._ring = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._dispatcher = 'dispatcher'
+
+        server.submit(msg)
+
+        self.assertFalse(msg.to_frame.called)
+        self.assertEqual([msg], list(server._dispatch))
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_fanout(self, mock_init):
+        def fake_to_frame(version):
+            if version > 2:
+                raise TestException('version too high')
+            return 'version %d' % version
+        msg = mock.Mock(expires=None, path=None, **{
+            'to_frame.side_effect': fake_to_frame,
+        })
+        server = hub.HubServer()
+        server.metrics = mock.MagicMock()
+        server._seen = collections.OrderedDict()
+        server._subscribers = {
+            'a': mock.Mock(outbox=None, relay=None, version=0),
+            'b': mock.Mock(outbox=None, relay=None, version=1),
+            'c': mock.Mock(outbox=None, relay=None, version=2),
+            'd': mock.Mock(outbox=None, relay=None, version=3),
+            'e': mock.Mock(outbox=None, relay=None, version=4),
+        }
+        server._history = None
+        server._journal = None
+        server._sessions = {}
+        server._ring = None
+
+        server._fanout(msg)
+
+        msg.to_frame.assert_has_calls([
+            mock.call(0),
+            mock.call(1),
+            mock.call(2),
+            mock.call(3),
+            mock.call(4),
+        ], any_order=True)
+        for client in server._subscribers.values():
+            if client.version > 2:
+                self.assertFalse(client.send_frame.called)
+            else:
+                client.send_frame.assert_called_once_with(
+                    'version %d' % client.version)
+
+    @mock.patch('time.time', return_value=1234.0)
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_submit_history(self, mock_init, mock_time):
+        msg = mock.Mock(expires=None, deliver_at=None, id='some-id',
+                        path=None)
+        msg.to_frame.side_effect = lambda x=0: 'version %d' % x
+        server = hub.HubServer()
+        server.metrics = mock.MagicMock()
+        server._seen = collections.OrderedDict()
+        server._subscribers = {
+            'a': mock.Mock(outbox=None, relay=None, version=0),
+        }
+        server._history = mock.Mock()
+        server._snapshot = None
+        server._journal = None
+        server._sessions = {}
+        server._ring = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._dispatcher = 'dispatcher'
+
+        server.submit(msg)
+
+        server._history.append.assert_called_once_with(
+            'some-id', 'version 0', 1234.0, None)
+        self.assertFalse(server._subscribers['a'].send_frame.called)
+        self.assertEqual([msg], list(server._dispatch))
+
+    @mock.patch('time.time', return_value=1234.0)
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_submit_snapshot(self, mock_init, mock_time):
+        msg = mock.Mock(expires=2000.0, deliver_at=None, id='some-id',
+                        path=None)
+        msg.to_frame.side_effect = lambda x=0: 'version %d' % x
+        server = hub.HubServer()
+        server.metrics = mock.MagicMock()
+        server._seen = collections.OrderedDict()
+        server._history = None
+        server._snapshot = mock.Mock()
+        server._journal = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._dispatcher = 'dispatcher'
+
+        server.submit(msg)
+
+        server._snapshot.update.assert_called_once_with(
+            'some-id', 'version 0', 2000.0)
+        self.assertEqual([msg], list(server._dispatch))
+
+    @mock.patch('time.time', return_value=1234.0)
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_submit_journal(self, mock_init, mock_time):
+        msg = mock.Mock(expires=None, deliver_at=None, id='some-id',
+                        path=None)
+        msg.to_frame.side_effect = lambda x=0: 'version %d' % x
+        server = hub.HubServer()
+        server.metrics = mock.MagicMock()
+        server._seen = collections.OrderedDict()
+        server._subscribers = {
+            'a': mock.Mock(outbox=None, relay=None, version=0),
+        }
+        server._history = None
+        server._snapshot = None
+        server._journal = mock.Mock()
+        server._sessions = {}
+        server._ring = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._dispatcher = 'dispatcher'
+
+        server.submit(msg)
+
+        server._journal.append.assert_called_once_with('version 0', 1234.0)
+        self.assertFalse(server._subscribers['a'].send_frame.called)
+        self.assertEqual([msg], list(server._dispatch))
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_fanout_outbox(self, mock_init):
+        msg = mock.Mock(expires=None, id='some-id', path=None, urgency=2, **{
+            'to_frame.side_effect': lambda x=0: 'version %d' % x,
+        })
+        server = hub.HubServer()
+        server.metrics = mock.MagicMock()
+        server._seen = collections.OrderedDict()
+        server._subscribers = {
+            'a': mock.Mock(relay=None, version=0),
+        }
+        server._history = None
+        server._journal = None
+        server._sessions = {}
+        server._ring = None
+
+        server._fanout(msg)
+
+        client = server._subscribers['a']
+        client.outbox.push.assert_called_once_with('some-id', 'version 0', 2,
+                                                   None)
+        self.assertFalse(client.send_frame.called)
+
+    @mock.patch('time.time', return_value=1234.0)
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_submit_expired(self, mock_init, mock_time):
+        msg = mock.Mock(id='some-id', path=None, expires=1234.0, **{
+            'to_frame.side_effect': lambda x=0: 'version %d' % x,
+        })
+        server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._seen = collections.OrderedDict()
+        server._subscribers = {
+            'a': mock.Mock(relay=None, version=0),
+        }
+        server._history = mock.Mock()
+        server._snapshot = None
+        server._journal = mock.Mock()
+        server._sessions = {}
+        server._ring = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._dispatcher = None
+
+        server.submit(msg)
+
+        server.metrics['notifications_expired'].inc.assert_called_once_with()
+        self.assertFalse(server._journal.append.called)
+        self.assertFalse(server._history.append.called)
+        self.assertEqual([], list(server._dispatch))
+        self.assertEqual(None, server._dispatcher)
+        self.assertFalse(server.metrics['notifications_submitted'].inc.called)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_fanout_split_horizon(self, mock_init):
+        msg = mock.Mock(expires=None, id='some-id', path=['hub1', 'hub2'], **{
+            'to_frame.side_effect': lambda x=0: 'version %d' % x,
+        })
+        server = hub.HubServer()
+        server.metrics = mock.MagicMock()
+        server._seen = collections.OrderedDict()
+        server._subscribers = {
+            'a': mock.Mock(outbox=None, relay=None, version=0),
+            'b': mock.Mock(outbox=None, relay='hub2', version=0),
+            'c': mock.Mock(outbox=None, relay='hub3', version=0),
+        }
+        server._history = None
+        server._journal = None
+        server._sessions = {}
+        server._ring = None
+
+        server._fanout(msg)
+
+        server._subscribers['a'].send_frame.assert_called_once_with(
+            'version 0')
+        self.assertFalse(server._subscribers['b'].send_frame.called)
+        server._subscribers['c'].send_frame.assert_called_once_with(
+            'version 0')
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_fanout_sessions(self, mock_init):
+        msg = mock.Mock(expires=None, id='some-id', path=['hub1', 'hub2'], **{
+            'to_frame.side_effect': lambda x=0: 'version %d' % x,
+        })
+        server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._seen = collections.OrderedDict()
+        server._subscribers = {}
+        server._sessions = collections.OrderedDict([
+            ('a', mock.Mock(version=0, relay=None,
+                            **{'sent.return_value': False})),
+            ('b', mock.Mock(version=1, relay='hub3',
+                            **{'sent.return_value': True})),
+            ('c', mock.Mock(version=0, relay='hub2')),
+        ])
+        server._ring = None
+        server._history = None
+        server._journal = None
+
+        server._fanout(msg)
+
+        server._sessions['a'].sent.assert_called_once_with('some-id',
+                                                           'version 0', None)
+        server._sessions['b'].sent.assert_called_once_with('some-id',
+                                                           'version 1', None)
+        self.assertFalse(server._sessions['c'].sent.called)
+        server.metrics['receipts_dropped'].inc.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_fanout_ring(self, mock_init):
+        msg = mock.Mock(expires=None, id='some-id', path=None, urgency=1, **{
+            'to_frame.side_effect': lambda x=0: 'version %d' % x,
+        })
+        server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._seen = collections.OrderedDict()
+        server._subscribers = {
+            'a': mock.Mock(relay=None, ring=True, wakeup=None, version=0),
+            'b': mock.Mock(relay=None, ring=False, version=0),
+        }
+        server._history = None
+        server._journal = None
+        server._sessions = {}
+        server._ring = mock.Mock(**{'write.return_value': True})
+        server._wakeups = []
+
+        server._fanout(msg)
+
+        server._ring.write.assert_called_once_with('version 0')
+        self.assertEqual(1, server._subscribers['a'].wakeup)
+        self.assertEqual([server._subscribers['a']], server._wakeups)
+        self.assertFalse(server._subscribers['a'].outbox.push.called)
+        server._subscribers['b'].outbox.push.assert_called_once_with(
+            'some-id', 'version 0', 1, None)
+        self.assertFalse(server.metrics['ring_oversize'].inc.called)
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_fanout_ring_wakeup_pending(self, mock_init):
+        msg = mock.Mock(expires=None, id='some-id', path=None, urgency=2, **{
+            'to_frame.side_effect': lambda x=0: 'version %d' % x,
+        })
+        client = mock.Mock(relay=None, ring=True, wakeup=1, version=0)
+        server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._seen = collections.OrderedDict()
+        server._subscribers = {'a': client}
+        server._history = None
+        server._journal = None
+        server._sessions = {}
+        server._ring = mock.Mock(**{'write.return_value': True})
+        server._wakeups = [client]
+
+        server._fanout(msg)
+
+        self.assertEqual(2, client.wakeup)
+        self.assertEqual([client], server._wakeups)
+        self.assertFalse(client.outbox.push.called)
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'wakeup',
+    }))
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_wake(self, mock_init, mock_Message):
+        clients = [
+            mock.Mock(wakeup=1),
+            mock.Mock(wakeup=2, outbox=None),
+            mock.Mock(wakeup=0, **{'outbox.push.side_effect': Exception()}),
+        ]
+        server = hub.HubServer()
+        server._wakeups = list(clients)
+
+        server._wake()
+
+        mock_Message.assert_called_once_with('wakeup')
+        clients[0].outbox.push.assert_called_once_with(None, 'wakeup', 1)
+        clients[2].outbox.push.assert_called_once_with(None, 'wakeup', 0)
+        for client in clients:
+            self.assertEqual(None, client.wakeup)
+        self.assertEqual([], server._wakeups)
+
+    @mock.patch('heyu.protocol.Message')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_wake_none(self, mock_init, mock_Message):
+        server = hub.HubServer()
+        server._wakeups = []
+
+        server._wake()
+
+        self.assertFalse(mock_Message.called)
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'wakeup',
+    }))
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_dispatch_queued_ring_burst(self, mock_init, mock_Message):
+        msgs = [mock.Mock(expires=None, id='id%d' % i, path=None, urgency=i,
+                          **{'to_frame.return_value': 'frame%d' % i})
+                for i in range(5)]
+        client = mock.Mock(relay=None, ring=True, wakeup=None, version=0)
+        server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._subscribers = {'a': client}
+        server._sessions = {}
+        server._ring = mock.Mock(**{'write.return_value': True})
+        server._dispatch = collections.deque(msgs)
+        server._wakeups = []
+
+        server._dispatch_queued()
+
+        self.assertEqual(5, server._ring.write.call_count)
+        client.outbox.push.assert_called_once_with(None, 'wakeup', 4)
+        self.assertEqual(None, client.wakeup)
+
+    @mock.patch('heyu.protocol.Message')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_fanout_ring_oversize(self, mock_init, mock_Message):
+        msg = mock.Mock(expires=None, id='some-id', path=None, urgency=1, **{
+            'to_frame.side_effect': lambda x=0: 'version %d' % x,
+        })
+        server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._seen = collections.OrderedDict()
+        server._subscribers = {
+            'a': mock.Mock(relay=None, ring=True, wakeup=None, version=0),
+        }
+        server._history = None
+        server._journal = None
+        server._sessions = {}
+        server._ring = mock.Mock(**{'write.return_value': False})
+        server._wakeups = []
+
+        server._fanout(msg)
+
+        self.assertFalse(mock_Message.called)
+        server._subscribers['a'].outbox.push.assert_called_once_with(
+            'some-id', 'version 0', 1, None)
+        server.metrics['ring_oversize'].inc.assert_called_once_with()
+
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_submit_seen(self, mock_init):
+        msg = mock.Mock(expires=None, deliver_at=None, id='id3', path=None,
+                        app_name='app', summary='summary', body='body',
+                        urgency='urgency', category='category')
+        server = hub.HubServer()
+        server.dedup_size = 2
+        server.metrics = mock.MagicMock()
+        server._seen = collections.OrderedDict([
+            ('id1', 'content1'),
+            ('id3', 'content3'),
+            ('id2', 'content2'),
+        ])
+        server._subscribers = {}
+        server._history = None
+        server._snapshot = None
+        server._journal = None
+        server._sessions = {}
+        server._ring = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._dispatcher = 'dispatcher'
+
+        server.submit(msg)
+
+        self.assertEqual([
+            ('id2', 'content2'),
+            ('id3', ('app', 'summary', 'body', 'urgency', 'category')),
+        ], list(server._seen.items()))
+
+    @mock.patch('time.time', return_value=1234.0)
+    @mock.patch.object(hub.HubServer, '_schedule')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_submit_scheduled(self, mock_init, mock_schedule, mock_time):
+        msg = mock.Mock(expires=None, deliver_at=1235.0, id='some-id',
+                        path=None)
+        server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._seen = collections.OrderedDict()
+        server._history = mock.Mock()
+        server._snapshot = None
+        server._journal = mock.Mock()
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._dispatcher = 'dispatcher'
+
+        server.submit(msg)
+
+        mock_schedule.assert_called_once_with(msg)
+        server._journal.append.assert_called_once_with(
+            msg.to_frame.return_value, 1234.0)
+        self.assertFalse(server._history.append.called)
+        self.assertEqual({}, server._seen)
+        self.assertEqual([], list(server._dispatch))
+        self.assertFalse(server.metrics['notifications_submitted'].inc.called)
+
+    @mock.patch('time.time', return_value=1234.0)
+    @mock.patch.object(hub.HubServer, '_schedule')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_submit_due(self, mock_init, mock_schedule, mock_time):
+        msg = mock.Mock(expires=None, deliver_at=1234.0, id='some-id',
+                        path=None)
+        server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._seen = collections.OrderedDict()
+        server._history = None
+        server._snapshot = None
+        server._journal = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._dispatcher = 'dispatcher'
+
+        server.submit(msg)
+
+        self.assertFalse(mock_schedule.called)
+        self.assertEqual([msg], list(server._dispatch))
+        server.metrics['notifications_submitted'].inc.assert_called_once_with()
+
+    @mock.patch('gevent.spawn', return_value='scheduler')
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_schedule(self, mock_init, mock_time, mock_spawn):
+        msg = mock.Mock(deliver_at=1235.0)
+        server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._scheduled = mock.Mock()
+        server._scheduler = None
+
+        server._schedule(msg)
+
+        server._scheduled.add.assert_called_once_with(1235.0, msg, 1000.0)
+        mock_spawn.assert_called_once_with(server._schedule_run)
+        self.assertEqual('scheduler', server._scheduler)
+        server.metrics['notifications_scheduled'].inc.assert_called_once_with()
+
+    @mock.patch('gevent.spawn')
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_schedule_running(self, mock_init, mock_time, mock_spawn):
+        msg = mock.Mock(deliver_at=1235.0)
+        server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._scheduled = mock.Mock()
+        server._scheduler = 'scheduler'
+
+        server._schedule(msg)
 
+        server._scheduled.add.assert_called_once_with(1235.0, msg, 1000.0)
+        self.assertFalse(mock_spawn.called)
+        self.assertEqual('scheduler', server._scheduler)
+
+    @mock.patch('time.time', side_effect=[1000.75, 1001.0, 1001.0, 1002.0])
+    @mock.patch('gevent.sleep')
+    @mock.patch.object(hub.HubServer, 'submit',
+                       side_effect=[None, TestException('failed'), None])
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
-    def test_shutdown_empty(self, mock_init):
+    def test_schedule_run(self, mock_init, mock_submit, mock_sleep,
+                          mock_time):
         server = hub.HubServer()
-        server._listeners = {}
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._scheduled = timingwheel.TimingWheel(1000.0)
+        server._scheduled.add(1001.0, 'msg1')
+        server._scheduled.add(1002.0, 'msg3')
+        server._scheduled.add(1000.5, 'msg2')
+        server._scheduler = 'scheduler'
+
+        server._schedule_run()
+
+        mock_sleep.assert_has_calls([mock.call(0.25), mock.call(1.0)])
+        self.assertEqual(2, mock_sleep.call_count)
+        self.assertEqual(0, len(server._scheduled))
+        mock_submit.assert_has_calls([
+            mock.call('msg1'),
+            mock.call('msg2'),
+            mock.call('msg3'),
+        ])
+        server.metrics['submit_errors'].inc.assert_called_once_with()
+        self.assertEqual(None, server._scheduler)
+
+    @mock.patch('gevent.spawn', return_value='dispatcher')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_submit_dispatcher(self, mock_init, mock_spawn):
+        msg = mock.Mock(expires=None, deliver_at=None, id='some-id', path=None)
+        server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._seen = collections.OrderedDict()
         server._subscribers = {
-            'a': (mock.Mock(), 0),
-            'b': (mock.Mock(), 1),
-            'c': (mock.Mock(), 2),
+            'a': mock.Mock(outbox=None, relay=None, version=0),
         }
-        server._running = True
+        server._history = None
+        server._snapshot = None
+        server._journal = None
+        server._sessions = {}
+        server._ring = None
+        server._dispatch = collections.deque()
+        server._wakeups = []
+        server._dispatcher = None
 
-        server.shutdown()
+        server.submit(msg)
 
-        self.assertEqual(False, server._running)
-        self.assertEqual({}, server._subscribers)
+        self.assertEqual([msg], list(server._dispatch))
+        self.assertEqual('dispatcher', server._dispatcher)
+        mock_spawn.assert_called_once_with(server._dispatch_run)
+        self.assertFalse(server._subscribers['a'].send_frame.called)
+        server.metrics['notifications_submitted'].inc.assert_called_once_with()
 
+    @mock.patch('gevent.spawn')
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
-    def test_subscribe(self, mock_init):
-        client = mock.Mock()
+    def test_submit_dispatcher_running(self, mock_init, mock_spawn):
+        msg = mock.Mock(expires=None, deliver_at=None, id='some-id', path=None)
         server = hub.HubServer()
+        server.metrics = collections.defaultdict(mock.Mock)
+        server._seen = collections.OrderedDict()
         server._subscribers = {}
+        server._history = None
+        server._snapshot = None
+        server._journal = None
+        server._sessions = {}
+        server._ring = None
+        server._dispatch = collections.deque(['other'])
+        server._dispatcher = 'dispatcher'
 
-        server.subscribe(client, 1)
+        server.submit(msg)
 
-        self.assertEqual({
-            id(client): (client, 1),
-        }, server._subscribers)
+        self.assertEqual(['other', msg], list(server._dispatch))
+        self.assertEqual('dispatcher', server._dispatcher)
+        self.assertFalse(mock_spawn.called)
 
+    @mock.patch.object(hub.HubServer, '_dispatch_queued')
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
-    def test_unsubscribe_unsubscribed(self, mock_init):
-        client1 = mock.Mock()
-        client2 = mock.Mock()
+    def test_dispatch_run(self, mock_init, mock_dispatch_queued):
         server = hub.HubServer()
-        server._subscribers = {
-            id(client1): (client1, 0),
-        }
+        server._dispatcher = 'dispatcher'
 
-        server.unsubscribe(client2)
+        server._dispatch_run()
 
-        self.assertEqual({
-            id(client1): (client1, 0),
-        }, server._subscribers)
+        mock_dispatch_queued.assert_called_once_with()
+        self.assertEqual(None, server._dispatcher)
 
+    @mock.patch.object(hub.HubServer, '_dispatch_queued',
+                       side_effect=TestException('failed'))
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
-    def test_unsubscribe_subscribed(self, mock_init):
-        client1 = mock.Mock()
-        client2 = mock.Mock()
+    def test_dispatch_run_failure(self, mock_init, mock_dispatch_queued):
         server = hub.HubServer()
-        server._subscribers = {
-            id(client1): (client1, 0),
-            id(client2): (client2, 0),
-        }
+        server._dispatcher = 'dispatcher'
 
-        server.unsubscribe(client2)
+        self.assertRaises(TestException, server._dispatch_run)
+        self.assertEqual(None, server._dispatcher)
 
-        self.assertEqual({
-            id(client1): (client1, 0),
-        }, server._subscribers)
+    @mock.patch.object(hub.HubServer, '_fanout')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    def test_dispatch_queued(self, mock_init, mock_fanout):
+        server = hub.HubServer()
+        server._dispatch = collections.deque(['msg1', 'msg2', 'msg3'])
+        server._wakeups = []
+
+        server._dispatch_queued()
+
+        mock_fanout.assert_has_calls([
+            mock.call('msg1'),
+            mock.call('msg2'),
+            mock.call('msg3'),
+        ])
+        self.assertEqual(3, mock_fanout.call_count)
+        self.assertEqual([], list(server._dispatch))
 
+    @mock.patch.object(hub.HubServer, 'submit')
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
-    def test_submit_empty(self, mock_init):
-        msg = mock.Mock(**{'to_frame.side_effect': lambda x: 'version %d' % x})
+    def test_relay_loop(self, mock_init, mock_submit):
+        msg = mock.Mock(id='some-id', path=['hub0', 'hub1'])
         server = hub.HubServer()
-        server._subscribers = {}
+        server.name = 'hub1'
+        server.metrics = mock.MagicMock()
+        server._seen = collections.OrderedDict()
 
-        server.submit(msg)
+        server.relay(msg)
 
-        self.assertFalse(msg.to_frame.called)
+        server.metrics['relay_loops'].inc.assert_called_once_with()
+        self.assertFalse(mock_submit.called)
 
+    @mock.patch.object(hub.HubServer, 'submit')
     @mock.patch.object(hub.HubServer, '__init__', return_value=None)
-    def test_submit(self, mock_init):
-        def fake_to_frame(version):
-            if version > 2:
-                raise TestException('version too high')
-            return 'version %d' % version
-        msg = mock.Mock(**{'to_frame.side_effect': fake_to_frame})
+    def test_relay_duplicate(self, mock_init, mock_submit):
+        msg = mock.Mock(id='some-id', path=['hub0', 'hub2'], app_name='app',
+                        summary='summary', body='body', urgency='urgency',
+                        category='category')
         server = hub.HubServer()
-        server._subscribers = {
-            'a': (mock.Mock(), 0),
-            'b': (mock.Mock(), 1),
-            'c': (mock.Mock(), 2),
-            'd': (mock.Mock(), 3),
-            'e': (mock.Mock(), 4),
-        }
+        server.name = 'hub1'
+        server.metrics = mock.MagicMock()
+        server._seen = collections.OrderedDict([
+            ('some-id', ('app', 'summary', 'body', 'urgency', 'category')),
+        ])
 
-        server.submit(msg)
+        server.relay(msg)
 
-        msg.to_frame.assert_has_calls([
-            mock.call(0),
-            mock.call(1),
-            mock.call(2),
-            mock.call(3),
-            mock.call(4),
-        ], any_order=True)
-        for client, version in server._subscribers.values():
-            if version > 2:
-                self.assertFalse(client.send_frame.called)
-            else:
-                client.send_frame.assert_called_once_with(
-                    'version %d' % version)
+        server.metrics['relay_duplicates'].inc.assert_called_once_with()
+        self.assertFalse(mock_submit.called)
+
+    @mock.patch.object(hub.HubServer, 'submit')
+    @mock.patch.object(hub.HubServer, '__init__', return_value=None)
+    @mock.patch('heyu.protocol.Message', return_value='notification')
+    def test_relay(self, mock_Message, mock_init, mock_submit):
+        msg = mock.Mock(id='some-id', path=['hub0'], app_name='app',
+                        summary='summary', body='body', urgency='urgency',
+                        category='category', expires=2000.0)
+        server = hub.HubServer()
+        server.name = 'hub1'
+        server.metrics = mock.MagicMock()
+        server._seen = collections.OrderedDict([
+            ('some-id', ('app', 'summary', 'old body', 'urgency',
+                         'category')),
+        ])
+
+        server.relay(msg)
+
+        mock_Message.assert_called_once_with(
+            'notify', id='some-id', app_name='app', summary='summary',
+            body='body', urgency='urgency', category='category',
+            path=['hub0', 'hub1'], expires=2000.0)
+        mock_submit.assert_called_once_with('notification')
 
 
 class HubApplicationTest(unittest.TestCase):
@@ -336,16 +2654,55 @@ class HubApplicationTest(unittest.TestCase):
     def test_init_localipv4(self, mock_getnameinfo, mock_getfqdn,
                             mock_COBSFramer, mock_init):
         parent = mock.Mock(remote_addr=('127.0.0.1', 4321))
+        server = mock.Mock(fqdn='fqdn')
 
-        app = hub.HubApplication(parent, 'server')
+        app = hub.HubApplication(parent, server)
 
-        self.assertEqual('server', app.server)
+        self.assertEqual(server, app.server)
         self.assertEqual(False, app.persist)
+        self.assertEqual(None, app.outbox)
+        self.assertEqual(None, app.writer)
+        self.assertEqual(None, app.version)
+        self.assertEqual(None, app.relay)
+        self.assertEqual(None, app.receipts)
+        self.assertEqual(True, app.local)
+        self.assertEqual(False, app.ring)
+        self.assertEqual(None, app.wakeup)
         self.assertEqual('fqdn', app.hostname)
         mock_init.assert_called_once_with(parent)
         mock_COBSFramer.assert_called_once_with(True)
         self.assertEqual('framer', parent.framers)
-        mock_getfqdn.assert_called_once_with()
+        self.assertFalse(mock_getfqdn.called)
+        self.assertFalse(mock_getnameinfo.called)
+
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch('socket.getfqdn', return_value='fqdn')
+    @mock.patch('socket.getnameinfo', return_value=('host', 1234))
+    @mock.patch.object(util, 'intern', return_value='interned')
+    def test_init_intern(self, mock_intern, mock_getnameinfo, mock_getfqdn,
+                         mock_COBSFramer, mock_init):
+        parent = mock.Mock(remote_addr=('10.0.0.1', 4321))
+
+        app = hub.HubApplication(parent, 'server')
+
+        self.assertEqual('interned', app.hostname)
+        mock_intern.assert_called_once_with('host')
+
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch('socket.getfqdn', return_value='fqdn')
+    @mock.patch('socket.getnameinfo', return_value=('host', 1234))
+    def test_init_unix(self, mock_getnameinfo, mock_getfqdn,
+                       mock_COBSFramer, mock_init):
+        parent = mock.Mock(proto='unix', remote_addr=(1, 1000, 1000, 5))
+        server = mock.Mock(fqdn='fqdn')
+
+        app = hub.HubApplication(parent, server)
+
+        self.assertEqual('fqdn', app.hostname)
+        self.assertEqual(True, app.local)
+        self.assertFalse(mock_getfqdn.called)
         self.assertFalse(mock_getnameinfo.called)
 
     @mock.patch('tendril.Application.__init__', return_value=None)
@@ -355,16 +2712,19 @@ class HubApplicationTest(unittest.TestCase):
     def test_init_localipv6(self, mock_getnameinfo, mock_getfqdn,
                             mock_COBSFramer, mock_init):
         parent = mock.Mock(remote_addr=('::1', 4321))
+        server = mock.Mock(fqdn='fqdn')
 
-        app = hub.HubApplication(parent, 'server')
+        app = hub.HubApplication(parent, server)
 
-        self.assertEqual('server', app.server)
+        self.assertEqual(True, app.local)
+        self.assertEqual(server, app.server)
         self.assertEqual(False, app.persist)
+        self.assertEqual(None, app.outbox)
         self.assertEqual('fqdn', app.hostname)
         mock_init.assert_called_once_with(parent)
         mock_COBSFramer.assert_called_once_with(True)
         self.assertEqual('framer', parent.framers)
-        mock_getfqdn.assert_called_once_with()
+        self.assertFalse(mock_getfqdn.called)
         self.assertFalse(mock_getnameinfo.called)
 
     @mock.patch('tendril.Application.__init__', return_value=None)
@@ -377,6 +2737,7 @@ class HubApplicationTest(unittest.TestCase):
 
         app = hub.HubApplication(parent, 'server')
 
+        self.assertEqual(False, app.local)
         self.assertEqual('server', app.server)
         self.assertEqual(False, app.persist)
         self.assertEqual('host', app.hostname)
@@ -386,6 +2747,44 @@ class HubApplicationTest(unittest.TestCase):
         self.assertFalse(mock_getfqdn.called)
         mock_getnameinfo.assert_called_once_with(('10.0.0.1', 4321), 0)
 
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch('socket.getfqdn', return_value='fqdn')
+    @mock.patch('socket.getnameinfo', return_value=('host', 1234))
+    def test_init_nodelay(self, mock_getnameinfo, mock_getfqdn,
+                          mock_COBSFramer, mock_init):
+        parent = mock.Mock(proto='tcp', remote_addr=('10.0.0.1', 4321))
+
+        hub.HubApplication(parent, 'server')
+
+        parent.sock.setsockopt.assert_called_once_with(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch('socket.getfqdn', return_value='fqdn')
+    @mock.patch('socket.getnameinfo', return_value=('host', 1234))
+    def test_init_nodelay_failed(self, mock_getnameinfo, mock_getfqdn,
+                                 mock_COBSFramer, mock_init):
+        parent = mock.Mock(proto='tcp', remote_addr=('10.0.0.1', 4321))
+        parent.sock.setsockopt.side_effect = socket.error('not supported')
+
+        app = hub.HubApplication(parent, 'server')
+
+        self.assertEqual('host', app.hostname)
+
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch('socket.getfqdn', return_value='fqdn')
+    @mock.patch('socket.getnameinfo', return_value=('host', 1234))
+    def test_init_unix_nodelay(self, mock_getnameinfo, mock_getfqdn,
+                               mock_COBSFramer, mock_init):
+        parent = mock.Mock(proto='unix', remote_addr=(1, 1000, 1000, 5))
+
+        hub.HubApplication(parent, mock.Mock(fqdn='fqdn'))
+
+        self.assertFalse(parent.sock.setsockopt.called)
+
     @mock.patch('tendril.Application.__init__', return_value=None)
     @mock.patch('tendril.COBSFramer', return_value='framer')
     @mock.patch('socket.getfqdn', return_value='fqdn')
@@ -396,6 +2795,7 @@ class HubApplicationTest(unittest.TestCase):
 
         app = hub.HubApplication(parent, 'server')
 
+        self.assertEqual(False, app.local)
         self.assertEqual('server', app.server)
         self.assertEqual(False, app.persist)
         self.assertEqual('10.0.0.1', app.hostname)
@@ -405,6 +2805,107 @@ class HubApplicationTest(unittest.TestCase):
         self.assertFalse(mock_getfqdn.called)
         mock_getnameinfo.assert_called_once_with(('10.0.0.1', 4321), 0)
 
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    def test_backlog(self, mock_init):
+        app = hub.HubApplication()
+        app.parent = mock.Mock(_sendbuf='pending')
+        app.writer = None
+
+        self.assertEqual(7, app.backlog)
+
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    def test_backlog_writer(self, mock_init):
+        app = hub.HubApplication()
+        app.parent = mock.Mock(_sendbuf='pending')
+        app.writer = mock.Mock(**{'__len__': mock.Mock(return_value=5)})
+
+        self.assertEqual(7, app.backlog)
+
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    def test_backlog_unknown(self, mock_init):
+        app = hub.HubApplication()
+        app.parent = object()
+        app.writer = None
+
+        self.assertEqual(0, app.backlog)
+
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    def test_pending(self, mock_init):
+        app = hub.HubApplication()
+        app.parent = mock.Mock(_sendbuf='pending')
+        app.writer = None
+
+        self.assertEqual(7, app.pending)
+
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    def test_pending_writer(self, mock_init):
+        app = hub.HubApplication()
+        app.parent = mock.Mock(_sendbuf='pending')
+        app.writer = mock.Mock(**{'__len__': mock.Mock(return_value=5)})
+
+        self.assertEqual(12, app.pending)
+
+    @mock.patch('tendril.Application.send_frame')
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    def test_burst_within_write_delay(self, mock_init, mock_send_frame):
+        app = hub.HubApplication()
+        app.parent = mock.Mock(_sendbuf='')
+        app.server = mock.Mock(metrics=collections.defaultdict(mock.Mock))
+        app.writer = writer.Writer(app.write_frames, 0.001, 65536)
+        app.outbox = outbox.Outbox(app, 0.05, False)
+        frames = ['frame%d' % i for i in range(10)]
+
+        for i, frame in enumerate(frames):
+            app.outbox.push('id%d' % i, frame)
+        gevent.sleep(0.01)
+
+        self.assertEqual(0, len(app.outbox))
+        self.assertEqual([mock.call(frame) for frame in frames],
+                         mock_send_frame.call_args_list)
+        app.server.metrics['write_batches'].inc.assert_called_once_with()
+
+    @mock.patch('tendril.Application.send_frame')
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    def test_send_frame(self, mock_init, mock_send_frame):
+        app = hub.HubApplication()
+        app.server = mock.MagicMock()
+        app.writer = None
+
+        app.send_frame('frame')
+
+        app.server.metrics.__getitem__.assert_called_once_with('bytes_out')
+        app.server.metrics['bytes_out'].inc.assert_called_once_with(5)
+        mock_send_frame.assert_called_once_with('frame')
+
+    @mock.patch('tendril.Application.send_frame')
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    def test_send_frame_writer(self, mock_init, mock_send_frame):
+        app = hub.HubApplication()
+        app.server = mock.MagicMock()
+        app.writer = mock.Mock()
+
+        app.send_frame('frame')
+
+        app.server.metrics['bytes_out'].inc.assert_called_once_with(5)
+        app.writer.write.assert_called_once_with('frame')
+        self.assertFalse(mock_send_frame.called)
+
+    @mock.patch('tendril.Application.send_frame')
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    def test_write_frames(self, mock_init, mock_send_frame):
+        app = hub.HubApplication()
+        app.server = mock.MagicMock()
+        app.writer = mock.Mock()
+
+        app.write_frames(['frame1', 'frame2'])
+
+        app.server.metrics['write_batches'].inc.assert_called_once_with()
+        self.assertEqual([
+            mock.call('frame1'),
+            mock.call('frame2'),
+        ], mock_send_frame.call_args_list)
+        self.assertFalse(app.writer.write.called)
+
     @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
         'to_frame.return_value': 'some frame',
     }), **{'from_frame.side_effect': ValueError('failed to decode')})
@@ -418,6 +2919,8 @@ class HubApplicationTest(unittest.TestCase):
                                     mock_notify, mock_close, mock_send_frame,
                                     mock_init, mock_Message):
         app = hub.HubApplication()
+        app.heartbeat = None
+        app.server = mock.MagicMock()
 
         app.recv_frame('test')
 
@@ -444,6 +2947,8 @@ class HubApplicationTest(unittest.TestCase):
                                    mock_notify, mock_close, mock_send_frame,
                                    mock_init, mock_Message):
         app = hub.HubApplication()
+        app.heartbeat = None
+        app.server = mock.MagicMock()
 
         app.recv_frame('test')
 
@@ -470,6 +2975,8 @@ class HubApplicationTest(unittest.TestCase):
                                mock_notify, mock_close, mock_send_frame,
                                mock_init, mock_Message):
         app = hub.HubApplication()
+        app.heartbeat = None
+        app.server = mock.MagicMock()
 
         app.recv_frame('test')
 
@@ -495,6 +3002,8 @@ class HubApplicationTest(unittest.TestCase):
                                   mock_notify, mock_close, mock_send_frame,
                                   mock_init, mock_Message):
         app = hub.HubApplication()
+        app.heartbeat = None
+        app.server = mock.MagicMock()
 
         app.recv_frame('test')
 
@@ -513,31 +3022,186 @@ class HubApplicationTest(unittest.TestCase):
     @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
     @mock.patch.object(hub.HubApplication, 'send_frame')
     @mock.patch.object(hub.HubApplication, 'close')
-    @mock.patch.object(hub.HubApplication, 'notify')
-    @mock.patch.object(hub.HubApplication, 'subscribe')
-    @mock.patch.object(hub.HubApplication, 'disconnect')
-    def test_recv_frame_goodbye(self, mock_disconnect, mock_subscribe,
-                                mock_notify, mock_close, mock_send_frame,
-                                mock_init, mock_Message):
+    @mock.patch.object(hub.HubApplication, 'notify')
+    @mock.patch.object(hub.HubApplication, 'subscribe')
+    @mock.patch.object(hub.HubApplication, 'disconnect')
+    def test_recv_frame_goodbye(self, mock_disconnect, mock_subscribe,
+                                mock_notify, mock_close, mock_send_frame,
+                                mock_init, mock_Message):
+        app = hub.HubApplication()
+        app.heartbeat = None
+        app.server = mock.MagicMock()
+
+        app.recv_frame('test')
+
+        mock_Message.from_frame.assert_called_once_with('test')
+        self.assertFalse(mock_Message.called)
+        self.assertFalse(mock_send_frame.called)
+        self.assertFalse(mock_close.called)
+        self.assertFalse(mock_notify.called)
+        self.assertFalse(mock_subscribe.called)
+        mock_disconnect.assert_called_once_with()
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }), **{'from_frame.return_value': mock.Mock(msg_type='stats')})
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    @mock.patch.object(hub.HubApplication, 'stats')
+    def test_recv_frame_stats(self, mock_stats, mock_close, mock_send_frame,
+                              mock_init, mock_Message):
+        app = hub.HubApplication()
+        app.heartbeat = None
+        app.server = mock.MagicMock()
+
+        app.recv_frame('test')
+
+        app.server.metrics['bytes_in'].inc.assert_called_once_with(4)
+        mock_Message.from_frame.assert_called_once_with('test')
+        self.assertFalse(mock_Message.called)
+        self.assertFalse(mock_send_frame.called)
+        self.assertFalse(mock_close.called)
+        mock_stats.assert_called_once_with()
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }), **{'from_frame.return_value': mock.Mock(msg_type='ack')})
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    @mock.patch.object(hub.HubApplication, 'ack')
+    def test_recv_frame_ack(self, mock_ack, mock_close, mock_send_frame,
+                            mock_init, mock_Message):
+        app = hub.HubApplication()
+        app.heartbeat = None
+        app.server = mock.MagicMock()
+
+        app.recv_frame('test')
+
+        mock_ack.assert_called_once_with(
+            mock_Message.from_frame.return_value)
+        self.assertFalse(mock_send_frame.called)
+        self.assertFalse(mock_close.called)
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }), **{'from_frame.return_value': mock.Mock(msg_type='ping')})
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_recv_frame_ping(self, mock_close, mock_send_frame, mock_init,
+                             mock_Message):
+        app = hub.HubApplication()
+        app.heartbeat = mock.Mock()
+        app.server = mock.MagicMock()
+
+        app.recv_frame('test')
+
+        app.heartbeat.received.assert_called_once_with()
+        mock_Message.assert_called_once_with('pong')
+        mock_send_frame.assert_called_once_with('some frame')
+        self.assertFalse(mock_close.called)
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }), **{'from_frame.return_value': mock.Mock(msg_type='pong')})
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_recv_frame_pong(self, mock_close, mock_send_frame, mock_init,
+                             mock_Message):
+        app = hub.HubApplication()
+        app.heartbeat = mock.Mock()
+        app.server = mock.MagicMock()
+
+        app.recv_frame('test')
+
+        app.heartbeat.received.assert_called_once_with()
+        self.assertFalse(mock_Message.called)
+        self.assertFalse(mock_send_frame.called)
+        self.assertFalse(mock_close.called)
+
+    @mock.patch('heyu.ulid.generate', return_value='some-ulid')
+    @mock.patch('heyu.protocol.Message')
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_notify_success(self, mock_close, mock_send_frame, mock_init,
+                            mock_Message, mock_generate):
+        msgs = {
+            'notify': 'notification',
+            'error': mock.Mock(**{'to_frame.return_value': 'error'}),
+            'accepted': mock.Mock(**{'to_frame.return_value': 'accepted'}),
+        }
+        mock_Message.side_effect = lambda x, **kw: msgs[x]
+        msg = mock.Mock(id=None, app_name='app', summary='summary',
+                        body='body', urgency='urgency', category='category',
+                        expires=None, ttl=None, deliver_at=None,
+                        delay=None)
+        app = hub.HubApplication()
+        app.hostname = 'host'
+        app.server = mock.MagicMock()
+        app.persist = True
+
+        app.notify(msg)
+
+        mock_generate.assert_called_once_with()
+        mock_Message.assert_has_calls([
+            mock.call('notify', id='some-ulid', app_name='[host]app',
+                      summary='summary', body='body', urgency='urgency',
+                      category='category', path=[app.server.name],
+                      expires=None, deliver_at=None),
+            mock.call('accepted', id='some-ulid'),
+        ])
+        app.server.throttle.assert_called_once_with('host', 'app')
+        app.server.submit.assert_called_once_with('notification')
+        self.assertFalse(msgs['error'].to_frame.called)
+        msgs['accepted'].to_frame.assert_called_once_with()
+        mock_send_frame.assert_called_once_with('accepted')
+        self.assertFalse(mock_close.called)
+
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch('heyu.ulid.generate', return_value='some-ulid')
+    @mock.patch('heyu.protocol.Message')
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_notify_delay(self, mock_close, mock_send_frame, mock_init,
+                          mock_Message, mock_generate, mock_time):
+        msgs = {
+            'notify': 'notification',
+            'error': mock.Mock(**{'to_frame.return_value': 'error'}),
+            'accepted': mock.Mock(**{'to_frame.return_value': 'accepted'}),
+        }
+        mock_Message.side_effect = lambda x, **kw: msgs[x]
+        msg = mock.Mock(id=None, app_name='app', summary='summary',
+                        body='body', urgency='urgency', category='category',
+                        expires=None, ttl=60.0, deliver_at=5000.0,
+                        delay=30.0)
         app = hub.HubApplication()
+        app.hostname = 'host'
+        app.server = mock.MagicMock()
+        app.persist = True
 
-        app.recv_frame('test')
+        app.notify(msg)
 
-        mock_Message.from_frame.assert_called_once_with('test')
-        self.assertFalse(mock_Message.called)
-        self.assertFalse(mock_send_frame.called)
-        self.assertFalse(mock_close.called)
-        self.assertFalse(mock_notify.called)
-        self.assertFalse(mock_subscribe.called)
-        mock_disconnect.assert_called_once_with()
+        mock_Message.assert_has_calls([
+            mock.call('notify', id='some-ulid', app_name='[host]app',
+                      summary='summary', body='body', urgency='urgency',
+                      category='category', path=[app.server.name],
+                      expires=1090.0, deliver_at=1030.0),
+            mock.call('accepted', id='some-ulid'),
+        ])
 
-    @mock.patch('uuid.uuid4', return_value='some-uuid')
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch('heyu.ulid.generate', return_value='some-ulid')
     @mock.patch('heyu.protocol.Message')
     @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
     @mock.patch.object(hub.HubApplication, 'send_frame')
     @mock.patch.object(hub.HubApplication, 'close')
-    def test_notify_success(self, mock_close, mock_send_frame, mock_init,
-                            mock_Message, mock_uuid4):
+    def test_notify_ttl(self, mock_close, mock_send_frame, mock_init,
+                        mock_Message, mock_generate, mock_time):
         msgs = {
             'notify': 'notification',
             'error': mock.Mock(**{'to_frame.return_value': 'error'}),
@@ -545,34 +3209,32 @@ class HubApplicationTest(unittest.TestCase):
         }
         mock_Message.side_effect = lambda x, **kw: msgs[x]
         msg = mock.Mock(id=None, app_name='app', summary='summary',
-                        body='body', urgency='urgency', category='category')
+                        body='body', urgency='urgency', category='category',
+                        expires=5000.0, ttl=60.0, deliver_at=None,
+                        delay=None)
         app = hub.HubApplication()
         app.hostname = 'host'
-        app.server = mock.Mock()
+        app.server = mock.MagicMock()
         app.persist = True
 
         app.notify(msg)
 
-        mock_uuid4.assert_called_once_with()
         mock_Message.assert_has_calls([
-            mock.call('notify', id='some-uuid', app_name='[host]app',
+            mock.call('notify', id='some-ulid', app_name='[host]app',
                       summary='summary', body='body', urgency='urgency',
-                      category='category'),
-            mock.call('accepted', id='some-uuid'),
+                      category='category', path=[app.server.name],
+                      expires=1060.0, deliver_at=None),
+            mock.call('accepted', id='some-ulid'),
         ])
         app.server.submit.assert_called_once_with('notification')
-        self.assertFalse(msgs['error'].to_frame.called)
-        msgs['accepted'].to_frame.assert_called_once_with()
-        mock_send_frame.assert_called_once_with('accepted')
-        self.assertFalse(mock_close.called)
 
-    @mock.patch('uuid.uuid4', return_value='some-uuid')
+    @mock.patch('heyu.ulid.generate', return_value='some-ulid')
     @mock.patch('heyu.protocol.Message')
     @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
     @mock.patch.object(hub.HubApplication, 'send_frame')
     @mock.patch.object(hub.HubApplication, 'close')
     def test_notify_provided_id(self, mock_close, mock_send_frame, mock_init,
-                                mock_Message, mock_uuid4):
+                                mock_Message, mock_generate):
         msgs = {
             'notify': 'notification',
             'error': mock.Mock(**{'to_frame.return_value': 'error'}),
@@ -580,34 +3242,38 @@ class HubApplicationTest(unittest.TestCase):
         }
         mock_Message.side_effect = lambda x, **kw: msgs[x]
         msg = mock.Mock(id='my-id', app_name='app', summary='summary',
-                        body='body', urgency='urgency', category='category')
+                        body='body', urgency='urgency', category='category',
+                        expires=None, ttl=None, deliver_at=None,
+                        delay=None)
         app = hub.HubApplication()
         app.hostname = 'host'
-        app.server = mock.Mock()
+        app.server = mock.MagicMock()
         app.persist = True
 
         app.notify(msg)
 
-        self.assertFalse(mock_uuid4.called)
+        self.assertFalse(mock_generate.called)
         mock_Message.assert_has_calls([
             mock.call('notify', id='my-id', app_name='[host]app',
                       summary='summary', body='body', urgency='urgency',
-                      category='category'),
+                      category='category', path=[app.server.name],
+                      expires=None, deliver_at=None),
             mock.call('accepted', id='my-id'),
         ])
+        app.server.throttle.assert_called_once_with('host', 'app')
         app.server.submit.assert_called_once_with('notification')
         self.assertFalse(msgs['error'].to_frame.called)
         msgs['accepted'].to_frame.assert_called_once_with()
         mock_send_frame.assert_called_once_with('accepted')
         self.assertFalse(mock_close.called)
 
-    @mock.patch('uuid.uuid4', return_value='some-uuid')
+    @mock.patch('heyu.ulid.generate', return_value='some-ulid')
     @mock.patch('heyu.protocol.Message')
     @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
     @mock.patch.object(hub.HubApplication, 'send_frame')
     @mock.patch.object(hub.HubApplication, 'close')
     def test_notify_no_persist(self, mock_close, mock_send_frame, mock_init,
-                               mock_Message, mock_uuid4):
+                               mock_Message, mock_generate):
         msgs = {
             'notify': 'notification',
             'error': mock.Mock(**{'to_frame.return_value': 'error'}),
@@ -615,34 +3281,38 @@ class HubApplicationTest(unittest.TestCase):
         }
         mock_Message.side_effect = lambda x, **kw: msgs[x]
         msg = mock.Mock(id=None, app_name='app', summary='summary',
-                        body='body', urgency='urgency', category='category')
+                        body='body', urgency='urgency', category='category',
+                        expires=None, ttl=None, deliver_at=None,
+                        delay=None)
         app = hub.HubApplication()
         app.hostname = 'host'
-        app.server = mock.Mock()
+        app.server = mock.MagicMock()
         app.persist = False
 
         app.notify(msg)
 
-        mock_uuid4.assert_called_once_with()
+        mock_generate.assert_called_once_with()
         mock_Message.assert_has_calls([
-            mock.call('notify', id='some-uuid', app_name='[host]app',
+            mock.call('notify', id='some-ulid', app_name='[host]app',
                       summary='summary', body='body', urgency='urgency',
-                      category='category'),
-            mock.call('accepted', id='some-uuid'),
+                      category='category', path=[app.server.name],
+                      expires=None, deliver_at=None),
+            mock.call('accepted', id='some-ulid'),
         ])
+        app.server.throttle.assert_called_once_with('host', 'app')
         app.server.submit.assert_called_once_with('notification')
         self.assertFalse(msgs['error'].to_frame.called)
         msgs['accepted'].to_frame.assert_called_once_with()
         mock_send_frame.assert_called_once_with('accepted')
         mock_close.assert_called_once_with()
 
-    @mock.patch('uuid.uuid4', return_value='some-uuid')
+    @mock.patch('heyu.ulid.generate', return_value='some-ulid')
     @mock.patch('heyu.protocol.Message')
     @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
     @mock.patch.object(hub.HubApplication, 'send_frame')
     @mock.patch.object(hub.HubApplication, 'close')
     def test_notify_failure(self, mock_close, mock_send_frame, mock_init,
-                            mock_Message, mock_uuid4):
+                            mock_Message, mock_generate):
         msgs = {
             'notify': 'notification',
             'error': mock.Mock(**{'to_frame.return_value': 'error'}),
@@ -650,21 +3320,24 @@ class HubApplicationTest(unittest.TestCase):
         }
         mock_Message.side_effect = lambda x, **kw: msgs[x]
         msg = mock.Mock(id=None, app_name='app', summary='summary',
-                        body='body', urgency='urgency', category='category')
+                        body='body', urgency='urgency', category='category',
+                        expires=None, ttl=None, deliver_at=None,
+                        delay=None)
         app = hub.HubApplication()
         app.hostname = 'host'
-        app.server = mock.Mock(**{
+        app.server = mock.MagicMock(**{
             'submit.side_effect': TestException('failed'),
         })
         app.persist = True
 
         app.notify(msg)
 
-        mock_uuid4.assert_called_once_with()
+        mock_generate.assert_called_once_with()
         mock_Message.assert_has_calls([
-            mock.call('notify', id='some-uuid', app_name='[host]app',
+            mock.call('notify', id='some-ulid', app_name='[host]app',
                       summary='summary', body='body', urgency='urgency',
-                      category='category'),
+                      category='category', path=[app.server.name],
+                      expires=None, deliver_at=None),
             mock.call('error', reason='Failed to submit notification: failed'),
         ])
         app.server.submit.assert_called_once_with('notification')
@@ -673,6 +3346,41 @@ class HubApplicationTest(unittest.TestCase):
         mock_send_frame.assert_called_once_with('error')
         self.assertFalse(mock_close.called)
 
+    @mock.patch('heyu.ulid.generate', return_value='some-ulid')
+    @mock.patch('heyu.protocol.Message')
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_notify_rate_limited(self, mock_close, mock_send_frame, mock_init,
+                                 mock_Message, mock_generate):
+        msgs = {
+            'notify': 'notification',
+            'error': mock.Mock(**{'to_frame.return_value': 'error'}),
+            'accepted': mock.Mock(**{'to_frame.return_value': 'accepted'}),
+        }
+        mock_Message.side_effect = lambda x, **kw: msgs[x]
+        msg = mock.Mock(id=None, app_name='app', summary='summary',
+                        body='body', urgency='urgency', category='category',
+                        expires=None, ttl=None, deliver_at=None,
+                        delay=None)
+        app = hub.HubApplication()
+        app.hostname = 'host'
+        app.server = mock.MagicMock(**{
+            'throttle.side_effect': ratelimit.RateLimitExceeded('limited'),
+        })
+        app.persist = False
+
+        app.notify(msg)
+
+        mock_Message.assert_has_calls([
+            mock.call('error', reason='Failed to submit notification: '
+                      'limited'),
+        ])
+        app.server.throttle.assert_called_once_with('host', 'app')
+        self.assertFalse(app.server.submit.called)
+        mock_send_frame.assert_called_once_with('error')
+        mock_close.assert_called_once_with()
+
     @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
         'to_frame.return_value': 'frame',
     }))
@@ -681,19 +3389,146 @@ class HubApplicationTest(unittest.TestCase):
     @mock.patch.object(hub.HubApplication, 'close')
     def test_subscribe_success(self, mock_close, mock_send_frame, mock_init,
                                mock_Message):
-        msg = mock.Mock(version=1)
+        msg = mock.Mock(version=1, since_id=None, since=None, heartbeat=None)
         app = hub.HubApplication()
         app.persist = False
-        app.server = mock.Mock()
+        app.ring = False
+        app.server = mock.MagicMock(**{'redeliver.return_value': False})
 
         app.subscribe(msg)
 
-        app.server.subscribe.assert_called_once_with(app, 1)
-        mock_Message.assert_called_once_with('subscribed')
+        app.server.subscribe.assert_called_once_with(app, 1, None, msg.session,
+                                                     msg.ring)
+        mock_Message.assert_called_once_with(
+            'subscribed', heartbeat=app.server.subscribe.return_value,
+            session=msg.session, ring=None)
         mock_Message.return_value.to_frame.assert_called_once_with()
         mock_send_frame.assert_called_once_with('frame')
         self.assertFalse(mock_close.called)
         self.assertEqual(True, app.persist)
+        self.assertEqual(msg.relay, app.relay)
+        self.assertFalse(app.server.replay.called)
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_subscribe_replay_id(self, mock_close, mock_send_frame, mock_init,
+                                 mock_Message):
+        msg = mock.Mock(version=1, since_id='some-id', since=None,
+                        heartbeat=None, snapshot=None)
+        app = hub.HubApplication()
+        app.persist = False
+        app.ring = False
+        app.server = mock.MagicMock(**{'redeliver.return_value': False})
+
+        app.subscribe(msg)
+
+        app.server.subscribe.assert_called_once_with(app, 1, None, msg.session,
+                                                     msg.ring)
+        mock_send_frame.assert_called_once_with('frame')
+        self.assertFalse(mock_close.called)
+        app.server.replay.assert_called_once_with(app, 'some-id', None)
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_subscribe_replay_time(self, mock_close, mock_send_frame,
+                                   mock_init, mock_Message):
+        msg = mock.Mock(version=1, since_id=None, since=1234, heartbeat=None,
+                        snapshot=None)
+        app = hub.HubApplication()
+        app.persist = False
+        app.ring = False
+        app.server = mock.MagicMock(**{'redeliver.return_value': False})
+
+        app.subscribe(msg)
+
+        app.server.subscribe.assert_called_once_with(app, 1, None, msg.session,
+                                                     msg.ring)
+        mock_send_frame.assert_called_once_with('frame')
+        self.assertFalse(mock_close.called)
+        app.server.replay.assert_called_once_with(app, None, 1234)
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_subscribe_snapshot(self, mock_close, mock_send_frame,
+                                mock_init, mock_Message):
+        msg = mock.Mock(version=1, since_id='some-id', since=None,
+                        heartbeat=None, snapshot=True)
+        app = hub.HubApplication()
+        app.persist = False
+        app.ring = False
+        app.server = mock.MagicMock(**{'redeliver.return_value': False})
+
+        app.subscribe(msg)
+
+        mock_send_frame.assert_called_once_with('frame')
+        app.server.send_snapshot.assert_called_once_with(app)
+        self.assertFalse(app.server.replay.called)
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_subscribe_redeliver(self, mock_close, mock_send_frame,
+                                 mock_init, mock_Message):
+        msg = mock.Mock(version=1, since_id='some-id', since=None,
+                        heartbeat=None, session='sess')
+        app = hub.HubApplication()
+        app.persist = False
+        app.ring = False
+        app.server = mock.MagicMock(**{'redeliver.return_value': True})
+
+        app.subscribe(msg)
+
+        app.server.subscribe.assert_called_once_with(app, 1, None, 'sess',
+                                                     msg.ring)
+        mock_Message.assert_called_once_with(
+            'subscribed', heartbeat=app.server.subscribe.return_value,
+            session='sess', ring=None)
+        mock_send_frame.assert_called_once_with('frame')
+        app.server.redeliver.assert_called_once_with(app)
+        self.assertFalse(app.server.replay.called)
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_subscribe_ring(self, mock_close, mock_send_frame, mock_init,
+                            mock_Message):
+        msg = mock.Mock(version=1, since_id=None, since=None, heartbeat=None,
+                        session='sess', ring='/ring')
+        app = hub.HubApplication()
+        app.persist = False
+        app.server = mock.MagicMock(ring_head=42, **{
+            'redeliver.return_value': False,
+        })
+
+        def subscribe(client, version, interval, session, ring):
+            client.ring = True
+        app.server.subscribe.side_effect = subscribe
+
+        app.subscribe(msg)
+
+        app.server.subscribe.assert_called_once_with(app, 1, None, 'sess',
+                                                     '/ring')
+        mock_Message.assert_called_once_with(
+            'subscribed', heartbeat=None, session=None, ring=42)
+        mock_send_frame.assert_called_once_with('frame')
 
     @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
         'to_frame.return_value': 'frame',
@@ -703,22 +3538,48 @@ class HubApplicationTest(unittest.TestCase):
     @mock.patch.object(hub.HubApplication, 'close')
     def test_subscribe_failure(self, mock_close, mock_send_frame, mock_init,
                                mock_Message):
-        msg = mock.Mock(version=1)
+        msg = mock.Mock(version=1, since_id='some-id', since=None,
+                        heartbeat=None)
         app = hub.HubApplication()
         app.persist = False
-        app.server = mock.Mock(**{
+        app.ring = False
+        app.server = mock.MagicMock(**{
             'subscribe.side_effect': TestException('failed'),
         })
 
         app.subscribe(msg)
 
-        app.server.subscribe.assert_called_once_with(app, 1)
+        app.server.subscribe.assert_called_once_with(app, 1, None, msg.session,
+                                                     msg.ring)
         mock_Message.assert_called_once_with(
             'error', reason='Failed to subscribe: failed')
         mock_Message.return_value.to_frame.assert_called_once_with()
         mock_send_frame.assert_called_once_with('frame')
         mock_close.assert_called_once_with()
         self.assertEqual(False, app.persist)
+        self.assertFalse(app.server.replay.called)
+
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    def test_ack(self, mock_init):
+        app = hub.HubApplication()
+        app.server = mock.Mock(metrics=collections.defaultdict(mock.Mock))
+        app.receipts = mock.Mock(**{'ack.return_value': 3})
+
+        app.ack(mock.Mock(seq=5))
+
+        app.receipts.ack.assert_called_once_with(5)
+        app.server.metrics['notifications_acked'].inc.assert_called_once_with(
+            3)
+
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    def test_ack_untracked(self, mock_init):
+        app = hub.HubApplication()
+        app.server = mock.Mock(metrics=collections.defaultdict(mock.Mock))
+        app.receipts = None
+
+        app.ack(mock.Mock(seq=5))
+
+        self.assertFalse(app.server.metrics['notifications_acked'].inc.called)
 
     @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
         'to_frame.return_value': 'frame',
@@ -729,16 +3590,58 @@ class HubApplicationTest(unittest.TestCase):
     def test_disconnect_success(self, mock_close, mock_send_frame, mock_init,
                                 mock_Message):
         app = hub.HubApplication()
-        app.server = mock.Mock()
+        app.server = mock.MagicMock()
 
         app.disconnect()
 
-        app.server.unsubscribe.assert_called_once_with(app)
+        app.server.unsubscribe.assert_called_once_with(app, False)
         mock_Message.assert_called_once_with('goodbye')
         mock_Message.return_value.to_frame.assert_called_once_with()
         mock_send_frame.assert_called_once_with('frame')
         mock_close.assert_called_once_with()
 
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_disconnect_drain(self, mock_close, mock_send_frame, mock_init,
+                              mock_Message):
+        app = hub.HubApplication()
+        app.server = mock.MagicMock()
+        outbox = mock.Mock()
+        app.outbox = outbox
+
+        def unsubscribe(client, retain):
+            self.assertTrue(outbox.drain.called)
+        app.server.unsubscribe.side_effect = unsubscribe
+
+        app.disconnect(drain=True)
+
+        outbox.drain.assert_called_once_with()
+        app.server.unsubscribe.assert_called_once_with(app, False)
+        mock_send_frame.assert_called_once_with('frame')
+        self.assertFalse(mock_close.called)
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_disconnect_drain_no_outbox(self, mock_close, mock_send_frame,
+                                        mock_init, mock_Message):
+        app = hub.HubApplication()
+        app.server = mock.MagicMock()
+        app.outbox = None
+
+        app.disconnect(drain=True)
+
+        app.server.unsubscribe.assert_called_once_with(app, False)
+        mock_send_frame.assert_called_once_with('frame')
+        self.assertFalse(mock_close.called)
+
     @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
         'to_frame.return_value': 'frame',
     }))
@@ -749,20 +3652,72 @@ class HubApplicationTest(unittest.TestCase):
     def test_disconnect_failure(self, mock_close, mock_send_frame, mock_init,
                                 mock_Message):
         app = hub.HubApplication()
-        app.server = mock.Mock()
+        app.server = mock.MagicMock()
 
         app.disconnect()
 
-        app.server.unsubscribe.assert_called_once_with(app)
+        app.server.unsubscribe.assert_called_once_with(app, False)
         mock_Message.assert_called_once_with('goodbye')
         mock_Message.return_value.to_frame.assert_called_once_with()
         mock_send_frame.assert_called_once_with('frame')
         mock_close.assert_called_once_with()
 
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_stats(self, mock_close, mock_send_frame, mock_init,
+                   mock_Message):
+        app = hub.HubApplication()
+        app.server = mock.MagicMock(**{
+            'metrics.snapshot.return_value': 'snapshot',
+        })
+        app.persist = True
+
+        app.stats()
+
+        mock_Message.assert_called_once_with('statistics', data='snapshot')
+        mock_send_frame.assert_called_once_with('frame')
+        self.assertFalse(mock_close.called)
+
+    @mock.patch('heyu.protocol.Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'send_frame')
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_stats_no_persist(self, mock_close, mock_send_frame, mock_init,
+                              mock_Message):
+        app = hub.HubApplication()
+        app.server = mock.MagicMock(**{
+            'metrics.snapshot.return_value': 'snapshot',
+        })
+        app.persist = False
+
+        app.stats()
+
+        mock_Message.assert_called_once_with('statistics', data='snapshot')
+        mock_send_frame.assert_called_once_with('frame')
+        mock_close.assert_called_once_with()
+
+    @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
+    @mock.patch.object(hub.HubApplication, 'close')
+    def test_expired(self, mock_close, mock_init):
+        app = hub.HubApplication()
+        app.server = mock.Mock(metrics=collections.defaultdict(mock.Mock))
+
+        app.expired()
+
+        app.server.metrics['heartbeat_evictions'].inc.assert_called_once_with()
+        app.server.unsubscribe.assert_called_once_with(app)
+        mock_close.assert_called_once_with()
+
     @mock.patch.object(hub.HubApplication, '__init__', return_value=None)
     def test_closed(self, mock_init):
         app = hub.HubApplication()
-        app.server = mock.Mock()
+        app.server = mock.MagicMock()
 
         app.closed(None)
 
@@ -775,16 +3730,44 @@ class StartHubTest(unittest.TestCase):
     def test_basic(self, mock_HubServer, mock_wait):
         hub.start_hub(['ep1', 'ep2', 'ep3'])
 
-        mock_HubServer.assert_called_once_with(['ep1', 'ep2', 'ep3'])
+        mock_HubServer.assert_called_once_with(['ep1', 'ep2', 'ep3'], 1000,
+                                               None, 0, None, None, None,
+                                               None, None, 5.0, None, None,
+                                               None, None, 5.0, None, 5.0,
+                                               None, None, 4194304, 0, 65536,
+                                               1000)
         mock_HubServer.return_value.start.assert_called_once_with(None, True)
         mock_wait.assert_called_once_with()
 
     @mock.patch('gevent.wait')
     @mock.patch.object(hub, 'HubServer')
-    def test_alts(self, mock_HubServer, mock_wait):
-        hub.start_hub(['ep1', 'ep2', 'ep3'], 'cert_conf', False)
-
-        mock_HubServer.assert_called_once_with(['ep1', 'ep2', 'ep3'])
+    @mock.patch('heyu.journal.Journal', return_value='journal')
+    @mock.patch('heyu.ratelimit.RateLimiter', return_value='limiter')
+    @mock.patch('heyu.udp.read_key', return_value='key')
+    @mock.patch('heyu.looplag.configure_log')
+    def test_alts(self, mock_configure_log, mock_read_key, mock_RateLimiter,
+                  mock_Journal, mock_HubServer, mock_wait):
+        hub.start_hub(['ep1', 'ep2', 'ep3'], 'cert_conf', False, 10,
+                      '/journal', 0.5, 1024, 4096, 3600, 0.25, (2.0, 10),
+                      True, 5.0, '/stats', 'name', ['relay'], 'primary', 2.5,
+                      '/sock', [1000, 1001, 1000], ('', 5000), '/key', 1.5,
+                      '/endpoints', 10.0, 0.25, '/lag.log', '/ring', 65536,
+                      0.002, 16384, 500)
+
+        mock_Journal.assert_called_once_with('/journal', 0.5, 1024, 4096,
+                                             3600)
+        mock_RateLimiter.assert_called_once_with(2.0, 10, True, 5.0)
+        mock_HubServer.assert_called_once_with(['ep1', 'ep2', 'ep3'], 10,
+                                               'journal', 0.25, 'limiter',
+                                               '/stats', 'name', ['relay'],
+                                               'primary', 2.5, '/sock',
+                                               set([1000, 1001]),
+                                               ('', 5000), 'key', 1.5,
+                                               '/endpoints', 10.0, 0.25,
+                                               '/ring', 65536, 0.002, 16384,
+                                               500)
+        mock_read_key.assert_called_once_with('/key')
+        mock_configure_log.assert_called_once_with('/lag.log')
         mock_HubServer.return_value.start.assert_called_once_with(
             'cert_conf', False)
         mock_wait.assert_called_once_with()
@@ -800,6 +3783,15 @@ class NormalizeArgsTest(unittest.TestCase):
             daemon=True,
             debug=False,
             pid_file=None,
+            journal_dir=None,
+            stats_socket=None,
+            unix_socket=None,
+            udp_endpoint=None,
+            udp_key_file=None,
+            endpoints_file=None,
+            lag_log=None,
+            ring_path=None,
+            loop=None,
         )
 
         hub._normalize_args(args)
@@ -817,6 +3809,15 @@ class NormalizeArgsTest(unittest.TestCase):
             daemon=True,
             debug=False,
             pid_file=None,
+            journal_dir=None,
+            stats_socket=None,
+            unix_socket=None,
+            udp_endpoint=None,
+            udp_key_file=None,
+            endpoints_file=None,
+            lag_log=None,
+            ring_path=None,
+            loop=None,
         )
 
         hub._normalize_args(args)
@@ -835,6 +3836,15 @@ class NormalizeArgsTest(unittest.TestCase):
             daemon=True,
             debug=False,
             pid_file=None,
+            journal_dir=None,
+            stats_socket=None,
+            unix_socket=None,
+            udp_endpoint=None,
+            udp_key_file=None,
+            endpoints_file=None,
+            lag_log=None,
+            ring_path=None,
+            loop=None,
         )
 
         hub._normalize_args(args)
@@ -857,6 +3867,15 @@ class NormalizeArgsTest(unittest.TestCase):
             daemon=True,
             debug=True,
             pid_file=None,
+            journal_dir=None,
+            stats_socket=None,
+            unix_socket=None,
+            udp_endpoint=None,
+            udp_key_file=None,
+            endpoints_file=None,
+            lag_log=None,
+            ring_path=None,
+            loop=None,
         )
 
         hub._normalize_args(args)
@@ -875,6 +3894,15 @@ class NormalizeArgsTest(unittest.TestCase):
             daemon=False,
             debug=False,
             pid_file=None,
+            journal_dir=None,
+            stats_socket=None,
+            unix_socket=None,
+            udp_endpoint=None,
+            udp_key_file=None,
+            endpoints_file=None,
+            lag_log=None,
+            ring_path=None,
+            loop=None,
         )
 
         hub._normalize_args(args)
@@ -893,6 +3921,15 @@ class NormalizeArgsTest(unittest.TestCase):
             daemon=True,
             debug=False,
             pid_file='/path/to/pid',
+            journal_dir=None,
+            stats_socket=None,
+            unix_socket=None,
+            udp_endpoint=None,
+            udp_key_file=None,
+            endpoints_file=None,
+            lag_log=None,
+            ring_path=None,
+            loop=None,
         )
 
         hub._normalize_args(args)
@@ -901,3 +3938,120 @@ class NormalizeArgsTest(unittest.TestCase):
                          args.endpoints)
         self.assertFalse(mock_parse_hub.called)
         mock_daemonize.assert_called_once_with(pidfile='/path/to/pid')
+
+    @mock.patch('socket.has_ipv6', True)
+    @mock.patch.object(util, 'parse_hub', side_effect=lambda x: (x, 1234))
+    @mock.patch.object(util, 'daemonize')
+    def test_udp_endpoint(self, mock_daemonize, mock_parse_hub):
+        args = mock.Mock(
+            endpoints=[],
+            daemon=False,
+            debug=False,
+            pid_file=None,
+            journal_dir=None,
+            stats_socket=None,
+            unix_socket=None,
+            udp_endpoint='addr',
+            udp_key_file='/key',
+            endpoints_file=None,
+            lag_log=None,
+            ring_path=None,
+            loop=None,
+        )
+
+        hub._normalize_args(args)
+
+        self.assertEqual(('addr', 1234), args.udp_endpoint)
+        mock_parse_hub.assert_called_once_with('addr')
+
+    @mock.patch('socket.has_ipv6', True)
+    @mock.patch.object(util, 'parse_hub', side_effect=lambda x: (x, 1234))
+    @mock.patch.object(util, 'daemonize')
+    def test_udp_endpoint_no_key(self, mock_daemonize, mock_parse_hub):
+        args = mock.Mock(
+            endpoints=[],
+            daemon=False,
+            debug=False,
+            pid_file=None,
+            journal_dir=None,
+            stats_socket=None,
+            unix_socket=None,
+            udp_endpoint='addr',
+            udp_key_file=None,
+            endpoints_file=None,
+            lag_log=None,
+            ring_path=None,
+            loop=None,
+        )
+
+        self.assertRaises(udp.UDPException, hub._normalize_args, args)
+
+    @mock.patch('socket.has_ipv6', True)
+    @mock.patch('os.path.abspath', side_effect=lambda x: '/abs/' + x)
+    @mock.patch.object(util, 'parse_hub', side_effect=lambda x: x)
+    @mock.patch.object(util, 'daemonize')
+    def test_abspaths(self, mock_daemonize, mock_parse_hub, mock_abspath):
+        args = mock.Mock(
+            endpoints=[],
+            daemon=True,
+            debug=False,
+            pid_file=None,
+            journal_dir='journal',
+            stats_socket='stats',
+            unix_socket='sock',
+            udp_endpoint=None,
+            udp_key_file='key',
+            endpoints_file='endpoints',
+            lag_log='lag.log',
+            ring_path='ring',
+            loop=None,
+        )
+
+        hub._normalize_args(args)
+
+        self.assertEqual('/abs/journal', args.journal_dir)
+        self.assertEqual('/abs/stats', args.stats_socket)
+        self.assertEqual('/abs/sock', args.unix_socket)
+        self.assertEqual('/abs/key', args.udp_key_file)
+        self.assertEqual('/abs/endpoints', args.endpoints_file)
+        self.assertEqual('/abs/lag.log', args.lag_log)
+        self.assertEqual('/abs/ring', args.ring_path)
+        self.assertEqual([], args.endpoints)
+        mock_abspath.assert_has_calls([
+            mock.call('journal'),
+            mock.call('stats'),
+            mock.call('sock'),
+            mock.call('key'),
+            mock.call('endpoints'),
+            mock.call('lag.log'),
+            mock.call('ring'),
+        ])
+        mock_daemonize.assert_called_once_with(pidfile=None)
+
+    @mock.patch.object(util, 'parse_hub', side_effect=lambda x: x)
+    @mock.patch.object(util, 'daemonize')
+    @mock.patch('heyu.loops.select')
+    def test_loop(self, mock_select, mock_daemonize, mock_parse_hub):
+        args = mock.Mock(
+            endpoints=['hub'],
+            daemon=True,
+            debug=False,
+            pid_file=None,
+            journal_dir=None,
+            stats_socket=None,
+            unix_socket=None,
+            udp_endpoint=None,
+            udp_key_file=None,
+            endpoints_file=None,
+            lag_log=None,
+            ring_path=None,
+            loop='libev:epoll',
+        )
+
+        def daemonize(pidfile):
+            mock_select.assert_called_once_with('libev:epoll')
+        mock_daemonize.side_effect = daemonize
+
+        hub._normalize_args(args)
+
+        mock_daemonize.assert_called_once_with(pidfile=None)
@@ -0,0 +1,234 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import gevent
+import mock
+
+from heyu import journal
+
+
+class ParseSyncTest(unittest.TestCase):
+    def test_always(self):
+        self.assertEqual(journal.SYNC_ALWAYS, journal.parse_sync('Always'))
+
+    def test_none(self):
+        self.assertEqual(journal.SYNC_NONE, journal.parse_sync(' none '))
+
+    def test_interval(self):
+        self.assertEqual(0.25, journal.parse_sync('250'))
+
+    def test_nonpositive(self):
+        self.assertRaises(journal.JournalException, journal.parse_sync, '0')
+
+    def test_bad(self):
+        self.assertRaises(journal.JournalException, journal.parse_sync,
+                          'sometimes')
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _segments(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_init(self):
+        result = journal.Journal('/journal')
+
+        self.assertEqual('/journal', result._directory)
+        self.assertEqual(journal.SYNC_ALWAYS, result._sync)
+        self.assertEqual(16777216, result._segment_size)
+        self.assertEqual(None, result._max_bytes)
+        self.assertEqual(None, result._max_age)
+        self.assertEqual(None, result._fd)
+        self.assertEqual(None, result._syncer)
+
+    def test_recover_empty(self):
+        directory = os.path.join(self.directory, 'sub')
+        jrnl = journal.Journal(directory)
+
+        self.assertEqual([], jrnl.recover())
+        self.assertTrue(os.path.isdir(directory))
+
+    def test_append_recover(self):
+        jrnl = journal.Journal(self.directory)
+        jrnl.recover()
+        jrnl.open()
+        jrnl.append(b'frame1', 1.0)
+        jrnl.append(b'frame2', 2.0)
+        jrnl.close()
+
+        jrnl = journal.Journal(self.directory)
+        self.assertEqual([(1.0, b'frame1'), (2.0, b'frame2')],
+                         jrnl.recover())
+        jrnl.open()
+        jrnl.append(b'frame3', 3.0)
+        jrnl.close()
+
+        self.assertEqual(['0000000000000001.seg', '0000000000000002.seg'],
+                         self._segments())
+        jrnl = journal.Journal(self.directory)
+        self.assertEqual([(1.0, b'frame1'), (2.0, b'frame2'),
+                          (3.0, b'frame3')], jrnl.recover())
+
+    def test_recover_torn(self):
+        jrnl = journal.Journal(self.directory)
+        jrnl.open()
+        jrnl.append(b'frame1', 1.0)
+        jrnl.append(b'frame2', 2.0)
+        jrnl.close()
+
+        # Chop off the end of the last record
+        path = os.path.join(self.directory, '0000000000000001.seg')
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:-2])
+
+        jrnl = journal.Journal(self.directory)
+        self.assertEqual([(1.0, b'frame1')], jrnl.recover())
+
+    def test_recover_corrupt(self):
+        jrnl = journal.Journal(self.directory)
+        jrnl.open()
+        jrnl.append(b'frame1', 1.0)
+        jrnl.append(b'frame2', 2.0)
+        jrnl.close()
+
+        # Damage the last record
+        path = os.path.join(self.directory, '0000000000000001.seg')
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:-1] + b'X')
+
+        jrnl = journal.Journal(self.directory)
+        self.assertEqual([(1.0, b'frame1')], jrnl.recover())
+
+    def test_append_closed(self):
+        jrnl = journal.Journal(self.directory)
+
+        self.assertRaises(journal.JournalException, jrnl.append, b'frame')
+
+    @mock.patch('os.fsync')
+    def test_append_sync_always(self, mock_fsync):
+        jrnl = journal.Journal(self.directory)
+        jrnl.open()
+
+        jrnl.append(b'frame', 1.0)
+
+        mock_fsync.assert_called_once_with(jrnl._fd)
+        self.assertFalse(jrnl._dirty)
+        self.assertEqual(None, jrnl._syncer)
+        jrnl.close()
+
+    @mock.patch('os.fsync')
+    def test_append_sync_always_batched(self, mock_fsync):
+        jrnl = journal.Journal(self.directory)
+        jrnl.open()
+
+        appenders = [gevent.spawn(jrnl.append, ('frame%d' % i).encode('ascii'),
+                                  float(i))
+                     for i in range(5)]
+        gevent.joinall(appenders, raise_error=True)
+
+        # The records are all written before the syncer gets to run,
+        # so a single sync covers them all
+        mock_fsync.assert_called_once_with(jrnl._fd)
+        self.assertEqual(None, jrnl._syncer)
+        jrnl.close()
+
+        jrnl = journal.Journal(self.directory)
+        self.assertEqual([(float(i), ('frame%d' % i).encode('ascii'))
+                          for i in range(5)], jrnl.recover())
+
+    @mock.patch('gevent.get_hub')
+    def test_fsync(self, mock_get_hub):
+        jrnl = journal.Journal(self.directory)
+
+        jrnl._fsync(5)
+
+        mock_get_hub.return_value.threadpool.apply.assert_called_once_with(
+            os.fsync, (5,))
+
+    @mock.patch('os.fsync')
+    def test_append_sync_none(self, mock_fsync):
+        jrnl = journal.Journal(self.directory, journal.SYNC_NONE)
+        jrnl.open()
+
+        jrnl.append(b'frame', 1.0)
+        jrnl.close()
+
+        self.assertFalse(mock_fsync.called)
+
+    def test_append_sync_interval(self):
+        jrnl = journal.Journal(self.directory, 0.01)
+        jrnl.open()
+
+        synced = jrnl._synced
+        jrnl.append(b'frame', 1.0)
+
+        self.assertTrue(synced.is_set())
+        self.assertFalse(jrnl._dirty)
+        self.assertNotEqual(synced, jrnl._synced)
+        jrnl.close()
+        self.assertEqual(None, jrnl._syncer)
+
+    def test_roll(self):
+        jrnl = journal.Journal(self.directory, segment_size=20)
+        jrnl.open()
+
+        jrnl.append(b'frame1', 1.0)
+        jrnl.append(b'frame2', 2.0)
+        jrnl.close()
+
+        self.assertEqual(['0000000000000001.seg', '0000000000000002.seg',
+                          '0000000000000003.seg'], self._segments())
+
+    def test_retain_bytes(self):
+        jrnl = journal.Journal(self.directory, segment_size=20, max_bytes=30)
+        jrnl.open()
+
+        for i in range(4):
+            jrnl.append(('frame%d' % i).encode('ascii'), float(i))
+        jrnl.close()
+
+        self.assertEqual(['0000000000000004.seg', '0000000000000005.seg'],
+                         self._segments())
+        jrnl = journal.Journal(self.directory)
+        self.assertEqual([(3.0, b'frame3')], jrnl.recover())
+
+    def test_retain_age(self):
+        jrnl = journal.Journal(self.directory, segment_size=20, max_age=60)
+        jrnl.open()
+        jrnl.append(b'frame1', 1.0)
+
+        # Age the first segment
+        path = os.path.join(self.directory, '0000000000000001.seg')
+        os.utime(path, (0, 0))
+
+        jrnl.append(b'frame2', 2.0)
+        jrnl.close()
+
+        self.assertEqual(['0000000000000002.seg', '0000000000000003.seg'],
+                         self._segments())
@@ -0,0 +1,180 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import logging
+import unittest
+
+import mock
+
+from heyu import looplag
+from heyu import metrics
+
+
+class TestException(BaseException):
+    pass
+
+
+class ConfigureLogTest(unittest.TestCase):
+    @mock.patch.object(looplag, 'LOG')
+    @mock.patch('logging.FileHandler')
+    @mock.patch('logging.StreamHandler')
+    def test_stderr(self, mock_StreamHandler, mock_FileHandler, mock_LOG):
+        looplag.configure_log()
+
+        self.assertFalse(mock_FileHandler.called)
+        mock_StreamHandler.assert_called_once_with()
+        mock_LOG.addHandler.assert_called_once_with(
+            mock_StreamHandler.return_value)
+        mock_LOG.setLevel.assert_called_once_with(logging.INFO)
+
+    @mock.patch.object(looplag, 'LOG')
+    @mock.patch('logging.FileHandler')
+    @mock.patch('logging.StreamHandler')
+    def test_file(self, mock_StreamHandler, mock_FileHandler, mock_LOG):
+        looplag.configure_log('/lag.log')
+
+        mock_FileHandler.assert_called_once_with('/lag.log')
+        self.assertFalse(mock_StreamHandler.called)
+        mock_LOG.addHandler.assert_called_once_with(
+            mock_FileHandler.return_value)
+
+
+class LoopMonitorTest(unittest.TestCase):
+    def test_init(self):
+        result = looplag.LoopMonitor(0.5)
+
+        self.assertEqual(0.5, result.threshold)
+        self.assertEqual(0.25, result.interval)
+        self.assertTrue('loop_lag_seconds' in result.metrics)
+        self.assertTrue('slow_callbacks' in result.metrics)
+        self.assertEqual(0, len(result.reports))
+        self.assertEqual(None, result._sampler)
+
+    def test_init_alt(self):
+        registry = metrics.Registry()
+
+        result = looplag.LoopMonitor(0.5, registry, 0.1)
+
+        self.assertEqual(0.1, result.interval)
+        self.assertEqual(registry, result.metrics)
+        self.assertTrue('loop_lag_seconds' in registry)
+
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch('gevent.spawn', return_value='sampler')
+    @mock.patch('threading.Thread')
+    def test_start(self, mock_Thread, mock_spawn, mock_time):
+        monitor = looplag.LoopMonitor(0.5)
+
+        monitor.start()
+
+        self.assertEqual(1000.0, monitor._tick)
+        self.assertEqual('sampler', monitor._sampler)
+        mock_spawn.assert_called_once_with(monitor._sample)
+        mock_Thread.assert_called_once_with(target=monitor._watch,
+                                            name='heyu-looplag')
+        self.assertEqual(True, mock_Thread.return_value.daemon)
+        mock_Thread.return_value.start.assert_called_once_with()
+
+        monitor.start()
+
+        self.assertEqual(1, mock_spawn.call_count)
+
+    def test_stop(self):
+        monitor = looplag.LoopMonitor(0.5)
+        sampler = mock.Mock()
+        monitor._sampler = sampler
+        monitor._watcher = 'watcher'
+
+        monitor.stop()
+
+        self.assertTrue(monitor._stopped.is_set())
+        sampler.kill.assert_called_once_with()
+        self.assertEqual(None, monitor._sampler)
+        self.assertEqual(None, monitor._watcher)
+
+    def test_stop_stopped(self):
+        monitor = looplag.LoopMonitor(0.5)
+
+        monitor.stop()
+
+        self.assertFalse(monitor._stopped.is_set())
+
+    @mock.patch('time.time', side_effect=[1000.0, 1000.7, 1000.7, 1000.9])
+    @mock.patch('gevent.sleep', side_effect=[None, TestException()])
+    def test_sample(self, mock_sleep, mock_time):
+        monitor = looplag.LoopMonitor(0.5)
+
+        self.assertRaises(TestException, monitor._sample)
+
+        mock_sleep.assert_has_calls([mock.call(0.25), mock.call(0.25)])
+        self.assertEqual(1000.7, monitor._tick)
+        lag = monitor.metrics['loop_lag_seconds'].collect()
+        self.assertEqual(1, lag['count'])
+        self.assertAlmostEqual(0.45, lag['sum'])
+
+    @mock.patch.object(looplag.LoopMonitor, 'check')
+    def test_watch(self, mock_check):
+        monitor = looplag.LoopMonitor(0.5)
+        monitor._stopped = mock.Mock(**{
+            'wait.side_effect': [False, False, True],
+        })
+
+        monitor._watch()
+
+        monitor._stopped.wait.assert_has_calls([mock.call(0.25)] * 3)
+        self.assertEqual(2, mock_check.call_count)
+
+    @mock.patch.object(looplag, 'LOG')
+    def test_check_ok(self, mock_LOG):
+        monitor = looplag.LoopMonitor(0.5)
+        monitor._tick = 1000.0
+
+        self.assertEqual(False, monitor.check(1000.7))
+
+        self.assertEqual(0, monitor.metrics['slow_callbacks'].value)
+        self.assertFalse(mock_LOG.warning.called)
+
+    @mock.patch('sys._current_frames', return_value={})
+    @mock.patch('traceback.format_stack', return_value=['line1\n', 'line2\n'])
+    @mock.patch.object(looplag, 'LOG')
+    def test_check_blocked(self, mock_LOG, mock_format_stack,
+                           mock_current_frames):
+        monitor = looplag.LoopMonitor(0.5)
+        monitor._tick = 1000.0
+        monitor._ident = 1234
+        mock_current_frames.return_value = {1234: 'frame'}
+
+        self.assertEqual(True, monitor.check(1001.0))
+
+        mock_format_stack.assert_called_once_with('frame')
+        self.assertEqual(1, monitor.metrics['slow_callbacks'].value)
+        self.assertEqual([(0.75, 'line1\nline2\n')], list(monitor.reports))
+        mock_LOG.warning.assert_called_once_with(
+            'Event loop blocked for %.3f seconds:\n%s', 0.75,
+            'line1\nline2\n')
+
+        # Only reported once
+        self.assertEqual(False, monitor.check(1002.0))
+        self.assertEqual(1, monitor.metrics['slow_callbacks'].value)
+
+    @mock.patch('sys._current_frames', return_value={})
+    @mock.patch.object(looplag, 'LOG')
+    def test_check_no_frame(self, mock_LOG, mock_current_frames):
+        monitor = looplag.LoopMonitor(0.5)
+        monitor._tick = 1000.0
+
+        self.assertEqual(True, monitor.check(1001.0))
+
+        self.assertEqual([(0.75, '')], list(monitor.reports))
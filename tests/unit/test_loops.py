@@ -0,0 +1,114 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import gevent
+import gevent.hub
+import mock
+
+from heyu import loops
+
+
+class ParseTest(unittest.TestCase):
+    def test_loop(self):
+        self.assertEqual(('libuv', None), loops.parse('libuv'))
+
+    def test_loop_backend(self):
+        self.assertEqual(('libev', 'epoll'), loops.parse(' libev:epoll '))
+
+    def test_backend(self):
+        self.assertEqual((None, 'poll'), loops.parse(':poll'))
+
+    def test_unknown(self):
+        self.assertRaises(loops.LoopException, loops.parse, 'uvloop')
+
+    def test_libuv_backend(self):
+        self.assertRaises(loops.LoopException, loops.parse, 'libuv:epoll')
+
+
+class HubExistsTest(unittest.TestCase):
+    @mock.patch.object(gevent.hub, '_get_hub', create=True,
+                       return_value='hub')
+    def test_exists(self, mock_get_hub):
+        self.assertEqual(True, loops._hub_exists())
+
+    @mock.patch.object(gevent.hub, '_get_hub', create=True,
+                       return_value=None)
+    def test_not_exists(self, mock_get_hub):
+        self.assertEqual(False, loops._hub_exists())
+
+
+class SelectTest(unittest.TestCase):
+    @mock.patch.dict('os.environ', clear=True)
+    @mock.patch.object(loops, '_hub_exists', return_value=True)
+    def test_default(self, mock_hub_exists):
+        self.assertEqual(None, loops.select())
+        self.assertFalse(mock_hub_exists.called)
+
+    @mock.patch.dict('os.environ', {'HEYU_LOOP': 'libuv'})
+    @mock.patch.object(loops, '_hub_exists', return_value=True)
+    def test_environment(self, mock_hub_exists):
+        self.assertRaises(loops.LoopException, loops.select)
+        mock_hub_exists.assert_called_once_with()
+
+    @mock.patch.object(loops, '_hub_exists', return_value=True)
+    def test_hub_exists(self, mock_hub_exists):
+        self.assertRaises(loops.LoopException, loops.select, 'libev')
+
+    @mock.patch.object(loops, '_hub_exists', return_value=False)
+    @mock.patch.object(gevent, 'config', create=True)
+    def test_config(self, mock_config, mock_hub_exists):
+        result = loops.select('libev-cffi:poll')
+
+        self.assertEqual(('libev-cffi', 'poll'), result)
+        self.assertEqual('libev-cffi', mock_config.loop)
+        self.assertEqual('poll', mock_config.libev_backend)
+
+    @mock.patch.object(loops, '_hub_exists', return_value=False)
+    @mock.patch.object(gevent, 'config', create=True)
+    def test_config_unavailable(self, mock_config, mock_hub_exists):
+        type(mock_config).loop = mock.PropertyMock(
+            side_effect=ImportError('no cffi'))
+
+        self.assertRaises(loops.LoopException, loops.select, 'libuv')
+
+    @mock.patch.object(loops, '_hub_exists', return_value=False)
+    @mock.patch.object(gevent.hub.Hub, 'backend', None)
+    @mock.patch('gevent.core.supported_backends', create=True,
+                return_value=['epoll', 'poll'])
+    def test_no_config(self, mock_supported_backends, mock_hub_exists):
+        with mock.patch.object(gevent, 'config', None, create=True):
+            result = loops.select('libev:poll')
+
+        self.assertEqual(('libev', 'poll'), result)
+        self.assertEqual('poll', gevent.hub.Hub.backend)
+
+    @mock.patch.object(loops, '_hub_exists', return_value=False)
+    def test_no_config_loop(self, mock_hub_exists):
+        with mock.patch.object(gevent, 'config', None, create=True):
+            self.assertRaises(loops.LoopException, loops.select, 'libuv')
+
+    @mock.patch.object(loops, '_hub_exists', return_value=False)
+    @mock.patch.object(gevent.hub.Hub, 'backend', None)
+    @mock.patch('gevent.core.supported_backends', create=True,
+                return_value=['epoll', 'poll'])
+    def test_no_config_backend(self, mock_supported_backends,
+                               mock_hub_exists):
+        with mock.patch.object(gevent, 'config', None, create=True):
+            self.assertRaises(loops.LoopException, loops.select,
+                              ':kqueue')
+
+        self.assertEqual(None, gevent.hub.Hub.backend)
@@ -0,0 +1,169 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import mock
+
+from heyu import metrics
+
+
+class CounterTest(unittest.TestCase):
+    def test_inc(self):
+        counter = metrics.Counter()
+
+        counter.inc()
+        counter.inc(5)
+
+        self.assertEqual(6, counter.collect())
+
+
+class GaugeTest(unittest.TestCase):
+    def test_collect(self):
+        func = mock.Mock(return_value=42)
+        gauge = metrics.Gauge(func)
+
+        self.assertFalse(func.called)
+        self.assertEqual(42, gauge.collect())
+        func.assert_called_once_with()
+
+
+class HistogramTest(unittest.TestCase):
+    def test_init(self):
+        hist = metrics.Histogram([1, 2])
+
+        self.assertEqual((1, 2), hist.bounds)
+        self.assertEqual([0, 0, 0], hist.counts)
+        self.assertEqual(0, hist.count)
+        self.assertEqual(0.0, hist.sum)
+
+    def test_observe(self):
+        hist = metrics.Histogram([1, 2])
+
+        for value in (0.5, 1, 1.5, 3, 4):
+            hist.observe(value)
+
+        self.assertEqual([2, 1, 2], hist.counts)
+        self.assertEqual({
+            'count': 5,
+            'sum': 10.0,
+            'buckets': [[1, 2], [2, 3], [None, 5]],
+        }, hist.collect())
+
+
+class RegistryTest(unittest.TestCase):
+    def test_register(self):
+        registry = metrics.Registry()
+
+        counter = registry.counter('c')
+        gauge = registry.gauge('g', lambda: 3)
+        hist = registry.histogram('h', [1])
+
+        self.assertTrue(isinstance(counter, metrics.Counter))
+        self.assertTrue(isinstance(gauge, metrics.Gauge))
+        self.assertTrue(isinstance(hist, metrics.Histogram))
+        self.assertEqual(counter, registry['c'])
+        self.assertEqual(gauge, registry['g'])
+        self.assertEqual(hist, registry['h'])
+        self.assertTrue('c' in registry)
+        self.assertFalse('x' in registry)
+
+    def test_register_duplicate(self):
+        registry = metrics.Registry()
+        registry.counter('c')
+
+        self.assertRaises(ValueError, registry.gauge, 'c', lambda: 3)
+
+    def test_snapshot(self):
+        registry = metrics.Registry()
+        registry.counter('c').inc(2)
+        registry.gauge('g', lambda: 3)
+        registry.histogram('h', [1]).observe(0.5)
+
+        self.assertEqual({
+            'c': 2,
+            'g': 3,
+            'h': {'count': 1, 'sum': 0.5, 'buckets': [[1, 1], [None, 1]]},
+        }, registry.snapshot())
+
+    def test_render(self):
+        registry = metrics.Registry()
+        registry.counter('c').inc(2)
+        registry.histogram('h', [1]).observe(0.5)
+
+        self.assertEqual('c 2\n'
+                         'h_count 1\n'
+                         'h_sum 0.5\n'
+                         'h_bucket{le="1"} 1\n'
+                         'h_bucket{le="+Inf"} 1\n', registry.render())
+
+
+class StatsServerTest(unittest.TestCase):
+    def test_init(self):
+        result = metrics.StatsServer('registry', '/stats')
+
+        self.assertEqual('registry', result._registry)
+        self.assertEqual('/stats', result._path)
+        self.assertEqual(None, result._server)
+
+    def test_handle(self):
+        registry = mock.Mock(**{'render.return_value': u'c 2\n'})
+        sock = mock.Mock()
+        server = metrics.StatsServer(registry, '/stats')
+
+        server._handle(sock, 'addr')
+
+        sock.sendall.assert_called_once_with(b'c 2\n')
+        sock.close.assert_called_once_with()
+
+    @mock.patch('os.path.exists', return_value=True)
+    @mock.patch('os.unlink')
+    @mock.patch('os.chmod')
+    @mock.patch('gevent.socket.socket')
+    @mock.patch('gevent.server.StreamServer')
+    def test_start(self, mock_StreamServer, mock_socket, mock_chmod,
+                   mock_unlink, mock_exists):
+        server = metrics.StatsServer('registry', '/stats')
+
+        server.start()
+
+        mock_unlink.assert_called_once_with('/stats')
+        listener = mock_socket.return_value
+        listener.bind.assert_called_once_with('/stats')
+        mock_chmod.assert_called_once_with('/stats', 0o600)
+        listener.listen.assert_called_once_with(16)
+        mock_StreamServer.assert_called_once_with(listener, server._handle)
+        mock_StreamServer.return_value.start.assert_called_once_with()
+        self.assertEqual(mock_StreamServer.return_value, server._server)
+
+    @mock.patch('os.unlink')
+    def test_stop_notstarted(self, mock_unlink):
+        server = metrics.StatsServer('registry', '/stats')
+
+        server.stop()
+
+        self.assertFalse(mock_unlink.called)
+
+    @mock.patch('os.unlink', side_effect=OSError())
+    def test_stop(self, mock_unlink):
+        stream = mock.Mock()
+        server = metrics.StatsServer('registry', '/stats')
+        server._server = stream
+
+        server.stop()
+
+        stream.stop.assert_called_once_with()
+        self.assertEqual(None, server._server)
+        mock_unlink.assert_called_once_with('/stats')
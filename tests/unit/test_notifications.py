@@ -22,6 +22,7 @@ import mock
 
 from heyu import notifications
 from heyu import protocol
+from heyu import shmring
 from heyu import util
 
 
@@ -59,12 +60,62 @@ class NotificationServerTest(unittest.TestCase):
         self.assertEqual(None, result._hub_app)
         self.assertEqual([], result._notifications)
         self.assertEqual('event', result._notify_event)
+        self.assertEqual(None, result._last_id)
+        self.assertEqual(30.0, result._heartbeat)
+        self.assertEqual(False, result._snapshot)
+        self.assertEqual(None, result._monitor)
+        self.assertEqual(None, result._ring_path)
+        self.assertEqual(None, result._ring)
         mock_outgoing_endpoint.assert_called_once_with('hub')
         mock_get_manager.assert_called_once_with('tcp', 'endpoint')
         mock_cert_wrapper.assert_called_once_with(
             None, 'notifier', secure=True)
         self._signal_test(result, mock_signal)
 
+    @mock.patch('tendril.get_manager', return_value='manager')
+    @mock.patch('gevent.signal')
+    @mock.patch.object(util, 'cert_wrapper', return_value='wrapper')
+    @mock.patch.object(util, 'outgoing_endpoint', return_value='endpoint')
+    @mock.patch('heyu.looplag.configure_log')
+    @mock.patch('heyu.looplag.LoopMonitor', return_value='monitor')
+    def test_init_lag_threshold(self, mock_LoopMonitor, mock_configure_log,
+                                mock_outgoing_endpoint, mock_cert_wrapper,
+                                mock_signal, mock_get_manager):
+        result = notifications.NotificationServer('hub', lag_threshold=0.25)
+
+        self.assertEqual('monitor', result._monitor)
+        mock_configure_log.assert_called_once_with()
+        mock_LoopMonitor.assert_called_once_with(0.25)
+
+    @mock.patch('tendril.get_manager', return_value='manager')
+    @mock.patch('gevent.signal')
+    @mock.patch.object(util, 'cert_wrapper', return_value='wrapper')
+    @mock.patch.object(util, 'outgoing_endpoint', return_value='endpoint')
+    @mock.patch('heyu.shmring.RingReader', return_value='reader')
+    def test_init_ring(self, mock_RingReader, mock_outgoing_endpoint,
+                       mock_cert_wrapper, mock_signal, mock_get_manager):
+        result = notifications.NotificationServer('hub', ring='/ring')
+
+        self.assertEqual('/ring', result._ring_path)
+        self.assertEqual(None, result._ring)
+        self.assertFalse(mock_RingReader.called)
+
+    @mock.patch('tendril.get_manager', return_value='manager')
+    @mock.patch('gevent.signal')
+    @mock.patch.object(util, 'cert_wrapper', return_value='wrapper')
+    @mock.patch.object(util, 'outgoing_endpoint', return_value='endpoint')
+    @mock.patch('heyu.loops.select')
+    def test_init_loop(self, mock_select, mock_outgoing_endpoint,
+                       mock_cert_wrapper, mock_signal, mock_get_manager):
+        def get_manager(proto, endpoint):
+            mock_select.assert_called_once_with('libuv')
+            return 'manager'
+        mock_get_manager.side_effect = get_manager
+
+        notifications.NotificationServer('hub', loop='libuv')
+
+        mock_get_manager.assert_called_once_with('tcp', 'endpoint')
+
     @mock.patch.object(sys, 'argv', ['/bin/notifier.py'])
     @mock.patch('tendril.get_manager', return_value='manager')
     @mock.patch('gevent.signal')
@@ -75,7 +126,8 @@ class NotificationServerTest(unittest.TestCase):
     def test_init_alt(self, mock_outgoing_endpoint, mock_cert_wrapper,
                       mock_Event, mock_uuid4, mock_signal, mock_get_manager):
         result = notifications.NotificationServer('hub', 'cert_conf', False,
-                                                  'app', 'app-uuid')
+                                                  'app', 'app-uuid', 10.0,
+                                                  snapshot=True)
 
         self.assertEqual('hub', result._hub)
         self.assertEqual('manager', result._manager)
@@ -85,6 +137,9 @@ class NotificationServerTest(unittest.TestCase):
         self.assertEqual(None, result._hub_app)
         self.assertEqual([], result._notifications)
         self.assertEqual('event', result._notify_event)
+        self.assertEqual(None, result._last_id)
+        self.assertEqual(10.0, result._heartbeat)
+        self.assertEqual(True, result._snapshot)
         mock_outgoing_endpoint.assert_called_once_with('hub')
         mock_get_manager.assert_called_once_with('tcp', 'endpoint')
         mock_cert_wrapper.assert_called_once_with(
@@ -214,6 +269,7 @@ class NotificationServerTest(unittest.TestCase):
         server = notifications.NotificationServer()
         server._hub_app = None
         server._manager = mock.Mock()
+        server._monitor = None
         server._hub = 'hub'
         server._wrapper = 'wrapper'
 
@@ -226,6 +282,48 @@ class NotificationServerTest(unittest.TestCase):
         ])
         self.assertEqual(2, len(server._manager.method_calls))
 
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_start_monitor(self, mock_init):
+        server = notifications.NotificationServer()
+        server._hub_app = None
+        server._manager = mock.Mock()
+        server._monitor = mock.Mock()
+        server._hub = 'hub'
+        server._wrapper = 'wrapper'
+
+        server.start()
+
+        server._monitor.start.assert_called_once_with()
+
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_stop_monitor(self, mock_init):
+        server = notifications.NotificationServer()
+        server._hub_app = mock.Mock()
+        server._manager = mock.Mock()
+        server._monitor = mock.Mock()
+        server._notifications = []
+        server._notify_event = mock.Mock()
+
+        server.stop()
+
+        server._monitor.stop.assert_called_once_with()
+
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_shutdown_monitor(self, mock_init):
+        server = notifications.NotificationServer()
+        server._hub_app = 'running'
+        server._manager = mock.Mock()
+        server._monitor = mock.Mock()
+        server._notifications = []
+        server._notify_event = mock.Mock()
+
+        server.shutdown()
+
+        server._monitor.stop.assert_called_once_with()
+
     @mock.patch.object(notifications.NotificationServer, '__init__',
                        return_value=None)
     def test_stop_stopped(self, mock_init):
@@ -249,6 +347,7 @@ class NotificationServerTest(unittest.TestCase):
         server = notifications.NotificationServer()
         server._hub_app = app
         server._manager = mock.Mock()
+        server._monitor = None
         server._notifications = []
         server._notify_event = mock.Mock()
 
@@ -269,6 +368,7 @@ class NotificationServerTest(unittest.TestCase):
         server = notifications.NotificationServer()
         server._hub_app = True
         server._manager = mock.Mock()
+        server._monitor = None
         server._notifications = []
         server._notify_event = mock.Mock()
 
@@ -288,6 +388,7 @@ class NotificationServerTest(unittest.TestCase):
         server = notifications.NotificationServer()
         server._hub_app = app
         server._manager = mock.Mock()
+        server._monitor = None
         server._notifications = []
         server._notify_event = mock.Mock()
 
@@ -324,6 +425,7 @@ class NotificationServerTest(unittest.TestCase):
         server = notifications.NotificationServer()
         server._hub_app = 'running'
         server._manager = mock.Mock()
+        server._monitor = None
         server._notifications = []
         server._notify_event = mock.Mock()
 
@@ -339,16 +441,54 @@ class NotificationServerTest(unittest.TestCase):
     @mock.patch.object(notifications.NotificationServer, '__init__',
                        return_value=None)
     def test_notify(self, mock_init):
+        msg = mock.Mock(id='notification-id', expires=None)
+        server = notifications.NotificationServer()
+        server._app_id = 'app_id'
+        server._last_id = None
+        server._notifications = []
+        server._notify_event = mock.Mock()
+
+        server.notify(msg)
+
+        self.assertEqual([msg], server._notifications)
+        self.assertEqual('notification-id', server._last_id)
+        server._notify_event.set.assert_called_once_with()
+        self.assertEqual(1, len(server._notify_event.method_calls))
+
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_notify_internal(self, mock_init):
+        msg = mock.Mock(id='app_id', expires=None)
         server = notifications.NotificationServer()
+        server._app_id = 'app_id'
+        server._last_id = 'notification-id'
         server._notifications = []
         server._notify_event = mock.Mock()
 
-        server.notify('notification')
+        server.notify(msg)
 
-        self.assertEqual(['notification'], server._notifications)
+        self.assertEqual([msg], server._notifications)
+        self.assertEqual('notification-id', server._last_id)
         server._notify_event.set.assert_called_once_with()
         self.assertEqual(1, len(server._notify_event.method_calls))
 
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_notify_expired(self, mock_init, mock_time):
+        msg = mock.Mock(id='notification-id', expires=1000.0)
+        server = notifications.NotificationServer()
+        server._app_id = 'app_id'
+        server._last_id = None
+        server._notifications = []
+        server._notify_event = mock.Mock()
+
+        server.notify(msg)
+
+        self.assertEqual([], server._notifications)
+        self.assertEqual('notification-id', server._last_id)
+        self.assertFalse(server._notify_event.set.called)
+
     @mock.patch.object(notifications.NotificationServer, '__init__',
                        return_value=None)
     def test_app_name(self, mock_init):
@@ -365,6 +505,92 @@ class NotificationServerTest(unittest.TestCase):
 
         self.assertEqual('app_id', server.app_id)
 
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_last_id(self, mock_init):
+        server = notifications.NotificationServer()
+        server._last_id = 'last_id'
+
+        self.assertEqual('last_id', server.last_id)
+
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_heartbeat(self, mock_init):
+        server = notifications.NotificationServer()
+        server._heartbeat = 30.0
+
+        self.assertEqual(30.0, server.heartbeat)
+
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_snapshot(self, mock_init):
+        server = notifications.NotificationServer()
+        server._snapshot = True
+
+        self.assertEqual(True, server.snapshot)
+
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_ring(self, mock_init):
+        server = notifications.NotificationServer()
+        server._ring = 'reader'
+
+        self.assertEqual('reader', server.ring)
+
+    @mock.patch('heyu.shmring.RingReader', return_value='reader')
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_open_ring(self, mock_init, mock_RingReader):
+        old = mock.Mock()
+        server = notifications.NotificationServer()
+        server._ring_path = '/ring'
+        server._ring = old
+
+        result = server.open_ring()
+
+        self.assertEqual('reader', result)
+        self.assertEqual('reader', server._ring)
+        old.close.assert_called_once_with()
+        mock_RingReader.assert_called_once_with('/ring')
+
+    @mock.patch('heyu.shmring.RingReader',
+                side_effect=shmring.RingException('missing'))
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_open_ring_fails(self, mock_init, mock_RingReader):
+        server = notifications.NotificationServer()
+        server._ring_path = '/ring'
+        server._ring = None
+
+        result = server.open_ring()
+
+        self.assertEqual(None, result)
+        self.assertEqual(None, server._ring)
+
+    @mock.patch('heyu.shmring.RingReader')
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_open_ring_unused(self, mock_init, mock_RingReader):
+        server = notifications.NotificationServer()
+        server._ring_path = None
+        server._ring = None
+
+        self.assertEqual(None, server.open_ring())
+        self.assertFalse(mock_RingReader.called)
+
+    @mock.patch.object(notifications.NotificationServer, '__init__',
+                       return_value=None)
+    def test_close_ring(self, mock_init):
+        ring = mock.Mock()
+        server = notifications.NotificationServer()
+        server._ring = ring
+
+        server.close_ring()
+        server.close_ring()
+
+        ring.close.assert_called_once_with()
+        self.assertEqual(None, server._ring)
+
 
 class NotificationApplicationTest(unittest.TestCase):
     @mock.patch('tendril.Application.__init__', return_value=None)
@@ -376,19 +602,101 @@ class NotificationApplicationTest(unittest.TestCase):
     def test_init(self, mock_send_frame, mock_Message,
                   mock_COBSFramer, mock_init):
         parent = mock.Mock()
-        result = notifications.NotificationApplication(parent, 'server',
+        server = mock.Mock(last_id=None, heartbeat=None, snapshot=False,
+                           **{'open_ring.return_value': None})
+        result = notifications.NotificationApplication(parent, server,
                                                        'app_name', 'app_id')
 
-        self.assertEqual('server', result.server)
+        self.assertEqual(server, result.server)
         self.assertEqual('app_name', result.app_name)
         self.assertEqual('app_id', result.app_id)
+        self.assertEqual(False, result.acks)
+        self.assertEqual(0, result._received_count)
+        self.assertEqual(0, result._ack_count)
+        self.assertEqual(None, result._ack_timer)
         self.assertEqual('framer', parent.framers)
         mock_init.assert_called_once_with(parent)
         mock_COBSFramer.assert_called_once_with(True)
-        mock_Message.assert_called_once_with('subscribe')
+        mock_Message.assert_called_once_with('subscribe', session='app_id')
+        mock_Message.return_value.to_frame.assert_called_once_with()
+        mock_send_frame.assert_called_once_with('some frame')
+
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }))
+    @mock.patch.object(notifications.NotificationApplication, 'send_frame')
+    def test_init_reconnect(self, mock_send_frame, mock_Message,
+                            mock_COBSFramer, mock_init):
+        parent = mock.Mock()
+        server = mock.Mock(last_id='last_id', heartbeat=None, snapshot=True,
+                           **{'open_ring.return_value': None})
+        result = notifications.NotificationApplication(parent, server,
+                                                       'app_name', 'app_id')
+
+        self.assertEqual(server, result.server)
+        mock_Message.assert_called_once_with('subscribe', session='app_id',
+                                             since_id='last_id')
         mock_Message.return_value.to_frame.assert_called_once_with()
         mock_send_frame.assert_called_once_with('some frame')
 
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }))
+    @mock.patch.object(notifications.NotificationApplication, 'send_frame')
+    def test_init_snapshot(self, mock_send_frame, mock_Message,
+                           mock_COBSFramer, mock_init):
+        parent = mock.Mock()
+        server = mock.Mock(last_id=None, heartbeat=None, snapshot=True,
+                           **{'open_ring.return_value': None})
+        notifications.NotificationApplication(parent, server,
+                                              'app_name', 'app_id')
+
+        mock_Message.assert_called_once_with('subscribe', session='app_id',
+                                             snapshot=True)
+        mock_send_frame.assert_called_once_with('some frame')
+
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }))
+    @mock.patch.object(notifications.NotificationApplication, 'send_frame')
+    def test_init_heartbeat(self, mock_send_frame, mock_Message,
+                            mock_COBSFramer, mock_init):
+        parent = mock.Mock()
+        server = mock.Mock(last_id=None, heartbeat=30.0, snapshot=False,
+                           **{'open_ring.return_value': None})
+        result = notifications.NotificationApplication(parent, server,
+                                                       'app_name', 'app_id')
+
+        self.assertEqual(None, result.heartbeat)
+        mock_Message.assert_called_once_with('subscribe', session='app_id',
+                                             heartbeat=30.0)
+        mock_send_frame.assert_called_once_with('some frame')
+
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }))
+    @mock.patch.object(notifications.NotificationApplication, 'send_frame')
+    def test_init_ring(self, mock_send_frame, mock_Message,
+                       mock_COBSFramer, mock_init):
+        parent = mock.Mock()
+        server = mock.Mock(last_id=None, heartbeat=None, snapshot=False, **{
+            'open_ring.return_value': mock.Mock(path='/ring'),
+        })
+        notifications.NotificationApplication(parent, server,
+                                              'app_name', 'app_id')
+
+        server.open_ring.assert_called_once_with()
+        mock_Message.assert_called_once_with('subscribe', session='app_id',
+                                             ring='/ring')
+
     @mock.patch.object(protocol.Message, 'from_frame',
                        side_effect=ValueError('failed to decode'))
     @mock.patch.object(notifications.NotificationApplication, '__init__',
@@ -399,6 +707,7 @@ class NotificationApplicationTest(unittest.TestCase):
     def test_recv_frame_decodeerror(self, mock_closed, mock_disconnect,
                                     mock_notify, mock_init, mock_from_frame):
         app = notifications.NotificationApplication()
+        app.heartbeat = None
         app.server = mock.Mock()
 
         app.recv_frame('test')
@@ -423,6 +732,7 @@ class NotificationApplicationTest(unittest.TestCase):
     def test_recv_frame_unknownmsg(self, mock_closed, mock_disconnect,
                                    mock_notify, mock_init, mock_from_frame):
         app = notifications.NotificationApplication()
+        app.heartbeat = None
         app.server = mock.Mock()
 
         app.recv_frame('test')
@@ -447,6 +757,7 @@ class NotificationApplicationTest(unittest.TestCase):
     def test_recv_frame_error(self, mock_closed, mock_disconnect,
                               mock_notify, mock_init, mock_from_frame):
         app = notifications.NotificationApplication()
+        app.heartbeat = None
         app.server = mock.Mock()
 
         app.recv_frame('test')
@@ -471,6 +782,7 @@ class NotificationApplicationTest(unittest.TestCase):
     def test_recv_frame_goodbye(self, mock_closed, mock_disconnect,
                                 mock_notify, mock_init, mock_from_frame):
         app = notifications.NotificationApplication()
+        app.heartbeat = None
         app.server = mock.Mock()
 
         app.recv_frame('test')
@@ -483,7 +795,7 @@ class NotificationApplicationTest(unittest.TestCase):
         self.assertFalse(app.server.notify.called)
 
     @mock.patch.object(protocol.Message, 'from_frame', return_value=mock.Mock(
-        msg_type='subscribed'))
+        msg_type='subscribed', heartbeat=None, session=None, ring=None))
     @mock.patch.object(notifications.NotificationApplication, '__init__',
                        return_value=None)
     @mock.patch.object(notifications.NotificationApplication, 'notify')
@@ -492,11 +804,14 @@ class NotificationApplicationTest(unittest.TestCase):
     def test_recv_frame_subscribed(self, mock_closed, mock_disconnect,
                                    mock_notify, mock_init, mock_from_frame):
         app = notifications.NotificationApplication()
+        app.heartbeat = None
         app.server = mock.Mock()
 
         app.recv_frame('test')
 
         mock_from_frame.assert_called_once_with('test')
+        self.assertEqual(False, app.acks)
+        app.server.close_ring.assert_called_once_with()
         mock_notify.assert_called_once_with(
             'Connection Established',
             'The connection to the HeyU hub has been established.',
@@ -506,6 +821,116 @@ class NotificationApplicationTest(unittest.TestCase):
         self.assertFalse(app.server.stop.called)
         self.assertFalse(app.server.notify.called)
 
+    @mock.patch('heyu.heartbeat.Heartbeat')
+    @mock.patch.object(protocol.Message, 'from_frame', return_value=mock.Mock(
+        msg_type='subscribed', heartbeat=10.0, session=None, ring=None))
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'notify')
+    def test_recv_frame_subscribed_heartbeat(self, mock_notify, mock_init,
+                                             mock_from_frame,
+                                             mock_Heartbeat):
+        app = notifications.NotificationApplication()
+        app.heartbeat = None
+        app.server = mock.Mock()
+
+        app.recv_frame('test')
+
+        mock_Heartbeat.assert_called_once_with(app, 10.0, 3, False)
+        mock_Heartbeat.return_value.start.assert_called_once_with()
+        self.assertEqual(mock_Heartbeat.return_value, app.heartbeat)
+        mock_notify.assert_called_once_with(
+            'Connection Established',
+            'The connection to the HeyU hub has been established.',
+            notifications.CONNECTED)
+
+    @mock.patch.object(protocol.Message, 'from_frame', return_value=mock.Mock(
+        msg_type='subscribed', heartbeat=None, session='app_id', ring=None))
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'notify')
+    def test_recv_frame_subscribed_session(self, mock_notify, mock_init,
+                                           mock_from_frame):
+        app = notifications.NotificationApplication()
+        app.heartbeat = None
+        app.server = mock.Mock()
+
+        app.recv_frame('test')
+
+        self.assertEqual(True, app.acks)
+
+    @mock.patch.object(protocol.Message, 'from_frame', return_value=mock.Mock(
+        msg_type='subscribed', heartbeat=None, session=None, ring=4096))
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'notify')
+    def test_recv_frame_subscribed_ring(self, mock_notify, mock_init,
+                                        mock_from_frame):
+        app = notifications.NotificationApplication()
+        app.heartbeat = None
+        app.server = mock.Mock(ring=mock.Mock(position=0))
+
+        app.recv_frame('test')
+
+        self.assertEqual(False, app.acks)
+        self.assertEqual(4096, app.server.ring.position)
+        self.assertFalse(app.server.close_ring.called)
+
+    @mock.patch.object(protocol.Message, 'from_frame', return_value=mock.Mock(
+        msg_type='wakeup'))
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, '_read_ring')
+    def test_recv_frame_wakeup(self, mock_read_ring, mock_init,
+                               mock_from_frame):
+        app = notifications.NotificationApplication()
+        app.heartbeat = None
+        app.server = mock.Mock()
+
+        app.recv_frame('test')
+
+        mock_read_ring.assert_called_once_with()
+        self.assertFalse(app.server.notify.called)
+
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }), **{'from_frame.return_value': mock.Mock(msg_type='ping')})
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'notify')
+    @mock.patch.object(notifications.NotificationApplication, 'send_frame')
+    def test_recv_frame_ping(self, mock_send_frame, mock_notify, mock_init,
+                             mock_Message):
+        app = notifications.NotificationApplication()
+        app.heartbeat = mock.Mock()
+        app.server = mock.Mock()
+
+        app.recv_frame('test')
+
+        app.heartbeat.received.assert_called_once_with()
+        mock_Message.assert_called_once_with('pong')
+        mock_send_frame.assert_called_once_with('some frame')
+        self.assertFalse(mock_notify.called)
+        self.assertFalse(app.server.notify.called)
+
+    @mock.patch.object(protocol.Message, 'from_frame', return_value=mock.Mock(
+        msg_type='pong'))
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'notify')
+    @mock.patch.object(notifications.NotificationApplication, 'send_frame')
+    def test_recv_frame_pong(self, mock_send_frame, mock_notify, mock_init,
+                             mock_from_frame):
+        app = notifications.NotificationApplication()
+        app.heartbeat = mock.Mock()
+        app.server = mock.Mock()
+
+        app.recv_frame('test')
+
+        app.heartbeat.received.assert_called_once_with()
+        self.assertFalse(mock_send_frame.called)
+        self.assertFalse(mock_notify.called)
+
     @mock.patch.object(protocol.Message, 'from_frame', return_value=mock.Mock(
         msg_type='notify'))
     @mock.patch.object(notifications.NotificationApplication, '__init__',
@@ -516,6 +941,8 @@ class NotificationApplicationTest(unittest.TestCase):
     def test_recv_frame_notify(self, mock_closed, mock_disconnect,
                                mock_notify, mock_init, mock_from_frame):
         app = notifications.NotificationApplication()
+        app.heartbeat = None
+        app.acks = False
         app.server = mock.Mock()
 
         app.recv_frame('test')
@@ -527,6 +954,44 @@ class NotificationApplicationTest(unittest.TestCase):
         self.assertFalse(app.server.stop.called)
         app.server.notify.assert_called_once_with(mock_from_frame.return_value)
 
+    @mock.patch.object(protocol.Message, 'from_frame', return_value=mock.Mock(
+        msg_type='notify', id='some-id'))
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, '_received')
+    def test_recv_frame_notify_acks(self, mock_received, mock_init,
+                                    mock_from_frame):
+        app = notifications.NotificationApplication()
+        app.heartbeat = None
+        app.acks = True
+        app.server = mock.Mock()
+
+        app.recv_frame('test')
+
+        app.server.notify.assert_called_once_with(mock_from_frame.return_value)
+        mock_received.assert_called_once_with()
+
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'send_frame')
+    @mock.patch.object(notifications.NotificationApplication, 'close')
+    def test_disconnect_heartbeat(self, mock_close, mock_send_frame,
+                                  mock_init, mock_Message):
+        app = notifications.NotificationApplication()
+        heartbeat = mock.Mock()
+        app.heartbeat = heartbeat
+        app._ack_count = 0
+        app._ack_timer = None
+
+        app.disconnect()
+
+        heartbeat.stop.assert_called_once_with()
+        self.assertEqual(None, app.heartbeat)
+        mock_close.assert_called_once_with()
+
     @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
         'to_frame.return_value': 'frame',
     }))
@@ -537,6 +1002,9 @@ class NotificationApplicationTest(unittest.TestCase):
     def test_disconnect_success(self, mock_close, mock_send_frame, mock_init,
                                 mock_Message):
         app = notifications.NotificationApplication()
+        app.heartbeat = None
+        app._ack_count = 0
+        app._ack_timer = None
 
         app.disconnect()
 
@@ -556,6 +1024,9 @@ class NotificationApplicationTest(unittest.TestCase):
     def test_disconnect_failure(self, mock_close, mock_send_frame, mock_init,
                                 mock_Message):
         app = notifications.NotificationApplication()
+        app.heartbeat = None
+        app._ack_count = 0
+        app._ack_timer = None
 
         app.disconnect()
 
@@ -569,6 +1040,8 @@ class NotificationApplicationTest(unittest.TestCase):
     @mock.patch.object(notifications.NotificationApplication, 'notify')
     def test_closed(self, mock_notify, mock_init):
         app = notifications.NotificationApplication()
+        app.heartbeat = None
+        app._ack_timer = None
         app.server = mock.Mock()
 
         app.closed(None)
@@ -579,6 +1052,188 @@ class NotificationApplicationTest(unittest.TestCase):
             notifications.DISCONNECTED)
         app.server.stop.assert_called_once_with()
 
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'close')
+    @mock.patch.object(notifications.NotificationApplication, 'closed')
+    def test_expired(self, mock_closed, mock_close, mock_init):
+        app = notifications.NotificationApplication()
+        app.heartbeat = mock.Mock()
+        app._ack_timer = None
+
+        app.expired()
+
+        self.assertEqual(None, app.heartbeat)
+        mock_close.assert_called_once_with()
+        mock_closed.assert_called_once_with(None)
+
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'send_ack')
+    @mock.patch.object(notifications.NotificationApplication, 'send_frame')
+    @mock.patch.object(notifications.NotificationApplication, 'close')
+    def test_disconnect_ack(self, mock_close, mock_send_frame, mock_send_ack,
+                            mock_init):
+        app = notifications.NotificationApplication()
+        app.heartbeat = None
+
+        def send_frame(frame):
+            mock_send_ack.assert_called_once_with()
+        mock_send_frame.side_effect = send_frame
+
+        app.disconnect()
+
+        self.assertEqual(1, mock_send_frame.call_count)
+        mock_close.assert_called_once_with()
+
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'notify')
+    def test_read_ring(self, mock_notify, mock_init):
+        notif = protocol.Message('notify', id='id1', app_name='app',
+                                 summary='summary', body='body')
+        other = protocol.Message('ping')
+        ring = mock.Mock(overruns=0, **{
+            'read.return_value': [notif.to_frame(), 'garbage',
+                                  other.to_frame()],
+        })
+        app = notifications.NotificationApplication()
+        app.server = mock.Mock(ring=ring)
+
+        app._read_ring()
+
+        self.assertEqual(1, app.server.notify.call_count)
+        self.assertEqual('id1', app.server.notify.call_args[0][0].id)
+        self.assertFalse(mock_notify.called)
+
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'notify')
+    def test_read_ring_overrun(self, mock_notify, mock_init):
+        ring = mock.Mock(overruns=0)
+
+        def read():
+            ring.overruns = 1
+            return []
+        ring.read.side_effect = read
+        app = notifications.NotificationApplication()
+        app.server = mock.Mock(ring=ring)
+
+        app._read_ring()
+
+        self.assertFalse(app.server.notify.called)
+        mock_notify.assert_called_once_with(
+            'Notifications Lost', 'Notifications were lost because the '
+            'notifier fell behind the HeyU hub.', notifications.ERROR)
+
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'notify')
+    def test_read_ring_none(self, mock_notify, mock_init):
+        app = notifications.NotificationApplication()
+        app.server = mock.Mock(ring=None)
+
+        app._read_ring()
+
+        self.assertFalse(app.server.notify.called)
+        self.assertFalse(mock_notify.called)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'send_ack')
+    def test_received(self, mock_send_ack, mock_init, mock_spawn_later):
+        app = notifications.NotificationApplication()
+        app._received_count = 5
+        app._ack_count = 0
+        app._ack_timer = None
+
+        app._received()
+        app._received()
+
+        self.assertEqual(7, app._received_count)
+        self.assertEqual(2, app._ack_count)
+        self.assertEqual('timer', app._ack_timer)
+        mock_spawn_later.assert_called_once_with(0.1, app.send_ack)
+        self.assertFalse(mock_send_ack.called)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'send_ack')
+    def test_received_batch(self, mock_send_ack, mock_init,
+                            mock_spawn_later):
+        app = notifications.NotificationApplication()
+        app.ack_batch = 2
+        app._received_count = 1
+        app._ack_count = 1
+        app._ack_timer = 'timer'
+
+        app._received()
+
+        self.assertEqual(2, app._received_count)
+        mock_send_ack.assert_called_once_with()
+        self.assertFalse(mock_spawn_later.called)
+
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'send_frame')
+    def test_send_ack(self, mock_send_frame, mock_init, mock_Message):
+        timer = mock.Mock()
+        app = notifications.NotificationApplication()
+        app._received_count = 7
+        app._ack_count = 2
+        app._ack_timer = timer
+
+        app.send_ack()
+
+        timer.kill.assert_called_once_with()
+        mock_Message.assert_called_once_with('ack', seq=7)
+        mock_send_frame.assert_called_once_with('frame')
+        self.assertEqual(7, app._received_count)
+        self.assertEqual(0, app._ack_count)
+        self.assertEqual(None, app._ack_timer)
+
+    @mock.patch('gevent.getcurrent')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'frame',
+    }))
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'send_frame',
+                       side_effect=TestException('test'))
+    def test_send_ack_timer(self, mock_send_frame, mock_init, mock_Message,
+                            mock_getcurrent):
+        timer = mock_getcurrent.return_value
+        app = notifications.NotificationApplication()
+        app._received_count = 1
+        app._ack_count = 1
+        app._ack_timer = timer
+
+        app.send_ack()
+
+        self.assertFalse(timer.kill.called)
+        mock_send_frame.assert_called_once_with('frame')
+        self.assertEqual(None, app._ack_timer)
+
+    @mock.patch.object(protocol, 'Message')
+    @mock.patch.object(notifications.NotificationApplication, '__init__',
+                       return_value=None)
+    @mock.patch.object(notifications.NotificationApplication, 'send_frame')
+    def test_send_ack_nothing(self, mock_send_frame, mock_init, mock_Message):
+        app = notifications.NotificationApplication()
+        app._received_count = 3
+        app._ack_count = 0
+        app._ack_timer = None
+
+        app.send_ack()
+
+        self.assertFalse(mock_Message.called)
+        self.assertFalse(mock_send_frame.called)
+
     @mock.patch.object(protocol, 'Message', return_value='notification')
     @mock.patch.object(notifications.NotificationApplication, '__init__',
                        return_value=None)
@@ -612,7 +1267,9 @@ class StdoutNotifierTest(unittest.TestCase):
     def test_output(self, mock_NotificationServer):
         notifications.stdout_notifier('hub')
 
-        mock_NotificationServer.assert_called_once_with('hub', None, True)
+        mock_NotificationServer.assert_called_once_with(
+            'hub', None, True, lag_threshold=None, ring=None,
+            loop=None, snapshot=False)
         self.assertEqual(
             'ID notify-1, urgency low\n'
             'Application: application-1\n'
@@ -663,7 +1320,9 @@ class FileNotifierTest(unittest.TestCase):
         notifications.file_notifier('file', 'hub')
 
         mock_open.assert_called_once_with('file', 'a')
-        mock_NotificationServer.assert_called_once_with('hub', None, True)
+        mock_NotificationServer.assert_called_once_with(
+            'hub', None, True, lag_threshold=None, ring=None,
+            loop=None, snapshot=False)
         self.assertEqual(
             'ID notify-1, urgency low\n'
             'Application: application-1\n'
@@ -735,7 +1394,9 @@ class ScriptNotifierTest(unittest.TestCase):
             'urgency={urgency}',
         ], 'hub')
 
-        mock_NotificationServer.assert_called_once_with('hub', None, True)
+        mock_NotificationServer.assert_called_once_with(
+            'hub', None, True, lag_threshold=None, ring=None,
+            loop=None, snapshot=False)
         self.assertEqual('', sys.stderr.getvalue())
         mock_call.assert_has_calls([
             mock.call([
@@ -775,7 +1436,9 @@ class ScriptNotifierTest(unittest.TestCase):
             'urgency={urgency}',
         ], 'hub')
 
-        mock_NotificationServer.assert_called_once_with('hub', None, True)
+        mock_NotificationServer.assert_called_once_with(
+            'hub', None, True, lag_threshold=None, ring=None,
+            loop=None, snapshot=False)
         self.assertEqual('Failed to call command: bad command\n'
                          'Failed to call command: bad command\n'
                          'Failed to call command: bad command\n',
@@ -0,0 +1,341 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import mock
+
+from heyu import outbox
+
+
+class TestException(Exception):
+    pass
+
+
+class OutboxTest(unittest.TestCase):
+    def _pending(self, box):
+        return [(urgency, list(box._queues[urgency].items()))
+                for urgency in sorted(box._queues, reverse=True)
+                if box._queues[urgency]]
+
+    def test_init(self):
+        result = outbox.Outbox('client', 0.5)
+
+        self.assertEqual('client', result._client)
+        self.assertEqual(0.5, result._window)
+        self.assertEqual(True, result._coalesce)
+        self.assertEqual(None, result._queues)
+        self.assertEqual(None, result._urgency)
+        self.assertEqual(None, result._expires)
+        self.assertEqual(None, result._receipts)
+        self.assertEqual(None, result._timer)
+        self.assertEqual(0, len(result))
+
+    def test_init_alt(self):
+        result = outbox.Outbox('client', 0.05, False, 'receipts')
+
+        self.assertEqual(0.05, result._window)
+        self.assertEqual(False, result._coalesce)
+        self.assertEqual('receipts', result._receipts)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_push(self, mock_spawn_later):
+        box = outbox.Outbox('client', 0.5)
+
+        box.push('id1', 'frame1')
+        box.push('id2', 'frame2')
+        box.push('id1', 'frame1b')
+
+        self.assertEqual([
+            (0, [('id1', ['frame1b']), ('id2', ['frame2'])]),
+        ], self._pending(box))
+        self.assertEqual(2, len(box))
+        self.assertEqual('timer', box._timer)
+        mock_spawn_later.assert_called_once_with(0.5, box.flush)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_push_urgency(self, mock_spawn_later):
+        box = outbox.Outbox('client', 0.5)
+
+        box.push('id1', 'frame1', 0)
+        box.push('id2', 'frame2', 2)
+        box.push('id3', 'frame3', 1)
+
+        self.assertEqual([
+            (2, [('id2', ['frame2'])]),
+            (1, [('id3', ['frame3'])]),
+            (0, [('id1', ['frame1'])]),
+        ], self._pending(box))
+        self.assertEqual(3, len(box))
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_push_promote(self, mock_spawn_later):
+        box = outbox.Outbox('client', 0.5)
+
+        box.push('id1', 'frame1', 0)
+        box.push('id2', 'frame2', 2)
+        box.push('id1', 'frame1b', 2)
+        box.push('id1', 'frame1c', 0)
+
+        self.assertEqual([
+            (2, [('id2', ['frame2']), ('id1', ['frame1c'])]),
+        ], self._pending(box))
+        self.assertEqual({'id1': 2, 'id2': 2}, box._urgency)
+        self.assertEqual(2, len(box))
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_push_expires(self, mock_spawn_later):
+        box = outbox.Outbox('client', 0.5)
+
+        box.push('id1', 'frame1', 0, 1000.0)
+        box.push('id2', 'frame2', 0, 1000.0)
+        box.push('id1', 'frame1b', 0, 2000.0)
+        box.push('id2', 'frame2b', 0)
+
+        self.assertEqual({'id1': 2000.0}, box._expires)
+
+    def test_push_immediate(self):
+        client = mock.Mock(backlog=0)
+        box = outbox.Outbox(client, 0.05, False)
+
+        box.push('id1', 'frame1', 2)
+
+        client.send_frame.assert_called_once_with('frame1')
+        self.assertEqual(0, len(box))
+        self.assertEqual(None, box._timer)
+
+    def test_push_immediate_receipts(self):
+        client = mock.Mock(backlog=0)
+        receipts = mock.Mock()
+        box = outbox.Outbox(client, 0.05, False, receipts)
+
+        box.push('id1', 'frame1', 2)
+
+        receipts.sent.assert_called_once_with('id1', 'frame1', None)
+        client.send_frame.assert_called_once_with('frame1')
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_push_behind(self, mock_spawn_later):
+        client = mock.Mock(backlog=10)
+        box = outbox.Outbox(client, 0.05, False)
+
+        box.push('id1', 'frame1', 0)
+        box.push('id2', 'frame2', 0)
+        box.push('id1', 'frame1b', 1)
+        box.push('id3', 'frame3', 2)
+
+        self.assertFalse(client.send_frame.called)
+        self.assertEqual([
+            (2, [('id3', ['frame3'])]),
+            (1, [('id1', ['frame1', 'frame1b'])]),
+            (0, [('id2', ['frame2'])]),
+        ], self._pending(box))
+        self.assertEqual(4, len(box))
+        mock_spawn_later.assert_called_once_with(0.05, box.flush)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_push_queued(self, mock_spawn_later):
+        client = mock.Mock(backlog=10)
+        box = outbox.Outbox(client, 0.05, False)
+        box.push('id1', 'frame1', 0)
+        client.backlog = 0
+
+        box.push('id2', 'frame2', 0)
+
+        self.assertFalse(client.send_frame.called)
+        self.assertEqual(2, len(box))
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_flush_empty(self, mock_spawn_later):
+        client = mock.Mock(backlog=0)
+        box = outbox.Outbox(client, 0.5)
+        box._timer = 'timer'
+
+        box.flush()
+
+        self.assertEqual(None, box._timer)
+        self.assertFalse(client.send_frame.called)
+        self.assertFalse(mock_spawn_later.called)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_flush_behind(self, mock_spawn_later):
+        client = mock.Mock(backlog=10)
+        box = outbox.Outbox(client, 0.5)
+        box.push('id1', 'frame1')
+        box._timer = 'old timer'
+        mock_spawn_later.reset_mock()
+
+        box.flush()
+
+        self.assertEqual('timer', box._timer)
+        self.assertEqual(1, len(box))
+        self.assertFalse(client.send_frame.called)
+        mock_spawn_later.assert_called_once_with(0.5, box.flush)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_flush(self, mock_spawn_later):
+        client = mock.Mock(backlog=0, **{
+            'send_frame.side_effect': [TestException('failed'), None, None],
+        })
+        box = outbox.Outbox(client, 0.5)
+        box.push('id1', 'frame1')
+        box.push('id2', 'frame2')
+        box.push('id3', 'frame3', 2)
+        mock_spawn_later.reset_mock()
+
+        box.flush()
+
+        self.assertEqual(None, box._timer)
+        self.assertEqual(0, len(box))
+        self.assertEqual(None, box._urgency)
+        client.send_frame.assert_has_calls([
+            mock.call('frame3'),
+            mock.call('frame1'),
+            mock.call('frame2'),
+        ])
+        self.assertFalse(mock_spawn_later.called)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_flush_ordered(self, mock_spawn_later):
+        client = mock.Mock(backlog=10)
+        box = outbox.Outbox(client, 0.05, False)
+        box.push('id1', 'frame1', 0)
+        box.push('id2', 'frame2', 1)
+        box.push('id1', 'frame1b', 2)
+        client.backlog = 0
+
+        box.flush()
+
+        self.assertEqual([
+            mock.call('frame1'),
+            mock.call('frame1b'),
+            mock.call('frame2'),
+        ], client.send_frame.call_args_list)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_flush_receipts(self, mock_spawn_later):
+        client = mock.Mock(backlog=0, **{
+            'send_frame.side_effect': [TestException('failed'), None],
+        })
+        receipts = mock.Mock()
+        box = outbox.Outbox(client, 0.5, receipts=receipts)
+        box.push('id1', 'frame1')
+        box.push('id2', 'frame2', 2)
+
+        box.flush()
+
+        self.assertEqual([
+            mock.call('id2', 'frame2', None),
+            mock.call('id1', 'frame1', None),
+        ], receipts.sent.call_args_list)
+        self.assertEqual(2, client.send_frame.call_count)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_take(self, mock_spawn_later):
+        client = mock.Mock(backlog=10)
+        box = outbox.Outbox(client, 0.05, False)
+        box.push('id1', 'frame1', 0)
+        box.push('id2', 'frame2', 1)
+        box.push('id1', 'frame1b', 0)
+
+        result = box.take()
+
+        self.assertEqual([
+            ('id2', 'frame2', None),
+            ('id1', 'frame1', None),
+            ('id1', 'frame1b', None),
+        ], result)
+        self.assertEqual(0, len(box))
+        self.assertEqual(None, box._queues)
+        self.assertEqual(None, box._expires)
+        self.assertFalse(client.send_frame.called)
+
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_take_expired(self, mock_spawn_later, mock_time):
+        client = mock.Mock(backlog=10)
+        box = outbox.Outbox(client, 0.05, False)
+        box.push('id1', 'frame1', 0, 1000.0)
+        box.push('id2', 'frame2', 1, 1001.0)
+        box.push('id3', 'frame3', 2, 999.0)
+        box.push('id1', 'frame1b', 0, 1000.0)
+
+        result = box.take()
+
+        self.assertEqual([('id2', 'frame2', 1001.0)], result)
+        self.assertEqual(0, len(box))
+
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_flush_expired(self, mock_spawn_later, mock_time):
+        client = mock.Mock(backlog=0)
+        receipts = mock.Mock()
+        box = outbox.Outbox(client, 0.5, receipts=receipts)
+        box.push('id1', 'frame1', 0, 1000.0)
+        box.push('id2', 'frame2', 0, 1001.0)
+
+        box.flush()
+
+        client.send_frame.assert_called_once_with('frame2')
+        receipts.sent.assert_called_once_with('id2', 'frame2', 1001.0)
+
+    @mock.patch('gevent.spawn_later')
+    def test_drain(self, mock_spawn_later):
+        client = mock.Mock(backlog=10)
+        timer = mock_spawn_later.return_value
+        box = outbox.Outbox(client, 0.5)
+        box.push('id1', 'frame1')
+        box.push('id2', 'frame2')
+
+        box.drain()
+
+        timer.kill.assert_called_once_with()
+        self.assertEqual(None, box._timer)
+        self.assertEqual(0, len(box))
+        client.send_frame.assert_has_calls([
+            mock.call('frame1'),
+            mock.call('frame2'),
+        ])
+
+    def test_drain_idle(self):
+        client = mock.Mock(backlog=0)
+        box = outbox.Outbox(client, 0.5)
+
+        box.drain()
+
+        self.assertEqual(None, box._timer)
+        self.assertFalse(client.send_frame.called)
+
+    @mock.patch('gevent.spawn_later')
+    def test_cancel(self, mock_spawn_later):
+        timer = mock_spawn_later.return_value
+        box = outbox.Outbox('client', 0.5)
+        box.push('id1', 'frame1')
+
+        box.cancel()
+
+        timer.kill.assert_called_once_with()
+        self.assertEqual(None, box._timer)
+        self.assertEqual(0, len(box))
+        self.assertEqual(None, box._queues)
+        self.assertEqual(None, box._urgency)
+
+    def test_cancel_idle(self):
+        box = outbox.Outbox('client', 0.5)
+
+        box.cancel()
+
+        self.assertEqual(None, box._timer)
+        self.assertEqual(0, len(box))
@@ -20,6 +20,56 @@ import mock
 from heyu import protocol
 
 
+class ExpiredTest(unittest.TestCase):
+    def test_never(self):
+        self.assertFalse(protocol.expired(None, 1000.0))
+
+    def test_expired(self):
+        self.assertTrue(protocol.expired(1000.0, 1000.0))
+        self.assertTrue(protocol.expired(999.0, 1000.0))
+
+    def test_unexpired(self):
+        self.assertFalse(protocol.expired(1001.0, 1000.0))
+
+    @mock.patch('time.time', return_value=1000.0)
+    def test_default_now(self, mock_time):
+        self.assertTrue(protocol.expired(1000.0))
+        self.assertFalse(protocol.expired(1001.0))
+
+
+class DeliveryTest(unittest.TestCase):
+    def test_no_delay(self):
+        self.assertEqual(2000.0, protocol.delivery(2000.0, None, 1000.0))
+        self.assertEqual(None, protocol.delivery(None, None, 1000.0))
+
+    def test_delay(self):
+        self.assertEqual(1060.0, protocol.delivery(2000.0, 60.0, 1000.0))
+
+    @mock.patch('time.time', return_value=1000.0)
+    def test_default_now(self, mock_time):
+        self.assertEqual(1060.0, protocol.delivery(None, 60.0))
+
+
+class ExpiryTest(unittest.TestCase):
+    def test_no_ttl(self):
+        self.assertEqual(2000.0, protocol.expiry(2000.0, None, 1500.0,
+                                                 1000.0))
+        self.assertEqual(None, protocol.expiry(None, None, None, 1000.0))
+
+    def test_ttl(self):
+        self.assertEqual(1060.0, protocol.expiry(2000.0, 60.0, None, 1000.0))
+
+    def test_ttl_deliver_at(self):
+        self.assertEqual(1560.0, protocol.expiry(None, 60.0, 1500.0, 1000.0))
+
+    def test_ttl_deliver_at_past(self):
+        self.assertEqual(1060.0, protocol.expiry(None, 60.0, 500.0, 1000.0))
+
+    @mock.patch('time.time', return_value=1000.0)
+    def test_default_now(self, mock_time):
+        self.assertEqual(1060.0, protocol.expiry(None, 60.0))
+
+
 class MessageTest(unittest.TestCase):
     @mock.patch('msgpack.loads', return_value=[])
     @mock.patch.object(protocol.Message, '__init__', return_value=None)
@@ -0,0 +1,169 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import mock
+
+from heyu import ratelimit
+
+
+class ParseRateTest(unittest.TestCase):
+    def test_rate(self):
+        self.assertEqual((5.0, 5), ratelimit.parse_rate('5'))
+
+    def test_fractional_rate(self):
+        self.assertEqual((0.5, 1), ratelimit.parse_rate('0.5'))
+
+    def test_rate_burst(self):
+        self.assertEqual((2.0, 10), ratelimit.parse_rate('2/10'))
+
+    def test_zero_rate(self):
+        self.assertRaises(ratelimit.RateLimitException,
+                          ratelimit.parse_rate, '0')
+
+    def test_zero_burst(self):
+        self.assertRaises(ratelimit.RateLimitException,
+                          ratelimit.parse_rate, '1/0')
+
+    def test_bad(self):
+        self.assertRaises(ratelimit.RateLimitException,
+                          ratelimit.parse_rate, 'fast')
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_init(self):
+        bucket = ratelimit.TokenBucket(2.0, 5, 100.0)
+
+        self.assertEqual(2.0, bucket.rate)
+        self.assertEqual(5, bucket.burst)
+        self.assertEqual(5.0, bucket.tokens)
+        self.assertEqual(100.0, bucket.stamp)
+
+    def test_consume_burst(self):
+        bucket = ratelimit.TokenBucket(2.0, 3, 100.0)
+
+        self.assertEqual(0, bucket.consume(100.0))
+        self.assertEqual(0, bucket.consume(100.0))
+        self.assertEqual(0, bucket.consume(100.0))
+        self.assertEqual(None, bucket.consume(100.0))
+        self.assertEqual(0.0, bucket.tokens)
+
+    def test_consume_refill(self):
+        bucket = ratelimit.TokenBucket(2.0, 3, 100.0)
+        bucket.tokens = 0.0
+
+        self.assertEqual(0, bucket.consume(100.5))
+        self.assertEqual(0.0, bucket.tokens)
+
+    def test_refill_capped(self):
+        bucket = ratelimit.TokenBucket(2.0, 3, 100.0)
+        bucket.tokens = 0.0
+
+        self.assertTrue(bucket.full(200.0))
+        self.assertEqual(3.0, bucket.tokens)
+
+    def test_consume_wait(self):
+        bucket = ratelimit.TokenBucket(2.0, 3, 100.0)
+        bucket.tokens = 0.0
+
+        self.assertEqual(0.5, bucket.consume(100.0, 1.0))
+        self.assertEqual(-1.0, bucket.tokens)
+        self.assertEqual(1.0, bucket.consume(100.0, 1.0))
+        self.assertEqual(None, bucket.consume(100.0, 1.0))
+        self.assertEqual(-2.0, bucket.tokens)
+
+    def test_full(self):
+        bucket = ratelimit.TokenBucket(2.0, 3, 100.0)
+        bucket.tokens = 1.0
+
+        self.assertFalse(bucket.full(100.5))
+        self.assertTrue(bucket.full(101.0))
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_init(self):
+        limiter = ratelimit.RateLimiter(2.0, 5)
+
+        self.assertEqual(2.0, limiter.rate)
+        self.assertEqual(5, limiter.burst)
+        self.assertEqual(False, limiter.by_app)
+        self.assertEqual(0, limiter.defer)
+        self.assertEqual(0, len(limiter))
+        self.assertEqual(0, limiter.rejected)
+        self.assertEqual(0, limiter.deferred)
+
+    @mock.patch('time.time', return_value=100.0)
+    def test_check_by_host(self, mock_time):
+        limiter = ratelimit.RateLimiter(1.0, 1)
+
+        self.assertEqual(0, limiter.check('host1', 'app1'))
+        self.assertRaises(ratelimit.RateLimitExceeded, limiter.check,
+                          'host1', 'app2')
+        self.assertEqual(0, limiter.check('host2', 'app1'))
+        self.assertEqual(2, len(limiter))
+        self.assertEqual(1, limiter.rejected)
+        self.assertEqual(0, limiter.deferred)
+
+    @mock.patch('time.time', return_value=100.0)
+    def test_check_by_app(self, mock_time):
+        limiter = ratelimit.RateLimiter(1.0, 1, by_app=True)
+
+        self.assertEqual(0, limiter.check('host1', 'app1'))
+        self.assertEqual(0, limiter.check('host1', 'app2'))
+        self.assertRaises(ratelimit.RateLimitExceeded, limiter.check,
+                          'host1', 'app1')
+        self.assertEqual(2, len(limiter))
+        self.assertEqual(1, limiter.rejected)
+
+    @mock.patch('time.time', return_value=100.0)
+    def test_check_defer(self, mock_time):
+        limiter = ratelimit.RateLimiter(1.0, 1, defer=1.0)
+
+        self.assertEqual(0, limiter.check('host'))
+        self.assertEqual(1.0, limiter.check('host'))
+        self.assertRaises(ratelimit.RateLimitExceeded, limiter.check,
+                          'host')
+        self.assertEqual(1, limiter.deferred)
+        self.assertEqual(1, limiter.rejected)
+
+    @mock.patch('time.time')
+    def test_check_prune(self, mock_time):
+        mock_time.return_value = 100.0
+        limiter = ratelimit.RateLimiter(1.0, 1)
+        limiter.prune_threshold = 2
+        limiter.check('host1')
+        limiter.check('host2')
+
+        mock_time.return_value = 101.0
+        limiter.check('host1')
+        limiter.check('host3')
+
+        self.assertEqual(['host1', 'host3'], list(limiter._buckets))
+
+    @mock.patch('time.time')
+    def test_check_prune_stops(self, mock_time):
+        mock_time.return_value = 100.0
+        limiter = ratelimit.RateLimiter(1.0, 1)
+        limiter.prune_threshold = 2
+        limiter.check('host1')
+        limiter.check('host2')
+
+        mock_time.return_value = 100.5
+        limiter._buckets['host2'].tokens = 1.0
+        limiter.check('host3')
+
+        self.assertEqual(['host1', 'host2', 'host3'],
+                         list(limiter._buckets))
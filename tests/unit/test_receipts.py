@@ -0,0 +1,154 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import mock
+
+from heyu import receipts
+
+
+class ReceiptsTest(unittest.TestCase):
+    def test_init(self):
+        result = receipts.Receipts('sess', 0, 'hub2')
+
+        self.assertEqual('sess', result.session)
+        self.assertEqual(0, result.version)
+        self.assertEqual('hub2', result.relay)
+        self.assertEqual(False, result.resumed)
+        self.assertEqual(0, len(result))
+        self.assertEqual(0, result._seq)
+        self.assertEqual(None, result._pending)
+
+    def test_sent(self):
+        tracker = receipts.Receipts('sess', 0)
+
+        self.assertEqual(False, tracker.sent('id1', 'frame1'))
+        self.assertEqual(False, tracker.sent('id2', 'frame2'))
+        self.assertEqual(False, tracker.sent('id1', 'frame1b', 1000.0))
+
+        self.assertEqual(3, len(tracker))
+        self.assertEqual([(1, 'id1', 'frame1', None),
+                          (2, 'id2', 'frame2', None),
+                          (3, 'id1', 'frame1b', 1000.0)],
+                         list(tracker._pending))
+
+    @mock.patch.object(receipts.Receipts, 'max_pending', 2)
+    def test_sent_overflow(self):
+        tracker = receipts.Receipts('sess', 0)
+        tracker.sent('id1', 'frame1')
+        tracker.sent('id2', 'frame2')
+
+        self.assertEqual(True, tracker.sent('id3', 'frame3'))
+
+        self.assertEqual([(2, 'id2', 'frame2', None),
+                          (3, 'id3', 'frame3', None)],
+                         list(tracker._pending))
+
+    def test_skip(self):
+        tracker = receipts.Receipts('sess', 0)
+        tracker.skip(3)
+
+        tracker.sent('id1', 'frame1')
+
+        self.assertEqual([(4, 'id1', 'frame1', None)],
+                         list(tracker._pending))
+
+    def test_ack(self):
+        tracker = receipts.Receipts('sess', 0)
+        tracker.sent('id1', 'frame1')
+        tracker.sent('id2', 'frame2')
+        tracker.sent('id3', 'frame3')
+
+        self.assertEqual(2, tracker.ack(2))
+
+        self.assertEqual([(3, 'id3', 'frame3', None)],
+                         list(tracker._pending))
+
+    def test_ack_stale(self):
+        tracker = receipts.Receipts('sess', 0)
+        tracker.sent('id1', 'frame1')
+        tracker.sent('id2', 'frame2')
+        tracker.ack(1)
+
+        self.assertEqual(0, tracker.ack(1))
+
+        self.assertEqual(1, len(tracker))
+
+    def test_ack_skipped(self):
+        tracker = receipts.Receipts('sess', 0)
+        tracker.skip(2)
+        tracker.sent('id1', 'frame1')
+
+        self.assertEqual(0, tracker.ack(2))
+        self.assertEqual(1, tracker.ack(3))
+
+        self.assertEqual(None, tracker._pending)
+
+    def test_ack_nothing_pending(self):
+        tracker = receipts.Receipts('sess', 0)
+
+        self.assertEqual(0, tracker.ack(1))
+
+        self.assertEqual(None, tracker._pending)
+
+    def test_ack_repeated(self):
+        tracker = receipts.Receipts('sess', 0)
+        for batch in range(50):
+            for i in range(100):
+                tracker.sent('id1', 'frame%d' % i)
+
+            self.assertEqual(100, tracker.ack((batch + 1) * 100))
+
+        self.assertEqual(0, len(tracker))
+        self.assertEqual(None, tracker._pending)
+
+    def test_ack_repeated_in_flight(self):
+        tracker = receipts.Receipts('sess', 0)
+        tracker.sent('id1', 'frame1')
+        tracker.sent('id2', 'frame2')
+        tracker.sent('id1', 'frame1b')
+
+        self.assertEqual(1, tracker.ack(1))
+
+        self.assertEqual([(2, 'id2', 'frame2', None),
+                          (3, 'id1', 'frame1b', None)],
+                         list(tracker._pending))
+
+    def test_take(self):
+        tracker = receipts.Receipts('sess', 0)
+        tracker.sent('id1', 'frame1')
+        tracker.sent('id2', 'frame2')
+
+        result = tracker.take()
+
+        self.assertEqual([('id1', 'frame1', None), ('id2', 'frame2', None)],
+                         result)
+        self.assertEqual(0, len(tracker))
+        self.assertEqual(None, tracker._pending)
+        self.assertEqual(0, tracker._seq)
+
+    @mock.patch('time.time', return_value=1000.0)
+    def test_take_expired(self, mock_time):
+        tracker = receipts.Receipts('sess', 0)
+        tracker.sent('id1', 'frame1', 1000.0)
+        tracker.sent('id2', 'frame2', 1001.0)
+        tracker.sent('id3', 'frame3')
+
+        result = tracker.take()
+
+        self.assertEqual([('id2', 'frame2', 1001.0), ('id3', 'frame3', None)],
+                         result)
+        self.assertEqual(None, tracker._pending)
@@ -0,0 +1,581 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import mock
+
+from heyu import protocol
+from heyu import relay
+
+
+class TestException(Exception):
+    pass
+
+
+class RelayTest(unittest.TestCase):
+    def _relay(self, **kwargs):
+        with mock.patch.object(relay.Relay, '__init__', return_value=None):
+            result = relay.Relay()
+
+        result._server = mock.Mock()
+        result._hub = 'hub'
+        result._wrapper = 'wrapper'
+        result._manager = mock.Mock(running=False)
+        result._app = None
+        result._timer = None
+        result._running = True
+        result._delay = relay.Relay.min_delay
+        result.last_id = None
+        result.since = None
+        for key, value in kwargs.items():
+            setattr(result, key, value)
+
+        return result
+
+    @mock.patch('tendril.get_manager', return_value='manager')
+    @mock.patch('heyu.util.outgoing_endpoint', return_value='endpoint')
+    def test_init(self, mock_outgoing_endpoint, mock_get_manager):
+        result = relay.Relay('server', 'hub', 'wrapper')
+
+        self.assertEqual('server', result._server)
+        self.assertEqual('hub', result._hub)
+        self.assertEqual('wrapper', result._wrapper)
+        self.assertEqual('manager', result._manager)
+        self.assertEqual(None, result._app)
+        self.assertEqual(None, result._timer)
+        self.assertEqual(False, result._running)
+        self.assertEqual(relay.Relay.min_delay, result._delay)
+        self.assertEqual(None, result.last_id)
+        self.assertEqual(None, result.since)
+        mock_outgoing_endpoint.assert_called_once_with('hub')
+        mock_get_manager.assert_called_once_with('tcp', 'endpoint')
+
+    @mock.patch.object(relay, 'RelayApplication', return_value='app')
+    def test_acceptor(self, mock_RelayApplication):
+        link = self._relay()
+        link._server.name = 'hub1'
+
+        result = link._acceptor('tendril')
+
+        self.assertEqual('app', result)
+        self.assertEqual('app', link._app)
+        mock_RelayApplication.assert_called_once_with('tendril', link, 'hub1')
+
+    @mock.patch.object(relay.Relay, '_reconnect')
+    def test_connect(self, mock_reconnect):
+        link = self._relay(_timer='timer')
+
+        link._connect()
+
+        self.assertEqual(None, link._timer)
+        link._manager.connect.assert_called_once_with(
+            'hub', link._acceptor, 'wrapper')
+        self.assertFalse(mock_reconnect.called)
+
+    @mock.patch.object(relay.Relay, '_reconnect')
+    def test_connect_failure(self, mock_reconnect):
+        link = self._relay(_app='app')
+        link._manager.connect.side_effect = TestException('test')
+
+        link._connect()
+
+        self.assertEqual(None, link._app)
+        mock_reconnect.assert_called_once_with()
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_reconnect(self, mock_spawn_later):
+        link = self._relay(_delay=40.0)
+
+        link._reconnect()
+
+        self.assertEqual('timer', link._timer)
+        self.assertEqual(relay.Relay.max_delay, link._delay)
+        mock_spawn_later.assert_called_once_with(40.0, link._connect)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_reconnect_pending(self, mock_spawn_later):
+        link = self._relay(_timer='pending')
+
+        link._reconnect()
+
+        self.assertEqual('pending', link._timer)
+        self.assertFalse(mock_spawn_later.called)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_reconnect_stopped(self, mock_spawn_later):
+        link = self._relay(_running=False)
+
+        link._reconnect()
+
+        self.assertEqual(None, link._timer)
+        self.assertFalse(mock_spawn_later.called)
+
+    @mock.patch.object(relay.Relay, '_connect')
+    def test_start(self, mock_connect):
+        link = self._relay(_running=False)
+
+        link.start()
+
+        self.assertEqual(True, link._running)
+        link._manager.start.assert_called_once_with()
+        mock_connect.assert_called_once_with()
+
+    @mock.patch.object(relay.Relay, '_connect')
+    def test_start_shared_manager(self, mock_connect):
+        link = self._relay(_running=False)
+        link._manager.running = True
+
+        link.start()
+
+        self.assertEqual(True, link._running)
+        self.assertFalse(link._manager.start.called)
+        mock_connect.assert_called_once_with()
+
+    @mock.patch.object(relay.Relay, '_connect')
+    def test_start_running(self, mock_connect):
+        link = self._relay()
+
+        self.assertRaises(ValueError, link.start)
+        self.assertFalse(link._manager.start.called)
+        self.assertFalse(mock_connect.called)
+
+    def test_stop(self):
+        timer = mock.Mock()
+        app = mock.Mock()
+        link = self._relay(_timer=timer, _app=app)
+
+        link.stop()
+
+        self.assertEqual(False, link._running)
+        self.assertEqual(None, link._timer)
+        self.assertEqual(None, link._app)
+        timer.kill.assert_called_once_with()
+        app.disconnect.assert_called_once_with()
+
+    def test_stop_notrunning(self):
+        app = mock.Mock()
+        link = self._relay(_running=False, _app=app)
+
+        link.stop()
+
+        self.assertFalse(app.disconnect.called)
+
+    def test_subscribed(self):
+        link = self._relay(_delay=16.0)
+
+        link.subscribed()
+
+        self.assertEqual(relay.Relay.min_delay, link._delay)
+
+    def test_notify(self):
+        msg = mock.Mock(id='some-id')
+        link = self._relay()
+
+        link.notify(msg)
+
+        self.assertEqual('some-id', link.last_id)
+        link._server.relay.assert_called_once_with(msg)
+
+    @mock.patch.object(relay.Relay, '_reconnect')
+    def test_closed(self, mock_reconnect):
+        link = self._relay(_app='app')
+
+        link.closed()
+
+        self.assertEqual(None, link._app)
+        mock_reconnect.assert_called_once_with()
+
+
+class StandbyTest(unittest.TestCase):
+    def _standby(self, **kwargs):
+        with mock.patch.object(relay.Standby, '__init__', return_value=None):
+            result = relay.Standby()
+
+        result._server = mock.Mock()
+        result._manager = mock.Mock(running=True)
+        result._app = None
+        result._timer = None
+        result._running = True
+        result._delay = relay.Standby.min_delay
+        result._failover = 2.5
+        result._failover_timer = None
+        for key, value in kwargs.items():
+            setattr(result, key, value)
+
+        return result
+
+    @mock.patch('tendril.get_manager', return_value='manager')
+    @mock.patch('heyu.util.outgoing_endpoint', return_value='endpoint')
+    def test_init(self, mock_outgoing_endpoint, mock_get_manager):
+        result = relay.Standby('server', 'hub', 'wrapper', 2.5)
+
+        self.assertEqual('server', result._server)
+        self.assertEqual('hub', result._hub)
+        self.assertEqual(2.5, result._failover)
+        self.assertEqual(None, result._failover_timer)
+        self.assertEqual(None, result.last_id)
+        self.assertEqual(0, result.since)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_arm(self, mock_spawn_later):
+        link = self._standby()
+
+        link._arm()
+
+        self.assertEqual('timer', link._failover_timer)
+        mock_spawn_later.assert_called_once_with(2.5, link._promote)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_arm_armed(self, mock_spawn_later):
+        link = self._standby(_failover_timer='armed')
+
+        link._arm()
+
+        self.assertEqual('armed', link._failover_timer)
+        self.assertFalse(mock_spawn_later.called)
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_arm_stopped(self, mock_spawn_later):
+        link = self._standby(_running=False)
+
+        link._arm()
+
+        self.assertEqual(None, link._failover_timer)
+        self.assertFalse(mock_spawn_later.called)
+
+    def test_disarm(self):
+        timer = mock.Mock()
+        link = self._standby(_failover_timer=timer)
+
+        link._disarm()
+
+        self.assertEqual(None, link._failover_timer)
+        timer.kill.assert_called_once_with()
+
+    @mock.patch.object(relay.Standby, 'stop')
+    def test_promote(self, mock_stop):
+        link = self._standby(_failover_timer='timer')
+
+        link._promote()
+
+        self.assertEqual(None, link._failover_timer)
+        mock_stop.assert_called_once_with()
+        link._server.promote.assert_called_once_with()
+
+    @mock.patch.object(relay.Relay, 'start')
+    @mock.patch.object(relay.Standby, '_arm')
+    def test_start(self, mock_arm, mock_start):
+        link = self._standby()
+
+        link.start()
+
+        mock_start.assert_called_once_with()
+        mock_arm.assert_called_once_with()
+
+    @mock.patch.object(relay.Relay, 'stop')
+    @mock.patch.object(relay.Standby, '_disarm')
+    def test_stop(self, mock_disarm, mock_stop):
+        link = self._standby()
+
+        link.stop()
+
+        mock_disarm.assert_called_once_with()
+        mock_stop.assert_called_once_with()
+
+    @mock.patch.object(relay.Standby, '_disarm')
+    def test_subscribed(self, mock_disarm):
+        link = self._standby(_delay=1.0)
+
+        link.subscribed()
+
+        self.assertEqual(relay.Standby.min_delay, link._delay)
+        mock_disarm.assert_called_once_with()
+
+    @mock.patch.object(relay.Relay, '_reconnect')
+    @mock.patch.object(relay.Standby, '_arm')
+    def test_closed(self, mock_arm, mock_reconnect):
+        link = self._standby(_app='app')
+
+        link.closed()
+
+        self.assertEqual(None, link._app)
+        mock_reconnect.assert_called_once_with()
+        mock_arm.assert_called_once_with()
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    @mock.patch.object(relay.Relay, '_reconnect')
+    def test_heartbeat_expired(self, mock_reconnect, mock_spawn_later):
+        link = self._standby()
+        with mock.patch.object(relay.RelayApplication, '__init__',
+                               return_value=None):
+            app = relay.RelayApplication()
+        app.relay = link
+        app.heartbeat = mock.Mock()
+        link._app = app
+
+        # The primary went quiet without closing the connection
+        with mock.patch.object(relay.RelayApplication, 'close') as mock_close:
+            app.expired()
+
+        mock_close.assert_called_once_with()
+        self.assertEqual(None, app.heartbeat)
+        self.assertEqual(None, link._app)
+        mock_reconnect.assert_called_once_with()
+        self.assertEqual('timer', link._failover_timer)
+        mock_spawn_later.assert_called_once_with(2.5, link._promote)
+
+
+class RelayApplicationTest(unittest.TestCase):
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }))
+    @mock.patch.object(relay.RelayApplication, 'send_frame')
+    def test_init(self, mock_send_frame, mock_Message, mock_COBSFramer,
+                  mock_init):
+        parent = mock.Mock()
+        link = mock.Mock(last_id=None, since=None, heartbeat=None)
+
+        result = relay.RelayApplication(parent, link, 'hub1')
+
+        self.assertEqual(link, result.relay)
+        self.assertEqual(None, result.heartbeat)
+        self.assertEqual('framer', parent.framers)
+        mock_init.assert_called_once_with(parent)
+        mock_Message.assert_called_once_with('subscribe', relay='hub1')
+        mock_send_frame.assert_called_once_with('some frame')
+
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }))
+    @mock.patch.object(relay.RelayApplication, 'send_frame')
+    def test_init_reconnect(self, mock_send_frame, mock_Message,
+                            mock_COBSFramer, mock_init):
+        parent = mock.Mock()
+        link = mock.Mock(last_id='last_id', since=0, heartbeat=None)
+
+        relay.RelayApplication(parent, link, 'hub1')
+
+        mock_Message.assert_called_once_with('subscribe', relay='hub1',
+                                             since_id='last_id')
+        mock_send_frame.assert_called_once_with('some frame')
+
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }))
+    @mock.patch.object(relay.RelayApplication, 'send_frame')
+    def test_init_since(self, mock_send_frame, mock_Message,
+                        mock_COBSFramer, mock_init):
+        parent = mock.Mock()
+        link = mock.Mock(last_id=None, since=0, heartbeat=None)
+
+        relay.RelayApplication(parent, link, 'hub1')
+
+        mock_Message.assert_called_once_with('subscribe', relay='hub1',
+                                             since=0)
+        mock_send_frame.assert_called_once_with('some frame')
+
+    @mock.patch('tendril.Application.__init__', return_value=None)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'some frame',
+    }))
+    @mock.patch.object(relay.RelayApplication, 'send_frame')
+    def test_init_heartbeat(self, mock_send_frame, mock_Message,
+                            mock_COBSFramer, mock_init):
+        parent = mock.Mock()
+        link = mock.Mock(last_id=None, since=None, heartbeat=5.0)
+
+        relay.RelayApplication(parent, link, 'hub1')
+
+        mock_Message.assert_called_once_with('subscribe', relay='hub1',
+                                             heartbeat=5.0)
+        mock_send_frame.assert_called_once_with('some frame')
+
+    def _app(self):
+        with mock.patch.object(relay.RelayApplication, '__init__',
+                               return_value=None):
+            app = relay.RelayApplication()
+        app.relay = mock.Mock()
+        app.heartbeat = None
+        return app
+
+    @mock.patch.object(protocol.Message, 'from_frame',
+                       side_effect=ValueError('failed to decode'))
+    @mock.patch.object(relay.RelayApplication, 'close')
+    def test_recv_frame_decodeerror(self, mock_close, mock_from_frame):
+        app = self._app()
+
+        app.recv_frame('test')
+
+        mock_close.assert_called_once_with()
+        app.relay.closed.assert_called_once_with()
+
+    @mock.patch.object(protocol.Message, 'from_frame')
+    @mock.patch.object(relay.RelayApplication, 'close')
+    def test_recv_frame_notify(self, mock_close, mock_from_frame):
+        msg = mock.Mock(msg_type='notify')
+        mock_from_frame.return_value = msg
+        app = self._app()
+
+        app.recv_frame('test')
+
+        app.relay.notify.assert_called_once_with(msg)
+        self.assertFalse(mock_close.called)
+
+    @mock.patch.object(protocol.Message, 'from_frame')
+    @mock.patch.object(relay.RelayApplication, 'close')
+    def test_recv_frame_notify_heartbeat(self, mock_close, mock_from_frame):
+        msg = mock.Mock(msg_type='notify')
+        mock_from_frame.return_value = msg
+        app = self._app()
+        hb = mock.Mock()
+        app.heartbeat = hb
+
+        app.recv_frame('test')
+
+        hb.received.assert_called_once_with()
+        app.relay.notify.assert_called_once_with(msg)
+
+    @mock.patch.object(relay.RelayApplication, 'send_frame')
+    @mock.patch.object(relay.RelayApplication, 'close')
+    def test_recv_frame_ping(self, mock_close, mock_send_frame):
+        app = self._app()
+
+        app.recv_frame(protocol.Message('ping').to_frame())
+
+        self.assertEqual(1, mock_send_frame.call_count)
+        pong = protocol.Message.from_frame(mock_send_frame.call_args[0][0])
+        self.assertEqual('pong', pong.msg_type)
+        self.assertFalse(mock_close.called)
+        self.assertFalse(app.relay.method_calls)
+
+    @mock.patch.object(protocol.Message, 'from_frame',
+                       return_value=mock.Mock(msg_type='subscribed',
+                                              heartbeat=None))
+    @mock.patch.object(relay.RelayApplication, 'close')
+    def test_recv_frame_subscribed(self, mock_close, mock_from_frame):
+        app = self._app()
+
+        app.recv_frame('test')
+
+        self.assertEqual(None, app.heartbeat)
+        app.relay.subscribed.assert_called_once_with()
+        self.assertFalse(mock_close.called)
+
+    @mock.patch('heyu.heartbeat.Heartbeat')
+    @mock.patch.object(protocol.Message, 'from_frame',
+                       return_value=mock.Mock(msg_type='subscribed',
+                                              heartbeat=5.0))
+    @mock.patch.object(relay.RelayApplication, 'close')
+    def test_recv_frame_subscribed_heartbeat(self, mock_close,
+                                             mock_from_frame,
+                                             mock_Heartbeat):
+        app = self._app()
+
+        app.recv_frame('test')
+
+        mock_Heartbeat.assert_called_once_with(app, 5.0, 3, False)
+        mock_Heartbeat.return_value.start.assert_called_once_with()
+        self.assertEqual(mock_Heartbeat.return_value, app.heartbeat)
+        app.relay.subscribed.assert_called_once_with()
+        self.assertFalse(mock_close.called)
+
+    @mock.patch.object(protocol.Message, 'from_frame',
+                       return_value=mock.Mock(msg_type='goodbye'))
+    @mock.patch.object(relay.RelayApplication, 'close')
+    def test_recv_frame_goodbye(self, mock_close, mock_from_frame):
+        app = self._app()
+        hb = mock.Mock()
+        app.heartbeat = hb
+
+        app.recv_frame('test')
+
+        hb.stop.assert_called_once_with()
+        self.assertEqual(None, app.heartbeat)
+        mock_close.assert_called_once_with()
+        app.relay.closed.assert_called_once_with()
+
+    @mock.patch.object(protocol.Message, 'from_frame',
+                       return_value=mock.Mock(msg_type='error'))
+    @mock.patch.object(relay.RelayApplication, 'close')
+    def test_recv_frame_error(self, mock_close, mock_from_frame):
+        app = self._app()
+
+        app.recv_frame('test')
+
+        mock_close.assert_called_once_with()
+        app.relay.closed.assert_called_once_with()
+
+    @mock.patch.object(protocol.Message, 'from_frame',
+                       return_value=mock.Mock(msg_type='accepted'))
+    @mock.patch.object(relay.RelayApplication, 'close')
+    def test_recv_frame_other(self, mock_close, mock_from_frame):
+        app = self._app()
+
+        app.recv_frame('test')
+
+        self.assertFalse(mock_close.called)
+        self.assertFalse(app.relay.method_calls)
+
+    @mock.patch.object(relay.RelayApplication, 'send_frame',
+                       side_effect=TestException('test'))
+    @mock.patch.object(relay.RelayApplication, 'close')
+    def test_disconnect(self, mock_close, mock_send_frame):
+        app = self._app()
+        hb = mock.Mock()
+        app.heartbeat = hb
+
+        app.disconnect()
+
+        hb.stop.assert_called_once_with()
+        self.assertEqual(None, app.heartbeat)
+        self.assertEqual(1, mock_send_frame.call_count)
+        mock_close.assert_called_once_with()
+
+    @mock.patch.object(relay.RelayApplication, 'close')
+    def test_expired(self, mock_close):
+        app = self._app()
+        app.heartbeat = 'heartbeat'
+
+        app.expired()
+
+        self.assertEqual(None, app.heartbeat)
+        mock_close.assert_called_once_with()
+        app.relay.closed.assert_called_once_with()
+
+    def test_closed(self):
+        app = self._app()
+
+        app.closed(None)
+
+        app.relay.closed.assert_called_once_with()
+
+    def test_closed_heartbeat(self):
+        app = self._app()
+        hb = mock.Mock()
+        app.heartbeat = hb
+
+        app.closed(None)
+
+        hb.stop.assert_called_once_with()
+        self.assertEqual(None, app.heartbeat)
+        app.relay.closed.assert_called_once_with()
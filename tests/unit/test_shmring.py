@@ -0,0 +1,157 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from heyu import shmring
+
+
+class RingTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'ring')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _writer(self, size=64):
+        writer = shmring.RingWriter(self.path, size)
+        writer.open()
+        self.addCleanup(writer.close)
+        return writer
+
+    def test_open(self):
+        writer = self._writer()
+
+        self.assertEqual(0, writer.head)
+        self.assertEqual(0o644, stat.S_IMODE(os.stat(self.path).st_mode))
+        self.assertEqual(shmring._header.size + 64,
+                         os.path.getsize(self.path))
+
+    def test_open_stale(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'stale')
+
+        self._writer()
+
+        reader = shmring.RingReader(self.path)
+        self.assertEqual(64, reader.size)
+
+    def test_close(self):
+        writer = self._writer()
+
+        writer.close()
+
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(writer.write(b'frame'))
+
+    def test_roundtrip(self):
+        writer = self._writer()
+        reader = shmring.RingReader(self.path)
+
+        self.assertTrue(writer.write(b'frame1'))
+        self.assertTrue(writer.write(b'frame2'))
+
+        self.assertEqual([b'frame1', b'frame2'], reader.read())
+        self.assertEqual([], reader.read())
+        self.assertEqual(writer.head, reader.position)
+        self.assertEqual(0, reader.overruns)
+
+    def test_reader_starts_at_head(self):
+        writer = self._writer()
+        writer.write(b'frame1')
+        reader = shmring.RingReader(self.path)
+
+        writer.write(b'frame2')
+
+        self.assertEqual([b'frame2'], reader.read())
+
+    def test_wrap(self):
+        writer = self._writer()
+        reader = shmring.RingReader(self.path)
+
+        for i in range(10):
+            frame = ('frame%d' % i).encode('ascii') * 3
+            self.assertTrue(writer.write(frame))
+            self.assertEqual([frame], reader.read())
+
+        self.assertEqual(0, reader.overruns)
+
+    def test_overrun(self):
+        writer = self._writer()
+        reader = shmring.RingReader(self.path)
+
+        for i in range(10):
+            writer.write(('frame%d' % i).encode('ascii') * 3)
+
+        self.assertEqual([], reader.read())
+        self.assertEqual(1, reader.overruns)
+        self.assertEqual(writer.head, reader.position)
+
+        writer.write(b'frame')
+
+        self.assertEqual([b'frame'], reader.read())
+
+    def test_reserved(self):
+        writer = self._writer()
+        reader = shmring.RingReader(self.path)
+
+        writer.write(b'frame1')
+
+        self.assertEqual(writer.head, reader.reserved)
+
+    def test_overwritten_while_copying(self):
+        writer = self._writer()
+        reader = shmring.RingReader(self.path)
+        writer.write(b'frame1')
+        writer.write(b'frame2')
+
+        # The writer has started on a record that reaches into the
+        # first one, but hasn't published it yet
+        writer._set(shmring._RESERVE_OFFSET, 64 + 4)
+
+        self.assertEqual([b'frame2'], reader.read())
+        self.assertEqual(1, reader.overruns)
+        self.assertEqual(writer.head, reader.position)
+
+    def test_oversize(self):
+        writer = self._writer()
+
+        self.assertFalse(writer.write(b'x' * 61))
+        self.assertTrue(writer.write(b'x' * 60))
+        self.assertEqual(64, writer.head)
+
+    def test_missing(self):
+        self.assertRaises(shmring.RingException, shmring.RingReader,
+                          self.path)
+
+    def test_truncated(self):
+        with open(self.path, 'wb') as f:
+            f.write(shmring.MAGIC)
+
+        self.assertRaises(shmring.RingException, shmring.RingReader,
+                          self.path)
+
+    def test_bad_magic(self):
+        with open(self.path, 'wb') as f:
+            f.write(shmring._header.pack(b'NotARing', 16, 0, 0) +
+                    b'\0' * 16)
+
+        self.assertRaises(shmring.RingException, shmring.RingReader,
+                          self.path)
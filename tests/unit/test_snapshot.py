@@ -0,0 +1,84 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import unittest
+
+import mock
+
+from heyu import snapshot
+
+
+class SnapshotTest(unittest.TestCase):
+    def test_init(self):
+        result = snapshot.Snapshot(5)
+
+        self.assertEqual(5, result.size)
+        self.assertEqual(0, len(result))
+
+    def test_update(self):
+        result = snapshot.Snapshot(5)
+
+        result.update('id1', 'frame1')
+        result.update('id2', 'frame2', 160)
+
+        self.assertEqual(2, len(result))
+        self.assertEqual([
+            ('id1', ('frame1', None)),
+            ('id2', ('frame2', 160)),
+        ], list(result._entries.items()))
+
+    def test_update_replace(self):
+        result = snapshot.Snapshot(5)
+        result.update('id1', 'frame1')
+        result.update('id2', 'frame2')
+
+        result.update('id1', 'frame3')
+
+        self.assertEqual(2, len(result))
+        self.assertEqual([
+            ('id2', ('frame2', None)),
+            ('id1', ('frame3', None)),
+        ], list(result._entries.items()))
+
+    def test_update_bounded(self):
+        result = snapshot.Snapshot(2)
+        result.update('id1', 'frame1')
+        result.update('id2', 'frame2')
+        result.update('id1', 'frame3')
+
+        result.update('id3', 'frame4')
+
+        self.assertEqual(2, len(result))
+        self.assertEqual([
+            ('id1', ('frame3', None)),
+            ('id3', ('frame4', None)),
+        ], list(result._entries.items()))
+
+    @mock.patch('time.time', return_value=150.0)
+    def test_frames(self, mock_time):
+        result = snapshot.Snapshot(5)
+        result.update('id1', 'frame1', 160)
+        result.update('id2', 'frame2', 150)
+        result.update('id3', 'frame3')
+        result.update('id1', 'frame4', 160)
+
+        self.assertEqual(['frame3', 'frame4'], result.frames())
+        self.assertEqual(2, len(result))
+
+    def test_frames_empty(self):
+        result = snapshot.Snapshot(5)
+
+        self.assertEqual([], result.frames())
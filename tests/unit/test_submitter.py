@@ -15,13 +15,17 @@
 
 from __future__ import print_function
 
+import socket
 import sys
+import time
 import unittest
 
 import mock
 
 from heyu import protocol
 from heyu import submitter
+from heyu import udp
+from heyu import unix
 from heyu import util
 
 
@@ -62,6 +66,59 @@ class SubmitterApplicationTest(unittest.TestCase):
             urgency='urgency', category='category', id='id')
         mock_send_frame.assert_called_once_with('message')
 
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'message',
+    }))
+    @mock.patch.object(submitter.SubmitterApplication, 'send_frame')
+    def test_init_ttl(self, mock_send_frame, mock_Message, mock_COBSFramer,
+                      mock_time):
+        parent = mock.Mock()
+
+        submitter.SubmitterApplication(parent, 'app', 'summary', 'body',
+                                       ttl=60.0)
+
+        mock_Message.assert_called_once_with(
+            'notify', app_name='app', summary='summary', body='body',
+            ttl=60.0)
+        mock_send_frame.assert_called_once_with('message')
+
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'message',
+    }))
+    @mock.patch.object(submitter.SubmitterApplication, 'send_frame')
+    def test_init_deliver_at(self, mock_send_frame, mock_Message,
+                             mock_COBSFramer, mock_time):
+        parent = mock.Mock()
+
+        submitter.SubmitterApplication(parent, 'app', 'summary', 'body',
+                                       ttl=60.0, deliver_at=2000.0)
+
+        mock_Message.assert_called_once_with(
+            'notify', app_name='app', summary='summary', body='body',
+            deliver_at=2000.0, ttl=60.0)
+        mock_send_frame.assert_called_once_with('message')
+
+    @mock.patch('tendril.COBSFramer', return_value='framer')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'message',
+    }))
+    @mock.patch.object(submitter.SubmitterApplication, 'send_frame')
+    def test_init_delay(self, mock_send_frame, mock_Message,
+                        mock_COBSFramer):
+        parent = mock.Mock()
+
+        submitter.SubmitterApplication(parent, 'app', 'summary', 'body',
+                                       ttl=60.0, delay=30.0)
+
+        mock_Message.assert_called_once_with(
+            'notify', app_name='app', summary='summary', body='body',
+            ttl=60.0, delay=30.0)
+        mock_send_frame.assert_called_once_with('message')
+
     @mock.patch.object(submitter.SubmitterApplication, '__init__',
                        return_value=None)
     @mock.patch.object(submitter.SubmitterApplication, 'close')
@@ -151,7 +208,7 @@ class SendNotificationTest(unittest.TestCase):
         ])
         mock_TendrilPartial.assert_called_once_with(
             submitter.SubmitterApplication,
-            'app', 'summary', 'body', None, None, None)
+            'app', 'summary', 'body', None, None, None, None, None, None)
         mock_cert_wrapper.assert_called_once_with(
             None, 'submitter', secure=True)
         mock_wait.assert_called_once_with()
@@ -165,7 +222,8 @@ class SendNotificationTest(unittest.TestCase):
                    mock_cert_wrapper, mock_outgoing_endpoint, mock_wait):
         submitter.send_notification('hub', 'app', 'summary', 'body',
                                     'urgency', 'category', 'id',
-                                    'cert_conf', False)
+                                    'cert_conf', False, ttl=60.0,
+                                    deliver_at=2000.0, delay=30.0)
 
         mock_outgoing_endpoint.assert_called_once_with('hub')
         mock_get_manager.assert_called_once_with('tcp', 'outgoing')
@@ -175,16 +233,70 @@ class SendNotificationTest(unittest.TestCase):
         ])
         mock_TendrilPartial.assert_called_once_with(
             submitter.SubmitterApplication,
-            'app', 'summary', 'body', 'urgency', 'category', 'id')
+            'app', 'summary', 'body', 'urgency', 'category', 'id', 60.0,
+            2000.0, 30.0)
         mock_cert_wrapper.assert_called_once_with(
             'cert_conf', 'submitter', secure=False)
         mock_wait.assert_called_once_with()
 
+    @mock.patch('gevent.wait')
+    @mock.patch.object(util, 'cert_wrapper', return_value='wrapper')
+    @mock.patch.object(unix, 'UnixTendrilManager')
+    @mock.patch('tendril.get_manager')
+    @mock.patch('tendril.TendrilPartial', return_value='the_app')
+    def test_unix_socket(self, mock_TendrilPartial, mock_get_manager,
+                         mock_UnixTendrilManager, mock_cert_wrapper,
+                         mock_wait):
+        submitter.send_notification('hub', 'app', 'summary', 'body',
+                                    unix_socket='/path/to/sock')
+
+        self.assertFalse(mock_get_manager.called)
+        self.assertFalse(mock_cert_wrapper.called)
+        mock_UnixTendrilManager.assert_called_once_with()
+        mock_UnixTendrilManager.return_value.assert_has_calls([
+            mock.call.start(),
+            mock.call.connect('/path/to/sock', 'the_app'),
+        ])
+        mock_wait.assert_called_once_with()
+
+    @mock.patch('gevent.wait')
+    @mock.patch('gevent.socket.socket')
+    @mock.patch('tendril.addr_info', return_value='family')
+    @mock.patch('heyu.ulid.generate', return_value='some-ulid')
+    @mock.patch.object(udp, 'read_key', return_value='key')
+    @mock.patch.object(udp, 'seal', return_value='datagram')
+    @mock.patch.object(protocol, 'Message', return_value=mock.Mock(**{
+        'to_frame.return_value': 'message',
+    }))
+    @mock.patch('tendril.get_manager')
+    @mock.patch('__builtin__.print')
+    def test_udp(self, mock_print, mock_get_manager, mock_Message, mock_seal,
+                 mock_read_key, mock_generate, mock_addr_info, mock_socket,
+                 mock_wait):
+        sock = mock_socket.return_value
+
+        submitter.send_notification(('hub', 1234), 'app', 'summary', 'body',
+                                    udp_key_file='/key')
+
+        mock_Message.assert_called_once_with(
+            'notify', app_name='app', summary='summary', body='body',
+            id='some-ulid')
+        mock_read_key.assert_called_once_with('/key')
+        mock_seal.assert_called_once_with('key', 'message')
+        mock_addr_info.assert_called_once_with(('hub', 1234))
+        mock_socket.assert_called_once_with('family', socket.SOCK_DGRAM)
+        sock.sendto.assert_called_once_with('datagram', ('hub', 1234))
+        sock.close.assert_called_once_with()
+        mock_print.assert_called_once_with('some-ulid')
+        self.assertFalse(mock_get_manager.called)
+        self.assertFalse(mock_wait.called)
+
 
 class NormalizeArgsTest(unittest.TestCase):
     @mock.patch('sys.argv', ['my/submitter'])
     def test_defaults(self):
-        args = mock.Mock(app_name=None, urgency=None)
+        args = mock.Mock(app_name=None, urgency=None, loop=None,
+                         delay=None, at=None)
 
         submitter._normalize_args(args)
 
@@ -193,7 +305,8 @@ class NormalizeArgsTest(unittest.TestCase):
 
     @mock.patch('sys.argv', ['my/submitter'])
     def test_given_app_name(self):
-        args = mock.Mock(app_name='myapp', urgency=None)
+        args = mock.Mock(app_name='myapp', urgency=None, loop=None,
+                         delay=None, at=None)
 
         submitter._normalize_args(args)
 
@@ -202,7 +315,8 @@ class NormalizeArgsTest(unittest.TestCase):
 
     @mock.patch('sys.argv', ['my/submitter'])
     def test_given_urgency(self):
-        args = mock.Mock(app_name=None, urgency='LoW')
+        args = mock.Mock(app_name=None, urgency='LoW', loop=None,
+                         delay=None, at=None)
 
         submitter._normalize_args(args)
 
@@ -211,7 +325,91 @@ class NormalizeArgsTest(unittest.TestCase):
 
     @mock.patch('sys.argv', ['my/submitter'])
     def test_bad_urgency(self):
-        args = mock.Mock(app_name=None, urgency='High')
+        args = mock.Mock(app_name=None, urgency='High', loop=None,
+                         delay=None, at=None)
 
         self.assertRaises(submitter.SubmitterException,
                           submitter._normalize_args, args)
+
+    @mock.patch('sys.argv', ['my/submitter'])
+    @mock.patch('heyu.loops.select')
+    def test_loop(self, mock_select):
+        args = mock.Mock(app_name=None, urgency=None, loop='libuv',
+                         delay=None, at=None)
+
+        submitter._normalize_args(args)
+
+        mock_select.assert_called_once_with('libuv')
+
+    @mock.patch('sys.argv', ['my/submitter'])
+    def test_delay(self):
+        args = mock.Mock(app_name=None, urgency=None, loop=None,
+                         delay=60.0, at=None)
+
+        submitter._normalize_args(args)
+
+        self.assertEqual(None, args.deliver_at)
+        self.assertEqual(60.0, args.delay)
+
+    @mock.patch('sys.argv', ['my/submitter'])
+    @mock.patch.object(submitter, 'parse_time', return_value=2000.0)
+    def test_at(self, mock_parse_time):
+        args = mock.Mock(app_name=None, urgency=None, loop=None,
+                         delay=None, at='09:00')
+
+        submitter._normalize_args(args)
+
+        self.assertEqual(2000.0, args.deliver_at)
+        mock_parse_time.assert_called_once_with('09:00')
+
+    @mock.patch('sys.argv', ['my/submitter'])
+    def test_no_deliver_at(self):
+        args = mock.Mock(app_name=None, urgency=None, loop=None,
+                         delay=None, at=None)
+
+        submitter._normalize_args(args)
+
+        self.assertEqual(None, args.deliver_at)
+
+    @mock.patch('sys.argv', ['my/submitter'])
+    def test_delay_and_at(self):
+        args = mock.Mock(app_name=None, urgency=None, loop=None,
+                         delay=60.0, at='09:00')
+
+        self.assertRaises(submitter.SubmitterException,
+                          submitter._normalize_args, args)
+
+
+class ParseTimeTest(unittest.TestCase):
+    def _now(self, hour, minute, second=0):
+        return time.mktime((2015, 3, 31, hour, minute, second, 0, 0, -1))
+
+    def test_today(self):
+        result = submitter.parse_time('09:30', self._now(8, 0))
+
+        self.assertEqual(self._now(9, 30), result)
+
+    def test_seconds(self):
+        result = submitter.parse_time('09:30:15', self._now(9, 30))
+
+        self.assertEqual(self._now(9, 30, 15), result)
+
+    def test_tomorrow(self):
+        result = submitter.parse_time('09:30', self._now(9, 30))
+
+        self.assertEqual(time.mktime((2015, 4, 1, 9, 30, 0, 0, 0, -1)),
+                         result)
+
+    @mock.patch('time.time')
+    def test_default_now(self, mock_time):
+        mock_time.return_value = self._now(8, 0)
+
+        result = submitter.parse_time('09:30')
+
+        self.assertEqual(self._now(9, 30), result)
+
+    def test_invalid(self):
+        for value in ('9', '09:30:15:00', 'nine:30', '24:00', '09:60',
+                      '09:30:60', '-1:30'):
+            self.assertRaises(submitter.SubmitterException,
+                              submitter.parse_time, value)
@@ -0,0 +1,161 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import unittest
+
+from heyu import timingwheel
+
+
+class TimingWheelTest(unittest.TestCase):
+    def test_init(self):
+        result = timingwheel.TimingWheel(1000.5, 0.5, 8, 3)
+
+        self.assertEqual(0.5, result.resolution)
+        self.assertEqual(8, result._slots)
+        self.assertEqual([1, 8, 64], result._spans)
+        self.assertEqual(2001, result._tick)
+        self.assertEqual(3, len(result._wheels))
+        self.assertEqual([[]] * 8, result._wheels[0])
+        self.assertEqual(0, len(result))
+
+    def test_init_defaults(self):
+        result = timingwheel.TimingWheel(1000.5)
+
+        self.assertEqual(1.0, result.resolution)
+        self.assertEqual(64, result._slots)
+        self.assertEqual([1, 64, 4096, 262144], result._spans)
+        self.assertEqual(1000, result._tick)
+
+    def test_add(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 8, 3)
+
+        wheel.add(1001.0, 'a')
+        wheel.add(1006.5, 'b')
+        wheel.add(1008.0, 'c')
+        wheel.add(1063.0, 'd')
+        wheel.add(1064.0, 'e')
+
+        self.assertEqual(5, len(wheel))
+        self.assertEqual([(1001, 'a')], wheel._wheels[0][1001 % 8])
+        self.assertEqual([(1007, 'b')], wheel._wheels[0][1007 % 8])
+        self.assertEqual([(1008, 'c')], wheel._wheels[1][(1008 // 8) % 8])
+        self.assertEqual([(1063, 'd')], wheel._wheels[1][(1063 // 8) % 8])
+        self.assertEqual([(1064, 'e')], wheel._wheels[2][(1064 // 64) % 8])
+
+    def test_add_past(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 8, 3)
+
+        wheel.add(900.0, 'a')
+
+        self.assertEqual([(1001, 'a')], wheel._wheels[0][1001 % 8])
+
+    def test_add_beyond_range(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 8, 2)
+
+        wheel.add(2000.0, 'a')
+
+        self.assertEqual([(2000, 'a')], wheel._wheels[1][(1063 // 8) % 8])
+
+    def test_add_idle(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 8, 3)
+        now = 1000.0 + 30 * 86400
+
+        wheel.add(now + 2.0, 'a', now)
+
+        self.assertEqual(int(now), wheel._tick)
+        self.assertEqual([(int(now) + 2, 'a')],
+                         wheel._wheels[0][(int(now) + 2) % 8])
+        self.assertEqual([], wheel.advance(now + 1.0))
+        self.assertEqual(['a'], wheel.advance(now + 2.0))
+
+    def test_add_idle_not_empty(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 8, 3)
+        wheel.add(1001.0, 'a')
+
+        wheel.add(1002.0, 'b', 1500.0)
+
+        self.assertEqual(1000, wheel._tick)
+        self.assertEqual(['a', 'b'], wheel.advance(1500.0))
+
+    def test_add_now_behind(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 8, 3)
+
+        wheel.add(1001.0, 'a', 900.0)
+
+        self.assertEqual(1000, wheel._tick)
+        self.assertEqual([(1001, 'a')], wheel._wheels[0][1001 % 8])
+
+    def test_advance(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 8, 3)
+        wheel.add(1001.0, 'a')
+        wheel.add(1002.5, 'b')
+        wheel.add(1003.0, 'c')
+        wheel.add(1100.0, 'd')
+
+        self.assertEqual([], wheel.advance(1000.9))
+        self.assertEqual(['a'], wheel.advance(1002.9))
+        self.assertEqual(['b', 'c'], wheel.advance(1003.0))
+        self.assertEqual([], wheel.advance(1099.9))
+        self.assertEqual(1, len(wheel))
+        self.assertEqual(['d'], wheel.advance(1100.0))
+        self.assertEqual(0, len(wheel))
+
+    def test_advance_order(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 4, 3)
+        wheel.add(1040.0, 'c')
+        wheel.add(1005.0, 'a')
+        wheel.add(1020.0, 'b')
+        wheel.add(1040.0, 'd')
+
+        self.assertEqual(['a', 'b', 'c', 'd'], wheel.advance(1050.0))
+
+    def test_advance_beyond_range(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 4, 2)
+        wheel.add(1100.0, 'a')
+
+        self.assertEqual([], wheel.advance(1099.0))
+        self.assertEqual(['a'], wheel.advance(1100.0))
+
+    def test_advance_one_level(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 4, 1)
+        wheel.add(1010.0, 'a')
+
+        self.assertEqual([], wheel.advance(1009.0))
+        self.assertEqual(['a'], wheel.advance(1010.0))
+
+    def test_advance_empty(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 8, 3)
+
+        self.assertEqual([], wheel.advance(1000000.0))
+        self.assertEqual(1000000, wheel._tick)
+
+    def test_advance_backwards(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 8, 3)
+        wheel.add(1001.0, 'a')
+
+        self.assertEqual([], wheel.advance(900.0))
+        self.assertEqual(1000, wheel._tick)
+        self.assertEqual(['a'], wheel.advance(1001.0))
+
+    def test_clear(self):
+        wheel = timingwheel.TimingWheel(1000.0, 1.0, 8, 3)
+        wheel.add(1001.0, 'a')
+        wheel.add(1100.0, 'b')
+
+        wheel.clear()
+
+        self.assertEqual(0, len(wheel))
+        self.assertEqual([], wheel.advance(1100.0))
@@ -0,0 +1,268 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import unittest
+
+import mock
+
+from heyu import protocol
+from heyu import udp
+
+
+class ReadKeyTest(unittest.TestCase):
+    @mock.patch('__builtin__.open', mock.mock_open(read_data='secret\n'))
+    def test_read(self):
+        self.assertEqual('secret', udp.read_key('/key'))
+
+    @mock.patch('__builtin__.open', mock.mock_open(read_data='\n'))
+    def test_empty(self):
+        self.assertRaises(udp.UDPException, udp.read_key, '/key')
+
+    @mock.patch('__builtin__.open', side_effect=IOError('no such file'))
+    def test_missing(self, mock_open):
+        self.assertRaises(udp.UDPException, udp.read_key, '/key')
+
+
+class SealTest(unittest.TestCase):
+    def test_roundtrip(self):
+        listener = udp.UDPListener('server', ('', 0), 'key')
+
+        datagram = udp.seal('key', 'payload', 1000.0, 42)
+
+        self.assertEqual('payload', listener.unseal(datagram, 1001.0))
+
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch('os.urandom', return_value='\0' * 7 + '\x2a')
+    def test_defaults(self, mock_urandom, mock_time):
+        self.assertEqual(udp.seal('key', 'payload', 1000.0, 42),
+                         udp.seal('key', 'payload'))
+        mock_urandom.assert_called_once_with(8)
+
+    def test_too_short(self):
+        listener = udp.UDPListener('server', ('', 0), 'key')
+
+        self.assertRaises(udp.UDPException, listener.unseal, 'short', 1000.0)
+
+    def test_bad_key(self):
+        listener = udp.UDPListener('server', ('', 0), 'key')
+
+        datagram = udp.seal('other', 'payload', 1000.0, 42)
+
+        self.assertRaises(udp.UDPException, listener.unseal, datagram,
+                          1000.0)
+
+    def test_tampered(self):
+        listener = udp.UDPListener('server', ('', 0), 'key')
+
+        datagram = udp.seal('key', 'payload', 1000.0, 42)[:-1] + 'X'
+
+        self.assertRaises(udp.UDPException, listener.unseal, datagram,
+                          1000.0)
+
+    def test_replayed(self):
+        listener = udp.UDPListener('server', ('', 0), 'key')
+
+        datagram = udp.seal('key', 'payload', 1000.0, 42)
+        listener.unseal(datagram, 1000.0)
+
+        self.assertRaises(udp.UDPException, listener.unseal, datagram,
+                          1001.0)
+
+
+class ReplayCacheTest(unittest.TestCase):
+    def test_check(self):
+        cache = udp.ReplayCache(30.0)
+
+        self.assertTrue(cache.check(1000.0, 1, 1000.0))
+        self.assertTrue(cache.check(1000.0, 2, 1000.0))
+        self.assertFalse(cache.check(1000.0, 1, 1001.0))
+        self.assertEqual(2, len(cache))
+
+    def test_stale(self):
+        cache = udp.ReplayCache(30.0)
+
+        self.assertFalse(cache.check(1000.0, 1, 1031.0))
+        self.assertFalse(cache.check(1031.0, 1, 1000.0))
+        self.assertEqual(0, len(cache))
+
+    def test_expire(self):
+        cache = udp.ReplayCache(30.0)
+        cache.check(1000.0, 1, 1000.0)
+        cache.check(1020.0, 2, 1020.0)
+
+        self.assertTrue(cache.check(1040.0, 3, 1040.0))
+        self.assertEqual(2, len(cache))
+
+    def test_max_nonces(self):
+        cache = udp.ReplayCache(30.0)
+        cache.max_nonces = 2
+        cache.check(1000.0, 1, 1000.0)
+        cache.check(1010.0, 2, 1010.0)
+
+        self.assertFalse(cache.check(1020.0, 3, 1020.0))
+        self.assertFalse(cache.check(1020.0, 1, 1020.0))
+        self.assertEqual(2, len(cache))
+        self.assertTrue(cache.check(1035.0, 3, 1035.0))
+        self.assertEqual(2, len(cache))
+
+
+class UDPListenerTest(unittest.TestCase):
+    def _server(self):
+        server = mock.Mock(metrics=collections.defaultdict(mock.Mock))
+        server.name = 'hub1'
+        return server
+
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch('heyu.ulid.generate', return_value='some-ulid')
+    def test_handle(self, mock_generate, mock_time):
+        server = self._server()
+        listener = udp.UDPListener(server, ('', 0), 'key')
+        listener._fqdn = 'fqdn'
+        msg = protocol.Message('notify', app_name='app', summary='summary',
+                               body='body', urgency=2, category='cat',
+                               expires=2000.0, deliver_at=1500.0)
+        datagram = udp.seal('key', msg.to_frame(), 1000.0, 42)
+
+        listener._handle(datagram, ('10.0.0.1', 4321))
+
+        self.assertEqual(1, server.submit.call_count)
+        notif = server.submit.call_args[0][0]
+        self.assertEqual('some-ulid', notif.id)
+        self.assertEqual('[10.0.0.1]app', notif.app_name)
+        self.assertEqual('summary', notif.summary)
+        self.assertEqual('body', notif.body)
+        self.assertEqual(2, notif.urgency)
+        self.assertEqual('cat', notif.category)
+        self.assertEqual(['hub1'], notif.path)
+        self.assertEqual(2000.0, notif.expires)
+        self.assertEqual(1500.0, notif.deliver_at)
+        server.throttle.assert_called_once_with('10.0.0.1', 'app')
+        server.metrics['udp_datagrams'].inc.assert_called_once_with()
+        server.metrics['bytes_in'].inc.assert_called_once_with(
+            len(datagram))
+        self.assertFalse(server.metrics['udp_rejected'].inc.called)
+        self.assertFalse(server.metrics['submit_errors'].inc.called)
+
+    @mock.patch('time.time', return_value=1000.0)
+    def test_handle_ttl(self, mock_time):
+        server = self._server()
+        listener = udp.UDPListener(server, ('', 0), 'key')
+        msg = protocol.Message('notify', id='notif-id', app_name='app',
+                               summary='summary', body='body', ttl=60.0,
+                               deliver_at=1500.0)
+        datagram = udp.seal('key', msg.to_frame(), 1000.0, 42)
+
+        listener._handle(datagram, ('10.0.0.1', 4321))
+
+        notif = server.submit.call_args[0][0]
+        self.assertEqual(1560.0, notif.expires)
+        self.assertEqual(1500.0, notif.deliver_at)
+
+    @mock.patch('time.time', return_value=1000.0)
+    def test_handle_delay(self, mock_time):
+        server = self._server()
+        listener = udp.UDPListener(server, ('', 0), 'key')
+        msg = protocol.Message('notify', id='notif-id', app_name='app',
+                               summary='summary', body='body', ttl=60.0,
+                               delay=30.0)
+        datagram = udp.seal('key', msg.to_frame(), 1000.0, 42)
+
+        listener._handle(datagram, ('10.0.0.1', 4321))
+
+        notif = server.submit.call_args[0][0]
+        self.assertEqual(1030.0, notif.deliver_at)
+        self.assertEqual(1090.0, notif.expires)
+
+    @mock.patch('time.time', return_value=1000.0)
+    @mock.patch('socket.getfqdn')
+    def test_handle_local(self, mock_getfqdn, mock_time):
+        server = self._server()
+        listener = udp.UDPListener(server, ('', 0), 'key')
+        listener._fqdn = 'fqdn'
+        msg = protocol.Message('notify', id='notif-id', app_name='app',
+                               summary='summary', body='body')
+        datagram = udp.seal('key', msg.to_frame(), 1000.0, 42)
+
+        listener._handle(datagram, ('127.0.0.1', 4321))
+
+        notif = server.submit.call_args[0][0]
+        self.assertEqual('notif-id', notif.id)
+        self.assertEqual('[fqdn]app', notif.app_name)
+        server.throttle.assert_called_once_with('fqdn', 'app')
+        self.assertFalse(mock_getfqdn.called)
+
+    @mock.patch('time.time', return_value=1000.0)
+    def test_handle_rejected(self, mock_time):
+        server = self._server()
+        listener = udp.UDPListener(server, ('', 0), 'key')
+        msg = protocol.Message('notify', app_name='app', summary='summary',
+                               body='body')
+        datagram = udp.seal('other', msg.to_frame(), 1000.0, 42)
+
+        listener._handle(datagram, ('10.0.0.1', 4321))
+
+        self.assertFalse(server.submit.called)
+        server.metrics['udp_rejected'].inc.assert_called_once_with()
+
+    @mock.patch('time.time', return_value=1000.0)
+    def test_handle_wrong_type(self, mock_time):
+        server = self._server()
+        listener = udp.UDPListener(server, ('', 0), 'key')
+        msg = protocol.Message('subscribe')
+        datagram = udp.seal('key', msg.to_frame(), 1000.0, 42)
+
+        listener._handle(datagram, ('10.0.0.1', 4321))
+
+        self.assertFalse(server.submit.called)
+        server.metrics['udp_rejected'].inc.assert_called_once_with()
+
+    @mock.patch('time.time', return_value=1000.0)
+    def test_handle_submit_error(self, mock_time):
+        server = self._server()
+        server.throttle.side_effect = Exception('rate limited')
+        listener = udp.UDPListener(server, ('', 0), 'key')
+        msg = protocol.Message('notify', app_name='app', summary='summary',
+                               body='body')
+        datagram = udp.seal('key', msg.to_frame(), 1000.0, 42)
+
+        listener._handle(datagram, ('10.0.0.1', 4321))
+
+        self.assertFalse(server.submit.called)
+        server.metrics['submit_errors'].inc.assert_called_once_with()
+
+    @mock.patch('socket.getfqdn', return_value='fqdn')
+    @mock.patch('gevent.server.DatagramServer')
+    def test_start_stop(self, mock_DatagramServer, mock_getfqdn):
+        listener = udp.UDPListener('server', ('', 5000), 'key')
+
+        listener.start()
+
+        self.assertEqual('fqdn', listener._fqdn)
+        mock_DatagramServer.assert_called_once_with(('', 5000),
+                                                    listener._handle)
+        mock_DatagramServer.return_value.start.assert_called_once_with()
+
+        listener.stop()
+
+        mock_DatagramServer.return_value.stop.assert_called_once_with()
+        self.assertEqual(None, listener._listener)
+
+    def test_stop_not_started(self):
+        listener = udp.UDPListener('server', ('', 5000), 'key')
+
+        listener.stop()
+
+        self.assertEqual(None, listener._listener)
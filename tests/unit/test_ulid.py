@@ -0,0 +1,124 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import mock
+
+from heyu import ulid
+
+
+class EncodeTest(unittest.TestCase):
+    def test_encode(self):
+        self.assertEqual('0' * 26, ulid.encode(0))
+        self.assertEqual('0' * 25 + 'Z', ulid.encode(31))
+        self.assertEqual('7' + 'Z' * 25, ulid.encode((1 << 128) - 1))
+
+    def test_decode(self):
+        self.assertEqual(0, ulid.decode('0' * 26))
+        self.assertEqual(31, ulid.decode('0' * 25 + 'z'))
+        self.assertEqual((1 << 128) - 1, ulid.decode('7' + 'Z' * 25))
+
+    def test_decode_bad_length(self):
+        self.assertRaises(ValueError, ulid.decode, '0' * 25)
+
+    def test_decode_bad_character(self):
+        self.assertRaises(ValueError, ulid.decode, '0' * 25 + 'U')
+
+    def test_decode_out_of_range(self):
+        self.assertRaises(ValueError, ulid.decode, '8' + '0' * 25)
+
+    def test_pack_unpack(self):
+        text = ulid.encode((1234567 << 80) | 42)
+
+        data = ulid.pack(text)
+
+        self.assertEqual(ulid.BINARY_SIZE, len(data))
+        self.assertEqual(text, ulid.unpack(data))
+
+    def test_pack_order(self):
+        first = ulid.encode((1000 << 80) | 42)
+        second = ulid.encode((1001 << 80) | 7)
+
+        self.assertTrue(ulid.pack(first) < ulid.pack(second))
+
+    def test_unpack_bad_length(self):
+        self.assertRaises(ValueError, ulid.unpack, 'short')
+
+    def test_timestamp(self):
+        self.assertEqual(1234.567,
+                         ulid.timestamp(ulid.encode((1234567 << 80) | 42)))
+
+    def test_timestamp_invalid(self):
+        self.assertEqual(None, ulid.timestamp('not-an-id'))
+        self.assertEqual(None, ulid.timestamp(None))
+
+
+class GeneratorTest(unittest.TestCase):
+    @mock.patch('os.urandom', return_value='\0' * 9 + '\x05')
+    def test_generate(self, mock_urandom):
+        generator = ulid.Generator()
+
+        result = generator(1234.567)
+
+        self.assertEqual(ulid.encode((1234567 << 80) | 5), result)
+        self.assertEqual(ulid.TEXT_SIZE, len(result))
+        mock_urandom.assert_called_once_with(10)
+
+    @mock.patch('time.time', return_value=1234.567)
+    @mock.patch('os.urandom', return_value='\0' * 9 + '\x05')
+    def test_generate_default_time(self, mock_urandom, mock_time):
+        generator = ulid.Generator()
+
+        self.assertEqual(ulid.encode((1234567 << 80) | 5), generator())
+
+    @mock.patch('os.urandom', return_value='\0' * 9 + '\x05')
+    def test_generate_same_millisecond(self, mock_urandom):
+        generator = ulid.Generator()
+
+        first = generator(1234.567)
+        second = generator(1234.5671)
+
+        self.assertEqual(ulid.encode((1234567 << 80) | 6), second)
+        self.assertTrue(first < second)
+        mock_urandom.assert_called_once_with(10)
+
+    @mock.patch('os.urandom', return_value='\0' * 9 + '\x05')
+    def test_generate_clock_backwards(self, mock_urandom):
+        generator = ulid.Generator()
+
+        first = generator(1234.567)
+        second = generator(1000.0)
+
+        self.assertEqual(ulid.encode((1234567 << 80) | 6), second)
+        self.assertTrue(first < second)
+
+    @mock.patch('os.urandom', return_value='\xff' * 10)
+    def test_generate_overflow(self, mock_urandom):
+        generator = ulid.Generator()
+
+        first = generator(1234.567)
+        second = generator(1234.567)
+
+        self.assertEqual(ulid.encode(1234568 << 80), second)
+        self.assertTrue(first < second)
+
+    def test_generate_order(self):
+        generator = ulid.Generator()
+
+        ids = [generator() for _i in range(100)]
+
+        self.assertEqual(sorted(ids), ids)
+        self.assertEqual(100, len(set(ids)))
@@ -0,0 +1,289 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import socket
+import stat
+import unittest
+
+import mock
+from tendril import application
+
+from heyu import unix
+
+
+class TestException(BaseException):
+    pass
+
+
+class ParseUserTest(unittest.TestCase):
+    @mock.patch('pwd.getpwnam')
+    def test_uid(self, mock_getpwnam):
+        self.assertEqual(1000, unix.parse_user(' 1000 '))
+        self.assertFalse(mock_getpwnam.called)
+
+    @mock.patch('pwd.getpwnam', return_value=mock.Mock(pw_uid=1001))
+    def test_name(self, mock_getpwnam):
+        self.assertEqual(1001, unix.parse_user('user'))
+        mock_getpwnam.assert_called_once_with('user')
+
+    @mock.patch('pwd.getpwnam', side_effect=KeyError('user'))
+    def test_unknown(self, mock_getpwnam):
+        self.assertRaises(unix.UnixException, unix.parse_user, 'user')
+
+
+class RemoveStaleTest(unittest.TestCase):
+    @mock.patch('os.lstat', return_value=mock.Mock(st_mode=stat.S_IFSOCK))
+    @mock.patch('os.unlink')
+    def test_socket(self, mock_unlink, mock_lstat):
+        unix.remove_stale('/sock')
+
+        mock_lstat.assert_called_once_with('/sock')
+        mock_unlink.assert_called_once_with('/sock')
+
+    @mock.patch('os.lstat', side_effect=OSError(errno.ENOENT, 'missing'))
+    @mock.patch('os.unlink')
+    def test_missing(self, mock_unlink, mock_lstat):
+        unix.remove_stale('/sock')
+
+        self.assertFalse(mock_unlink.called)
+
+    @mock.patch('os.lstat', side_effect=OSError(errno.EACCES, 'denied'))
+    @mock.patch('os.unlink')
+    def test_lstat_error(self, mock_unlink, mock_lstat):
+        self.assertRaises(OSError, unix.remove_stale, '/sock')
+        self.assertFalse(mock_unlink.called)
+
+    @mock.patch('os.lstat', return_value=mock.Mock(st_mode=stat.S_IFREG))
+    @mock.patch('os.unlink')
+    def test_not_socket(self, mock_unlink, mock_lstat):
+        self.assertRaises(unix.UnixException, unix.remove_stale, '/sock')
+        self.assertFalse(mock_unlink.called)
+
+
+class PeerCredentialsTest(unittest.TestCase):
+    def test_credentials(self):
+        sock = mock.Mock(**{
+            'getsockopt.return_value': unix._ucred.pack(1, 2, 3),
+        })
+
+        result = unix.peer_credentials(sock)
+
+        self.assertEqual((1, 2, 3), result)
+        sock.getsockopt.assert_called_once_with(
+            socket.SOL_SOCKET, unix.SO_PEERCRED, unix._ucred.size)
+
+
+class UnixTendrilTest(unittest.TestCase):
+    @mock.patch('tendril.tcp.TCPTendril.__init__', return_value=None)
+    def test_init(self, mock_init):
+        result = unix.UnixTendril('manager', 'sock', 'remote', (1, 2, 3))
+
+        self.assertEqual((1, 2, 3), result.credentials)
+        mock_init.assert_called_once_with('manager', 'sock', 'remote')
+
+
+class UnixTendrilManagerTest(unittest.TestCase):
+    def _manager(self, **kwargs):
+        with mock.patch('tendril.tcp.TCPTendrilManager.__init__',
+                        return_value=None):
+            manager = unix.UnixTendrilManager(**kwargs)
+        manager.endpoint = kwargs.get('path')
+        manager.backlog = 1024
+        manager.running = True
+        manager._local_addr_event = mock.Mock()
+        return manager
+
+    @mock.patch('tendril.tcp.TCPTendrilManager.__init__', return_value=None)
+    def test_init(self, mock_init):
+        result = unix.UnixTendrilManager('/sock', set([1000]), 0o660)
+
+        self.assertEqual(set([1000]), result.uids)
+        self.assertEqual(0o660, result.mode)
+        mock_init.assert_called_once_with('/sock')
+
+    @mock.patch('tendril.tcp.TCPTendrilManager.__init__', return_value=None)
+    def test_init_defaults(self, mock_init):
+        result = unix.UnixTendrilManager()
+
+        self.assertEqual(None, result.uids)
+        self.assertEqual(0o600, result.mode)
+        mock_init.assert_called_once_with(None)
+
+    @mock.patch('tendril.tcp.TCPTendrilManager.__init__', return_value=None)
+    def test_init_uids_default_mode(self, mock_init):
+        result = unix.UnixTendrilManager('/sock', set([1000]))
+
+        self.assertEqual(0o666, result.mode)
+
+    @mock.patch.object(unix, 'remove_stale')
+    @mock.patch('tendril.tcp.TCPTendrilManager.start')
+    def test_start(self, mock_start, mock_remove_stale):
+        manager = self._manager(path='/sock')
+
+        manager.start('acceptor', 'wrapper')
+
+        mock_remove_stale.assert_called_once_with('/sock')
+        mock_start.assert_called_once_with('acceptor', 'wrapper')
+
+    @mock.patch.object(unix, 'remove_stale',
+                       side_effect=unix.UnixException('not a socket'))
+    @mock.patch('tendril.tcp.TCPTendrilManager.start')
+    def test_start_not_socket(self, mock_start, mock_remove_stale):
+        manager = self._manager(path='/sock')
+
+        self.assertRaises(unix.UnixException, manager.start, 'acceptor',
+                          None)
+        self.assertFalse(mock_start.called)
+
+    @mock.patch.object(unix, 'remove_stale')
+    @mock.patch('tendril.tcp.TCPTendrilManager.start')
+    def test_start_no_acceptor(self, mock_start, mock_remove_stale):
+        manager = self._manager()
+
+        manager.start()
+
+        self.assertFalse(mock_remove_stale.called)
+        mock_start.assert_called_once_with(None, None)
+
+    @mock.patch('gevent.socket.socket')
+    def test_connect_not_running(self, mock_socket):
+        manager = self._manager()
+        manager.running = False
+
+        self.assertRaises(ValueError, manager.connect, '/sock', 'acceptor')
+        self.assertFalse(mock_socket.called)
+
+    @mock.patch('gevent.socket.socket')
+    @mock.patch.object(unix, 'UnixTendril')
+    @mock.patch.object(unix.UnixTendrilManager, '_track_tendril')
+    def test_connect(self, mock_track_tendril, mock_UnixTendril,
+                     mock_socket):
+        sock = mock_socket.return_value
+        tend = mock_UnixTendril.return_value
+        acceptor = mock.Mock(return_value='app')
+        manager = self._manager()
+
+        result = manager.connect('/sock', acceptor)
+
+        self.assertEqual(tend, result)
+        mock_socket.assert_called_once_with(socket.AF_UNIX,
+                                            socket.SOCK_STREAM)
+        sock.connect.assert_called_once_with('/sock')
+        mock_UnixTendril.assert_called_once_with(manager, sock, '/sock')
+        acceptor.assert_called_once_with(tend)
+        self.assertEqual('app', tend.application)
+        mock_track_tendril.assert_called_once_with(tend)
+        tend._start.assert_called_once_with()
+        self.assertFalse(sock.close.called)
+
+    @mock.patch('gevent.socket.socket')
+    @mock.patch.object(unix, 'UnixTendril')
+    @mock.patch.object(unix.UnixTendrilManager, '_track_tendril')
+    def test_connect_wrapper(self, mock_track_tendril, mock_UnixTendril,
+                             mock_socket):
+        sock = mock_socket.return_value
+        wrapper = mock.Mock(return_value='wrapped')
+        manager = self._manager()
+
+        manager.connect('/sock', mock.Mock(), wrapper)
+
+        wrapper.assert_called_once_with(sock)
+        mock_UnixTendril.assert_called_once_with(manager, 'wrapped', '/sock')
+
+    @mock.patch('gevent.socket.socket')
+    @mock.patch.object(unix, 'UnixTendril')
+    @mock.patch.object(unix.UnixTendrilManager, '_track_tendril')
+    def test_connect_rejected(self, mock_track_tendril, mock_UnixTendril,
+                              mock_socket):
+        sock = mock_socket.return_value
+        acceptor = mock.Mock(side_effect=application.RejectConnection())
+        manager = self._manager()
+
+        result = manager.connect('/sock', acceptor)
+
+        self.assertEqual(None, result)
+        self.assertFalse(mock_track_tendril.called)
+        sock.close.assert_called_once_with()
+
+    @mock.patch('os.chmod')
+    @mock.patch('gevent.socket.socket')
+    @mock.patch.object(unix, 'peer_credentials', return_value=(1, 1000, 100))
+    @mock.patch.object(unix, 'UnixTendril')
+    @mock.patch.object(unix.UnixTendrilManager, '_track_tendril')
+    def test_listener(self, mock_track_tendril, mock_UnixTendril,
+                      mock_peer_credentials, mock_socket, mock_chmod):
+        cli = mock.Mock(**{'fileno.return_value': 7})
+        sock = mock_socket.return_value
+        sock.accept.side_effect = [(cli, ''), TestException()]
+        tend = mock_UnixTendril.return_value
+        acceptor = mock.Mock(return_value='app')
+        manager = self._manager(path='/sock', uids=set([1000]))
+
+        self.assertRaises(TestException, manager.listener, acceptor, None)
+
+        sock.bind.assert_called_once_with('/sock')
+        mock_chmod.assert_called_once_with('/sock', 0o666)
+        sock.listen.assert_called_once_with(1024)
+        self.assertEqual('/sock', manager.local_addr)
+        mock_peer_credentials.assert_called_once_with(cli)
+        mock_UnixTendril.assert_called_once_with(
+            manager, cli, (1, 1000, 100, 7), (1, 1000, 100))
+        acceptor.assert_called_once_with(tend)
+        self.assertEqual('app', tend.application)
+        mock_track_tendril.assert_called_once_with(tend)
+        tend._start.assert_called_once_with()
+        self.assertFalse(cli.close.called)
+
+    @mock.patch('os.chmod')
+    @mock.patch('gevent.socket.socket')
+    @mock.patch.object(unix, 'peer_credentials', return_value=(1, 1001, 100))
+    @mock.patch.object(unix, 'UnixTendril')
+    @mock.patch.object(unix.UnixTendrilManager, '_track_tendril')
+    def test_listener_unauthorized(self, mock_track_tendril,
+                                   mock_UnixTendril, mock_peer_credentials,
+                                   mock_socket, mock_chmod):
+        cli = mock.Mock()
+        sock = mock_socket.return_value
+        sock.accept.side_effect = [(cli, ''), TestException()]
+        acceptor = mock.Mock()
+        manager = self._manager(path='/sock', uids=set([1000]))
+
+        self.assertRaises(TestException, manager.listener, acceptor, None)
+
+        self.assertFalse(mock_UnixTendril.called)
+        self.assertFalse(acceptor.called)
+        cli.close.assert_called_once_with()
+
+    @mock.patch('os.chmod')
+    @mock.patch('gevent.socket.socket')
+    @mock.patch.object(unix, 'peer_credentials', return_value=(1, 1001, 100))
+    @mock.patch.object(unix, 'UnixTendril')
+    @mock.patch.object(unix.UnixTendrilManager, '_track_tendril')
+    def test_listener_any_user(self, mock_track_tendril, mock_UnixTendril,
+                               mock_peer_credentials, mock_socket,
+                               mock_chmod):
+        cli = mock.Mock(**{'fileno.return_value': 7})
+        sock = mock_socket.return_value
+        sock.accept.side_effect = [(cli, ''), TestException()]
+        acceptor = mock.Mock()
+        manager = self._manager(path='/sock')
+
+        self.assertRaises(TestException, manager.listener, acceptor, None)
+
+        mock_chmod.assert_called_once_with('/sock', 0o600)
+        mock_UnixTendril.assert_called_once_with(
+            manager, cli, (1, 1001, 100, 7), (1, 1001, 100))
+        self.assertFalse(cli.close.called)
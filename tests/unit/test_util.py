@@ -154,6 +154,21 @@ class DefaultHubTest(unittest.TestCase):
         mock_parse_hub.assert_called_once_with('hub')
 
 
+class ReadEndpointsTest(unittest.TestCase):
+    @mock.patch('__builtin__.open', mock.mock_open(
+        read_data='# Endpoints\nhost1\n\n  host2:1234  \n'))
+    @mock.patch.object(util, 'parse_hub', side_effect=lambda x: (x, 1))
+    def test_read(self, mock_parse_hub):
+        result = util.read_endpoints('/endpoints')
+
+        self.assertEqual([('host1', 1), ('host2:1234', 1)], result)
+
+    @mock.patch('__builtin__.open', side_effect=IOError('no such file'))
+    def test_missing(self, mock_open):
+        self.assertRaises(util.HubException, util.read_endpoints,
+                          '/endpoints')
+
+
 class OutgoingEndpointTest(unittest.TestCase):
     @mock.patch('tendril.addr_info', return_value=socket.AF_INET)
     def test_ipv4(self, mock_addr_info):
@@ -171,28 +186,34 @@ class OutgoingEndpointTest(unittest.TestCase):
 
 
 class CertWrapperTest(unittest.TestCase):
+    def setUp(self):
+        util._wrappers.clear()
+
+    def tearDown(self):
+        util._wrappers.clear()
+
     @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
     @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
         'read.return_value': [],
         'items.return_value': [],
     }))
-    @mock.patch('tendril.TendrilPartial', return_value='wrapper')
-    def test_insecure(self, mock_TendrilPartial, mock_SafeConfigParser,
+    @mock.patch.object(util, 'SSLContext')
+    def test_insecure(self, mock_SSLContext, mock_SafeConfigParser,
                       mock_expanduser):
         result = util.cert_wrapper(None, 'test', secure=False)
 
         self.assertEqual(None, result)
         self.assertFalse(mock_expanduser.called)
         self.assertFalse(mock_SafeConfigParser.called)
-        self.assertFalse(mock_TendrilPartial.called)
+        self.assertFalse(mock_SSLContext.called)
 
     @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
     @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
         'read.return_value': [],
         'items.return_value': [],
     }))
-    @mock.patch('tendril.TendrilPartial', return_value='wrapper')
-    def test_missing_conf(self, mock_TendrilPartial, mock_SafeConfigParser,
+    @mock.patch.object(util, 'SSLContext')
+    def test_missing_conf(self, mock_SSLContext, mock_SafeConfigParser,
                           mock_expanduser):
         cp = mock_SafeConfigParser.return_value
 
@@ -201,15 +222,15 @@ class CertWrapperTest(unittest.TestCase):
         mock_SafeConfigParser.assert_called_once_with()
         cp.read.assert_called_once_with('/home/dir/.heyu.cert')
         self.assertFalse(cp.items.called)
-        self.assertFalse(mock_TendrilPartial.called)
+        self.assertFalse(mock_SSLContext.called)
 
     @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
     @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
         'read.return_value': [],
         'items.return_value': [],
     }))
-    @mock.patch('tendril.TendrilPartial', return_value='wrapper')
-    def test_bad_conf(self, mock_TendrilPartial, mock_SafeConfigParser,
+    @mock.patch.object(util, 'SSLContext')
+    def test_bad_conf(self, mock_SSLContext, mock_SafeConfigParser,
                       mock_expanduser):
         cp = mock_SafeConfigParser.return_value
 
@@ -218,15 +239,15 @@ class CertWrapperTest(unittest.TestCase):
         self.assertFalse(mock_expanduser.called)
         self.assertFalse(mock_SafeConfigParser.called)
         self.assertFalse(cp.items.called)
-        self.assertFalse(mock_TendrilPartial.called)
+        self.assertFalse(mock_SSLContext.called)
 
     @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
     @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
         'read.return_value': ['/home/dir/.heyu.cert'],
         'items.side_effect': ConfigParser.NoSectionError('test'),
     }))
-    @mock.patch('tendril.TendrilPartial', return_value='wrapper')
-    def test_missing_profile(self, mock_TendrilPartial, mock_SafeConfigParser,
+    @mock.patch.object(util, 'SSLContext')
+    def test_missing_profile(self, mock_SSLContext, mock_SafeConfigParser,
                              mock_expanduser):
         cp = mock_SafeConfigParser.return_value
 
@@ -235,15 +256,15 @@ class CertWrapperTest(unittest.TestCase):
         mock_SafeConfigParser.assert_called_once_with()
         cp.read.assert_called_once_with('/home/dir/.heyu.cert')
         cp.items.assert_called_once_with('test')
-        self.assertFalse(mock_TendrilPartial.called)
+        self.assertFalse(mock_SSLContext.called)
 
     @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
     @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
         'read.return_value': ['/home/dir/.heyu.cert'],
         'items.side_effect': TestException('test'),
     }))
-    @mock.patch('tendril.TendrilPartial', return_value='wrapper')
-    def test_unloadable_profile(self, mock_TendrilPartial,
+    @mock.patch.object(util, 'SSLContext')
+    def test_unloadable_profile(self, mock_SSLContext,
                                 mock_SafeConfigParser, mock_expanduser):
         cp = mock_SafeConfigParser.return_value
 
@@ -252,15 +273,15 @@ class CertWrapperTest(unittest.TestCase):
         mock_SafeConfigParser.assert_called_once_with()
         cp.read.assert_called_once_with('/home/dir/.heyu.cert')
         cp.items.assert_called_once_with('test')
-        self.assertFalse(mock_TendrilPartial.called)
+        self.assertFalse(mock_SSLContext.called)
 
     @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
     @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
         'read.return_value': ['/home/dir/.heyu.cert'],
         'items.return_value': [('cafile', 'ca'), ('certfile', 'cert')],
     }))
-    @mock.patch('tendril.TendrilPartial', return_value='wrapper')
-    def test_missing_keyfile(self, mock_TendrilPartial, mock_SafeConfigParser,
+    @mock.patch.object(util, 'SSLContext')
+    def test_missing_keyfile(self, mock_SSLContext, mock_SafeConfigParser,
                              mock_expanduser):
         cp = mock_SafeConfigParser.return_value
 
@@ -269,15 +290,15 @@ class CertWrapperTest(unittest.TestCase):
         mock_SafeConfigParser.assert_called_once_with()
         cp.read.assert_called_once_with('/home/dir/.heyu.cert')
         cp.items.assert_called_once_with('test')
-        self.assertFalse(mock_TendrilPartial.called)
+        self.assertFalse(mock_SSLContext.called)
 
     @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
     @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
         'read.return_value': ['/home/dir/.heyu.cert'],
         'items.return_value': [('keyfile', 'key'), ('certfile', 'cert')],
     }))
-    @mock.patch('tendril.TendrilPartial', return_value='wrapper')
-    def test_missing_cafile(self, mock_TendrilPartial, mock_SafeConfigParser,
+    @mock.patch.object(util, 'SSLContext')
+    def test_missing_cafile(self, mock_SSLContext, mock_SafeConfigParser,
                             mock_expanduser):
         cp = mock_SafeConfigParser.return_value
 
@@ -286,15 +307,15 @@ class CertWrapperTest(unittest.TestCase):
         mock_SafeConfigParser.assert_called_once_with()
         cp.read.assert_called_once_with('/home/dir/.heyu.cert')
         cp.items.assert_called_once_with('test')
-        self.assertFalse(mock_TendrilPartial.called)
+        self.assertFalse(mock_SSLContext.called)
 
     @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
     @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
         'read.return_value': ['/home/dir/.heyu.cert'],
         'items.return_value': [('cafile', 'ca'), ('keyfile', 'key')],
     }))
-    @mock.patch('tendril.TendrilPartial', return_value='wrapper')
-    def test_missing_certfile(self, mock_TendrilPartial, mock_SafeConfigParser,
+    @mock.patch.object(util, 'SSLContext')
+    def test_missing_certfile(self, mock_SSLContext, mock_SafeConfigParser,
                               mock_expanduser):
         cp = mock_SafeConfigParser.return_value
 
@@ -303,7 +324,7 @@ class CertWrapperTest(unittest.TestCase):
         mock_SafeConfigParser.assert_called_once_with()
         cp.read.assert_called_once_with('/home/dir/.heyu.cert')
         cp.items.assert_called_once_with('test')
-        self.assertFalse(mock_TendrilPartial.called)
+        self.assertFalse(mock_SSLContext.called)
 
     @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
     @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
@@ -314,22 +335,25 @@ class CertWrapperTest(unittest.TestCase):
             ('certfile', 'cert'),
         ],
     }))
-    @mock.patch('tendril.TendrilPartial', return_value='wrapper')
-    def test_basic(self, mock_TendrilPartial, mock_SafeConfigParser,
+    @mock.patch.object(util, 'SSLContext')
+    def test_basic(self, mock_SSLContext, mock_SafeConfigParser,
                    mock_expanduser):
         cp = mock_SafeConfigParser.return_value
 
         result = util.cert_wrapper(None, 'test')
 
-        self.assertEqual(result, 'wrapper')
         mock_expanduser.assert_called_once_with('~/.heyu.cert')
         mock_SafeConfigParser.assert_called_once_with()
         cp.read.assert_called_once_with('/home/dir/.heyu.cert')
         cp.items.assert_called_once_with('test')
-        mock_TendrilPartial.assert_called_once_with(
-            ssl.wrap_socket, keyfile='key', certfile='cert', ca_certs='ca',
-            server_side=False, cert_reqs=ssl.CERT_REQUIRED,
-            ssl_version=ssl.PROTOCOL_TLSv1)
+        self.assertTrue(isinstance(result, util.TLSWrapper))
+        self.assertEqual(mock_SSLContext.return_value, result.context)
+        self.assertEqual(False, result.server_side)
+        mock_SSLContext.assert_called_once_with(ssl.PROTOCOL_TLSv1)
+        ctx = mock_SSLContext.return_value
+        self.assertEqual(ssl.CERT_REQUIRED, ctx.verify_mode)
+        ctx.load_cert_chain.assert_called_once_with('cert', 'key')
+        ctx.load_verify_locations.assert_called_once_with('ca')
 
     @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
     @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
@@ -340,22 +364,25 @@ class CertWrapperTest(unittest.TestCase):
             ('certfile', 'cert'),
         ],
     }))
-    @mock.patch('tendril.TendrilPartial', return_value='wrapper')
-    def test_server(self, mock_TendrilPartial, mock_SafeConfigParser,
+    @mock.patch.object(util, 'SSLContext')
+    def test_server(self, mock_SSLContext, mock_SafeConfigParser,
                     mock_expanduser):
         cp = mock_SafeConfigParser.return_value
 
         result = util.cert_wrapper(None, 'test', True)
 
-        self.assertEqual(result, 'wrapper')
         mock_expanduser.assert_called_once_with('~/.heyu.cert')
         mock_SafeConfigParser.assert_called_once_with()
         cp.read.assert_called_once_with('/home/dir/.heyu.cert')
         cp.items.assert_called_once_with('test')
-        mock_TendrilPartial.assert_called_once_with(
-            ssl.wrap_socket, keyfile='key', certfile='cert', ca_certs='ca',
-            server_side=True, cert_reqs=ssl.CERT_REQUIRED,
-            ssl_version=ssl.PROTOCOL_TLSv1)
+        self.assertTrue(isinstance(result, util.TLSWrapper))
+        self.assertEqual(mock_SSLContext.return_value, result.context)
+        self.assertEqual(True, result.server_side)
+        mock_SSLContext.assert_called_once_with(ssl.PROTOCOL_TLSv1)
+        ctx = mock_SSLContext.return_value
+        self.assertEqual(ssl.CERT_REQUIRED, ctx.verify_mode)
+        ctx.load_cert_chain.assert_called_once_with('cert', 'key')
+        ctx.load_verify_locations.assert_called_once_with('ca')
 
     @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
     @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
@@ -366,22 +393,25 @@ class CertWrapperTest(unittest.TestCase):
             ('certfile', 'cert'),
         ],
     }))
-    @mock.patch('tendril.TendrilPartial', return_value='wrapper')
-    def test_alt_conf(self, mock_TendrilPartial, mock_SafeConfigParser,
+    @mock.patch.object(util, 'SSLContext')
+    def test_alt_conf(self, mock_SSLContext, mock_SafeConfigParser,
                       mock_expanduser):
         cp = mock_SafeConfigParser.return_value
 
         result = util.cert_wrapper('alt_conf', 'test')
 
-        self.assertEqual(result, 'wrapper')
         mock_expanduser.assert_called_once_with('alt_conf')
         mock_SafeConfigParser.assert_called_once_with()
         cp.read.assert_called_once_with('/home/dir/.heyu.cert')
         cp.items.assert_called_once_with('test')
-        mock_TendrilPartial.assert_called_once_with(
-            ssl.wrap_socket, keyfile='key', certfile='cert', ca_certs='ca',
-            server_side=False, cert_reqs=ssl.CERT_REQUIRED,
-            ssl_version=ssl.PROTOCOL_TLSv1)
+        self.assertTrue(isinstance(result, util.TLSWrapper))
+        self.assertEqual(mock_SSLContext.return_value, result.context)
+        self.assertEqual(False, result.server_side)
+        mock_SSLContext.assert_called_once_with(ssl.PROTOCOL_TLSv1)
+        ctx = mock_SSLContext.return_value
+        self.assertEqual(ssl.CERT_REQUIRED, ctx.verify_mode)
+        ctx.load_cert_chain.assert_called_once_with('cert', 'key')
+        ctx.load_verify_locations.assert_called_once_with('ca')
 
     @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
     @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
@@ -392,22 +422,141 @@ class CertWrapperTest(unittest.TestCase):
             ('certfile', 'cert'),
         ],
     }))
-    @mock.patch('tendril.TendrilPartial', return_value='wrapper')
-    def test_alt_profile(self, mock_TendrilPartial, mock_SafeConfigParser,
+    @mock.patch.object(util, 'SSLContext')
+    def test_alt_profile(self, mock_SSLContext, mock_SafeConfigParser,
                          mock_expanduser):
         cp = mock_SafeConfigParser.return_value
 
         result = util.cert_wrapper('alt_conf[alt_profile]', 'test')
 
-        self.assertEqual(result, 'wrapper')
         mock_expanduser.assert_called_once_with('alt_conf')
         mock_SafeConfigParser.assert_called_once_with()
         cp.read.assert_called_once_with('/home/dir/.heyu.cert')
         cp.items.assert_called_once_with('alt_profile')
-        mock_TendrilPartial.assert_called_once_with(
-            ssl.wrap_socket, keyfile='key', certfile='cert', ca_certs='ca',
-            server_side=False, cert_reqs=ssl.CERT_REQUIRED,
-            ssl_version=ssl.PROTOCOL_TLSv1)
+        self.assertTrue(isinstance(result, util.TLSWrapper))
+        self.assertEqual(mock_SSLContext.return_value, result.context)
+        self.assertEqual(False, result.server_side)
+        mock_SSLContext.assert_called_once_with(ssl.PROTOCOL_TLSv1)
+        ctx = mock_SSLContext.return_value
+        self.assertEqual(ssl.CERT_REQUIRED, ctx.verify_mode)
+        ctx.load_cert_chain.assert_called_once_with('cert', 'key')
+        ctx.load_verify_locations.assert_called_once_with('ca')
+
+    @mock.patch('os.path.expanduser', return_value='/home/dir/.heyu.cert')
+    @mock.patch('ConfigParser.SafeConfigParser', return_value=mock.Mock(**{
+        'read.return_value': ['/home/dir/.heyu.cert'],
+        'items.return_value': [
+            ('cafile', 'ca'),
+            ('keyfile', 'key'),
+            ('certfile', 'cert'),
+        ],
+    }))
+    @mock.patch.object(util, 'SSLContext')
+    def test_cached(self, mock_SSLContext, mock_SafeConfigParser,
+                    mock_expanduser):
+        first = util.cert_wrapper(None, 'test')
+        second = util.cert_wrapper(None, 'test')
+        server = util.cert_wrapper(None, 'test', True)
+
+        self.assertTrue(first is second)
+        self.assertFalse(first is server)
+        self.assertEqual(2, mock_SafeConfigParser.call_count)
+        self.assertEqual(2, mock_SSLContext.call_count)
+
+
+class ReloadWrappersTest(unittest.TestCase):
+    def setUp(self):
+        util._wrappers.clear()
+
+    def tearDown(self):
+        util._wrappers.clear()
+
+    @mock.patch.object(util, '_load_context',
+                       side_effect=lambda path, profile: (path, profile))
+    def test_reload(self, mock_load_context):
+        client = mock.Mock()
+        server = mock.Mock()
+        util._wrappers[('/conf', 'hub', False)] = client
+        util._wrappers[('/conf', 'hub', True)] = server
+
+        util.reload_wrappers()
+
+        client.replace.assert_called_once_with(('/conf', 'hub'))
+        server.replace.assert_called_once_with(('/conf', 'hub'))
+        self.assertTrue(util._wrappers[('/conf', 'hub', False)] is client)
+
+    @mock.patch.object(util, '_load_context',
+                       side_effect=[
+                           'context', util.CertException('bad'),
+                       ])
+    def test_reload_error(self, mock_load_context):
+        wrappers = [mock.Mock(), mock.Mock()]
+        util._wrappers[('/conf', 'hub', False)] = wrappers[0]
+        util._wrappers[('/conf', 'hub', True)] = wrappers[1]
+
+        self.assertRaises(util.CertException, util.reload_wrappers)
+
+        for wrapper in wrappers:
+            self.assertFalse(wrapper.replace.called)
+
+
+class TLSWrapperTest(unittest.TestCase):
+    def test_init(self):
+        result = util.TLSWrapper('context', True)
+
+        self.assertEqual('context', result.context)
+        self.assertEqual(True, result.server_side)
+        self.assertEqual({}, result._sessions)
+
+    def test_replace(self):
+        wrapper = util.TLSWrapper('context')
+        wrapper._sessions[('hub', 4859)] = 'session'
+
+        wrapper.replace('new_context')
+
+        self.assertEqual('new_context', wrapper.context)
+        self.assertEqual({}, wrapper._sessions)
+
+    def test_server(self):
+        context = mock.Mock(**{'wrap_socket.return_value': 'wrapped'})
+        wrapper = util.TLSWrapper(context, True)
+
+        result = wrapper('sock')
+
+        self.assertEqual('wrapped', result)
+        context.wrap_socket.assert_called_once_with('sock', server_side=True)
+
+    @mock.patch.object(ssl, 'SSLSession', None, create=True)
+    def test_client_sessions(self):
+        context = mock.Mock(**{
+            'wrap_socket.side_effect': [
+                mock.Mock(session='session1'),
+                mock.Mock(session='session2'),
+            ],
+        })
+        sock = mock.Mock(**{'getpeername.return_value': ('hub', 4859)})
+        wrapper = util.TLSWrapper(context)
+
+        first = wrapper(sock)
+        second = wrapper(sock)
+
+        self.assertEqual('session1', first.session)
+        self.assertEqual('session2', second.session)
+        context.wrap_socket.assert_has_calls([
+            mock.call(sock, session=None),
+            mock.call(sock, session='session1'),
+        ])
+        self.assertEqual({('hub', 4859): 'session2'}, wrapper._sessions)
+
+    def test_client_no_sessions(self):
+        context = mock.Mock(**{'wrap_socket.return_value': 'wrapped'})
+        wrapper = util.TLSWrapper(context)
+
+        with mock.patch.object(util, 'ssl', mock.Mock(spec=[])):
+            result = wrapper('sock')
+
+        self.assertEqual('wrapped', result)
+        context.wrap_socket.assert_called_once_with('sock')
 
 
 class MyBytesIO(io.BytesIO):
@@ -0,0 +1,95 @@
+# Copyright 2015 Rackspace
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import unittest
+
+import mock
+
+from heyu import writer
+
+
+class WriterTest(unittest.TestCase):
+    def test_init(self):
+        result = writer.Writer('write', 0.002, 1024)
+
+        self.assertEqual('write', result._write)
+        self.assertEqual(0.002, result.delay)
+        self.assertEqual(1024, result.budget)
+        self.assertEqual(None, result._frames)
+        self.assertEqual(None, result._timer)
+        self.assertEqual(0, len(result))
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_write(self, mock_spawn_later):
+        write = mock.Mock()
+        wr = writer.Writer(write, 0.002, 1024)
+
+        wr.write('frame1')
+        wr.write('frame2')
+
+        self.assertEqual(['frame1', 'frame2'], wr._frames)
+        self.assertEqual(12, len(wr))
+        self.assertEqual('timer', wr._timer)
+        mock_spawn_later.assert_called_once_with(0.002, wr._expired)
+        self.assertFalse(write.called)
+
+    @mock.patch('gevent.spawn_later')
+    def test_write_budget(self, mock_spawn_later):
+        timer = mock_spawn_later.return_value
+        write = mock.Mock()
+        wr = writer.Writer(write, 0.002, 10)
+        wr.write('frame1')
+
+        wr.write('frame2')
+
+        write.assert_called_once_with(['frame1', 'frame2'])
+        timer.kill.assert_called_once_with()
+        self.assertEqual(None, wr._timer)
+        self.assertEqual(None, wr._frames)
+        self.assertEqual(0, len(wr))
+
+    @mock.patch('gevent.spawn_later')
+    def test_write_large(self, mock_spawn_later):
+        write = mock.Mock()
+        wr = writer.Writer(write, 0.002, 4)
+
+        wr.write('frame1')
+
+        write.assert_called_once_with(['frame1'])
+        self.assertFalse(mock_spawn_later.called)
+        self.assertEqual(0, len(wr))
+
+    @mock.patch('gevent.spawn_later', return_value='timer')
+    def test_expired(self, mock_spawn_later):
+        write = mock.Mock()
+        wr = writer.Writer(write, 0.002, 1024)
+        wr.write('frame1')
+
+        wr._expired()
+
+        write.assert_called_once_with(['frame1'])
+        self.assertEqual(None, wr._timer)
+        self.assertEqual(None, wr._frames)
+        self.assertEqual(0, len(wr))
+
+    def test_flush_idle(self):
+        write = mock.Mock()
+        wr = writer.Writer(write, 0.002, 1024)
+
+        wr.flush()
+
+        self.assertFalse(write.called)
+        self.assertEqual(None, wr._timer)